@@ -67,11 +67,37 @@ def create_app(config_name=None):
         from app.models.notification import Notification
         from app.models.product import Product, Category, Brand
         from app.models.order import Order, OrderItem, DeliveryZone
-        from app.models.returns import Return, SupplierPayout, DeliveryPayout
+        from app.models.returns import Return, SupplierPayout, DeliveryPayout, PayoutBatch
         from app.models.cart import Cart, CartItem
         from app.models.audit_log import AuditLog
         from app.models.otp import OTP
         from app.models.delivery_request import DeliveryRequest
+        from app.models.delivery_agent_stats import DeliveryAgentStats
+        from app.models.provider_token import ProviderToken
+        from app.models.inbound_event import InboundEvent
+        from app.models.report_job import ReportJob
+        from app.models.ledger import LedgerEntry
+        from app.models.analytics import DailySalesRollup, DailyOrderRollup, RollupDay
+        from app.services.agent_stats_service import register_listeners
+        from app.services.rollup_service import register_listeners as register_rollup_listeners
+        from app.services.dashboard_service import register_listeners as register_dashboard_listeners
+        from app.services.supplier_analytics import register_listeners as register_supplier_analytics_listeners
+        from app.services.returns_analytics import register_listeners as register_returns_analytics_listeners
+
+        # Keep delivery agent dashboard counters in step with order changes
+        register_listeners()
+
+        # Mark analytics rollup days dirty as orders change
+        register_rollup_listeners()
+
+        # Mark the cached admin dashboard KPIs stale on relevant writes
+        register_dashboard_listeners()
+
+        # Drop cached supplier analytics when their rollup days are rebuilt
+        register_supplier_analytics_listeners()
+
+        # Drop cached returns analytics when returns change
+        register_returns_analytics_listeners()
 
         # One-time data fix: update product images
         _run_startup_fixes(db, Product)
@@ -140,6 +166,7 @@ def create_app(config_name=None):
                     order_id VARCHAR(36) NOT NULL REFERENCES orders(id),
                     delivery_agent_id VARCHAR(36) NOT NULL REFERENCES users(id),
                     status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                    wave INTEGER NOT NULL DEFAULT 1,
                     responded_at TIMESTAMP,
                     rejection_reason TEXT,
                     expires_at TIMESTAMP NOT NULL,
@@ -150,6 +177,196 @@ def create_app(config_name=None):
             db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_delivery_requests_order ON delivery_requests(order_id)"))
             db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_delivery_requests_agent ON delivery_requests(delivery_agent_id)"))
             db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_delivery_requests_status ON delivery_requests(status)"))
+            db.session.execute(text("ALTER TABLE delivery_requests ADD COLUMN IF NOT EXISTS wave INTEGER NOT NULL DEFAULT 1"))
+
+            # Geospatial routing columns
+            db.session.execute(text("ALTER TABLE addresses ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION"))
+            db.session.execute(text("ALTER TABLE addresses ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION"))
+            db.session.execute(text("ALTER TABLE delivery_zones ADD COLUMN IF NOT EXISTS boundary JSON"))
+            db.session.execute(text("ALTER TABLE delivery_zones ADD COLUMN IF NOT EXISTS hub_latitude DOUBLE PRECISION"))
+            db.session.execute(text("ALTER TABLE delivery_zones ADD COLUMN IF NOT EXISTS hub_longitude DOUBLE PRECISION"))
+            db.session.execute(text("ALTER TABLE delivery_zones ADD COLUMN IF NOT EXISTS fee_per_km NUMERIC(10,2)"))
+            db.session.execute(text("ALTER TABLE delivery_agent_profiles ADD COLUMN IF NOT EXISTS current_latitude DOUBLE PRECISION"))
+            db.session.execute(text("ALTER TABLE delivery_agent_profiles ADD COLUMN IF NOT EXISTS current_longitude DOUBLE PRECISION"))
+            db.session.execute(text("ALTER TABLE delivery_agent_profiles ADD COLUMN IF NOT EXISTS location_updated_at TIMESTAMP"))
+            
+            # Create payout_batches table if not exists
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS payout_batches (
+                    id VARCHAR(36) PRIMARY KEY,
+                    source VARCHAR(20) NOT NULL DEFAULT 'admin',
+                    status VARCHAR(20) NOT NULL DEFAULT 'QUEUED',
+                    total_count INTEGER NOT NULL DEFAULT 0,
+                    submitted_count INTEGER NOT NULL DEFAULT 0,
+                    failed_count INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_by VARCHAR(36) REFERENCES users(id),
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """))
+            db.session.execute(text("ALTER TABLE supplier_payouts ADD COLUMN IF NOT EXISTS batch_id VARCHAR(36) REFERENCES payout_batches(id)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_supplier_payouts_batch_id ON supplier_payouts(batch_id)"))
+            
+            # Create provider_tokens table if not exists (shared OAuth tokens)
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS provider_tokens (
+                    key VARCHAR(100) PRIMARY KEY,
+                    token TEXT NOT NULL DEFAULT '',
+                    expires_at TIMESTAMP NOT NULL,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            
+            # Create inbound_events table if not exists (stored provider callbacks)
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS inbound_events (
+                    id VARCHAR(36) PRIMARY KEY,
+                    provider VARCHAR(20) NOT NULL,
+                    event_type VARCHAR(50) NOT NULL,
+                    reference VARCHAR(100),
+                    payload JSON NOT NULL,
+                    status VARCHAR(20) NOT NULL DEFAULT 'PENDING',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    received_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    processed_at TIMESTAMP,
+                    CONSTRAINT uq_inbound_events_reference UNIQUE (provider, event_type, reference)
+                )
+            """))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_inbound_events_pending ON inbound_events(available_at) WHERE status = 'PENDING'"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_payment_reference ON orders(payment_reference)"))
+            db.session.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_checked_at TIMESTAMP"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_payment_pending ON orders(created_at) WHERE payment_status = 'PENDING'"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_supplier_payouts_reference ON supplier_payouts(reference)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_supplier_profiles_phone_change_queue ON supplier_profiles(payment_phone_change_status, payment_phone_change_requested_at, id)"))
+            db.session.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivery_payout_id VARCHAR(36) REFERENCES delivery_payouts(id)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_delivery_payout_id ON orders(delivery_payout_id)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_delivery_fee_unclaimed ON orders(assigned_delivery_agent) WHERE NOT delivery_fee_paid AND delivery_payout_id IS NULL"))
+            # Supplier dashboard and sales report indexes
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_order_items_supplier_order ON order_items(supplier_id, order_id) INCLUDE (quantity, supplier_earnings)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_payment_status_created ON orders(payment_status, created_at)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_returns_order_id ON returns(order_id)"))
+            # Hot order filters: agent queues, COD collections, awaiting confirmation
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_agent_status_created ON orders(assigned_delivery_agent, status, created_at)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_cod_collector ON orders(cod_collected_by, cod_collected_at) WHERE cod_collected_at IS NOT NULL"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_cod_unverified ON orders(cod_collected_at) WHERE cod_collected_at IS NOT NULL AND cod_verified_at IS NULL"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_awaiting_confirmation ON orders(auto_confirm_deadline) WHERE delivery_confirmed_by_agent AND NOT customer_confirmed_delivery AND NOT customer_dispute"))
+            # Orders already listed on an open delivery payout belong to it
+            db.session.execute(text("""
+                UPDATE orders SET delivery_payout_id = p.id
+                FROM delivery_payouts p, json_array_elements_text(p.order_ids) AS claimed(order_id)
+                WHERE orders.id = claimed.order_id AND p.status IN ('pending', 'processing')
+                  AND orders.delivery_payout_id IS NULL AND NOT orders.delivery_fee_paid
+            """))
+            
+            # Create ledger_entries table if not exists (partner balance ledger)
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS ledger_entries (
+                    id VARCHAR(36) PRIMARY KEY,
+                    transaction_id VARCHAR(36) NOT NULL,
+                    account_type VARCHAR(20) NOT NULL,
+                    account_id VARCHAR(36) NOT NULL,
+                    entry_type VARCHAR(20) NOT NULL,
+                    amount NUMERIC(12,2) NOT NULL,
+                    order_id VARCHAR(36) REFERENCES orders(id),
+                    reference VARCHAR(100),
+                    memo VARCHAR(255),
+                    created_by VARCHAR(36) REFERENCES users(id),
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_ledger_entries_transaction_id ON ledger_entries(transaction_id)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_ledger_entries_order_id ON ledger_entries(order_id)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_ledger_entries_account ON ledger_entries(account_type, account_id, created_at)"))
+            
+            # Create delivery_agent_stats table if not exists
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS delivery_agent_stats (
+                    user_id VARCHAR(36) PRIMARY KEY REFERENCES users(id),
+                    pending_deliveries INTEGER NOT NULL DEFAULT 0,
+                    delivered_today INTEGER NOT NULL DEFAULT 0,
+                    cod_collected_today NUMERIC(12,2) NOT NULL DEFAULT 0,
+                    cod_pending_verification NUMERIC(12,2) NOT NULL DEFAULT 0,
+                    stats_date DATE NOT NULL DEFAULT CURRENT_DATE,
+                    reconciled_at TIMESTAMP,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            
+            # Create analytics rollup tables if not exist (daily sales rollups)
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS daily_sales_rollups (
+                    id SERIAL PRIMARY KEY,
+                    day DATE NOT NULL,
+                    hour INTEGER NOT NULL,
+                    product_id VARCHAR(36) NOT NULL,
+                    supplier_id VARCHAR(36) NOT NULL,
+                    category_id VARCHAR(36),
+                    delivery_zone VARCHAR(100) NOT NULL,
+                    payment_method VARCHAR(20) NOT NULL,
+                    revenue NUMERIC(14,2) NOT NULL DEFAULT 0,
+                    commission NUMERIC(14,2) NOT NULL DEFAULT 0,
+                    supplier_earnings NUMERIC(14,2) NOT NULL DEFAULT 0,
+                    items_sold INTEGER NOT NULL DEFAULT 0,
+                    line_count INTEGER NOT NULL DEFAULT 0,
+                    product_orders INTEGER NOT NULL DEFAULT 0,
+                    supplier_orders INTEGER NOT NULL DEFAULT 0,
+                    category_orders INTEGER NOT NULL DEFAULT 0
+                )
+            """))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_daily_sales_rollups_day ON daily_sales_rollups(day)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_daily_sales_rollups_product_id ON daily_sales_rollups(product_id)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_daily_sales_rollups_supplier_day ON daily_sales_rollups(supplier_id, day)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_daily_sales_rollups_category_day ON daily_sales_rollups(category_id, day)"))
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS daily_order_rollups (
+                    id SERIAL PRIMARY KEY,
+                    day DATE NOT NULL,
+                    hour INTEGER NOT NULL,
+                    delivery_zone VARCHAR(100) NOT NULL,
+                    payment_method VARCHAR(20) NOT NULL,
+                    order_count INTEGER NOT NULL DEFAULT 0,
+                    revenue NUMERIC(14,2) NOT NULL DEFAULT 0,
+                    subtotal NUMERIC(14,2) NOT NULL DEFAULT 0,
+                    delivery_fees NUMERIC(14,2) NOT NULL DEFAULT 0,
+                    items_sold INTEGER NOT NULL DEFAULT 0,
+                    commission NUMERIC(14,2) NOT NULL DEFAULT 0,
+                    supplier_earnings NUMERIC(14,2) NOT NULL DEFAULT 0
+                )
+            """))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_daily_order_rollups_day ON daily_order_rollups(day)"))
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS rollup_days (
+                    day DATE PRIMARY KEY,
+                    dirty BOOLEAN NOT NULL DEFAULT TRUE,
+                    refreshed_at TIMESTAMP,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            
+            # Create report_jobs table if not exists (background admin reports)
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS report_jobs (
+                    id VARCHAR(36) PRIMARY KEY,
+                    report_type VARCHAR(50) NOT NULL,
+                    params JSON NOT NULL,
+                    spec_hash VARCHAR(64) NOT NULL,
+                    status VARCHAR(20) NOT NULL DEFAULT 'PENDING',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    result JSON,
+                    requested_by VARCHAR(36) REFERENCES users(id),
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    completed_at TIMESTAMP,
+                    expires_at TIMESTAMP
+                )
+            """))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_report_jobs_spec_hash ON report_jobs(spec_hash, created_at)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_report_jobs_pending ON report_jobs(created_at) WHERE status = 'PENDING'"))
             
             # Update null values
             db.session.execute(text("UPDATE returns SET return_number = 'RET-' || LPAD(id::text, 8, '0') WHERE return_number IS NULL"))
@@ -160,6 +377,27 @@ def create_app(config_name=None):
             db.session.rollback()
             print(f"[Startup Fix] Column fix: {e}")
 
+        # Carry existing partner balances into the ledger (once per account)
+        try:
+            from app.services.ledger_service import ledger_service
+            opened = ledger_service.open_accounts()
+            if opened:
+                print(f"[Startup Fix] ✓ Opened {opened} ledger accounts")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[Startup Fix] Ledger opening balances: {e}")
+
+        # Queue the analytics rollup history on a database that has none yet
+        try:
+            from app.services.rollup_service import rollup_service
+            queued = rollup_service.queue_backfill()
+            db.session.commit()
+            if queued:
+                print(f"[Startup Fix] ✓ Queued {queued} days for analytics rollups")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[Startup Fix] Analytics rollups: {e}")
+
     from app.routes.auth import auth_bp
     from app.routes.contact import contact_bp
     from app.routes.products import products_bp
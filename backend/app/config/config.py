@@ -33,6 +33,26 @@ class Config:
         'pool_size': 5,
         'max_overflow': 10,
     }
+
+    # Optional read replica for analytics, reports and exports (app.services.read_replica).
+    # Its own pool, so heavy reports cannot starve checkout; unset keeps every query on the primary.
+    REPLICA_DATABASE_URL = os.getenv('REPLICA_DATABASE_URL')
+    if REPLICA_DATABASE_URL and REPLICA_DATABASE_URL.startswith('postgres://'):
+        REPLICA_DATABASE_URL = REPLICA_DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+    SQLALCHEMY_BINDS = {
+        'replica': {
+            'url': REPLICA_DATABASE_URL,
+            'pool_pre_ping': True,
+            'pool_recycle': 280,
+            'pool_size': int(os.getenv('REPLICA_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('REPLICA_MAX_OVERFLOW', 5)),
+            # An unreachable replica fails fast, so its lag probe never stalls a request
+            'connect_args': {'connect_timeout': int(os.getenv('REPLICA_CONNECT_TIMEOUT', 3))}
+            if REPLICA_DATABASE_URL.startswith('postgresql') else {},
+        }
+    } if REPLICA_DATABASE_URL else {}
+    REPLICA_MAX_LAG_SECONDS = int(os.getenv('REPLICA_MAX_LAG_SECONDS', 10))  # lagging further falls back to the primary
+    REPLICA_LAG_CHECK_SECONDS = int(os.getenv('REPLICA_LAG_CHECK_SECONDS', 15))  # how long a lag reading is trusted
     
     # JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev-jwt-secret-key-change-in-production')
@@ -66,6 +86,72 @@ class Config:
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
     GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
 
+    # Delivery dispatch - orders are offered to agents in ranked waves
+    DISPATCH_WAVE_SIZE = int(os.getenv('DISPATCH_WAVE_SIZE', 3))  # agents offered per wave
+    DISPATCH_MAX_WAVES = int(os.getenv('DISPATCH_MAX_WAVES', 3))  # waves before escalating to admins
+    DISPATCH_OFFER_TIMEOUT_MINUTES = int(os.getenv('DISPATCH_OFFER_TIMEOUT_MINUTES', 120))  # how long an agent has to accept an offer
+
+    # M-Pesa OAuth token is shared across workers and refreshed this long before expiry
+    MPESA_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv('MPESA_TOKEN_REFRESH_MARGIN_SECONDS', 300))
+
+    # Supplier B2C payout batches
+    PAYOUT_MAX_WORKERS = int(os.getenv('PAYOUT_MAX_WORKERS', 8))  # concurrent B2C requests per batch
+    PAYOUT_B2C_RATE_PER_SECOND = float(os.getenv('PAYOUT_B2C_RATE_PER_SECOND', 5))
+
+    # Provider callbacks are stored on receipt and applied by a background worker
+    INBOUND_EVENT_POLL_SECONDS = int(os.getenv('INBOUND_EVENT_POLL_SECONDS', 10))
+    INBOUND_EVENT_BATCH_SIZE = int(os.getenv('INBOUND_EVENT_BATCH_SIZE', 50))
+    INBOUND_EVENT_MAX_ATTEMPTS = int(os.getenv('INBOUND_EVENT_MAX_ATTEMPTS', 5))
+    INBOUND_EVENT_RETRY_SECONDS = int(os.getenv('INBOUND_EVENT_RETRY_SECONDS', 30))  # multiplied by attempt number
+    WEBHOOK_REPLAY_TTL_SECONDS = int(os.getenv('WEBHOOK_REPLAY_TTL_SECONDS', 86400))  # in-process replay cache
+    WEBHOOK_REPLAY_CACHE_SIZE = int(os.getenv('WEBHOOK_REPLAY_CACHE_SIZE', 10000))
+
+    # Stuck payment reconciliation - pending payments are queried from the provider
+    PAYMENT_RECONCILE_AFTER_MINUTES = int(os.getenv('PAYMENT_RECONCILE_AFTER_MINUTES', 5))  # minimum age before a check
+    PAYMENT_RECONCILE_RECHECK_MINUTES = int(os.getenv('PAYMENT_RECONCILE_RECHECK_MINUTES', 10))
+    PAYMENT_RECONCILE_STALE_HOURS = int(os.getenv('PAYMENT_RECONCILE_STALE_HOURS', 24))  # unresolved payments fail after this
+    PAYMENT_RECONCILE_BATCH_SIZE = int(os.getenv('PAYMENT_RECONCILE_BATCH_SIZE', 100))
+    PAYMENT_RECONCILE_MAX_WORKERS = int(os.getenv('PAYMENT_RECONCILE_MAX_WORKERS', 4))
+    PAYMENT_QUERY_MIN_INTERVAL_SECONDS = int(os.getenv('PAYMENT_QUERY_MIN_INTERVAL_SECONDS', 15))  # client status polls
+
+    # Outbound HTTP (M-Pesa, Paystack, Google, Cloudinary) - pooled sessions per provider
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+    HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 2))  # idempotent calls only
+    HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 0.3))
+    HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', 4.0))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 10))  # keep-alive connections per provider
+    HTTP_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('HTTP_CIRCUIT_FAILURE_THRESHOLD', 5))
+    HTTP_CIRCUIT_RESET_SECONDS = int(os.getenv('HTTP_CIRCUIT_RESET_SECONDS', 30))
+
+    # Geospatial routing - in-process grid indexes over zone boundaries and agent positions
+    GEO_INDEX_CELL_DEGREES = float(os.getenv('GEO_INDEX_CELL_DEGREES', 0.1))  # ~11 km cells
+    GEO_ZONE_INDEX_TTL_SECONDS = int(os.getenv('GEO_ZONE_INDEX_TTL_SECONDS', 300))
+    GEO_AGENT_INDEX_TTL_SECONDS = int(os.getenv('GEO_AGENT_INDEX_TTL_SECONDS', 30))
+    GEO_AGENT_SEARCH_RADIUS_KM = float(os.getenv('GEO_AGENT_SEARCH_RADIUS_KM', 25))
+
+    # Analytics rollups - dirty days rebuilt per refresh run (history backfills in batches of this)
+    ANALYTICS_ROLLUP_BATCH_DAYS = int(os.getenv('ANALYTICS_ROLLUP_BATCH_DAYS', 31))
+
+    # Admin dashboard KPI snapshot - served fresh for this long, then stale while a background refresh runs
+    ADMIN_DASHBOARD_CACHE_SECONDS = int(os.getenv('ADMIN_DASHBOARD_CACHE_SECONDS', 30))
+    ADMIN_DASHBOARD_STALE_SECONDS = int(os.getenv('ADMIN_DASHBOARD_STALE_SECONDS', 600))  # older snapshots are recomputed in the request
+
+    # Rows fetched per server-side cursor batch by the streaming admin exports
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+    # Supplier analytics payload cache, also dropped when the supplier's rollup days are rebuilt
+    SUPPLIER_ANALYTICS_CACHE_SECONDS = int(os.getenv('SUPPLIER_ANALYTICS_CACHE_SECONDS', 300))
+
+    # Returns analytics cache (admin summary and per-supplier stats); committed return changes drop it early
+    RETURNS_ANALYTICS_CACHE_SECONDS = int(os.getenv('RETURNS_ANALYTICS_CACHE_SECONDS', 60))
+
+    # Background admin report jobs (app.services.report_jobs)
+    REPORT_JOB_POLL_SECONDS = int(os.getenv('REPORT_JOB_POLL_SECONDS', 60))  # submissions also wake the worker
+    REPORT_JOB_RESULT_TTL_SECONDS = int(os.getenv('REPORT_JOB_RESULT_TTL_SECONDS', 86400))  # results reused and downloadable until then
+    REPORT_JOB_TIMEOUT_SECONDS = int(os.getenv('REPORT_JOB_TIMEOUT_SECONDS', 1800))  # running longer counts as a dead worker
+    REPORT_JOB_MAX_ATTEMPTS = int(os.getenv('REPORT_JOB_MAX_ATTEMPTS', 2))
+
 
 class DevelopmentConfig(Config):
     """Development configuration."""
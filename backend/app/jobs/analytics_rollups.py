@@ -0,0 +1,49 @@
+"""
+Analytics Rollup Jobs
+
+Keeps the daily sales rollups behind the admin and supplier analytics
+dashboards current:
+1. Every minute, rebuild the days marked dirty by order changes
+2. Nightly, rebuild the last few days to absorb writes made outside the ORM
+"""
+
+from datetime import datetime, timedelta
+from app.models import db
+from app.services.rollup_service import rollup_service
+
+
+# Days rebuilt by the nightly pass, counting today
+RECENT_DAYS = 3
+
+
+def refresh_sales_rollups():
+    """
+    Rebuild the rollups for days with changed orders.
+    Runs every minute via scheduler.
+    """
+    try:
+        days = rollup_service.refresh_dirty()
+        if days:
+            print(f"[{datetime.utcnow()}] ✓ Refreshed analytics rollups for {len(days)} days")
+    except Exception as e:
+        db.session.rollback()
+        print(f"  ✗ Analytics rollup refresh failed: {str(e)}")
+
+
+def rebuild_recent_sales_rollups():
+    """
+    Rebuild the rollups for the last few days from the orders table.
+    Bulk updates skip the dirty-day tracking; this nightly pass catches them.
+    """
+    try:
+        print(f"[{datetime.utcnow()}] Running analytics rollup rebuild...")
+
+        today = datetime.utcnow().date()
+        rollup_service.rebuild(today - timedelta(days=RECENT_DAYS - 1), today)
+        db.session.commit()
+
+        print(f"  ✓ Rebuilt analytics rollups for the last {RECENT_DAYS} days")
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"  ✗ Analytics rollup rebuild failed: {str(e)}")
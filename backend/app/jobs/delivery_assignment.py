@@ -3,23 +3,22 @@ Automated Delivery Assignment Job
 
 This job runs every 5 minutes to:
 1. Find orders in PROCESSING/QUALITY_APPROVED status without delivery assignment
-2. Automatically notify available delivery agents
+2. Offer them to a ranked wave of delivery agents (see dispatch_service)
 3. Ensure orders don't get stuck waiting for admin
 
 This makes the system fully automated and enterprise-level.
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime
 from app.models import db
 from app.models.order import Order, OrderStatus
-from app.models.user import User, DeliveryAgentProfile
-from app.models.delivery_request import DeliveryRequest, DeliveryRequestStatus
-from app.services.notification_service import notification_service
+from app.services.dispatch_service import dispatch_service
+from app.services.agent_stats_service import agent_stats_service
 
 
 def auto_notify_delivery_agents():
     """
-    Automatically notify delivery agents for orders ready for delivery.
+    Offer orders ready for delivery to the first wave of delivery agents.
     Runs every 5 minutes via scheduler.
     """
     try:
@@ -41,67 +40,18 @@ def auto_notify_delivery_agents():
         notified_count = 0
         
         for order in orders:
-            # Check if already notified (has pending delivery requests)
-            existing_requests = DeliveryRequest.query.filter_by(
-                order_id=order.id,
-                status=DeliveryRequestStatus.PENDING
-            ).count()
+            # Offers only go out when the order has no live requests
+            offers = dispatch_service.offer_next_wave(order)
             
-            if existing_requests > 0:
-                print(f"  Order {order.order_number} already has pending requests, skipping")
+            if not offers:
+                print(f"  No agents offered order {order.order_number}")
                 continue
             
-            # Find available agents in delivery zone
-            agents = DeliveryAgentProfile.query.join(User).filter(
-                User.is_active == True,
-                DeliveryAgentProfile.is_available == True
-            ).all()
-            
-            # Filter by zone
-            zone_agents = []
-            for agent in agents:
-                if agent.assigned_zones and order.delivery_zone in agent.assigned_zones:
-                    zone_agents.append(agent)
-            
-            # If no zone-specific agents, use all available
-            if not zone_agents:
-                zone_agents = agents
-            
-            if not zone_agents:
-                print(f"  No available agents for order {order.order_number}")
-                continue
-            
-            # Change status to pending assignment
-            order.status = OrderStatus.PENDING_ASSIGNMENT
-            
-            # Create delivery requests
-            expires_at = datetime.utcnow() + timedelta(hours=2)
-            
-            for agent in zone_agents:
-                delivery_request = DeliveryRequest(
-                    order_id=order.id,
-                    delivery_agent_id=agent.user_id,
-                    expires_at=expires_at
-                )
-                db.session.add(delivery_request)
-                
-                # Notify agent
-                try:
-                    notification_service.create_notification(
-                        user_id=agent.user_id,
-                        title='New Delivery Available',
-                        message=f'Order #{order.order_number} to {order.delivery_zone} - KES {order.delivery_fee} delivery fee. Accept within 2 hours.',
-                        notification_type='info',
-                        link=f'/delivery/available-requests'
-                    )
-                except Exception as e:
-                    print(f"  Failed to notify agent {agent.user_id}: {str(e)}")
-            
             db.session.commit()
             notified_count += 1
-            print(f"  ✓ Notified {len(zone_agents)} agents for order {order.order_number}")
+            print(f"  ✓ Offered order {order.order_number} to {len(offers)} agents (wave {offers[0].wave})")
         
-        print(f"  Completed: Notified agents for {notified_count} orders")
+        print(f"  Completed: Offered {notified_count} orders")
         
     except Exception as e:
         db.session.rollback()
@@ -112,32 +62,17 @@ def auto_notify_delivery_agents():
 
 def expire_old_delivery_requests():
     """
-    Expire delivery requests that have passed their timeout.
-    Runs every 10 minutes via scheduler.
+    Safety-net sweep for delivery requests that have passed their timeout.
+    Requests normally expire on their own deadline via the scheduler's timer
+    wheel; this catches any missed after a restart. Runs every 30 minutes.
     """
     try:
         print(f"[{datetime.utcnow()}] Running expire delivery requests job...")
         
-        expired_count = DeliveryRequest.query.filter(
-            DeliveryRequest.status == DeliveryRequestStatus.PENDING,
-            DeliveryRequest.expires_at <= datetime.utcnow()
-        ).update({'status': DeliveryRequestStatus.EXPIRED})
-        
-        db.session.commit()
+        expired_count, order_ids = dispatch_service.expire_requests()
         
         if expired_count > 0:
-            print(f"  ✓ Expired {expired_count} delivery requests")
-            
-            # Notify admins about expired requests
-            try:
-                notification_service.notify_admins(
-                    title='Delivery Requests Expired',
-                    message=f'{expired_count} delivery requests expired. Manual assignment may be needed.',
-                    notification_type='warning',
-                    link='/admin/orders?status=pending_assignment'
-                )
-            except Exception as e:
-                print(f"  Failed to notify admins: {str(e)}")
+            print(f"  ✓ Expired {expired_count} delivery requests across {len(order_ids)} orders")
         else:
             print("  No expired requests")
             
@@ -146,6 +81,25 @@ def expire_old_delivery_requests():
         print(f"  ✗ Expire requests job failed: {str(e)}")
 
 
+def reconcile_delivery_agent_stats():
+    """
+    Rebuild every agent's dashboard counters from the orders table.
+    Counters are maintained incrementally on each order change; this nightly
+    pass corrects drift from bulk updates and restarts the daily counters.
+    """
+    try:
+        print(f"[{datetime.utcnow()}] Running delivery agent stats reconciliation...")
+        
+        rows = agent_stats_service.reconcile()
+        db.session.commit()
+        
+        print(f"  ✓ Reconciled counters for {len(rows)} delivery agents")
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"  ✗ Agent stats reconciliation failed: {str(e)}")
+
+
 if __name__ == '__main__':
     # For testing
     from app import create_app
@@ -1,3 +1,38 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql import Select
 
-db = SQLAlchemy()
+# SQLALCHEMY_BINDS key of the optional read replica (see app.services.read_replica)
+REPLICA_BIND = 'replica'
+USE_REPLICA = 'use_replica'
+# Set once the session writes inside a replica block; later reads stay on the primary
+REPLICA_WROTE = 'replica_wrote'
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to the replica while session.info[USE_REPLICA]
+    is set. Everything else (flushes, Core insert/update/delete, SELECT ... FOR
+    UPDATE, session.connection()) stays on the primary, and once the session has
+    written or holds pending changes its reads do too, so it reads its own writes.
+    """
+
+    def _reads_from_replica(self, clause):
+        if not self.info.get(USE_REPLICA) or self.info.get(REPLICA_WROTE):
+            return False
+        if self._flushing or (clause is not None and not isinstance(clause, Select)):
+            self.info[REPLICA_WROTE] = True
+            return False
+        if clause is None or clause._for_update_arg is not None:
+            return False
+        return not (self.new or self.dirty or self.deleted)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
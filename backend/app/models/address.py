@@ -18,6 +18,8 @@ class Address(db.Model):
     city = db.Column(db.String(100), nullable=False)
     county = db.Column(db.String(100), nullable=False)
     postal_code = db.Column(db.String(20), nullable=True)
+    latitude = db.Column(db.Float, nullable=True)  # Optional pin for geospatial zone routing
+    longitude = db.Column(db.Float, nullable=True)
     is_default = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -25,6 +27,11 @@ class Address(db.Model):
     # Relationships
     orders = db.relationship('Order', lazy='dynamic', foreign_keys='Order.delivery_address_id', overlaps="delivery_address")
     
+    @property
+    def has_coordinates(self):
+        """Whether the address has a map pin."""
+        return self.latitude is not None and self.longitude is not None
+    
     def to_dict(self):
         """Convert address to dictionary."""
         return {
@@ -37,6 +44,8 @@ class Address(db.Model):
             'city': self.city,
             'county': self.county,
             'postal_code': self.postal_code,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
             'is_default': self.is_default
         }
     
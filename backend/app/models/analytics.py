@@ -0,0 +1,77 @@
+"""Pre-aggregated sales rollups read by the analytics dashboards."""
+from datetime import datetime
+from app.models import db
+from app.models.order import PaymentMethod
+
+
+class DailySalesRollup(db.Model):
+    """
+    Completed order items summed per day, hour, product, zone and payment method.
+    Supplier and category ride along with the product. The *_orders columns
+    count each order once per supplier / category, so they can be summed
+    along those dimensions without double counting.
+    """
+
+    __tablename__ = 'daily_sales_rollups'
+    __table_args__ = (
+        db.Index('ix_daily_sales_rollups_supplier_day', 'supplier_id', 'day'),
+        db.Index('ix_daily_sales_rollups_category_day', 'category_id', 'day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    hour = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.String(36), nullable=False, index=True)
+    supplier_id = db.Column(db.String(36), nullable=False)
+    category_id = db.Column(db.String(36), nullable=True)
+    delivery_zone = db.Column(db.String(100), nullable=False)
+    payment_method = db.Column(db.Enum(PaymentMethod, native_enum=False, length=20), nullable=False)
+
+    revenue = db.Column(db.Numeric(14, 2), default=0, nullable=False)  # Item subtotals
+    commission = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    supplier_earnings = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    items_sold = db.Column(db.Integer, default=0, nullable=False)  # Units
+    line_count = db.Column(db.Integer, default=0, nullable=False)  # Order item rows
+    product_orders = db.Column(db.Integer, default=0, nullable=False)
+    supplier_orders = db.Column(db.Integer, default=0, nullable=False)
+    category_orders = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<DailySalesRollup {self.day} {self.product_id}>'
+
+
+class DailyOrderRollup(db.Model):
+    """Completed orders summed per day, hour, zone and payment method."""
+
+    __tablename__ = 'daily_order_rollups'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    hour = db.Column(db.Integer, nullable=False)
+    delivery_zone = db.Column(db.String(100), nullable=False)
+    payment_method = db.Column(db.Enum(PaymentMethod, native_enum=False, length=20), nullable=False)
+
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Numeric(14, 2), default=0, nullable=False)  # Order totals
+    subtotal = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    delivery_fees = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    items_sold = db.Column(db.Integer, default=0, nullable=False)
+    commission = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    supplier_earnings = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<DailyOrderRollup {self.day} {self.delivery_zone}>'
+
+
+class RollupDay(db.Model):
+    """A day covered by the rollups; dirty until its rows are rebuilt from the orders."""
+
+    __tablename__ = 'rollup_days'
+
+    day = db.Column(db.Date, primary_key=True)
+    dirty = db.Column(db.Boolean, default=True, nullable=False)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<RollupDay {self.day} dirty={self.dirty}>'
@@ -0,0 +1,35 @@
+from datetime import datetime
+from app.models import db
+
+
+class DeliveryAgentStats(db.Model):
+    """Rolling dashboard counters for a delivery agent (one row per agent)."""
+
+    __tablename__ = 'delivery_agent_stats'
+
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), primary_key=True)
+
+    # Maintained on every order flush, rebuilt nightly by reconciliation
+    pending_deliveries = db.Column(db.Integer, default=0, nullable=False)
+    delivered_today = db.Column(db.Integer, default=0, nullable=False)
+    cod_collected_today = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    cod_pending_verification = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+
+    # Day the *_today counters belong to; a new day starts them from zero
+    stats_date = db.Column(db.Date, nullable=False)
+
+    reconciled_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        """Convert counters to dictionary, zeroing daily counters from a previous day."""
+        is_today = self.stats_date == datetime.utcnow().date()
+        return {
+            'pending_deliveries': self.pending_deliveries,
+            'delivered_today': self.delivered_today if is_today else 0,
+            'cod_collected_today': float(self.cod_collected_today) if is_today else 0.0,
+            'cod_pending_verification': float(self.cod_pending_verification),
+        }
+
+    def __repr__(self):
+        return f'<DeliveryAgentStats {self.user_id}>'
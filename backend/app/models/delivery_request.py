@@ -23,6 +23,7 @@ class DeliveryRequest(db.Model):
     delivery_agent_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
     
     status = db.Column(db.Enum(DeliveryRequestStatus), default=DeliveryRequestStatus.PENDING, nullable=False, index=True)
+    wave = db.Column(db.Integer, default=1, nullable=False)  # Dispatch wave this offer belongs to
     
     # Response tracking
     responded_at = db.Column(db.DateTime, nullable=True)
@@ -67,6 +68,7 @@ class DeliveryRequest(db.Model):
             'order_id': self.order_id,
             'delivery_agent_id': self.delivery_agent_id,
             'status': self.status.value,
+            'wave': self.wave,
             'responded_at': self.responded_at.isoformat() if self.responded_at else None,
             'rejection_reason': self.rejection_reason,
             'expires_at': self.expires_at.isoformat() if self.expires_at else None,
@@ -0,0 +1,60 @@
+"""Inbound provider callback model."""
+import uuid
+from datetime import datetime
+from enum import Enum
+from app.models import db
+
+
+class InboundEventStatus(str, Enum):
+    """Inbound event status enumeration."""
+    PENDING = 'pending'  # Stored, waiting for the worker
+    PROCESSED = 'processed'  # Applied to its order/payout
+    IGNORED = 'ignored'  # Nothing to apply (unknown reference or already applied)
+    FAILED = 'failed'  # Gave up after the maximum number of attempts
+
+
+class InboundEvent(db.Model):
+    """Provider callback stored on receipt and applied later by the inbound event worker."""
+
+    __tablename__ = 'inbound_events'
+    __table_args__ = (
+        # Provider retries of the same callback are stored once
+        db.UniqueConstraint('provider', 'event_type', 'reference', name='uq_inbound_events_reference'),
+        # The worker only ever scans events still waiting to be applied
+        db.Index(
+            'ix_inbound_events_pending',
+            'available_at',
+            postgresql_where=db.text("status = 'PENDING'")
+        ),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    provider = db.Column(db.String(20), nullable=False)  # mpesa
+    event_type = db.Column(db.String(50), nullable=False)  # stk_callback, b2c_result, b2c_timeout
+    reference = db.Column(db.String(100), nullable=True)  # CheckoutRequestID / ConversationID
+    payload = db.Column(db.JSON, nullable=False)
+
+    status = db.Column(db.Enum(InboundEventStatus), default=InboundEventStatus.PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Retry backoff
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        """Convert to dictionary."""
+        return {
+            'id': self.id,
+            'provider': self.provider,
+            'event_type': self.event_type,
+            'reference': self.reference,
+            'status': self.status.value if self.status else None,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
+
+    def __repr__(self):
+        return f'<InboundEvent {self.provider}:{self.event_type} {self.reference}>'
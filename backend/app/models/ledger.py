@@ -0,0 +1,60 @@
+"""Double-entry balance ledger model."""
+import uuid
+from datetime import datetime
+from enum import Enum
+from app.models import db
+
+
+class LedgerEntryType(str, Enum):
+    """Ledger entry type enumeration."""
+    OPENING = 'opening'  # Balance carried over from before the ledger
+    EARNING = 'earning'  # Owed to the account (sale, delivery fee)
+    DEDUCTION = 'deduction'  # Clawed back from the account
+    PAYOUT = 'payout'  # Paid out to the account
+    REFUND = 'refund'  # Account's share of a customer refund
+
+
+class LedgerEntry(db.Model):
+    """
+    One leg of a balance transaction. Every transaction posts an owner leg
+    (supplier, agent or company) and a platform leg that sum to zero.
+    Entries are append-only; corrections are new entries.
+    """
+
+    __tablename__ = 'ledger_entries'
+    __table_args__ = (
+        db.Index('ix_ledger_entries_account', 'account_type', 'account_id', 'created_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    transaction_id = db.Column(db.String(36), nullable=False, index=True)
+
+    account_type = db.Column(db.String(20), nullable=False)  # supplier, agent, company, platform
+    account_id = db.Column(db.String(36), nullable=False)  # Profile id, or platform account name
+    entry_type = db.Column(db.Enum(LedgerEntryType), nullable=False)
+    amount = db.Column(db.Numeric(12, 2), nullable=False)  # Signed; positive raises what the account is owed
+
+    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=True, index=True)
+    reference = db.Column(db.String(100), nullable=True)  # Payout / return / payment reference
+    memo = db.Column(db.String(255), nullable=True)
+    created_by = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        """Convert to dictionary."""
+        return {
+            'id': self.id,
+            'transaction_id': self.transaction_id,
+            'account_type': self.account_type,
+            'account_id': self.account_id,
+            'entry_type': self.entry_type.value if self.entry_type else None,
+            'amount': float(self.amount),
+            'order_id': self.order_id,
+            'reference': self.reference,
+            'memo': self.memo,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<LedgerEntry {self.entry_type} {self.account_type}:{self.account_id} {self.amount}>'
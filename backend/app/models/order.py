@@ -2,6 +2,7 @@ import uuid
 from datetime import datetime
 from enum import Enum
 from datetime import timedelta
+from sqlalchemy import update
 from app.models import db
 
 
@@ -39,6 +40,54 @@ class Order(db.Model):
     """Order model."""
 
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Only delivered orders still waiting on the customer are indexed,
+        # so the auto-confirm job scans due rows rather than the whole table
+        db.Index(
+            'ix_orders_auto_confirm_due',
+            'auto_confirm_deadline',
+            postgresql_where=db.text(
+                'delivery_confirmed_by_agent AND NOT customer_confirmed_delivery '
+                'AND NOT customer_dispute AND NOT auto_confirmed'
+            )
+        ),
+        # Unpaid orders only, for the payment reconciliation job
+        db.Index(
+            'ix_orders_payment_pending',
+            'created_at',
+            postgresql_where=db.text("payment_status = 'PENDING'")
+        ),
+        # Confirmed deliveries not yet in a payout, grouped per agent by payout generation
+        db.Index(
+            'ix_orders_delivery_fee_unclaimed',
+            'assigned_delivery_agent',
+            postgresql_where=db.text('NOT delivery_fee_paid AND delivery_payout_id IS NULL')
+        ),
+        # Paid orders by date, for the sales dashboards and reports
+        db.Index('ix_orders_payment_status_created', 'payment_status', 'created_at'),
+        # An agent's orders by status, newest first (also serves agent-only lookups)
+        db.Index('ix_orders_agent_status_created', 'assigned_delivery_agent', 'status', 'created_at'),
+        # Cash an agent has collected, by collection time
+        db.Index(
+            'ix_orders_cod_collector',
+            'cod_collected_by', 'cod_collected_at',
+            postgresql_where=db.text('cod_collected_at IS NOT NULL')
+        ),
+        # Collected cash still waiting for admin verification
+        db.Index(
+            'ix_orders_cod_unverified',
+            'cod_collected_at',
+            postgresql_where=db.text('cod_collected_at IS NOT NULL AND cod_verified_at IS NULL')
+        ),
+        # Delivered orders awaiting the customer, for the admin confirmations list
+        db.Index(
+            'ix_orders_awaiting_confirmation',
+            'auto_confirm_deadline',
+            postgresql_where=db.text(
+                'delivery_confirmed_by_agent AND NOT customer_confirmed_delivery AND NOT customer_dispute'
+            )
+        ),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     order_number = db.Column(db.String(50), unique=True, nullable=False, index=True)
@@ -57,8 +106,9 @@ class Order(db.Model):
     # Payment
     payment_method = db.Column(db.Enum(PaymentMethod), nullable=False)
     payment_status = db.Column(db.Enum(PaymentStatus), default=PaymentStatus.PENDING, nullable=False)
-    payment_reference = db.Column(db.String(100), nullable=True)  # M-Pesa/Card reference
+    payment_reference = db.Column(db.String(100), nullable=True, index=True)  # M-Pesa/Card reference
     paid_at = db.Column(db.DateTime, nullable=True)
+    payment_checked_at = db.Column(db.DateTime, nullable=True)  # Last provider status query
 
     # COD (Cash on Delivery) specific fields
     cod_collected_by = db.Column(db.String(36), nullable=True)  # Delivery person who collected cash
@@ -68,7 +118,7 @@ class Order(db.Model):
     cod_verified_at = db.Column(db.DateTime, nullable=True)  # When COD was verified
 
     # Delivery assignment
-    assigned_delivery_agent = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True, index=True)
+    assigned_delivery_agent = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)  # Indexed by ix_orders_agent_status_created
     assigned_delivery_company = db.Column(db.String(36), db.ForeignKey('delivery_companies.id'), nullable=True)
 
     # Delivery confirmation workflow
@@ -92,6 +142,7 @@ class Order(db.Model):
     delivery_fee_paid = db.Column(db.Boolean, default=False, nullable=False)
     delivery_fee_paid_at = db.Column(db.DateTime, nullable=True)
     delivery_payment_reference = db.Column(db.String(100), nullable=True)
+    delivery_payout_id = db.Column(db.String(36), db.ForeignKey('delivery_payouts.id'), nullable=True, index=True)  # Payout that claimed the fee
 
     # Order status
     status = db.Column(db.Enum(OrderStatus), default=OrderStatus.PENDING, nullable=False, index=True)
@@ -168,6 +219,33 @@ class Order(db.Model):
             return True
         return False
 
+    @staticmethod
+    def auto_confirm_due_deliveries(now=None):
+        """
+        Auto-confirm every delivery past its deadline in a single UPDATE.
+        Mirrors auto_confirm_delivery() and returns the confirmed order IDs.
+        """
+        now = now or datetime.utcnow()
+        stmt = (
+            update(Order)
+            .where(
+                Order.delivery_confirmed_by_agent == True,
+                Order.customer_confirmed_delivery == False,
+                Order.customer_dispute == False,
+                Order.auto_confirmed == False,
+                Order.auto_confirm_deadline <= now
+            )
+            .values(
+                auto_confirmed=True,
+                customer_confirmed_delivery=True,
+                customer_confirmed_at=now,
+                updated_at=now
+            )
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        )
+        return [row[0] for row in db.session.execute(stmt)]
+
     def is_delivery_confirmed(self):
         """Check if delivery is confirmed (by customer or auto)."""
         return self.customer_confirmed_delivery or self.auto_confirmed
@@ -236,6 +314,7 @@ class Order(db.Model):
             'delivery_fee_paid': self.delivery_fee_paid,
             'delivery_fee_paid_at': self.delivery_fee_paid_at.isoformat() if self.delivery_fee_paid_at else None,
             'delivery_payment_reference': self.delivery_payment_reference,
+            'delivery_payout_id': self.delivery_payout_id,
             'is_delivery_confirmed': self.is_delivery_confirmed(),
         }
 
@@ -253,6 +332,12 @@ class OrderItem(db.Model):
     """Order item model."""
     
     __tablename__ = 'order_items'
+    __table_args__ = (
+        # A supplier's items per order; the included columns let the supplier
+        # dashboard sum quantities and earnings from the index alone
+        db.Index('ix_order_items_supplier_order', 'supplier_id', 'order_id',
+                 postgresql_include=['quantity', 'supplier_earnings']),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False, index=True)
@@ -318,6 +403,13 @@ class DeliveryZone(db.Model):
     delivery_fee = db.Column(db.Numeric(10, 2), nullable=False)
     estimated_days = db.Column(db.Integer, nullable=False)  # Estimated delivery days
     is_active = db.Column(db.Boolean, default=True, nullable=False)
+    
+    # Optional geometry: GeoJSON Polygon/MultiPolygon ([lng, lat] positions)
+    boundary = db.Column(db.JSON, nullable=True)
+    hub_latitude = db.Column(db.Float, nullable=True)  # Dispatch hub for distance-based fees
+    hub_longitude = db.Column(db.Float, nullable=True)
+    fee_per_km = db.Column(db.Numeric(10, 2), nullable=True)  # Added to delivery_fee per km from hub
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     def to_dict(self):
@@ -329,6 +421,10 @@ class DeliveryZone(db.Model):
             'delivery_fee': float(self.delivery_fee),
             'estimated_days': self.estimated_days,
             'is_active': self.is_active,
+            'boundary': self.boundary,
+            'hub_latitude': self.hub_latitude,
+            'hub_longitude': self.hub_longitude,
+            'fee_per_km': float(self.fee_per_km) if self.fee_per_km is not None else None,
         }
     
     def __repr__(self):
@@ -0,0 +1,16 @@
+"""Shared provider access token model."""
+from app.models import db
+from datetime import datetime
+
+
+class ProviderToken(db.Model):
+    """Short-lived OAuth access token shared by every worker process (one row per provider/credential)."""
+    __tablename__ = 'provider_tokens'
+    
+    key = db.Column(db.String(100), primary_key=True)  # e.g. mpesa:sandbox:<credential hash>
+    token = db.Column(db.Text, nullable=False, default='')
+    expires_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<ProviderToken {self.key}>'
@@ -0,0 +1,68 @@
+"""Background report job model."""
+import uuid
+from datetime import datetime
+from enum import Enum
+from app.models import db
+
+
+class ReportJobStatus(str, Enum):
+    """Report job status enumeration."""
+    PENDING = 'pending'  # Submitted, waiting for the worker
+    RUNNING = 'running'  # Claimed by a worker
+    COMPLETED = 'completed'  # Result stored until expires_at
+    FAILED = 'failed'  # Gave up after the maximum number of attempts
+
+
+class ReportJob(db.Model):
+    """A long-running admin report computed by the report worker, with its stored result."""
+
+    __tablename__ = 'report_jobs'
+    __table_args__ = (
+        # Identical specs are looked up to reuse a queued, running or fresh result
+        db.Index('ix_report_jobs_spec_hash', 'spec_hash', 'created_at'),
+        # The worker only ever scans jobs still waiting to run
+        db.Index(
+            'ix_report_jobs_pending',
+            'created_at',
+            postgresql_where=db.text("status = 'PENDING'")
+        ),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    report_type = db.Column(db.String(50), nullable=False)  # financial
+    params = db.Column(db.JSON, nullable=False)  # Normalised report parameters
+    spec_hash = db.Column(db.String(64), nullable=False)  # sha256 of report_type + params
+
+    status = db.Column(db.Enum(ReportJobStatus), default=ReportJobStatus.PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+
+    requested_by = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)  # Result is purged after this
+
+    @property
+    def is_expired(self):
+        return self.expires_at is not None and self.expires_at <= datetime.utcnow()
+
+    def to_dict(self):
+        """Convert to dictionary (without the result)."""
+        return {
+            'id': self.id,
+            'report_type': self.report_type,
+            'params': self.params,
+            'status': self.status.value if self.status else None,
+            'attempts': self.attempts,
+            'error': self.error,
+            'requested_by': self.requested_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+    def __repr__(self):
+        return f'<ReportJob {self.report_type} {self.status}>'
@@ -1,4 +1,5 @@
 import uuid
+from sqlalchemy import or_
 from app.models import db
 from datetime import datetime
 from enum import Enum
@@ -27,7 +28,7 @@ class Return(db.Model):
     __tablename__ = 'returns'
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False, index=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     order_item_id = db.Column(db.String(36), db.ForeignKey('order_items.id'), nullable=True)
     customer_id = db.Column(db.String(36), db.ForeignKey('customer_profiles.id'), nullable=True)
@@ -88,22 +89,61 @@ class Return(db.Model):
         ).count() + 1
         self.return_number = f'RET-{date_str}-{count:04d}'
 
-    def get_item_total(self):
+    @staticmethod
+    def load_related(returns):
+        """
+        Order items, order numbers and customer details for a batch of
+        returns, in three queries however many returns there are.
+        """
+        from app.models.order import Order, OrderItem
+        from app.models.user import User, CustomerProfile
+
+        item_ids = {r.order_item_id for r in returns if r.order_item_id}
+        order_ids = {r.order_id for r in returns if r.order_id}
+        customer_ids = {r.customer_id for r in returns if r.customer_id}
+        related = {'items': {}, 'order_items': {}, 'order_numbers': {}, 'customers': {}}
+
+        if item_ids or order_ids:
+            for item in OrderItem.query.filter(or_(OrderItem.id.in_(item_ids), OrderItem.order_id.in_(order_ids))):
+                related['items'][item.id] = item
+                related['order_items'].setdefault(item.order_id, []).append(item)
+        if order_ids:
+            related['order_numbers'] = dict(
+                db.session.query(Order.id, Order.order_number).filter(Order.id.in_(order_ids))
+            )
+        if customer_ids:
+            related['customers'] = {row.id: row for row in db.session.query(
+                CustomerProfile.id, CustomerProfile.first_name, CustomerProfile.last_name,
+                CustomerProfile.phone_number, User.email
+            ).outerjoin(User, User.id == CustomerProfile.user_id).filter(CustomerProfile.id.in_(customer_ids))}
+        return related
+
+    @classmethod
+    def serialize_many(cls, returns):
+        """to_dict() for a list of returns with their related rows loaded up front."""
+        related = cls.load_related(returns)
+        return [r.to_dict(related) for r in returns]
+
+    def _order_item(self, related, any_item):
+        """
+        The returned order item: order_item_id, else the order's item for
+        product_id, else (when any_item, or without a product) its first item.
+        """
+        item = related['items'].get(self.order_item_id) if self.order_item_id else None
+        if item or not self.order_id:
+            return item
+        items = related['order_items'].get(self.order_id, [])
+        if self.product_id:
+            item = next((i for i in items if i.product_id == self.product_id), None)
+            if item or not any_item:
+                return item
+        return items[0] if items else None
+
+    def get_item_total(self, related=None):
         """Get the total value of the returned item(s)."""
-        from app.models.order import OrderItem
-        # Try specific order_item first
-        if self.order_item_id:
-            oi = OrderItem.query.get(self.order_item_id)
-            if oi:
-                return float(oi.product_price) * (self.quantity or oi.quantity)
-        # Fallback: find item from the order
-        if self.order_id:
-            if self.product_id:
-                oi = OrderItem.query.filter_by(order_id=self.order_id, product_id=self.product_id).first()
-            else:
-                oi = OrderItem.query.filter_by(order_id=self.order_id).first()
-            if oi:
-                return float(oi.product_price) * (self.quantity or oi.quantity)
+        oi = self._order_item(related or self.load_related([self]), any_item=False)
+        if oi:
+            return float(oi.product_price) * (self.quantity or oi.quantity)
         return 0
 
     def calculate_refund(self, policy=None):
@@ -141,42 +181,31 @@ class Return(db.Model):
 
         self.refund_amount = item_total
 
-    def to_dict(self):
+    def to_dict(self, related=None):
         refund_amount = float(self.refund_amount) if self.refund_amount else 0
 
         # Derive display names and item price
+        related = related or self.load_related([self])
         product_name = None
         customer_name = None
         customer_email = None
         customer_phone = None
-        order_number = None
         item_price = 0
         item_subtotal = 0
-        from app.models.order import OrderItem, Order
-        oi = None
-        if self.order_item_id:
-            oi = OrderItem.query.get(self.order_item_id)
-        if not oi and self.order_id:
-            if self.product_id:
-                oi = OrderItem.query.filter_by(order_id=self.order_id, product_id=self.product_id).first()
-            if not oi:
-                oi = OrderItem.query.filter_by(order_id=self.order_id).first()
+        oi = self._order_item(related, any_item=True)
         if oi:
             product_name = oi.product_name
             item_price = float(oi.product_price) if oi.product_price else 0
             item_subtotal = item_price * (self.quantity or oi.quantity)
         
         # Get customer and order info
-        if self.customer:
-            customer_name = f"{self.customer.first_name} {self.customer.last_name}"
-            customer_phone = self.customer.phone_number
-            if self.customer.user:
-                customer_email = self.customer.user.email
+        customer = related['customers'].get(self.customer_id)
+        if customer:
+            customer_name = f"{customer.first_name} {customer.last_name}"
+            customer_phone = customer.phone_number
+            customer_email = customer.email
         
-        if self.order_id:
-            order = Order.query.get(self.order_id)
-            if order:
-                order_number = order.order_number
+        order_number = related['order_numbers'].get(self.order_id)
 
         # Use item_subtotal as fallback for refund_amount display
         display_refund = refund_amount if refund_amount > 0 else item_subtotal
@@ -240,8 +269,9 @@ class SupplierPayout(db.Model):
     net_amount = db.Column(db.Numeric(10, 2), nullable=True)
     status = db.Column(db.String(50), default='pending', nullable=False)
     payment_reference = db.Column(db.String(100), nullable=True)
-    reference = db.Column(db.String(100), nullable=True)
+    reference = db.Column(db.String(100), nullable=True, index=True)  # B2C ConversationID, matched by the result callback
     notes = db.Column(db.Text, nullable=True)
+    batch_id = db.Column(db.String(36), db.ForeignKey('payout_batches.id'), nullable=True, index=True)  # Last B2C batch
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     paid_at = db.Column(db.DateTime, nullable=True)
 
@@ -268,11 +298,53 @@ class SupplierPayout(db.Model):
             'payment_reference': self.payment_reference or self.reference,
             'reference': self.reference,
             'notes': self.notes,
+            'batch_id': self.batch_id,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'paid_at': self.paid_at.isoformat() if self.paid_at else None
         }
 
 
+class PayoutBatchStatus(str, Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+
+class PayoutBatch(db.Model):
+    """A background run of M-Pesa B2C payments for a set of supplier payouts."""
+    __tablename__ = 'payout_batches'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    source = db.Column(db.String(20), default='admin', nullable=False)  # admin, scheduler
+    status = db.Column(db.Enum(PayoutBatchStatus), default=PayoutBatchStatus.QUEUED, nullable=False)
+    total_count = db.Column(db.Integer, default=0, nullable=False)
+    submitted_count = db.Column(db.Integer, default=0, nullable=False)  # Accepted by M-Pesa
+    failed_count = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    payouts = db.relationship('SupplierPayout', backref='batch', lazy='dynamic')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'source': self.source,
+            'status': self.status.value if self.status else None,
+            'total_count': self.total_count,
+            'submitted_count': self.submitted_count,
+            'failed_count': self.failed_count,
+            'remaining_count': max(self.total_count - self.submitted_count - self.failed_count, 0),
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
 class DeliveryPayoutType(str, Enum):
     """Type of delivery payout recipient."""
     AGENT = 'agent'  # Individual delivery agent
@@ -321,14 +393,15 @@ class DeliveryPayout(db.Model):
     delivery_agent = db.relationship('DeliveryAgentProfile', backref=db.backref('payouts', lazy='dynamic'))
     delivery_company = db.relationship('DeliveryCompany', backref=db.backref('payouts', lazy='dynamic'))
 
-    def generate_payout_number(self):
-        """Generate unique payout number."""
+    def generate_payout_number(self, sequence=None):
+        """Generate unique payout number. Bulk inserts pass today's sequence instead of counting per payout."""
         date_str = datetime.utcnow().strftime('%Y%m%d')
-        count = DeliveryPayout.query.filter(
-            DeliveryPayout.created_at >= datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        ).count() + 1
+        if sequence is None:
+            sequence = DeliveryPayout.query.filter(
+                DeliveryPayout.created_at >= datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            ).count() + 1
         prefix = 'DPA' if self.payout_type == DeliveryPayoutType.AGENT else 'DPC'
-        self.payout_number = f'{prefix}-{date_str}-{count:04d}'
+        self.payout_number = f'{prefix}-{date_str}-{sequence:04d}'
 
     def to_dict(self):
         """Convert to dictionary."""
@@ -145,6 +145,11 @@ class SupplierProfile(db.Model):
     """Supplier profile"""
 
     __tablename__ = 'supplier_profiles'
+    __table_args__ = (
+        # Admin phone change review queue, newest request first within a status
+        db.Index('ix_supplier_profiles_phone_change_queue',
+                 'payment_phone_change_status', 'payment_phone_change_requested_at', 'id'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, unique=True)
@@ -181,28 +186,47 @@ class SupplierProfile(db.Model):
         self.payment_phone_change_reviewed_at = None
         self.payment_phone_change_reviewed_by = None
 
-    def approve_payment_phone_change(self, admin_id):
-        """Approve phone change"""
-        if self.payment_phone_pending and self.payment_phone_change_status == PaymentPhoneChangeStatus.PENDING:
-            self.mpesa_number = self.payment_phone_pending
-            self.payment_phone_pending = None
-            self.payment_phone_change_status = PaymentPhoneChangeStatus.APPROVED
-            self.payment_phone_change_reviewed_at = datetime.utcnow()
-            self.payment_phone_change_reviewed_by = admin_id
-            return True
-        return False
-
-    def reject_payment_phone_change(self, admin_id, reason=None):
-        """Reject phone change"""
-        if self.payment_phone_change_status == PaymentPhoneChangeStatus.PENDING:
-            self.payment_phone_pending = None
-            self.payment_phone_change_status = PaymentPhoneChangeStatus.REJECTED
-            self.payment_phone_change_reviewed_at = datetime.utcnow()
-            self.payment_phone_change_reviewed_by = admin_id
-            if reason:
-                self.payment_phone_change_reason = reason
-            return True
-        return False
+    @classmethod
+    def approve_payment_phone_changes(cls, supplier_ids, admin_id):
+        """
+        Approve many pending phone changes in one UPDATE.
+        Returns (id, user_id, mpesa_number) for the requests that were still pending.
+        """
+        return db.session.execute(
+            db.update(cls).where(
+                cls.id.in_(supplier_ids),
+                cls.payment_phone_change_status == PaymentPhoneChangeStatus.PENDING,
+                cls.payment_phone_pending.isnot(None)
+            ).values(
+                mpesa_number=cls.payment_phone_pending,
+                payment_phone_pending=None,
+                payment_phone_change_status=PaymentPhoneChangeStatus.APPROVED,
+                payment_phone_change_reviewed_at=datetime.utcnow(),
+                payment_phone_change_reviewed_by=admin_id
+            ).returning(cls.id, cls.user_id, cls.mpesa_number).execution_options(synchronize_session='fetch')
+        ).all()
+
+    @classmethod
+    def reject_payment_phone_changes(cls, supplier_ids, admin_id, reason=None):
+        """
+        Reject many pending phone changes in one UPDATE.
+        Returns (id, user_id, mpesa_number) for the requests that were still pending.
+        """
+        values = {
+            'payment_phone_pending': None,
+            'payment_phone_change_status': PaymentPhoneChangeStatus.REJECTED,
+            'payment_phone_change_reviewed_at': datetime.utcnow(),
+            'payment_phone_change_reviewed_by': admin_id,
+        }
+        if reason:
+            values['payment_phone_change_reason'] = reason
+        return db.session.execute(
+            db.update(cls).where(
+                cls.id.in_(supplier_ids),
+                cls.payment_phone_change_status == PaymentPhoneChangeStatus.PENDING
+            ).values(**values).returning(cls.id, cls.user_id, cls.mpesa_number)
+            .execution_options(synchronize_session='fetch')
+        ).all()
 
     def to_dict(self):
         """Convert to dict"""
@@ -279,6 +303,9 @@ class DeliveryAgentProfile(db.Model):
     vehicle_registration = db.Column(db.String(20), nullable=True)
     assigned_zones = db.Column(db.JSON, nullable=True)  # List of delivery zone IDs
     is_available = db.Column(db.Boolean, default=True, nullable=False)
+    current_latitude = db.Column(db.Float, nullable=True)  # Last reported position
+    current_longitude = db.Column(db.Float, nullable=True)
+    location_updated_at = db.Column(db.DateTime, nullable=True)
     total_deliveries = db.Column(db.Integer, default=0, nullable=False)
     total_cod_collected = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
 
@@ -308,6 +335,9 @@ class DeliveryAgentProfile(db.Model):
             'vehicle_registration': self.vehicle_registration,
             'assigned_zones': self.assigned_zones,
             'is_available': self.is_available,
+            'current_latitude': self.current_latitude,
+            'current_longitude': self.current_longitude,
+            'location_updated_at': self.location_updated_at.isoformat() if self.location_updated_at else None,
             'total_deliveries': self.total_deliveries,
             'total_cod_collected': float(self.total_cod_collected),
             'partner_type': self.partner_type.value if self.partner_type else 'in_house',
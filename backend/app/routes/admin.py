@@ -1,15 +1,27 @@
-from flask import Blueprint, request, current_app
+import json
+from flask import Blueprint, Response, request, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc, case
+from sqlalchemy import Float, cast, func, desc, case, tuple_
 from app.models import db
 from app.models.user import User, UserRole, SupplierProfile, PaymentPhoneChangeStatus
 from app.models.order import Order, OrderItem, OrderStatus, DeliveryZone, PaymentMethod, PaymentStatus
 from app.models.product import Product, Category, Brand
 from app.models.returns import Return, SupplierPayout, ReturnStatus, RefundPolicy
+from app.models.analytics import DailySalesRollup, DailyOrderRollup
+from app.models.report_job import ReportJob, ReportJobStatus
 from app.utils.validation import validate_required_fields
 from app.utils.responses import success_response, error_response
+from app.utils.pagination import encode_cursor, decode_cursor
 from app.services.mpesa_service import mpesa_service
+from app.services.ledger_service import ledger_service
+from app.services.financial_report import financial_report_service
+from app.services.dashboard_service import dashboard_service
+from app.services.export_service import export_service, FORMATS
+from app.services.returns_analytics import returns_analytics_service
+from app.services.read_replica import reads_from_replica, replica_reads
+from app.services.report_jobs import report_job_service, render_csv
+from app.services.geo_service import geo_service, parse_boundary, parse_coordinates
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
@@ -34,80 +46,7 @@ def require_admin(func):
 def get_dashboard():
     """Get admin dashboard with KPIs."""
     try:
-        # Users
-        total_users = User.query.count()
-        customers = User.query.filter_by(role=UserRole.CUSTOMER).count()
-        suppliers = User.query.filter_by(role=UserRole.SUPPLIER).count()
-        pending_suppliers = SupplierProfile.query.filter_by(is_approved=False).count()
-        
-        # Products
-        total_products = Product.query.count()
-        active_products = Product.query.filter_by(is_active=True).count()
-        low_stock = Product.query.filter(
-            Product.is_active == True,
-            Product.stock_quantity <= 10
-        ).count()
-        
-        # Orders
-        total_orders = Order.query.count()
-        pending_orders = Order.query.filter_by(status=OrderStatus.PENDING).count()
-        paid_orders = Order.query.filter_by(payment_status=PaymentStatus.COMPLETED).count()
-        
-        # Revenue (completed payments only)
-        total_revenue = db.session.query(func.sum(Order.total))\
-            .filter(Order.payment_status == PaymentStatus.COMPLETED).scalar() or 0
-        
-        # This month revenue
-        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        month_revenue = db.session.query(func.sum(Order.total))\
-            .filter(
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= month_start
-            ).scalar() or 0
-        
-        # Platform commission (25% of total)
-        try:
-            platform_earnings = db.session.query(func.sum(OrderItem.platform_commission))\
-                .join(Order)\
-                .filter(Order.payment_status == PaymentStatus.COMPLETED).scalar() or 0
-        except Exception:
-            # Fallback if column doesn't exist yet
-            platform_earnings = total_revenue * 0.25
-        
-        # Returns
-        try:
-            pending_returns = Return.query.filter(
-                Return.status.in_(['pending', 'requested', 'pending_review', 'supplier_review', 'disputed'])
-            ).count()
-        except Exception:
-            pending_returns = 0
-        
-        return success_response(data={
-            'users': {
-                'total': total_users,
-                'customers': customers,
-                'suppliers': suppliers,
-                'pending_suppliers': pending_suppliers
-            },
-            'products': {
-                'total': total_products,
-                'active': active_products,
-                'low_stock': low_stock
-            },
-            'orders': {
-                'total': total_orders,
-                'pending': pending_orders,
-                'paid': paid_orders
-            },
-            'revenue': {
-                'total': float(total_revenue),
-                'this_month': float(month_revenue),
-                'platform_earnings': float(platform_earnings)
-            },
-            'returns': {
-                'pending': pending_returns
-            }
-        })
+        return success_response(data=dashboard_service.snapshot())
     except Exception as e:
         current_app.logger.error(f'Dashboard error: {str(e)}')
         return error_response(f'Failed to fetch dashboard: {str(e)}', 500)
@@ -116,69 +55,62 @@ def get_dashboard():
 @admin_bp.route('/analytics', methods=['GET'])
 @jwt_required()
 @require_admin
+@reads_from_replica
 def get_analytics():
     """Get enterprise-level analytics with comprehensive metrics."""
     try:
-        # Daily revenue (last 30 days)
+        # Sales figures come from the daily rollups (see rollup_service)
         end_date = datetime.utcnow()
-        start_date_30 = end_date - timedelta(days=30)
-        start_date_90 = end_date - timedelta(days=90)
-        start_date_12m = end_date - timedelta(days=365)
+        today = end_date.date()
+        start_date_30 = today - timedelta(days=30)
+        start_date_90 = today - timedelta(days=90)
+        start_date_12m = today - timedelta(days=365)
         
+        # Daily revenue (last 30 days)
         daily_revenue = db.session.query(
-            func.date(Order.created_at).label('date'),
-            func.sum(Order.total).label('revenue'),
-            func.count(Order.id).label('orders'),
-            func.sum(OrderItem.quantity).label('items_sold')
-        ).join(OrderItem)\
-            .filter(
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= start_date_30
-            ).group_by(func.date(Order.created_at))\
-            .order_by(func.date(Order.created_at)).all()
+            DailyOrderRollup.day,
+            func.sum(DailyOrderRollup.revenue).label('revenue'),
+            func.sum(DailyOrderRollup.order_count).label('orders'),
+            func.sum(DailyOrderRollup.items_sold).label('items_sold')
+        ).filter(DailyOrderRollup.day >= start_date_30)\
+            .group_by(DailyOrderRollup.day)\
+            .order_by(DailyOrderRollup.day).all()
         
         # Monthly revenue (last 12 months)
+        month = func.to_char(DailyOrderRollup.day, 'YYYY-MM')
         monthly_revenue = db.session.query(
-            func.to_char(Order.created_at, 'YYYY-MM').label('month'),
-            func.sum(Order.total).label('revenue'),
-            func.sum(OrderItem.platform_commission).label('commission'),
-            func.count(Order.id).label('orders')
-        ).join(OrderItem)\
-            .filter(
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= start_date_12m
-            ).group_by(func.to_char(Order.created_at, 'YYYY-MM'))\
-            .order_by(func.to_char(Order.created_at, 'YYYY-MM')).all()
+            month.label('month'),
+            func.sum(DailyOrderRollup.revenue).label('revenue'),
+            func.sum(DailyOrderRollup.commission).label('commission'),
+            func.sum(DailyOrderRollup.order_count).label('orders')
+        ).filter(DailyOrderRollup.day >= start_date_12m)\
+            .group_by(month).order_by(month).all()
         
         # Top products
         top_products = db.session.query(
             Product.name,
             Product.image_url,
-            func.sum(OrderItem.quantity).label('quantity_sold'),
-            func.sum(OrderItem.subtotal).label('revenue'),
-            func.count(func.distinct(Order.id)).label('orders')
-        ).select_from(Product)\
-            .join(OrderItem, OrderItem.product_id == Product.id)\
-            .join(Order, Order.id == OrderItem.order_id)\
-            .filter(Order.payment_status == PaymentStatus.COMPLETED)\
+            func.sum(DailySalesRollup.items_sold).label('quantity_sold'),
+            func.sum(DailySalesRollup.revenue).label('revenue'),
+            func.sum(DailySalesRollup.product_orders).label('orders')
+        ).select_from(DailySalesRollup)\
+            .join(Product, Product.id == DailySalesRollup.product_id)\
             .group_by(Product.id, Product.name, Product.image_url)\
-            .order_by(func.sum(OrderItem.quantity).desc())\
+            .order_by(func.sum(DailySalesRollup.items_sold).desc())\
             .limit(20).all()
         
         # Top suppliers with performance metrics
         top_suppliers = db.session.query(
             SupplierProfile.id,
             SupplierProfile.business_name,
-            func.count(func.distinct(Order.id)).label('orders'),
-            func.sum(OrderItem.supplier_earnings).label('earnings'),
-            func.sum(OrderItem.quantity).label('items_sold'),
-            func.avg(OrderItem.subtotal).label('avg_order_value')
-        ).select_from(SupplierProfile)\
-            .join(OrderItem, OrderItem.supplier_id == SupplierProfile.id)\
-            .join(Order, Order.id == OrderItem.order_id)\
-            .filter(Order.payment_status == PaymentStatus.COMPLETED)\
+            func.sum(DailySalesRollup.supplier_orders).label('orders'),
+            func.sum(DailySalesRollup.supplier_earnings).label('earnings'),
+            func.sum(DailySalesRollup.items_sold).label('items_sold'),
+            (func.sum(DailySalesRollup.revenue) / func.nullif(func.sum(DailySalesRollup.line_count), 0)).label('avg_order_value')
+        ).select_from(DailySalesRollup)\
+            .join(SupplierProfile, SupplierProfile.id == DailySalesRollup.supplier_id)\
             .group_by(SupplierProfile.id, SupplierProfile.business_name)\
-            .order_by(func.sum(OrderItem.supplier_earnings).desc())\
+            .order_by(func.sum(DailySalesRollup.supplier_earnings).desc())\
             .limit(20).all()
         
         # Order status distribution
@@ -189,25 +121,21 @@ def get_analytics():
         
         # Payment methods
         payment_methods = db.session.query(
-            Order.payment_method,
-            func.count(Order.id).label('count'),
-            func.sum(Order.total).label('revenue')
-        ).filter(Order.payment_status == PaymentStatus.COMPLETED)\
-            .group_by(Order.payment_method).all()
+            DailyOrderRollup.payment_method,
+            func.sum(DailyOrderRollup.order_count).label('count'),
+            func.sum(DailyOrderRollup.revenue).label('revenue')
+        ).group_by(DailyOrderRollup.payment_method).all()
         
         # Category performance
         category_performance = db.session.query(
             Category.name,
-            func.sum(OrderItem.subtotal).label('revenue'),
-            func.sum(OrderItem.quantity).label('quantity'),
-            func.count(func.distinct(Order.id)).label('orders')
-        ).select_from(Category)\
-            .join(Product, Product.category_id == Category.id)\
-            .join(OrderItem, OrderItem.product_id == Product.id)\
-            .join(Order, Order.id == OrderItem.order_id)\
-            .filter(Order.payment_status == PaymentStatus.COMPLETED)\
+            func.sum(DailySalesRollup.revenue).label('revenue'),
+            func.sum(DailySalesRollup.items_sold).label('quantity'),
+            func.sum(DailySalesRollup.category_orders).label('orders')
+        ).select_from(DailySalesRollup)\
+            .join(Category, Category.id == DailySalesRollup.category_id)\
             .group_by(Category.id, Category.name)\
-            .order_by(func.sum(OrderItem.subtotal).desc()).all()
+            .order_by(func.sum(DailySalesRollup.revenue).desc()).all()
         
         # User growth (last 12 months)
         user_growth = db.session.query(
@@ -228,73 +156,48 @@ def get_analytics():
             .group_by(Order.customer_id)\
             .having(func.count(Order.id) > 1).count()
         
-        # AOV trend (last 30 days)
-        aov_trend = db.session.query(
-            func.date(Order.created_at).label('date'),
-            func.avg(Order.total).label('aov')
-        ).filter(
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= start_date_30
-        ).group_by(func.date(Order.created_at))\
-            .order_by(func.date(Order.created_at)).all()
-        
         # Peak hours (last 90 days)
         peak_hours = db.session.query(
-            func.extract('hour', Order.created_at).label('hour'),
-            func.count(Order.id).label('orders'),
-            func.sum(Order.total).label('revenue')
-        ).filter(
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= start_date_90
-        ).group_by(func.extract('hour', Order.created_at))\
-            .order_by(func.extract('hour', Order.created_at)).all()
+            DailyOrderRollup.hour,
+            func.sum(DailyOrderRollup.order_count).label('orders'),
+            func.sum(DailyOrderRollup.revenue).label('revenue')
+        ).filter(DailyOrderRollup.day >= start_date_90)\
+            .group_by(DailyOrderRollup.hour)\
+            .order_by(DailyOrderRollup.hour).all()
         
         # Growth metrics (MoM, YoY)
-        this_month_start = end_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        this_month_start = today.replace(day=1)
         last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
-        this_year_start = end_date.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        this_year_start = today.replace(month=1, day=1)
         last_year_start = this_year_start.replace(year=this_year_start.year - 1)
         
-        this_month_revenue = db.session.query(func.sum(Order.total))\
-            .filter(
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= this_month_start
-            ).scalar() or 0
-        
-        last_month_revenue = db.session.query(func.sum(Order.total))\
-            .filter(
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= last_month_start,
-                Order.created_at < this_month_start
-            ).scalar() or 0
+        def rollup_revenue(start, end=None):
+            query = db.session.query(func.sum(DailyOrderRollup.revenue)).filter(DailyOrderRollup.day >= start)
+            if end:
+                query = query.filter(DailyOrderRollup.day < end)
+            return query.scalar() or 0
         
-        this_year_revenue = db.session.query(func.sum(Order.total))\
-            .filter(
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= this_year_start
-            ).scalar() or 0
-        
-        last_year_revenue = db.session.query(func.sum(Order.total))\
-            .filter(
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= last_year_start,
-                Order.created_at < this_year_start
-            ).scalar() or 0
+        this_month_revenue = rollup_revenue(this_month_start)
+        last_month_revenue = rollup_revenue(last_month_start, this_month_start)
+        this_year_revenue = rollup_revenue(this_year_start)
+        last_year_revenue = rollup_revenue(last_year_start, this_year_start)
         
         mom_growth = ((float(this_month_revenue) - float(last_month_revenue)) / float(last_month_revenue) * 100) if last_month_revenue > 0 else 0
         yoy_growth = ((float(this_year_revenue) - float(last_year_revenue)) / float(last_year_revenue) * 100) if last_year_revenue > 0 else 0
         
         # Platform commission metrics
-        total_commission = db.session.query(func.sum(OrderItem.platform_commission))\
-            .join(Order)\
-            .filter(Order.payment_status == PaymentStatus.COMPLETED).scalar() or 0
-        
-        total_revenue = db.session.query(func.sum(Order.total))\
-            .filter(Order.payment_status == PaymentStatus.COMPLETED).scalar() or 0
+        total_commission, total_revenue, completed_orders = db.session.query(
+            func.sum(DailyOrderRollup.commission),
+            func.sum(DailyOrderRollup.revenue),
+            func.sum(DailyOrderRollup.order_count)
+        ).one()
+        total_commission = total_commission or 0
+        total_revenue = total_revenue or 0
+        completed_orders = completed_orders or 0
         
         # Return analysis
         total_returns = Return.query.count()
-        return_rate = (total_returns / Order.query.filter_by(payment_status=PaymentStatus.COMPLETED).count() * 100) if Order.query.filter_by(payment_status=PaymentStatus.COMPLETED).count() > 0 else 0
+        return_rate = (total_returns / completed_orders * 100) if completed_orders > 0 else 0
         
         return_by_reason = db.session.query(
             Return.reason,
@@ -306,26 +209,25 @@ def get_analytics():
         active_delivery_agents = db.session.query(func.count(func.distinct(Order.assigned_delivery_agent)))\
             .filter(
                 Order.status == OrderStatus.DELIVERED,
-                Order.created_at >= start_date_30
+                Order.created_at >= end_date - timedelta(days=30)
             ).scalar() or 0
         
         avg_delivery_time = db.session.query(
             func.avg(func.extract('epoch', Order.updated_at - Order.created_at) / 86400)
         ).filter(
             Order.status == OrderStatus.DELIVERED,
-            Order.created_at >= start_date_30
+            Order.created_at >= end_date - timedelta(days=30)
         ).scalar() or 0
         
         # Geographic distribution (by delivery zone)
         geographic_revenue = db.session.query(
             DeliveryZone.name,
-            func.count(Order.id).label('orders'),
-            func.sum(Order.total).label('revenue')
+            func.sum(DailyOrderRollup.order_count).label('orders'),
+            func.sum(DailyOrderRollup.revenue).label('revenue')
         ).select_from(DeliveryZone)\
-            .join(Order, Order.delivery_zone == DeliveryZone.name)\
-            .filter(Order.payment_status == PaymentStatus.COMPLETED)\
+            .join(DailyOrderRollup, DailyOrderRollup.delivery_zone == DeliveryZone.name)\
             .group_by(DeliveryZone.id, DeliveryZone.name)\
-            .order_by(func.sum(Order.total).desc()).all()
+            .order_by(func.sum(DailyOrderRollup.revenue).desc()).all()
         
         return success_response(data={
             'daily_revenue': [{'date': str(d[0]), 'revenue': float(d[1] or 0), 'orders': d[2], 'items_sold': d[3]} for d in daily_revenue],
@@ -343,7 +245,7 @@ def get_analytics():
                 'repeat_rate': (repeat_customers / customers_with_orders * 100) if customers_with_orders > 0 else 0,
                 'conversion_rate': (customers_with_orders / total_customers * 100) if total_customers > 0 else 0
             },
-            'aov_trend': [{'date': str(a[0]), 'aov': float(a[1] or 0)} for a in aov_trend],
+            'aov_trend': [{'date': str(d[0]), 'aov': float(d[1] or 0) / d[2] if d[2] else 0} for d in daily_revenue],
             'peak_hours': [{'hour': int(h[0]), 'orders': h[1], 'revenue': float(h[2])} for h in peak_hours],
             'growth_metrics': {
                 'mom_growth': round(mom_growth, 2),
@@ -523,16 +425,28 @@ def create_delivery_zone():
     try:
         data = request.get_json()
         
+        try:
+            if data.get('boundary'):
+                parse_boundary(data['boundary'])
+            hub_latitude, hub_longitude = parse_coordinates(data, 'hub_latitude', 'hub_longitude')
+        except ValueError as e:
+            return error_response(str(e), 400)
+        
         zone = DeliveryZone(
             name=data['name'].strip(),
             counties=data['counties'],  # Array of counties
             delivery_fee=data['delivery_fee'],
             estimated_days=data['estimated_days'],
-            is_active=data.get('is_active', True)
+            is_active=data.get('is_active', True),
+            boundary=data.get('boundary') or None,  # GeoJSON Polygon/MultiPolygon
+            hub_latitude=hub_latitude,
+            hub_longitude=hub_longitude,
+            fee_per_km=data.get('fee_per_km')
         )
         
         db.session.add(zone)
         db.session.commit()
+        geo_service.invalidate_zones()
         
         return success_response(
             data=zone.to_dict(),
@@ -567,7 +481,20 @@ def update_delivery_zone(zone_id):
         if 'is_active' in data:
             zone.is_active = data['is_active']
         
+        try:
+            if 'boundary' in data:
+                if data['boundary']:
+                    parse_boundary(data['boundary'])
+                zone.boundary = data['boundary'] or None
+            if 'hub_latitude' in data or 'hub_longitude' in data:
+                zone.hub_latitude, zone.hub_longitude = parse_coordinates(data, 'hub_latitude', 'hub_longitude')
+        except ValueError as e:
+            return error_response(str(e), 400)
+        if 'fee_per_km' in data:
+            zone.fee_per_km = data['fee_per_km']
+        
         db.session.commit()
+        geo_service.invalidate_zones()
         
         return success_response(
             data=zone.to_dict(),
@@ -940,78 +867,25 @@ def cancel_payout(payout_id):
 @jwt_required()
 @require_admin
 def batch_mpesa_payouts():
-    """Initiate M-Pesa B2C payments for multiple pending payouts."""
+    """Start a background M-Pesa B2C batch for pending payouts; poll it via /payouts/batches/<id>."""
     try:
-        data = request.get_json() or {}
-        payout_ids = data.get('payout_ids', [])
-
-        if not payout_ids:
-            # If no specific IDs, process all pending payouts
-            payouts = SupplierPayout.query.filter_by(status='pending').all()
-        else:
-            payouts = SupplierPayout.query.filter(
-                SupplierPayout.id.in_(payout_ids),
-                SupplierPayout.status == 'pending'
-            ).all()
-
-        results = {
-            'successful': [],
-            'failed': []
-        }
-
-        for payout in payouts:
-            supplier = SupplierProfile.query.get(payout.supplier_id)
-
-            if not supplier or not supplier.mpesa_number:
-                results['failed'].append({
-                    'payout_id': payout.id,
-                    'payout_number': payout.payout_number,
-                    'error': 'Supplier has no M-Pesa number'
-                })
-                continue
-
-            # Validate phone
-            is_valid, result = mpesa_service.validate_phone_number(supplier.mpesa_number)
-            if not is_valid:
-                results['failed'].append({
-                    'payout_id': payout.id,
-                    'payout_number': payout.payout_number,
-                    'error': f'Invalid phone: {result}'
-                })
-                continue
+        from app.services.payout_engine import payout_engine
 
-            # Mark as processing
-            payout.status = 'processing'
-            db.session.commit()
+        data = request.get_json() or {}
+        # If no specific IDs, process all pending payouts
+        payout_ids = data.get('payout_ids') or None
 
-            # Initiate payment
-            response = mpesa_service.b2c_payment(
-                phone_number=supplier.mpesa_number,
-                amount=float(payout.net_amount),
-                remarks=f'Payout {payout.payout_number}',
-                occasion=f'Supplier Payout'
-            )
+        batch = payout_engine.create_batch(payout_ids, created_by=get_jwt_identity())
 
-            if response.get('success'):
-                payout.payment_reference = response.get('conversation_id')
-                results['successful'].append({
-                    'payout_id': payout.id,
-                    'payout_number': payout.payout_number,
-                    'conversation_id': response.get('conversation_id')
-                })
-            else:
-                payout.status = 'pending'
-                results['failed'].append({
-                    'payout_id': payout.id,
-                    'payout_number': payout.payout_number,
-                    'error': response.get('error', 'Unknown error')
-                })
+        if not batch.total_count:
+            return success_response(data=batch.to_dict(), message='No pending payouts to process')
 
-        db.session.commit()
+        payout_engine.start_batch(batch.id)
 
         return success_response(
-            data=results,
-            message=f"Processed {len(results['successful'])} payouts, {len(results['failed'])} failed"
+            data=batch.to_dict(),
+            message=f'Started payout batch for {batch.total_count} payouts',
+            status_code=202
         )
 
     except Exception as e:
@@ -1020,6 +894,37 @@ def batch_mpesa_payouts():
         return error_response(f'Failed to process batch payouts: {str(e)}', 500)
 
 
+@admin_bp.route('/payouts/batches/<batch_id>', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_payout_batch(batch_id):
+    """Get progress and per-payout results of a B2C payout batch."""
+    try:
+        from app.models.returns import PayoutBatch
+
+        batch = PayoutBatch.query.get(batch_id)
+        if not batch:
+            return error_response('Payout batch not found', 404)
+
+        payouts = batch.payouts.order_by(SupplierPayout.created_at).all()
+
+        return success_response(data={
+            **batch.to_dict(),
+            'payouts': [
+                {
+                    'payout_id': p.id,
+                    'payout_number': p.payout_number,
+                    'status': p.status,
+                    'conversation_id': p.reference,
+                    'notes': p.notes
+                }
+                for p in payouts
+            ]
+        })
+    except Exception as e:
+        return error_response(f'Failed to fetch payout batch: {str(e)}', 500)
+
+
 # =============================================================================
 # Payment Phone Change Management
 # =============================================================================
@@ -1028,30 +933,46 @@ def batch_mpesa_payouts():
 @jwt_required()
 @require_admin
 def get_payment_phone_requests():
-    """Get all pending payment phone change requests."""
+    """
+    Get payment phone change requests, newest first.
+    Keyset paginated: pass the returned next_cursor as ?cursor= for the next page.
+    """
     try:
         status = request.args.get('status', 'pending')
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 20))
+        per_page = min(int(request.args.get('per_page', 20)), 100)
+        cursor = request.args.get('cursor')
 
-        query = SupplierProfile.query.filter(
-            SupplierProfile.payment_phone_pending.isnot(None)
-        )
+        query = db.session.query(SupplierProfile, User.email)\
+            .join(User, SupplierProfile.user_id == User.id)
 
-        if status == 'pending':
-            query = query.filter(
-                SupplierProfile.payment_phone_change_status == PaymentPhoneChangeStatus.PENDING
-            )
-        elif status == 'all':
-            pass  # Show all requests
+        if status == 'all':
+            query = query.filter(SupplierProfile.payment_phone_change_status.isnot(None))
         else:
+            try:
+                query = query.filter(
+                    SupplierProfile.payment_phone_change_status == PaymentPhoneChangeStatus(status)
+                )
+            except ValueError:
+                return error_response(f'Invalid status: {status}', 400)
+
+        if cursor:
+            try:
+                requested_at, supplier_id = decode_cursor(cursor)
+            except ValueError as e:
+                return error_response(str(e), 400)
             query = query.filter(
-                SupplierProfile.payment_phone_change_status == status
+                tuple_(SupplierProfile.payment_phone_change_requested_at, SupplierProfile.id) <
+                tuple_(requested_at, supplier_id)
             )
 
-        suppliers = query.order_by(
-            SupplierProfile.payment_phone_change_requested_at.desc()
-        ).paginate(page=page, per_page=per_page, error_out=False)
+        rows = query.order_by(
+            SupplierProfile.payment_phone_change_requested_at.desc(),
+            SupplierProfile.id.desc()
+        ).limit(per_page + 1).all()
+
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        last = rows[-1][0] if rows else None
 
         return success_response(data={
             'requests': [
@@ -1059,48 +980,69 @@ def get_payment_phone_requests():
                     'supplier_id': s.id,
                     'business_name': s.business_name,
                     'contact_person': s.contact_person,
+                    'email': email,
                     'current_phone': s.mpesa_number,
                     'requested_phone': s.payment_phone_pending,
                     'status': s.payment_phone_change_status.value if s.payment_phone_change_status else None,
                     'reason': s.payment_phone_change_reason,
                     'requested_at': s.payment_phone_change_requested_at.isoformat() if s.payment_phone_change_requested_at else None,
+                    'reviewed_at': s.payment_phone_change_reviewed_at.isoformat() if s.payment_phone_change_reviewed_at else None,
                 }
-                for s in suppliers.items
+                for s, email in rows
             ],
             'pagination': {
-                'page': suppliers.page,
-                'per_page': suppliers.per_page,
-                'total': suppliers.total,
-                'pages': suppliers.pages
+                'per_page': per_page,
+                'has_more': has_more,
+                'next_cursor': encode_cursor(last.payment_phone_change_requested_at, last.id) if has_more else None
             }
         })
     except Exception as e:
         return error_response(f'Failed to fetch requests: {str(e)}', 500)
 
 
+def _review_payment_phone_changes(supplier_ids, approve, reason=None):
+    """Approve or reject pending phone changes in one UPDATE and notify the suppliers together."""
+    from app.services.notification_service import notification_service
+
+    admin_id = get_jwt_identity()
+    if approve:
+        reviewed = SupplierProfile.approve_payment_phone_changes(supplier_ids, admin_id)
+    else:
+        reviewed = SupplierProfile.reject_payment_phone_changes(supplier_ids, admin_id, reason)
+
+    notification_service.create_notifications([
+        {
+            'user_id': user_id,
+            'title': 'Payment Phone Updated' if approve else 'Payment Phone Change Rejected',
+            'message': (
+                f'Your payouts will now be sent to {mpesa_number}.' if approve
+                else f'Your payment phone change request was rejected: {reason}'
+            ),
+            'type': 'success' if approve else 'warning',
+            'link': '/supplier/payouts',
+        }
+        for _, user_id, mpesa_number in reviewed
+    ])
+    db.session.commit()
+    return [supplier_id for supplier_id, _, _ in reviewed]
+
+
 @admin_bp.route('/payment-phone-requests/<supplier_id>/approve', methods=['POST'])
 @jwt_required()
 @require_admin
 def approve_payment_phone_change(supplier_id):
     """Approve a supplier's payment phone change request."""
     try:
-        user_id = get_jwt_identity()
-        supplier = SupplierProfile.query.get(supplier_id)
-
-        if not supplier:
-            return error_response('Supplier not found', 404)
-
-        if not supplier.payment_phone_pending:
+        if not _review_payment_phone_changes([supplier_id], approve=True):
+            if not db.session.get(SupplierProfile, supplier_id):
+                return error_response('Supplier not found', 404)
             return error_response('No pending phone change request', 400)
 
-        if supplier.approve_payment_phone_change(user_id):
-            db.session.commit()
-            return success_response(
-                data=supplier.to_dict(),
-                message=f'Payment phone changed to {supplier.mpesa_number}'
-            )
-        else:
-            return error_response('Failed to approve change', 400)
+        supplier = db.session.get(SupplierProfile, supplier_id)
+        return success_response(
+            data=supplier.to_dict(),
+            message=f'Payment phone changed to {supplier.mpesa_number}'
+        )
 
     except Exception as e:
         db.session.rollback()
@@ -1113,29 +1055,59 @@ def approve_payment_phone_change(supplier_id):
 def reject_payment_phone_change(supplier_id):
     """Reject a supplier's payment phone change request."""
     try:
-        user_id = get_jwt_identity()
-        supplier = SupplierProfile.query.get(supplier_id)
-
-        if not supplier:
-            return error_response('Supplier not found', 404)
-
         data = request.get_json() or {}
         reason = data.get('reason', 'Request rejected by admin')
 
-        if supplier.reject_payment_phone_change(user_id, reason):
-            db.session.commit()
-            return success_response(
-                data=supplier.to_dict(),
-                message='Payment phone change rejected'
-            )
-        else:
+        if not _review_payment_phone_changes([supplier_id], approve=False, reason=reason):
+            if not db.session.get(SupplierProfile, supplier_id):
+                return error_response('Supplier not found', 404)
             return error_response('No pending request to reject', 400)
 
+        return success_response(
+            data=db.session.get(SupplierProfile, supplier_id).to_dict(),
+            message='Payment phone change rejected'
+        )
+
     except Exception as e:
         db.session.rollback()
         return error_response(f'Failed to reject: {str(e)}', 500)
 
 
+@admin_bp.route('/payment-phone-requests/bulk', methods=['POST'])
+@jwt_required()
+@require_admin
+@validate_required_fields(['supplier_ids', 'action'])
+def bulk_review_payment_phone_changes():
+    """Approve or reject many payment phone change requests at once."""
+    try:
+        data = request.get_json()
+        supplier_ids = data['supplier_ids']
+        action = data['action']
+
+        if action not in ('approve', 'reject'):
+            return error_response("Action must be 'approve' or 'reject'", 400)
+        if not isinstance(supplier_ids, list) or not supplier_ids:
+            return error_response('supplier_ids must be a non-empty list', 400)
+        if len(supplier_ids) > 500:
+            return error_response('At most 500 requests can be reviewed at once', 400)
+
+        reviewed = _review_payment_phone_changes(
+            supplier_ids,
+            approve=action == 'approve',
+            reason=data.get('reason', 'Request rejected by admin')
+        )
+        skipped = sorted(set(supplier_ids) - set(reviewed))
+
+        return success_response(
+            data={'reviewed': reviewed, 'skipped': skipped},
+            message=f"{'Approved' if action == 'approve' else 'Rejected'} {len(reviewed)} phone change requests"
+        )
+
+    except Exception as e:
+        db.session.rollback()
+        return error_response(f'Failed to review requests: {str(e)}', 500)
+
+
 # =============================================================================
 # COD (Cash on Delivery) Payment Management
 # =============================================================================
@@ -1305,7 +1277,7 @@ def get_all_returns():
             .paginate(page=page, per_page=per_page, error_out=False)
         
         return success_response(data={
-            'returns': [r.to_dict() for r in returns.items],
+            'returns': Return.serialize_many(returns.items),
             'pagination': {
                 'page': returns.page,
                 'per_page': returns.per_page,
@@ -1505,42 +1477,21 @@ def process_return_refund(return_id):
                 
         elif refund_method == 'card':
             # Paystack card refund
-            import os
-            import requests
+            from app.services.paystack_service import paystack_service
             
-            paystack_key = os.getenv('PAYSTACK_SECRET_KEY')
-            if not paystack_key:
+            if not paystack_service.secret_key:
                 return error_response('Paystack not configured', 500)
             
             if not order.payment_reference:
                 return error_response('No payment reference found for card refund', 400)
             
-            # Initiate Paystack refund
-            headers = {
-                'Authorization': f'Bearer {paystack_key}',
-                'Content-Type': 'application/json'
-            }
-            
-            payload = {
-                'transaction': order.payment_reference,
-                'amount': int(refund_amount * 100)  # Convert to kobo
-            }
-            
-            response = requests.post(
-                'https://api.paystack.co/refund',
-                json=payload,
-                headers=headers
-            )
+            result = paystack_service.create_refund(order.payment_reference, amount=refund_amount)
             
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('status'):
-                    refund_reference = result['data'].get('id')
-                    refund_success = True
-                else:
-                    return error_response(f"Paystack refund failed: {result.get('message')}", 400)
+            if result.get('success'):
+                refund_reference = result.get('refund_id')
+                refund_success = True
             else:
-                return error_response('Paystack refund request failed', 400)
+                return error_response(f"Paystack refund failed: {result.get('error')}", 400)
                 
         elif refund_method == 'cash':
             # Manual cash refund - just mark as completed
@@ -1555,6 +1506,17 @@ def process_return_refund(return_id):
             return_request.refund_processed_at = datetime.utcnow()
             return_request.refund_reference = refund_reference
             return_request.refund_method = refund_method
+
+            # Charge the supplier's share of the refund to their balance
+            deduction = float(return_request.supplier_deduction or 0)
+            if deduction > 0 and return_request.order_item:
+                ledger_service.refund(
+                    'supplier', return_request.order_item.supplier_id, deduction,
+                    order_id=return_request.order_id,
+                    reference=return_request.return_number or return_request.id,
+                    memo=f'Return refund via {refund_method}',
+                    created_by=get_jwt_identity()
+                )
             
             db.session.commit()
             
@@ -1573,60 +1535,11 @@ def process_return_refund(return_id):
 @admin_bp.route('/returns/analytics', methods=['GET'])
 @jwt_required()
 @require_admin
+@reads_from_replica
 def get_returns_analytics():
     """Get returns analytics."""
     try:
-        # Total returns
-        total_returns = Return.query.count()
-
-        # Returns by status
-        try:
-            by_status = db.session.query(
-                Return.status,
-                func.count(Return.id).label('count')
-            ).group_by(Return.status).all()
-        except Exception:
-            by_status = []
-
-        # Pending returns (includes new statuses from supplier workflow)
-        try:
-            pending = Return.query.filter(
-                Return.status.in_(['pending', 'requested', 'pending_review', 'supplier_review'])
-            ).count()
-        except Exception:
-            pending = 0
-            
-        try:
-            approved = Return.query.filter_by(status='approved').count()
-        except Exception:
-            approved = 0
-            
-        try:
-            rejected = Return.query.filter_by(status='rejected').count()
-        except Exception:
-            rejected = 0
-            
-        try:
-            completed = Return.query.filter(
-                Return.status.in_(['completed', 'refund_completed'])
-            ).count()
-        except Exception:
-            completed = 0
-            
-        try:
-            disputed = Return.query.filter_by(status='disputed').count()
-        except Exception:
-            disputed = 0
-
-        return success_response(data={
-            'total_returns': total_returns,
-            'pending': pending,
-            'approved': approved,
-            'rejected': rejected,
-            'completed': completed,
-            'disputed': disputed,
-            'by_status': [{'status': str(s[0]), 'count': s[1]} for s in by_status]
-        })
+        return success_response(data=returns_analytics_service.summary())
     except Exception as e:
         current_app.logger.error(f'Returns analytics error: {str(e)}')
         return success_response(data={
@@ -1913,452 +1826,91 @@ def get_audit_logs():
 @admin_bp.route('/reports/financial', methods=['GET'])
 @jwt_required(optional=True)
 @require_admin
+@reads_from_replica
 def get_financial_report():
     """Get comprehensive financial report with enterprise-level metrics."""
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-        
-        # Base query for completed orders
-        query = Order.query.filter(Order.payment_status == PaymentStatus.COMPLETED)
-        
-        if start_date:
-            query = query.filter(Order.created_at >= datetime.fromisoformat(start_date))
-        if end_date:
-            end_dt = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
-            query = query.filter(Order.created_at <= end_dt)
-        
-        orders = query.all()
-        
-        # Initialize metrics
-        total_revenue = 0
-        total_subtotal = 0
-        total_delivery_fees = 0
-        total_commission = 0
-        total_supplier_earnings = 0
-        payment_method_breakdown = {'mpesa': 0, 'card': 0, 'cash': 0}
-        category_revenue = {}
-        supplier_revenue = {}
-        
-        # Calculate order metrics
-        for order in orders:
-            total_revenue += float(order.total)
-            total_subtotal += float(order.subtotal)
-            total_delivery_fees += float(order.delivery_fee)
-            
-            # Payment method breakdown
-            method = order.payment_method.value if hasattr(order.payment_method, 'value') else str(order.payment_method)
-            payment_method_breakdown[method] = payment_method_breakdown.get(method, 0) + float(order.total)
-            
-            # Process order items
-            for item in order.items:
-                total_commission += float(item.platform_commission)
-                total_supplier_earnings += float(item.supplier_earnings)
-                
-                # Category revenue
-                if item.product_id:
-                    product = Product.query.get(item.product_id)
-                    if product and product.category:
-                        cat_name = product.category.name
-                        category_revenue[cat_name] = category_revenue.get(cat_name, 0) + float(item.subtotal)
-                
-                # Supplier revenue
-                if item.supplier_id:
-                    from app.models.user import SupplierProfile
-                    supplier = SupplierProfile.query.get(item.supplier_id)
-                    if supplier:
-                        supplier_name = supplier.business_name
-                        if supplier_name not in supplier_revenue:
-                            supplier_revenue[supplier_name] = {
-                                'revenue': 0,
-                                'earnings': 0,
-                                'orders': 0
-                            }
-                        supplier_revenue[supplier_name]['revenue'] += float(item.subtotal)
-                        supplier_revenue[supplier_name]['earnings'] += float(item.supplier_earnings)
-                        supplier_revenue[supplier_name]['orders'] += 1
-        
-        # Calculate refunds - separate by who pays
-        try:
-            returns_query = Return.query.filter(
-                Return.status.in_(['approved', 'completed', 'refund_completed'])
-            )
-            if start_date:
-                returns_query = returns_query.filter(Return.created_at >= datetime.fromisoformat(start_date))
-            if end_date:
-                end_dt = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
-                returns_query = returns_query.filter(Return.created_at <= end_dt)
-            
-            returns = returns_query.all()
-            total_refunds_to_customers = sum(float(r.customer_refund or r.refund_amount or 0) for r in returns)
-            platform_paid_refunds = sum(float(r.platform_deduction or 0) for r in returns)
-            supplier_paid_refunds = sum(float(r.supplier_deduction or 0) for r in returns)
-            refund_count = len(returns)
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f'Returns query error: {str(e)}')
-            returns = []
-            total_refunds_to_customers = 0
-            platform_paid_refunds = 0
-            supplier_paid_refunds = 0
-            refund_count = 0
-        
-        # Calculate supplier payouts
-        try:
-            payouts_query = SupplierPayout.query.filter_by(status='completed')
-            if start_date:
-                payouts_query = payouts_query.filter(SupplierPayout.paid_at >= datetime.fromisoformat(start_date))
-            if end_date:
-                end_dt = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
-                payouts_query = payouts_query.filter(SupplierPayout.paid_at <= end_dt)
-            
-            payouts = payouts_query.all()
-            total_payouts = sum(float(p.amount) for p in payouts)
-            payout_count = len(payouts)
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f'Payouts query error: {str(e)}')
-            payouts = []
-            total_payouts = 0
-            payout_count = 0
-        
-        # Calculate pending payouts
-        try:
-            pending_payouts = SupplierPayout.query.filter_by(status='pending').all()
-            total_pending_payouts = sum(float(p.amount) for p in pending_payouts)
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f'Pending payouts query error: {str(e)}')
-            pending_payouts = []
-            total_pending_payouts = 0
-        
-        # Calculate delivery agent earnings
-        delivery_query = Order.query.filter(
-            Order.status == OrderStatus.DELIVERED,
-            Order.assigned_delivery_agent.isnot(None)
-        )
-        if start_date:
-            delivery_query = delivery_query.filter(Order.created_at >= datetime.fromisoformat(start_date))
-        if end_date:
-            end_dt = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
-            delivery_query = delivery_query.filter(Order.created_at <= end_dt)
-        
-        # Calculate delivery agent earnings (what we owe them)
-        delivered_orders = delivery_query.all()
-        total_delivery_fees_collected = sum(float(o.delivery_fee) for o in delivered_orders)
-        delivery_agent_share = sum(float(o.delivery_fee) * 0.7 for o in delivered_orders)  # 70% to agent
-        platform_delivery_earnings = sum(float(o.delivery_fee) * 0.3 for o in delivered_orders)  # 30% to platform
-        
-        # Calculate net metrics
-        net_revenue = total_revenue - total_refunds_to_customers
-        
-        # Platform's actual earnings breakdown:
-        # 1. Commission from products (25%)
-        # 2. Cut from delivery fees (30%)
-        # Total platform earnings before payouts
-        platform_gross_earnings = total_commission + platform_delivery_earnings
-        
-        # Platform net earnings after only the refunds IT paid
-        platform_net_earnings = platform_gross_earnings - platform_paid_refunds
-        
-        # Calculate margins and ratios
-        commission_rate = (total_commission / total_subtotal * 100) if total_subtotal > 0 else 0
-        refund_rate = (refund_count / len(orders) * 100) if orders else 0
-        avg_order_value = total_revenue / len(orders) if orders else 0
-        
-        # Top categories
-        top_categories = sorted(
-            [{'name': k, 'revenue': v} for k, v in category_revenue.items()],
-            key=lambda x: x['revenue'],
-            reverse=True
-        )[:10]
-        
-        # Top suppliers
-        top_suppliers = sorted(
-            [{'name': k, **v} for k, v in supplier_revenue.items()],
-            key=lambda x: x['revenue'],
-            reverse=True
-        )[:10]
-        
-        # ===== ADDITIONAL COMPREHENSIVE METRICS =====
-        
-        # 1. CASH FLOW ANALYSIS
-        outstanding_supplier_payouts = total_supplier_earnings - total_payouts
-        outstanding_delivery_payouts = delivery_agent_share - 0  # Assume no delivery payouts tracked yet
-        pending_orders_query = Order.query.filter(Order.payment_status == PaymentStatus.PENDING)
-        if start_date:
-            pending_orders_query = pending_orders_query.filter(Order.created_at >= datetime.fromisoformat(start_date))
-        if end_date:
-            pending_orders_query = pending_orders_query.filter(Order.created_at <= datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59))
-        expected_incoming = sum(float(o.total) for o in pending_orders_query.all())
-        
-        # 2. PROFIT MARGINS
-        gross_profit = platform_gross_earnings
-        gross_profit_margin = (gross_profit / total_revenue * 100) if total_revenue > 0 else 0
-        net_profit_margin = (platform_net_earnings / total_revenue * 100) if total_revenue > 0 else 0
-        profit_per_order = platform_net_earnings / len(orders) if orders else 0
-        
-        # 3. GROWTH METRICS (compare to previous period)
-        if start_date and end_date:
-            period_days = (datetime.fromisoformat(end_date) - datetime.fromisoformat(start_date)).days
-            prev_start = (datetime.fromisoformat(start_date) - timedelta(days=period_days)).isoformat()
-            prev_end = start_date
-            
-            current_app.logger.info(f'Growth calculation: Current period {start_date} to {end_date} ({period_days} days)')
-            current_app.logger.info(f'Growth calculation: Previous period {prev_start} to {prev_end}')
-            current_app.logger.info(f'Growth calculation: Current revenue = {total_revenue}, Current orders = {len(orders)}')
-            
-            prev_orders = Order.query.filter(
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= datetime.fromisoformat(prev_start),
-                Order.created_at < datetime.fromisoformat(prev_end)
-            ).all()
-            
-            prev_revenue = sum(float(o.total) for o in prev_orders)
-            current_app.logger.info(f'Growth calculation: Previous revenue = {prev_revenue}, Previous orders = {len(prev_orders)}')
-            
-            # Calculate growth - return None if no previous data to indicate "N/A"
-            if prev_revenue > 0:
-                revenue_growth = ((total_revenue - prev_revenue) / prev_revenue * 100)
-            else:
-                revenue_growth = None  # No previous data
-            
-            if len(prev_orders) > 0:
-                order_growth = ((len(orders) - len(prev_orders)) / len(prev_orders) * 100)
-            else:
-                order_growth = None  # No previous data
-            
-            current_app.logger.info(f'Growth calculation: Revenue growth = {revenue_growth}%, Order growth = {order_growth}%')
-            
-            # Customer acquisition (new customers in period)
-            new_customers = User.query.filter(
-                User.role == UserRole.CUSTOMER,
-                User.created_at >= datetime.fromisoformat(start_date),
-                User.created_at <= datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
-            ).count()
-            customer_acquisition_cost = (platform_gross_earnings / new_customers) if new_customers > 0 else 0
-        else:
-            revenue_growth = 0
-            order_growth = 0
-            new_customers = 0
-            customer_acquisition_cost = 0
-        
-        # 4. OPERATIONAL COSTS (estimated transaction fees)
-        # M-Pesa: ~1.5% fee, Paystack: ~2.9% + KES 100
-        mpesa_revenue = payment_method_breakdown.get('mpesa', 0)
-        card_revenue = payment_method_breakdown.get('card', 0)
-        mpesa_fees = mpesa_revenue * 0.015
-        paystack_fees = (card_revenue * 0.029) + (100 * len([o for o in orders if o.payment_method.value == 'card']))
-        total_transaction_fees = mpesa_fees + paystack_fees
-        
-        # 5. TAX INFORMATION (16% VAT in Kenya)
-        vat_rate = 0.16
-        vat_collected = total_revenue * (vat_rate / (1 + vat_rate))  # VAT inclusive
-        tax_liability = platform_net_earnings * 0.30  # Estimated 30% corporate tax
-        
-        # 6. SUPPLIER PERFORMANCE
-        supplier_performance = []
-        try:
-            for supplier_name, data in supplier_revenue.items():
-                supplier_profile = SupplierProfile.query.filter_by(business_name=supplier_name).first()
-                if supplier_profile:
-                    supplier_payouts_made = sum(float(p.amount) for p in payouts if p.supplier_id == supplier_profile.id)
-                    pending_payout = data['earnings'] - supplier_payouts_made
-                    
-                    # Calculate average payout time
-                    supplier_completed_payouts = [p for p in payouts if p.supplier_id == supplier_profile.id and p.paid_at]
-                    if supplier_completed_payouts:
-                        avg_payout_days = sum(
-                            (p.paid_at - p.created_at).days for p in supplier_completed_payouts
-                        ) / len(supplier_completed_payouts)
-                    else:
-                        avg_payout_days = 0
-                    
-                    supplier_performance.append({
-                        'name': supplier_name,
-                        'revenue': data['revenue'],
-                        'earnings': data['earnings'],
-                        'orders': data['orders'],
-                        'paid_out': supplier_payouts_made,
-                        'pending_payout': pending_payout,
-                        'avg_payout_days': round(avg_payout_days, 1)
-                    })
-            
-            supplier_performance = sorted(supplier_performance, key=lambda x: x['revenue'], reverse=True)[:10]
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f'Supplier performance error: {str(e)}')
-            supplier_performance = []
-        
-        # 7. RETURN RATE ANALYSIS
-        # By category
-        return_by_category = {}
-        return_by_supplier = {}
-        return_by_policy = {}
-        
-        try:
-            for ret in returns:
-                if ret.product_id:
-                    product = Product.query.get(ret.product_id)
-                    if product and product.category:
-                        cat_name = product.category.name
-                        if cat_name not in return_by_category:
-                            return_by_category[cat_name] = {'count': 0, 'amount': 0}
-                        return_by_category[cat_name]['count'] += 1
-                        return_by_category[cat_name]['amount'] += float(ret.customer_refund or ret.refund_amount or 0)
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f'Return by category error: {str(e)}')
-        
-        # By supplier
-        try:
-            for ret in returns:
-                if ret.order_item_id:
-                    from app.models.order import OrderItem
-                    item = OrderItem.query.get(ret.order_item_id)
-                    if item and item.supplier_id:
-                        supplier = SupplierProfile.query.get(item.supplier_id)
-                        if supplier:
-                            sup_name = supplier.business_name
-                            if sup_name not in return_by_supplier:
-                                return_by_supplier[sup_name] = {'count': 0, 'amount': 0}
-                            return_by_supplier[sup_name]['count'] += 1
-                            return_by_supplier[sup_name]['amount'] += float(ret.customer_refund or ret.refund_amount or 0)
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f'Return by supplier error: {str(e)}')
-        
-        # By policy
-        try:
-            for ret in returns:
-                policy = ret.refund_policy or 'unknown'
-                if policy not in return_by_policy:
-                    return_by_policy[policy] = {'count': 0, 'platform_cost': 0, 'supplier_cost': 0}
-                return_by_policy[policy]['count'] += 1
-                return_by_policy[policy]['platform_cost'] += float(ret.platform_deduction or 0)
-                return_by_policy[policy]['supplier_cost'] += float(ret.supplier_deduction or 0)
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f'Return by policy error: {str(e)}')
-        
-        return success_response(data={
-            # Revenue Metrics
-            'revenue': {
-                'total_revenue': float(total_revenue),
-                'total_subtotal': float(total_subtotal),
-                'total_delivery_fees': float(total_delivery_fees),
-                'net_revenue': float(net_revenue),
-                'avg_order_value': float(avg_order_value)
-            },
-            
-            # Commission & Earnings
-            'earnings': {
-                'total_commission': float(total_commission),
-                'total_supplier_earnings': float(total_supplier_earnings),
-                'total_delivery_fees_collected': float(total_delivery_fees_collected),
-                'delivery_agent_share': float(delivery_agent_share),
-                'platform_delivery_earnings': float(platform_delivery_earnings),
-                'platform_gross_earnings': float(platform_gross_earnings),
-                'platform_net_earnings': float(platform_net_earnings),
-                'commission_rate': float(commission_rate)
-            },
-            
-            # Cash Flow Analysis
-            'cash_flow': {
-                'outstanding_supplier_payouts': float(outstanding_supplier_payouts),
-                'outstanding_delivery_payouts': float(outstanding_delivery_payouts),
-                'expected_incoming_revenue': float(expected_incoming),
-                'net_cash_position': float(platform_net_earnings - outstanding_supplier_payouts - outstanding_delivery_payouts)
-            },
-            
-            # Profit Margins
-            'profit_margins': {
-                'gross_profit': float(gross_profit),
-                'gross_profit_margin': float(gross_profit_margin),
-                'net_profit_margin': float(net_profit_margin),
-                'profit_per_order': float(profit_per_order)
-            },
-            
-            # Growth Metrics
-            'growth': {
-                'revenue_growth': float(revenue_growth) if revenue_growth is not None else None,
-                'order_growth': float(order_growth) if order_growth is not None else None,
-                'new_customers': new_customers,
-                'customer_acquisition_cost': float(customer_acquisition_cost),
-                'has_comparison_data': revenue_growth is not None
-            },
-            
-            # Operational Costs
-            'operational_costs': {
-                'mpesa_fees': float(mpesa_fees),
-                'paystack_fees': float(paystack_fees),
-                'total_transaction_fees': float(total_transaction_fees),
-                'net_after_fees': float(platform_net_earnings - total_transaction_fees)
-            },
-            
-            # Tax Information
-            'tax': {
-                'vat_collected': float(vat_collected),
-                'vat_rate': float(vat_rate * 100),
-                'estimated_tax_liability': float(tax_liability),
-                'net_after_tax': float(platform_net_earnings - tax_liability)
-            },
-            
-            # Payouts
-            'payouts': {
-                'total_payouts': float(total_payouts),
-                'payout_count': payout_count,
-                'pending_payouts': float(total_pending_payouts),
-                'pending_count': len(pending_payouts)
-            },
-            
-            # Refunds
-            'refunds': {
-                'total_refunds_to_customers': float(total_refunds_to_customers),
-                'platform_paid_refunds': float(platform_paid_refunds),
-                'supplier_paid_refunds': float(supplier_paid_refunds),
-                'refund_count': refund_count,
-                'refund_rate': float(refund_rate)
-            },
-            
-            # Return Analysis
-            'return_analysis': {
-                'by_category': [{'category': k, **v} for k, v in return_by_category.items()],
-                'by_supplier': [{'supplier': k, **v} for k, v in return_by_supplier.items()],
-                'by_policy': [{'policy': k, **v} for k, v in return_by_policy.items()]
-            },
-            
-            # Order Metrics
-            'orders': {
-                'total_orders': len(orders),
-                'delivered_orders': len(delivered_orders)
-            },
-            
-            # Payment Methods
-            'payment_methods': [
-                {'method': k, 'amount': float(v)}
-                for k, v in payment_method_breakdown.items()
-                if v > 0
-            ],
-            
-            # Top Performers
-            'top_categories': top_categories,
-            'top_suppliers': top_suppliers,
-            'supplier_performance': supplier_performance,
-            
-            # Date Range
-            'period': {
-                'start_date': start_date,
-                'end_date': end_date
-            }
-        })
+        return success_response(data=financial_report_service.build(start_date, end_date))
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f'Financial report error: {str(e)}')
-        import traceback
-        traceback.print_exc()
         return error_response(f'Failed to generate report: {str(e)}', 500)
 
 
+@admin_bp.route('/reports/jobs', methods=['POST'])
+@jwt_required()
+@require_admin
+def submit_report_job():
+    """Queue a report to run in the background (reuses a matching queued, running or fresh job)."""
+    try:
+        data = request.get_json(silent=True) or {}
+        job, reused = report_job_service.submit(
+            data.get('report', 'financial'), data.get('params') or {}, requested_by=get_jwt_identity()
+        )
+        return success_response(
+            data={'job': job.to_dict(), 'reused': reused},
+            message='Report ready' if job.status == ReportJobStatus.COMPLETED else 'Report queued',
+            status_code=200 if job.status == ReportJobStatus.COMPLETED else 202
+        )
+    except ValueError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        db.session.rollback()
+        return error_response(f'Failed to queue report: {str(e)}', 500)
+
+
+@admin_bp.route('/reports/jobs', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_report_jobs():
+    """List recent report jobs."""
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+        jobs = ReportJob.query.order_by(ReportJob.created_at.desc()).limit(limit).all()
+        return success_response(data=[job.to_dict() for job in jobs])
+    except Exception as e:
+        return error_response(f'Failed to fetch report jobs: {str(e)}', 500)
+
+
+@admin_bp.route('/reports/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_report_job(job_id):
+    """Poll a report job's status."""
+    job = db.session.get(ReportJob, job_id)
+    if not job:
+        return error_response('Report job not found', 404)
+    return success_response(data=job.to_dict())
+
+
+@admin_bp.route('/reports/jobs/<job_id>/download', methods=['GET'])
+@jwt_required()
+@require_admin
+def download_report_job(job_id):
+    """Download a completed report job's result (?format=json|csv)."""
+    job = db.session.get(ReportJob, job_id)
+    if not job:
+        return error_response('Report job not found', 404)
+    if job.status != ReportJobStatus.COMPLETED:
+        return error_response(f'Report is {job.status.value}', 409)
+    if job.is_expired:
+        return error_response('Report result has expired; submit it again', 410)
+
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'csv'):
+        return error_response(f"Unsupported format '{fmt}'. Use json or csv", 400)
+
+    filename = f"{job.report_type}-report-{job.completed_at.strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    body = render_csv(job.result) if fmt == 'csv' else json.dumps(job.result)
+    return Response(
+        body,
+        mimetype='text/csv' if fmt == 'csv' else 'application/json',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
 # =============================================================================
 # Bulk Operations
 # =============================================================================
@@ -2421,30 +1973,54 @@ def bulk_order_update():
 @admin_bp.route('/products/export-csv', methods=['GET'])
 @jwt_required()
 @require_admin
+@reads_from_replica
 def export_products_csv():
-    """Export products to CSV."""
+    """Export products to CSV (JSON-wrapped; use /exports/products for large catalogs)."""
     try:
-        from io import StringIO
-        import csv
-        
-        products = Product.query.all()
-        
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['ID', 'Name', 'Price', 'Stock', 'Category', 'Brand', 'Active'])
-        
-        for p in products:
-            writer.writerow([
-                p.id, p.name, float(p.price), p.stock_quantity,
-                p.category.name if p.category else '',
-                p.brand.name if p.brand else '',
-                p.is_active
-            ])
-        
-        return success_response(data={'csv': output.getvalue()})
+        # Price as a float (1500.0), as this endpoint has always written it
+        stmt = export_service.query('products', {}).with_only_columns(
+            Product.id, Product.name, cast(Product.price, Float), Product.stock_quantity,
+            Category.name, Brand.name, Product.is_active
+        )
+        csv_text = ''.join(export_service.stream(
+            stmt, 'csv', headers=['ID', 'Name', 'Price', 'Stock', 'Category', 'Brand', 'Active']
+        ))
+        return success_response(data={'csv': csv_text})
+    except Exception as e:
+        return error_response(f'Failed to export: {str(e)}', 500)
+
+
+@admin_bp.route('/exports/<dataset>', methods=['GET'])
+@jwt_required()
+@require_admin
+@reads_from_replica
+def stream_export(dataset):
+    """Stream a dataset as CSV or NDJSON (?format=csv|ndjson plus dataset filters)."""
+    try:
+        fmt = request.args.get('format', 'csv')
+        if fmt not in FORMATS:
+            return error_response(f"Unsupported format '{fmt}'. Use csv or ndjson", 400)
+        stmt = export_service.query(dataset, request.args)
+    except ValueError as e:
+        return error_response(str(e), 400)
     except Exception as e:
         return error_response(f'Failed to export: {str(e)}', 500)
 
+    def generate():
+        # The body streams after this view returns, so route its reads again
+        with replica_reads():
+            yield from export_service.stream(stmt, fmt)
+
+    filename = f"{dataset}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'X-Accel-Buffering': 'no'  # Let nginx pass chunks through
+        }
+    )
+
 
 # =============================================================================
 # Notifications
@@ -2518,3 +2094,108 @@ def get_activity_timeline():
         })
     except Exception as e:
         return success_response(data={'activities': []})
+
+
+@admin_bp.route('/payments/reconciliation', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_payment_reconciliation():
+    """Get stuck payment counts and the last reconciliation run."""
+    try:
+        from app.services.payment_reconciler import payment_reconciler
+        
+        return success_response(data=payment_reconciler.summary())
+    except Exception as e:
+        return error_response(f'Failed to fetch payment reconciliation: {str(e)}', 500)
+
+
+@admin_bp.route('/payments/reconciliation/run', methods=['POST'])
+@jwt_required()
+@require_admin
+def run_payment_reconciliation():
+    """Reconcile one batch of pending payments now."""
+    try:
+        from app.services.payment_reconciler import payment_reconciler
+        
+        counts = payment_reconciler.run()
+        return success_response(
+            data=counts,
+            message=f"Checked {counts['checked']} payments: {counts['completed']} completed, {counts['failed']} failed"
+        )
+    except Exception as e:
+        db.session.rollback()
+        return error_response(f'Failed to reconcile payments: {str(e)}', 500)
+
+
+@admin_bp.route('/ledger/<account_type>/<account_id>', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_ledger_entries(account_type, account_id):
+    """Get a supplier, agent or company's ledger entries, newest first."""
+    try:
+        from app.services.ledger_service import ACCOUNTS
+        
+        if account_type not in ACCOUNTS:
+            return error_response(f'Unknown account type: {account_type}', 400)
+        
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 50))
+        
+        entries = ledger_service.entries(account_type, account_id)\
+            .paginate(page=page, per_page=per_page, error_out=False)
+        
+        return success_response(data={
+            'entries': [e.to_dict() for e in entries.items],
+            'pagination': {
+                'page': entries.page,
+                'per_page': entries.per_page,
+                'total': entries.total,
+                'pages': entries.pages
+            }
+        })
+    except Exception as e:
+        return error_response(f'Failed to fetch ledger entries: {str(e)}', 500)
+
+
+@admin_bp.route('/ledger/rebuild', methods=['POST'])
+@jwt_required()
+@require_admin
+def rebuild_ledger_balances():
+    """Reset partner balances from the ledger and report the ones that had drifted."""
+    try:
+        from app.services.ledger_service import ACCOUNTS
+        
+        data = request.get_json(silent=True) or {}
+        account_types = [data['account_type']] if data.get('account_type') else list(ACCOUNTS)
+        if any(account_type not in ACCOUNTS for account_type in account_types):
+            return error_response(f"Unknown account type: {data.get('account_type')}", 400)
+        
+        drifted = {account_type: ledger_service.rebuild_balances(account_type) for account_type in account_types}
+        db.session.commit()
+        
+        return success_response(
+            data={'drifted': drifted},
+            message=f'Rebuilt balances, {sum(len(d) for d in drifted.values())} accounts corrected'
+        )
+    except Exception as e:
+        db.session.rollback()
+        return error_response(f'Failed to rebuild balances: {str(e)}', 500)
+
+
+@admin_bp.route('/integrations/health', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_integrations_health():
+    """Get outbound provider call health (this worker), the inbound callback backlog and read replica status."""
+    try:
+        from app.services.http_client import http_client
+        from app.services.callback_inbox import callback_inbox
+        from app.services.read_replica import replica_router
+        
+        return success_response(data={
+            'providers': http_client.stats(),
+            'inbound_events': callback_inbox.backlog(),
+            'read_replica': replica_router.status()
+        })
+    except Exception as e:
+        return error_response(f'Failed to fetch integration health: {str(e)}', 500)
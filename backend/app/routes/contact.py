@@ -4,11 +4,11 @@ Supports both direct email sending and Web3Forms integration.
 """
 
 import os
-import requests
 from flask import Blueprint, request
 from app.utils.validation import validate_email, validate_required_fields
 from app.utils.responses import success_response, error_response, validation_error_response
 from app.services.email_service import send_contact_form_notification, send_contact_form_confirmation
+from app.services.http_client import http_client
 
 contact_bp = Blueprint('contact', __name__, url_prefix='/api/contact')
 
@@ -69,7 +69,8 @@ def send_via_web3forms(access_key, name, email, subject, message):
     Get your access key at: https://web3forms.com/
     """
     try:
-        response = requests.post(
+        response = http_client.post(
+            'web3forms',
             'https://api.web3forms.com/submit',
             json={
                 'access_key': access_key,
@@ -5,7 +5,7 @@ Delivery agent routes for managing deliveries and COD collection.
 from flask import Blueprint, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
-from sqlalchemy import func, cast, Text, or_
+from sqlalchemy import func, cast, Text
 from app.models import db
 from app.models.user import User, UserRole, DeliveryAgentProfile
 from app.models.order import Order, OrderStatus, PaymentMethod, PaymentStatus, DeliveryZone
@@ -14,6 +14,8 @@ from app.models.user import DeliveryCompany
 from app.models.returns import DeliveryZoneRequest, ZoneRequestStatus
 from app.utils.responses import success_response, error_response
 from app.services.email_service import send_email
+from app.services.ledger_service import ledger_service
+from app.services.read_replica import reads_from_replica
 from app.models.user import CustomerProfile
 
 
@@ -129,42 +131,15 @@ def get_dashboard():
         if not profile:
             return error_response('Delivery profile not found', 404)
 
-        # Today's stats
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-
-        # Orders assigned to this agent (pending delivery)
-        pending_orders = Order.query.filter(
-            Order.assigned_delivery_agent == user_id,
-            Order.status.in_([OrderStatus.PAID, OrderStatus.PROCESSING, OrderStatus.SHIPPED])
-        ).count()
-
-        # Delivered today
-        delivered_today = Order.query.filter(
-            Order.assigned_delivery_agent == user_id,
-            Order.status == OrderStatus.DELIVERED,
-            Order.updated_at >= today_start
-        ).count()
-
-        # COD collected today
-        cod_today = db.session.query(func.sum(Order.cod_amount_collected)).filter(
-            Order.cod_collected_by == user_id,
-            Order.cod_collected_at >= today_start
-        ).scalar() or 0
+        from app.services.agent_stats_service import agent_stats_service
 
-        # Total COD pending verification (collected by this agent)
-        cod_pending = db.session.query(func.sum(Order.cod_amount_collected)).filter(
-            Order.cod_collected_by == user_id,
-            Order.cod_verified_at.is_(None),
-            Order.cod_collected_at.isnot(None)
-        ).scalar() or 0
+        # Counters are maintained on order changes, so this is a single-row read
+        stats = agent_stats_service.get_stats(user_id).to_dict()
 
         return success_response(data={
             'profile': profile.to_dict(),
             'stats': {
-                'pending_deliveries': pending_orders,
-                'delivered_today': delivered_today,
-                'cod_collected_today': float(cod_today),
-                'cod_pending_verification': float(cod_pending),
+                **stats,
                 'total_deliveries': profile.total_deliveries,
                 'total_cod_collected': float(profile.total_cod_collected)
             }
@@ -327,14 +302,22 @@ def collect_cod(order_id):
             delivery_earning = user.delivery_agent_profile.calculate_delivery_earning(order.delivery_fee)
             user.delivery_agent_profile.total_deliveries += 1
             user.delivery_agent_profile.total_cod_collected += Decimal(str(amount))
-            user.delivery_agent_profile.pending_payout += Decimal(str(delivery_earning))
+            if delivery_earning > 0:
+                ledger_service.earning(
+                    'agent', user.delivery_agent_profile.id, delivery_earning,
+                    order_id=order.id, memo=f'Delivery fee for {order.order_number}'
+                )
 
-        # Update supplier earnings for each order item
+        # Credit supplier earnings, one ledger entry per supplier on the order
+        supplier_earnings = {}
         for item in order.items:
-            from app.models.user import SupplierProfile
-            supplier = SupplierProfile.query.get(item.supplier_id)
-            if supplier:
-                supplier.outstanding_balance += item.supplier_earnings
+            supplier_earnings[item.supplier_id] = supplier_earnings.get(item.supplier_id, 0) + (item.supplier_earnings or 0)
+        for supplier_id, earnings in supplier_earnings.items():
+            if earnings > 0:
+                ledger_service.earning(
+                    'supplier', supplier_id, earnings,
+                    order_id=order.id, memo=f'Sales from {order.order_number}'
+                )
 
         db.session.commit()
 
@@ -435,6 +418,13 @@ def manage_profile():
             profile.vehicle_registration = data['vehicle_registration']
         if 'is_available' in data:
             profile.is_available = data['is_available']
+        if 'latitude' in data or 'longitude' in data:
+            from app.services.geo_service import parse_coordinates
+            try:
+                profile.current_latitude, profile.current_longitude = parse_coordinates(data)
+            except ValueError as e:
+                return error_response(str(e), 400)
+            profile.location_updated_at = datetime.utcnow()
 
         db.session.commit()
 
@@ -497,6 +487,53 @@ def get_all_delivery_agents():
         return error_response(f'Failed to fetch agents: {str(e)}', 500)
 
 
+@delivery_bp.route('/admin/agents/nearest', methods=['GET'])
+@jwt_required()
+@require_admin
+def get_nearest_agents():
+    """Get the closest available agents to a point or to an order's delivery address (admin only)."""
+    try:
+        from app.services.geo_service import geo_service, parse_coordinates
+
+        order_id = request.args.get('order_id')
+        limit = min(int(request.args.get('limit', 5)), 50)
+        max_km = float(request.args['max_km']) if request.args.get('max_km') else None
+
+        if order_id:
+            order = Order.query.get(order_id)
+            if not order:
+                return error_response('Order not found', 404)
+            address = order.delivery_address
+            if not address or not address.has_coordinates:
+                return error_response('Order delivery address has no coordinates', 400)
+            latitude, longitude = address.latitude, address.longitude
+        else:
+            try:
+                latitude, longitude = parse_coordinates(request.args)
+            except ValueError as e:
+                return error_response(str(e), 400)
+            if latitude is None:
+                return error_response('Provide order_id or latitude/longitude', 400)
+
+        nearest = geo_service.nearest_agents(latitude, longitude, limit=limit, max_km=max_km)
+        profiles = {
+            p.user_id: p for p in DeliveryAgentProfile.query.filter(
+                DeliveryAgentProfile.user_id.in_([user_id for user_id, _ in nearest])
+            ).all()
+        } if nearest else {}
+
+        return success_response(data={
+            'latitude': latitude,
+            'longitude': longitude,
+            'agents': [
+                {**profiles[user_id].to_dict(), 'user_id': user_id, 'distance_km': round(distance, 2)}
+                for user_id, distance in nearest if user_id in profiles
+            ]
+        })
+    except Exception as e:
+        return error_response(f'Failed to find nearest agents: {str(e)}', 500)
+
+
 @delivery_bp.route('/admin/orders/<order_id>/assign', methods=['POST'])
 @jwt_required()
 @require_admin
@@ -533,6 +570,7 @@ def assign_delivery_agent(order_id):
 @delivery_bp.route('/admin/agents/<agent_id>/stats', methods=['GET'])
 @jwt_required()
 @require_admin
+@reads_from_replica
 def get_agent_stats(agent_id):
     """Get detailed stats for a delivery agent (admin only)."""
     try:
@@ -782,20 +820,13 @@ def process_auto_confirmations():
     This should be called periodically (e.g., via cron job).
     """
     try:
-        # Find orders ready for auto-confirmation
-        orders = Order.query.filter(
-            Order.delivery_confirmed_by_agent == True,
-            Order.customer_confirmed_delivery == False,
-            Order.customer_dispute == False,
-            Order.auto_confirmed == False,
-            Order.auto_confirm_deadline <= datetime.utcnow()
-        ).all()
+        from app.services.notification_service import notification_service
 
-        confirmed_count = 0
-        for order in orders:
-            if order.auto_confirm_delivery():
-                confirmed_count += 1
+        # Confirm every due order in one statement
+        confirmed_ids = Order.auto_confirm_due_deliveries()
+        confirmed_count = len(confirmed_ids)
 
+        notification_service.notify_auto_confirmed_orders(confirmed_ids)
         db.session.commit()
 
         return success_response(
@@ -915,69 +946,13 @@ def generate_delivery_payouts():
     Generate payouts for confirmed deliveries that haven't been paid yet.
     This creates payout records for each delivery agent/company with pending earnings.
     """
-    from app.models.returns import DeliveryPayout, DeliveryPayoutType
+    from app.services.delivery_payout_service import delivery_payout_service
 
     try:
         user_id = get_jwt_identity()
 
-        # Find all confirmed orders with unpaid delivery fees
-        orders = Order.query.filter(
-            or_(
-                Order.customer_confirmed_delivery == True,
-                Order.auto_confirmed == True
-            ),
-            Order.delivery_fee_paid == False,
-            Order.assigned_delivery_agent.isnot(None)
-        ).all()
-
-        # Group orders by delivery agent
-        agent_orders = {}
-        for order in orders:
-            agent_id = order.assigned_delivery_agent
-            if agent_id not in agent_orders:
-                agent_orders[agent_id] = []
-            agent_orders[agent_id].append(order)
-
-        payouts_created = []
-
-        for agent_id, orders_list in agent_orders.items():
-            user = User.query.get(agent_id)
-            if not user or not user.delivery_agent_profile:
-                continue
-
-            profile = user.delivery_agent_profile
-
-            # Calculate totals
-            gross_amount = sum(float(o.delivery_fee) for o in orders_list)
-            fee_percentage = float(profile.delivery_fee_percentage) / 100
-            net_amount = gross_amount * fee_percentage
-            platform_fee = gross_amount - net_amount
-
-            # Get confirmed dates (filter out None values)
-            confirmed_dates = [o.delivery_confirmed_at or o.customer_confirmed_at or o.updated_at for o in orders_list]
-            confirmed_dates = [d for d in confirmed_dates if d is not None]
-            
-            # Create payout
-            payout = DeliveryPayout(
-                payout_type=DeliveryPayoutType.AGENT,
-                delivery_agent_id=profile.id,
-                gross_amount=gross_amount,
-                platform_fee=platform_fee,
-                net_amount=net_amount,
-                order_count=len(orders_list),
-                order_ids=[o.id for o in orders_list],
-                mpesa_number=profile.mpesa_number,
-                period_start=min(confirmed_dates) if confirmed_dates else datetime.utcnow(),
-                period_end=max(confirmed_dates) if confirmed_dates else datetime.utcnow()
-            )
-            payout.generate_payout_number()
-            db.session.add(payout)
-
-            # Update agent's pending payout
-            from decimal import Decimal
-            profile.pending_payout += Decimal(str(net_amount))
-
-            payouts_created.append(payout.payout_number)
+        payouts = delivery_payout_service.generate(created_by=user_id)
+        payouts_created = [payout.payout_number for payout in payouts]
 
         db.session.commit()
 
@@ -1078,6 +1053,7 @@ def process_delivery_payout_mpesa(payout_id):
 def complete_delivery_payout(payout_id):
     """Mark a delivery payout as completed and update related orders."""
     from app.models.returns import DeliveryPayout, DeliveryPayoutType
+    from app.services.delivery_payout_service import delivery_payout_service
 
     try:
         user_id = get_jwt_identity()
@@ -1099,21 +1075,19 @@ def complete_delivery_payout(payout_id):
         payout.payment_reference = payment_reference
 
         # Mark orders as paid
-        if payout.order_ids:
-            for order_id in payout.order_ids:
-                order = Order.query.get(order_id)
-                if order:
-                    order.delivery_fee_paid = True
-                    order.delivery_fee_paid_at = datetime.utcnow()
-                    order.delivery_payment_reference = payment_reference
-
-        # Update delivery partner stats
-        if payout.payout_type == DeliveryPayoutType.AGENT and payout.delivery_agent:
-            payout.delivery_agent.total_earnings += float(payout.net_amount)
-            payout.delivery_agent.pending_payout -= float(payout.net_amount)
-        elif payout.payout_type == DeliveryPayoutType.COMPANY and payout.delivery_company:
-            payout.delivery_company.total_paid += float(payout.net_amount)
-            payout.delivery_company.pending_balance -= float(payout.net_amount)
+        delivery_payout_service.mark_orders_paid(payout, payment_reference)
+
+        # Update delivery partner balances
+        if payout.payout_type == DeliveryPayoutType.AGENT and payout.delivery_agent_id:
+            ledger_service.payout(
+                'agent', payout.delivery_agent_id, payout.net_amount,
+                reference=payout.payout_number, memo='Delivery payout completed', created_by=user_id
+            )
+        elif payout.payout_type == DeliveryPayoutType.COMPANY and payout.delivery_company_id:
+            ledger_service.payout(
+                'company', payout.delivery_company_id, payout.net_amount,
+                reference=payout.payout_number, memo='Delivery payout completed', created_by=user_id
+            )
 
         db.session.commit()
 
@@ -1132,6 +1106,7 @@ def complete_delivery_payout(payout_id):
 def cancel_delivery_payout(payout_id):
     """Cancel a delivery payout that is in pending status."""
     from app.models.returns import DeliveryPayout
+    from app.services.delivery_payout_service import delivery_payout_service
 
     try:
         payout = DeliveryPayout.query.get(payout_id)
@@ -1147,11 +1122,17 @@ def cancel_delivery_payout(payout_id):
                 400
             )
 
+        if payout.status == 'cancelled':
+            return error_response('Payout already cancelled', 400)
+
         data = request.get_json() or {}
         reason = data.get('reason', 'Cancelled by admin')
 
         payout.status = 'cancelled'
         payout.notes = f"{payout.notes or ''}\n\nCancelled: {reason}"
+
+        # Free the orders for the next payout run
+        delivery_payout_service.release(payout)
         db.session.commit()
 
         return success_response(
@@ -1285,9 +1266,10 @@ def pay_delivery_agent_now(agent_id):
         
         if response.get('success'):
             # Update agent balance
-            from decimal import Decimal
-            profile.pending_payout -= Decimal(str(amount))
-            profile.total_earnings += Decimal(str(amount))
+            ledger_service.payout(
+                'agent', profile.id, amount,
+                reference=response.get('conversation_id'), memo=notes, created_by=get_jwt_identity()
+            )
             
             # Create payment record
             from app.models.returns import DeliveryPayout, DeliveryPayoutType
@@ -1377,8 +1359,10 @@ def pay_supplier_now(supplier_id):
         
         if response.get('success'):
             # Update supplier balance
-            supplier.outstanding_balance -= amount
-            supplier.total_sales += amount
+            ledger_service.payout(
+                'supplier', supplier.id, amount,
+                reference=response.get('conversation_id'), memo=notes, created_by=get_jwt_identity()
+            )
             
             # Create payment record
             from app.models.returns import SupplierPayout
@@ -2254,6 +2238,11 @@ def reject_delivery_request(request_id):
         
         # Reject the request
         delivery_request.reject(reason)
+        db.session.flush()
+        
+        # Move to the next wave once everyone in this wave has declined
+        from app.services.dispatch_service import dispatch_service
+        dispatch_service.offer_next_wave(delivery_request.order)
         db.session.commit()
         
         return success_response(
@@ -2269,10 +2258,8 @@ def reject_delivery_request(request_id):
 @jwt_required()
 @require_admin
 def notify_agents_for_delivery(order_id):
-    """Admin notifies available agents about delivery (enterprise-level)."""
+    """Admin offers the order to the next wave of ranked delivery agents."""
     try:
-        from app.services.notification_service import notification_service
-        
         order = Order.query.get(order_id)
         if not order:
             return error_response('Order not found', 404)
@@ -2284,67 +2271,29 @@ def notify_agents_for_delivery(order_id):
             return error_response('Order must be in processing or quality_approved status', 400)
         
         data = request.get_json() or {}
-        timeout_hours = data.get('timeout_hours', 2)  # Default 2 hours
-        
-        # Find available agents in the delivery zone
-        from app.models.user import DeliveryAgentProfile
-        from sqlalchemy import cast, Text
-        
-        agents = DeliveryAgentProfile.query.join(User).filter(
-            User.is_active == True,
-            DeliveryAgentProfile.is_available == True
-        ).all()
+        timeout_minutes = None  # Defaults to DISPATCH_OFFER_TIMEOUT_MINUTES
+        if data.get('timeout_minutes'):
+            timeout_minutes = int(data['timeout_minutes'])
+        elif data.get('timeout_hours'):
+            timeout_minutes = int(float(data['timeout_hours']) * 60)
         
-        # Filter by zone if possible
-        zone_agents = []
-        for agent in agents:
-            if agent.assigned_zones and order.delivery_zone in agent.assigned_zones:
-                zone_agents.append(agent)
+        # Offer the order to the next ranked wave of agents
+        from app.services.dispatch_service import dispatch_service
+        offers = dispatch_service.offer_next_wave(order, timeout_minutes=timeout_minutes)
         
-        # If no zone-specific agents, use all available agents
-        if not zone_agents:
-            zone_agents = agents
-        
-        if not zone_agents:
-            return error_response('No available delivery agents found', 400)
-        
-        # Create delivery requests for all available agents
-        expires_at = datetime.utcnow() + timedelta(hours=timeout_hours)
-        requests_created = []
-        
-        for agent in zone_agents:
-            delivery_request = DeliveryRequest(
-                order_id=order.id,
-                delivery_agent_id=agent.user_id,
-                expires_at=expires_at
-            )
-            db.session.add(delivery_request)
-            requests_created.append(agent.user_id)
-            
-            # Notify agent
-            try:
-                notification_service.create_notification(
-                    user_id=agent.user_id,
-                    title='New Delivery Available',
-                    message=f'Order #{order.order_number} to {order.delivery_zone} - KES {order.delivery_fee} delivery fee. Accept within {timeout_hours} hours.',
-                    notification_type='info',
-                    link=f'/delivery/available-requests'
-                )
-            except Exception as e:
-                print(f'Agent notification error: {str(e)}')
-        
-        # Update order status
-        order.status = OrderStatus.PENDING_ASSIGNMENT
+        if not offers:
+            return error_response('No delivery agents available for a new offer wave', 400)
         
         db.session.commit()
         
         return success_response(
             data={
                 'order': order.to_dict(),
-                'agents_notified': len(requests_created),
-                'expires_at': expires_at.isoformat()
+                'agents_notified': len(offers),
+                'wave': offers[0].wave,
+                'expires_at': offers[0].expires_at.isoformat()
             },
-            message=f'Notified {len(requests_created)} delivery agents'
+            message=f'Offered order to {len(offers)} delivery agents (wave {offers[0].wave})'
         )
     except Exception as e:
         db.session.rollback()
@@ -2448,14 +2397,10 @@ def get_all_delivery_requests():
 @jwt_required()
 @require_admin
 def expire_old_delivery_requests():
-    """Expire delivery requests that have passed timeout."""
+    """Expire delivery requests that have passed timeout and dispatch the next wave."""
     try:
-        expired = DeliveryRequest.query.filter(
-            DeliveryRequest.status == DeliveryRequestStatus.PENDING,
-            DeliveryRequest.expires_at <= datetime.utcnow()
-        ).update({'status': DeliveryRequestStatus.EXPIRED})
-        
-        db.session.commit()
+        from app.services.dispatch_service import dispatch_service
+        expired, _ = dispatch_service.expire_requests()
         
         return success_response(
             data={'expired_count': expired},
@@ -6,6 +6,7 @@ from app.models.user import User, UserRole
 from app.models.address import Address
 from app.models.order import Order, OrderItem, DeliveryZone, OrderStatus, PaymentStatus
 from app.models.product import Product
+from app.services.geo_service import geo_service, parse_coordinates
 from app.utils.validation import validate_required_fields
 from app.utils.responses import success_response, error_response, validation_error_response
 from app.services.email_service import (
@@ -54,6 +55,11 @@ def create_address():
             # Unset other default addresses
             Address.query.filter_by(user_id=user_id, is_default=True).update({'is_default': False})
         
+        try:
+            latitude, longitude = parse_coordinates(data)
+        except ValueError as e:
+            return error_response(str(e), 400)
+        
         address = Address(
             user_id=user_id,
             label=data['label'].strip(),
@@ -64,6 +70,8 @@ def create_address():
             city=data['city'].strip(),
             county=data['county'].strip(),
             postal_code=data.get('postal_code', '').strip() if data.get('postal_code') else None,
+            latitude=latitude,
+            longitude=longitude,
             is_default=is_default
         )
         
@@ -110,6 +118,11 @@ def update_address(address_id):
             address.county = data['county'].strip()
         if 'postal_code' in data:
             address.postal_code = data['postal_code'].strip() if data['postal_code'] else None
+        if 'latitude' in data or 'longitude' in data:
+            try:
+                address.latitude, address.longitude = parse_coordinates(data)
+            except ValueError as e:
+                return error_response(str(e), 400)
         
         # Handle default address
         if 'is_default' in data and data['is_default']:
@@ -170,24 +183,31 @@ def get_delivery_zones():
 
 
 @orders_bp.route('/delivery-zones/calculate', methods=['POST'])
-@validate_required_fields(['county'])
 def calculate_delivery_fee():
-    """Calculate delivery fee for a county."""
+    """Calculate delivery fee for a map pin (latitude/longitude) or a county."""
     try:
-        data = request.get_json()
-        county = data['county'].strip()
-        
-        # Find zone that contains this county
-        zones = DeliveryZone.query.filter_by(is_active=True).all()
+        data = request.get_json() or {}
         
-        for zone in zones:
-            if county.lower() in [c.lower() for c in zone.counties]:
-                return success_response(data={
-                    'zone_id': zone.id,
-                    'zone_name': zone.name,
-                    'delivery_fee': float(zone.delivery_fee),
-                    'estimated_days': zone.estimated_days
-                })
+        try:
+            latitude, longitude = parse_coordinates(data)
+        except ValueError as e:
+            return error_response(str(e), 400)
+        
+        if latitude is None and not data.get('county'):
+            return error_response('Provide a county or latitude/longitude', 400)
+        
+        # Prefer the zone containing the pin, then the zone listing the county
+        zone = geo_service.resolve_zone(latitude, longitude) if latitude is not None else None
+        if not zone:
+            zone = geo_service.zone_for_county(data.get('county'))
+        
+        if zone:
+            return success_response(data={
+                'zone_id': zone.id,
+                'zone_name': zone.name,
+                'delivery_fee': geo_service.delivery_fee(zone, latitude, longitude),
+                'estimated_days': zone.estimated_days
+            })
         
         return error_response('Delivery not available for this location', 400)
     except Exception as e:
@@ -223,20 +243,14 @@ def create_order():
         
         print(f'Address validated: {address.id}')
         
-        # Calculate delivery fee
-        zones = DeliveryZone.query.filter_by(is_active=True).all()
-        delivery_zone = None
-        delivery_fee = 0
-        
-        for zone in zones:
-            if address.county.lower() in [c.lower() for c in zone.counties]:
-                delivery_zone = zone
-                delivery_fee = float(zone.delivery_fee)
-                break
+        # Calculate delivery fee (zone by map pin when available, else by county)
+        delivery_zone = geo_service.zone_for_address(address)
         
         if not delivery_zone:
             return error_response('Delivery not available to your location', 400)
         
+        delivery_fee = geo_service.delivery_fee(delivery_zone, address.latitude, address.longitude)
+        
         print(f'Delivery zone found: {delivery_zone.name}, fee: {delivery_fee}')
         
         # Validate items and calculate subtotal
@@ -559,54 +573,14 @@ def update_payment_status(order_id):
         if data['payment_status'] == PaymentStatus.COMPLETED.value:
             order.paid_at = datetime.utcnow()
             
-            # Automatically notify delivery agents when payment is completed
-            from app.models.user import DeliveryAgentProfile
-            from app.models.delivery_request import DeliveryRequest
-            from datetime import timedelta
+            # Automatically offer the order to the first wave of delivery agents
+            from app.services.dispatch_service import dispatch_service
             
-            # Find available agents in delivery zone
-            agents = DeliveryAgentProfile.query.join(User).filter(
-                User.is_active == True,
-                DeliveryAgentProfile.is_available == True
-            ).all()
+            order.status = OrderStatus.PAID
+            offers = dispatch_service.offer_next_wave(order)
             
-            zone_agents = []
-            for agent in agents:
-                if agent.assigned_zones and order.delivery_zone in agent.assigned_zones:
-                    zone_agents.append(agent)
-            
-            if not zone_agents:
-                zone_agents = agents
-            
-            if zone_agents:
-                # Change to pending assignment
-                order.status = OrderStatus.PENDING_ASSIGNMENT
-                expires_at = datetime.utcnow() + timedelta(hours=2)
-                
-                for agent in zone_agents:
-                    delivery_request = DeliveryRequest(
-                        order_id=order.id,
-                        delivery_agent_id=agent.user_id,
-                        expires_at=expires_at
-                    )
-                    db.session.add(delivery_request)
-                    
-                    try:
-                        from app.services.notification_service import notification_service
-                        notification_service.create_notification(
-                            user_id=agent.user_id,
-                            title='New Delivery Available',
-                            message=f'Order #{order.order_number} to {order.delivery_zone} - KES {order.delivery_fee} delivery fee.',
-                            notification_type='info',
-                            link=f'/delivery/available-requests'
-                        )
-                    except Exception as e:
-                        print(f'Agent notification error: {str(e)}')
-                
-                print(f'Auto-notified {len(zone_agents)} agents for paid order {order.order_number}')
-            else:
-                # No agents available, set to PAID status for admin to handle
-                order.status = OrderStatus.PAID
+            if offers:
+                print(f'Offered paid order {order.order_number} to {len(offers)} agents')
         
         db.session.commit()
         
@@ -2,10 +2,11 @@
 Payment routes for M-Pesa and Card payments.
 """
 
+import json
 import os
 from flask import Blueprint, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.models import db
 from app.models.user import User, UserRole
 from app.models.order import Order, OrderStatus, PaymentMethod, PaymentStatus
@@ -15,6 +16,8 @@ from app.utils.responses import success_response, error_response
 from app.utils.decorators import admin_required
 from app.services.mpesa_service import mpesa_service
 from app.services.paystack_service import paystack_service
+from app.services.callback_inbox import callback_inbox
+from app.services.payment_reconciler import payment_reconciler
 from app.services.email_service import send_payment_confirmation_email
 
 payments_bp = Blueprint('payments', __name__, url_prefix='/api/payments')
@@ -73,8 +76,10 @@ def initiate_mpesa_payment():
         )
 
         if result.get('success'):
-            # Store checkout request ID for callback matching
+            # Store checkout request ID for callback matching; a retry reopens a failed payment
             order.payment_reference = result.get('checkout_request_id')
+            order.payment_status = PaymentStatus.PENDING
+            order.payment_checked_at = None
             db.session.commit()
 
             return success_response(
@@ -102,78 +107,25 @@ def mpesa_callback():
     """
     Handle M-Pesa callback from Safaricom.
     This endpoint is called by M-Pesa when payment is completed or fails.
+    The callback is stored and acknowledged; the inbound event worker applies it.
     """
     try:
-        # Log raw request for debugging
-        raw_data = request.get_data(as_text=True)
-        current_app.logger.info(f'M-Pesa callback RAW: {raw_data}')
-        
-        data = request.get_json()
-        current_app.logger.info(f'M-Pesa callback JSON: {data}')
+        data = request.get_json(silent=True) or {}
 
-        # Extract callback data
         stk_callback = data.get('Body', {}).get('stkCallback', {})
-        merchant_request_id = stk_callback.get('MerchantRequestID')
         checkout_request_id = stk_callback.get('CheckoutRequestID')
-        result_code = stk_callback.get('ResultCode')
-        result_desc = stk_callback.get('ResultDesc')
-        
-        current_app.logger.info(f'Callback details - CheckoutID: {checkout_request_id}, ResultCode: {result_code}')
-
-        # Find order by checkout request ID
-        order = Order.query.filter_by(payment_reference=checkout_request_id).first()
-
-        if not order:
-            current_app.logger.warning(f'Order not found for checkout ID: {checkout_request_id}')
-            return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
-
-        if result_code == 0:
-            # Payment successful
-            callback_metadata = stk_callback.get('CallbackMetadata', {}).get('Item', [])
-
-            # Extract transaction details
-            mpesa_receipt = None
-            amount = None
-            phone = None
-
-            for item in callback_metadata:
-                if item.get('Name') == 'MpesaReceiptNumber':
-                    mpesa_receipt = item.get('Value')
-                elif item.get('Name') == 'Amount':
-                    amount = item.get('Value')
-                elif item.get('Name') == 'PhoneNumber':
-                    phone = item.get('Value')
-
-            # Update order
-            order.payment_status = PaymentStatus.COMPLETED
-            order.status = OrderStatus.PAID
-            order.payment_reference = mpesa_receipt or checkout_request_id
-            order.paid_at = datetime.utcnow()
-
-            db.session.commit()
-
-            # Send confirmation email
-            try:
-                send_payment_confirmation_email(order, order.customer.user.email)
-            except Exception as e:
-                current_app.logger.error(f'Failed to send payment email: {str(e)}')
-
-            current_app.logger.info(f'Payment COMPLETED for order {order.order_number}, Receipt: {mpesa_receipt}')
-
-        else:
-            # Payment failed
-            order.payment_status = PaymentStatus.FAILED
-            order.admin_notes = f'M-Pesa payment failed: {result_desc}'
-            db.session.commit()
-
-            current_app.logger.warning(f'Payment FAILED for order {order.order_number}: {result_desc}')
+        current_app.logger.info(
+            f"M-Pesa callback - CheckoutID: {checkout_request_id}, ResultCode: {stk_callback.get('ResultCode')}"
+        )
 
-        # M-Pesa expects this response format
-        return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
+        callback_inbox.record('mpesa', 'stk_callback', checkout_request_id, data)
 
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f'M-Pesa callback error: {str(e)}', exc_info=True)
-        return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
+
+    # M-Pesa expects this response format
+    return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
 
 
 @payments_bp.route('/mpesa/query', methods=['POST'])
@@ -205,71 +157,41 @@ def query_mpesa_status():
         if not order.payment_reference:
             return error_response('No payment initiated for this order', 400)
 
-        # If already paid, return success
+        # The reconciliation job also checks pending payments, so polls within
+        # the minimum interval are answered from the database
+        min_interval = int(current_app.config.get('PAYMENT_QUERY_MIN_INTERVAL_SECONDS', 15))
+        if order.payment_status == PaymentStatus.PENDING and (
+            not order.payment_checked_at or
+            order.payment_checked_at <= datetime.utcnow() - timedelta(seconds=min_interval)
+        ):
+            payment_reconciler.check_order(order)
+
         if order.payment_status == PaymentStatus.COMPLETED:
             return success_response(
                 data={
                     'status': 'completed',
                     'payment_reference': order.payment_reference,
-                    'payment_status': order.payment_status.value
+                    'payment_status': 'completed'
                 },
                 message='Payment completed'
             )
-
-        # Query M-Pesa for status
-        try:
-            result = mpesa_service.query_stk_push_status(order.payment_reference)
-            current_app.logger.info(f'Query result for order {order.order_number}: {result}')
-            
-            # Update order if payment completed
-            if result.get('result_code') == '0':
-                order.payment_status = PaymentStatus.COMPLETED
-                order.status = OrderStatus.PAID
-                order.paid_at = datetime.utcnow()
-                db.session.commit()
-                
-                # Send confirmation email
-                try:
-                    send_payment_confirmation_email(order, order.customer.user.email)
-                except Exception as e:
-                    current_app.logger.error(f'Failed to send payment email: {str(e)}')
-                
-                return success_response(
-                    data={
-                        'status': 'completed',
-                        'payment_reference': order.payment_reference,
-                        'payment_status': 'completed'
-                    },
-                    message='Payment completed'
-                )
-            elif result.get('result_code') == '1032':
-                # User cancelled
-                order.payment_status = PaymentStatus.FAILED
-                order.admin_notes = 'Payment cancelled by user'
-                db.session.commit()
-                return success_response(
-                    data={'status': 'cancelled', 'payment_status': 'failed'},
-                    message='Payment was cancelled'
-                )
-            else:
-                return success_response(
-                    data={
-                        'status': 'pending',
-                        'result_code': result.get('result_code'),
-                        'result_desc': result.get('result_desc'),
-                        'payment_status': order.payment_status.value
-                    },
-                    message='Payment still pending'
-                )
-        except Exception as query_error:
-            current_app.logger.error(f'M-Pesa query API error: {str(query_error)}')
-            # Return current order status even if query fails
+        elif order.payment_status == PaymentStatus.FAILED:
+            cancelled = order.admin_notes == 'Payment cancelled by user'
+            return success_response(
+                data={
+                    'status': 'cancelled' if cancelled else 'failed',
+                    'result_desc': order.admin_notes,
+                    'payment_status': 'failed'
+                },
+                message='Payment was cancelled' if cancelled else 'Payment failed'
+            )
+        else:
             return success_response(
                 data={
-                    'status': order.payment_status.value,
+                    'status': 'pending',
                     'payment_status': order.payment_status.value
                 },
-                message='Using cached payment status'
+                message='Payment still pending'
             )
 
     except Exception as e:
@@ -462,8 +384,10 @@ def initiate_card_payment():
         )
 
         if result.get('success'):
-            # Store reference for verification
+            # Store reference for verification; a retry reopens a failed payment
             order.payment_reference = reference
+            order.payment_status = PaymentStatus.PENDING
+            order.payment_checked_at = None
             db.session.commit()
 
             return success_response(
@@ -567,39 +491,37 @@ def card_webhook():
     """
     Handle Paystack webhook events.
     This endpoint is called by Paystack when payment events occur.
+    Deliveries must carry a valid x-paystack-signature; replays are dropped
+    before the database and charges are applied by the inbound event worker.
     """
     try:
-        data = request.get_json()
-        current_app.logger.info(f'Paystack webhook received: {data}')
+        raw_body = request.get_data()
+        if not paystack_service.verify_webhook_signature(raw_body, request.headers.get('x-paystack-signature')):
+            current_app.logger.warning('Paystack webhook rejected: invalid signature')
+            return {'status': 'error', 'message': 'Invalid signature'}, 401
 
+        data = json.loads(raw_body or b'{}')
         event = data.get('event')
         event_data = data.get('data', {})
+        reference = event_data.get('reference')
+        current_app.logger.info(f'Paystack webhook received: {event} {reference}')
 
-        # Handle charge.success event
-        if event == 'charge.success':
-            reference = event_data.get('reference')
-            status = event_data.get('status')
-
-            # Find order by reference
-            order = Order.query.filter_by(payment_reference=reference).first()
-
-            if order and status == 'success':
-                order.payment_status = PaymentStatus.COMPLETED
-                order.status = OrderStatus.PAID
-                order.paid_at = datetime.utcnow()
-                db.session.commit()
-
-                # Send confirmation email
-                try:
-                    send_payment_confirmation_email(order, order.customer.user.email)
-                except Exception as e:
-                    current_app.logger.error(f'Failed to send payment email: {str(e)}')
+        # Only charge.success changes an order
+        if event != 'charge.success':
+            return {'status': 'success'}, 200
 
-                current_app.logger.info(f'Payment successful for order {order.order_number}')
+        delivery_id = f"{event}:{event_data.get('id') or reference}"
+        if callback_inbox.is_replay('paystack', delivery_id):
+            current_app.logger.info(f'Paystack webhook replay ignored: {event} {reference}')
+            return {'status': 'success'}, 200
 
+        # Remembered only once stored (or found stored), so a failed attempt is retried
+        callback_inbox.record('paystack', event, reference, data)
+        callback_inbox.remember_delivery('paystack', delivery_id)
         return {'status': 'success'}, 200
 
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f'Paystack webhook error: {str(e)}')
         return {'status': 'error', 'message': str(e)}, 500
 
@@ -731,73 +653,40 @@ def initiate_supplier_payout():
 def b2c_result_callback():
     """
     Handle B2C result callback from M-Pesa.
-    Called when B2C payment completes or fails.
+    Called when B2C payment completes or fails; applied by the inbound event worker.
     """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         current_app.logger.info(f'B2C result callback: {data}')
 
-        result = data.get('Result', {})
-        conversation_id = result.get('ConversationID')
-        result_code = result.get('ResultCode')
-        result_desc = result.get('ResultDesc')
-
-        # Find payout by conversation ID
-        payout = SupplierPayout.query.filter_by(reference=conversation_id).first()
-
-        if payout:
-            if result_code == 0:
-                # Payment successful
-                payout.status = 'completed'
-                payout.paid_at = datetime.utcnow()
-
-                # Extract transaction details from ResultParameters
-                result_params = result.get('ResultParameters', {}).get('ResultParameter', [])
-                for param in result_params:
-                    if param.get('Key') == 'TransactionReceipt':
-                        payout.reference = param.get('Value')
-                        break
-
-                current_app.logger.info(f'B2C payout successful: {payout.id}')
-            else:
-                # Payment failed
-                payout.status = 'failed'
-                payout.notes = (payout.notes or '') + f'\nFailed: {result_desc}'
-                current_app.logger.warning(f'B2C payout failed: {payout.id} - {result_desc}')
-
-            db.session.commit()
-
-        return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
+        conversation_id = data.get('Result', {}).get('ConversationID')
+        callback_inbox.record('mpesa', 'b2c_result', conversation_id, data)
 
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f'B2C result callback error: {str(e)}')
-        return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
+
+    return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
 
 
 @payments_bp.route('/b2c/timeout', methods=['POST'])
 def b2c_timeout_callback():
     """
     Handle B2C timeout callback from M-Pesa.
-    Called when B2C request times out.
+    Called when B2C request times out; applied by the inbound event worker.
     """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         current_app.logger.warning(f'B2C timeout callback: {data}')
 
-        # Mark payout as failed due to timeout
         conversation_id = data.get('Result', {}).get('ConversationID')
-        if conversation_id:
-            payout = SupplierPayout.query.filter_by(reference=conversation_id).first()
-            if payout:
-                payout.status = 'failed'
-                payout.notes = (payout.notes or '') + '\nFailed: Request timed out'
-                db.session.commit()
-
-        return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
+        callback_inbox.record('mpesa', 'b2c_timeout', conversation_id, data)
 
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f'B2C timeout callback error: {str(e)}')
-        return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
+
+    return {'ResultCode': 0, 'ResultDesc': 'Accepted'}
 
 
 @payments_bp.route('/supplier/payouts', methods=['GET'])
@@ -7,6 +7,7 @@ from app.models.order import Order, OrderItem, OrderStatus
 from app.models.returns import Return, ReturnStatus
 from app.utils.validation import validate_required_fields
 from app.utils.responses import success_response, error_response
+from app.services.read_replica import reads_from_replica
 
 returns_bp = Blueprint('returns', __name__, url_prefix='/api/returns')
 
@@ -115,7 +116,7 @@ def get_returns():
             # Admin sees all
             returns = Return.query.order_by(Return.created_at.desc()).all()
         
-        return success_response(data=[r.to_dict() for r in returns])
+        return success_response(data=Return.serialize_many(returns))
     except Exception as e:
         return error_response(f'Failed to fetch returns: {str(e)}', 500)
 
@@ -233,6 +234,7 @@ def update_return_status(return_id):
 
 @returns_bp.route('/stats', methods=['GET'])
 @jwt_required()
+@reads_from_replica
 def get_return_stats():
     """Get return statistics (admin/supplier)."""
     try:
@@ -1,19 +1,23 @@
 from flask import Blueprint, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime, timedelta
+from datetime import datetime
 from sqlalchemy import func
 from app.models import db
 from app.models.user import User, UserRole, CustomerProfile
 from app.models.order import Order, OrderItem, OrderStatus, PaymentStatus
-from app.models.product import Product, Category
+from app.models.product import Product
 from app.models.returns import Return, ReturnStatus, SupplierPayout
 from app.utils.responses import success_response, error_response
+from app.services.supplier_analytics import supplier_analytics_service
+from app.services.returns_analytics import returns_analytics_service
+from app.services.read_replica import reads_from_replica
 
 supplier_bp = Blueprint('supplier', __name__, url_prefix='/api/supplier')
 
 
 @supplier_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
+@reads_from_replica
 def get_dashboard():
     """Get supplier dashboard overview."""
     try:
@@ -26,76 +30,7 @@ def get_dashboard():
         if not user.supplier_profile:
             return error_response('Supplier profile not found. Please complete your profile setup.', 404)
         
-        supplier_id = user.supplier_profile.id
-        
-        # Total products
-        total_products = Product.query.filter_by(supplier_id=supplier_id).count()
-        active_products = Product.query.filter_by(supplier_id=supplier_id, is_active=True).count()
-        
-        # Orders containing supplier's products
-        total_orders = db.session.query(Order.id)\
-            .join(OrderItem)\
-            .filter(OrderItem.supplier_id == supplier_id)\
-            .distinct().count()
-        
-        # Get supplier profile for accurate balance info
-        supplier_profile = user.supplier_profile
-        
-        # Total earnings (lifetime)
-        total_earnings = float(supplier_profile.total_sales)
-        
-        # Pending earnings (outstanding balance)
-        pending_earnings = float(supplier_profile.outstanding_balance)
-        
-        # This month's sales
-        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        month_sales = db.session.query(func.sum(OrderItem.supplier_earnings))\
-            .join(Order)\
-            .filter(
-                OrderItem.supplier_id == supplier_id,
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= month_start
-            ).scalar() or 0
-
-        # Total items sold
-        items_sold = db.session.query(func.sum(OrderItem.quantity))\
-            .join(Order)\
-            .filter(
-                OrderItem.supplier_id == supplier_id,
-                Order.payment_status == PaymentStatus.COMPLETED
-            ).scalar() or 0
-        
-        # Returns
-        total_returns = db.session.query(func.count(Return.id.distinct()))\
-            .join(Order, Return.order_id == Order.id)\
-            .join(OrderItem, OrderItem.order_id == Order.id)\
-            .filter(OrderItem.supplier_id == supplier_id)\
-            .scalar() or 0
-        
-        # Low stock products
-        low_stock = Product.query.filter(
-            Product.supplier_id == supplier_id,
-            Product.is_active == True,
-            Product.stock_quantity <= Product.low_stock_threshold
-        ).count()
-        
-        return success_response(data={
-            'products': {
-                'total': total_products,
-                'active': active_products,
-                'low_stock': low_stock
-            },
-            'orders': {
-                'total': total_orders,
-                'items_sold': int(items_sold) if items_sold else 0
-            },
-            'earnings': {
-                'total': float(total_earnings),
-                'pending': float(pending_earnings),
-                'this_month': float(month_sales)
-            },
-            'returns': total_returns
-        })
+        return success_response(data=supplier_analytics_service.dashboard(user.supplier_profile))
     except Exception as e:
         import traceback
         print(f"Dashboard error: {str(e)}")
@@ -415,6 +350,7 @@ def get_supplier_orders():
 
 @supplier_bp.route('/analytics', methods=['GET'])
 @jwt_required()
+@reads_from_replica
 def get_analytics():
     """Get comprehensive enterprise-level supplier analytics."""
     try:
@@ -424,221 +360,7 @@ def get_analytics():
         if user.role != UserRole.SUPPLIER:
             return error_response('Only suppliers can access this', 403)
         
-        supplier_id = user.supplier_profile.id
-        
-        # Date ranges
-        now = datetime.utcnow()
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        last_month_start = (month_start - timedelta(days=1)).replace(day=1)
-        year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-        last_year_start = year_start.replace(year=year_start.year - 1)
-        days_30_ago = now - timedelta(days=30)
-        days_90_ago = now - timedelta(days=90)
-        
-        # === DAILY SALES (Last 30 days) ===
-        daily_sales = db.session.query(
-            func.date(Order.created_at).label('date'),
-            func.sum(OrderItem.supplier_earnings).label('earnings'),
-            func.count(OrderItem.id).label('items_sold'),
-            func.count(func.distinct(Order.id)).label('orders')
-        ).join(Order).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= days_30_ago
-        ).group_by(func.date(Order.created_at)).order_by(func.date(Order.created_at)).all()
-        
-        # === TOP PRODUCTS ===
-        top_products = db.session.query(
-            Product.id, Product.name, Product.price,
-            func.sum(OrderItem.quantity).label('quantity_sold'),
-            func.sum(OrderItem.supplier_earnings).label('earnings'),
-            func.count(func.distinct(Order.id)).label('orders')
-        ).select_from(Product).join(OrderItem, OrderItem.product_id == Product.id).join(Order, Order.id == OrderItem.order_id).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).group_by(Product.id, Product.name, Product.price).order_by(func.sum(OrderItem.quantity).desc()).limit(10).all()
-        
-        # === MONTHLY EARNINGS (Last 12 months) ===
-        monthly_earnings = []
-        for i in range(12):
-            m_start = (month_start - timedelta(days=30*i)).replace(day=1)
-            m_end = (m_start + timedelta(days=32)).replace(day=1)
-            
-            earnings = db.session.query(func.sum(OrderItem.supplier_earnings)).join(Order).filter(
-                OrderItem.supplier_id == supplier_id,
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= m_start,
-                Order.created_at < m_end
-            ).scalar() or 0
-            
-            orders = db.session.query(func.count(func.distinct(Order.id))).join(OrderItem).filter(
-                OrderItem.supplier_id == supplier_id,
-                Order.payment_status == PaymentStatus.COMPLETED,
-                Order.created_at >= m_start,
-                Order.created_at < m_end
-            ).scalar() or 0
-            
-            monthly_earnings.insert(0, {
-                'month': m_start.strftime('%b %Y'),
-                'earnings': float(earnings),
-                'orders': orders
-            })
-        
-        # === CATEGORY PERFORMANCE ===
-        category_performance = db.session.query(
-            Category.name,
-            func.sum(OrderItem.supplier_earnings).label('earnings'),
-            func.sum(OrderItem.quantity).label('quantity')
-        ).select_from(Category).join(Product, Product.category_id == Category.id).join(OrderItem, OrderItem.product_id == Product.id).join(Order, Order.id == OrderItem.order_id).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).group_by(Category.id, Category.name).order_by(func.sum(OrderItem.supplier_earnings).desc()).all()
-        
-        # === RETURN RATE ANALYSIS ===
-        total_items_sold = db.session.query(func.sum(OrderItem.quantity)).join(Order).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).scalar() or 0
-        
-        supplier_order_ids = db.session.query(OrderItem.order_id).filter(OrderItem.supplier_id == supplier_id).distinct().subquery()
-        total_returns = Return.query.filter(Return.order_id.in_(supplier_order_ids)).count()
-        return_rate = (total_returns / total_items_sold * 100) if total_items_sold > 0 else 0
-        
-        returns_by_reason = db.session.query(
-            Return.reason,
-            func.count(Return.id).label('count')
-        ).filter(Return.order_id.in_(supplier_order_ids)).group_by(Return.reason).all()
-        
-        # === PROFIT MARGIN ANALYSIS ===
-        total_revenue = db.session.query(func.sum(OrderItem.supplier_earnings + OrderItem.platform_commission)).join(Order).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).scalar() or 0
-        
-        total_earnings = db.session.query(func.sum(OrderItem.supplier_earnings)).join(Order).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).scalar() or 0
-        
-        platform_commission = float(total_revenue) - float(total_earnings)
-        profit_margin = (float(total_earnings) / float(total_revenue) * 100) if total_revenue > 0 else 0
-        
-        # === INVENTORY TURNOVER ===
-        products = Product.query.filter_by(supplier_id=supplier_id, is_active=True).all()
-        avg_inventory = sum(p.stock_quantity for p in products) / len(products) if products else 0
-        inventory_turnover = (float(total_items_sold) / avg_inventory) if avg_inventory > 0 else 0
-        
-        # === CUSTOMER METRICS ===
-        unique_customers = db.session.query(func.count(func.distinct(Order.customer_id))).join(OrderItem).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).scalar() or 0
-        
-        repeat_customers = db.session.query(Order.customer_id).join(OrderItem).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED
-        ).group_by(Order.customer_id).having(func.count(Order.id) > 1).count()
-        
-        repeat_rate = (repeat_customers / unique_customers * 100) if unique_customers > 0 else 0
-        
-        # === AVERAGE ORDER VALUE ===
-        aov_data = db.session.query(
-            func.date(Order.created_at).label('date'),
-            func.avg(OrderItem.supplier_earnings).label('aov')
-        ).join(Order).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= days_30_ago
-        ).group_by(func.date(Order.created_at)).order_by(func.date(Order.created_at)).all()
-        
-        # === GROWTH METRICS ===
-        this_month_sales = db.session.query(func.sum(OrderItem.supplier_earnings)).join(Order).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= month_start
-        ).scalar() or 0
-        
-        last_month_sales = db.session.query(func.sum(OrderItem.supplier_earnings)).join(Order).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= last_month_start,
-            Order.created_at < month_start
-        ).scalar() or 0
-        
-        mom_growth = ((float(this_month_sales) - float(last_month_sales)) / float(last_month_sales) * 100) if last_month_sales > 0 else 0
-        
-        this_year_sales = db.session.query(func.sum(OrderItem.supplier_earnings)).join(Order).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= year_start
-        ).scalar() or 0
-        
-        last_year_sales = db.session.query(func.sum(OrderItem.supplier_earnings)).join(Order).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= last_year_start,
-            Order.created_at < year_start
-        ).scalar() or 0
-        
-        yoy_growth = ((float(this_year_sales) - float(last_year_sales)) / float(last_year_sales) * 100) if last_year_sales > 0 else 0
-        
-        # === PEAK HOURS ANALYSIS ===
-        peak_hours = db.session.query(
-            func.extract('hour', Order.created_at).label('hour'),
-            func.count(Order.id).label('orders'),
-            func.sum(OrderItem.supplier_earnings).label('earnings')
-        ).join(OrderItem).filter(
-            OrderItem.supplier_id == supplier_id,
-            Order.payment_status == PaymentStatus.COMPLETED,
-            Order.created_at >= days_90_ago
-        ).group_by(func.extract('hour', Order.created_at)).order_by(func.extract('hour', Order.created_at)).all()
-        
-        # === LOW STOCK ALERTS ===
-        low_stock_products = Product.query.filter(
-            Product.supplier_id == supplier_id,
-            Product.is_active == True,
-            Product.stock_quantity <= Product.low_stock_threshold
-        ).order_by(Product.stock_quantity).limit(10).all()
-        
-        return success_response(data={
-            'daily_sales': [{'date': str(d[0]), 'earnings': float(d[1] or 0), 'items_sold': d[2], 'orders': d[3]} for d in daily_sales],
-            'top_products': [{'id': p[0], 'name': p[1], 'price': float(p[2]), 'quantity_sold': p[3], 'earnings': float(p[4]), 'orders': p[5]} for p in top_products],
-            'monthly_earnings': monthly_earnings,
-            'category_performance': [{'name': c[0], 'earnings': float(c[1]), 'quantity': c[2]} for c in category_performance],
-            'return_analysis': {
-                'total_returns': total_returns,
-                'return_rate': round(return_rate, 2),
-                'by_reason': [{'reason': r[0], 'count': r[1]} for r in returns_by_reason]
-            },
-            'profit_metrics': {
-                'total_revenue': float(total_revenue),
-                'total_earnings': float(total_earnings),
-                'platform_commission': float(platform_commission),
-                'profit_margin': round(profit_margin, 2)
-            },
-            'inventory_metrics': {
-                'turnover_rate': round(inventory_turnover, 2),
-                'avg_inventory': round(avg_inventory, 2),
-                'low_stock_count': len(low_stock_products),
-                'low_stock_products': [{'id': p.id, 'name': p.name, 'stock': p.stock_quantity, 'threshold': p.low_stock_threshold} for p in low_stock_products]
-            },
-            'customer_metrics': {
-                'unique_customers': unique_customers,
-                'repeat_customers': repeat_customers,
-                'repeat_rate': round(repeat_rate, 2)
-            },
-            'aov_trend': [{'date': str(a[0]), 'aov': float(a[1] or 0)} for a in aov_data],
-            'growth_metrics': {
-                'mom_growth': round(mom_growth, 2),
-                'yoy_growth': round(yoy_growth, 2),
-                'this_month': float(this_month_sales),
-                'last_month': float(last_month_sales),
-                'this_year': float(this_year_sales),
-                'last_year': float(last_year_sales)
-            },
-            'peak_hours': [{'hour': int(h[0]), 'orders': h[1], 'earnings': float(h[2])} for h in peak_hours]
-        })
+        return success_response(data=supplier_analytics_service.get(user.supplier_profile.id))
     except Exception as e:
         import traceback
         print(f"Analytics error: {str(e)}")
@@ -858,7 +580,7 @@ def get_supplier_returns():
             .paginate(page=page, per_page=per_page, error_out=False)
 
         return success_response(data={
-            'returns': [r.to_dict() for r in returns.items],
+            'returns': Return.serialize_many(returns.items),
             'pagination': {
                 'page': returns.page,
                 'per_page': returns.per_page,
@@ -872,6 +594,7 @@ def get_supplier_returns():
 
 @supplier_bp.route('/returns/stats', methods=['GET'])
 @jwt_required()
+@reads_from_replica
 def get_supplier_return_stats():
     """Get return statistics for supplier."""
     try:
@@ -881,67 +604,7 @@ def get_supplier_return_stats():
         if user.role != UserRole.SUPPLIER:
             return error_response('Only suppliers can access this', 403)
 
-        supplier_id = user.supplier_profile.id
-
-        # Subquery: order IDs that contain this supplier's products
-        supplier_order_ids = db.session.query(OrderItem.order_id)\
-            .filter(OrderItem.supplier_id == supplier_id)\
-            .distinct().subquery()
-
-        base_query = Return.query.filter(Return.order_id.in_(supplier_order_ids))
-
-        total = base_query.count()
-
-        try:
-            pending = base_query.filter(
-                Return.status.in_(['requested', 'pending', 'supplier_review'])
-            ).count()
-        except Exception:
-            pending = 0
-
-        try:
-            needs_response = base_query.filter(
-                Return.supplier_action.is_(None),
-                Return.status.in_(['requested', 'pending', 'supplier_review'])
-            ).count()
-        except Exception:
-            needs_response = 0
-
-        try:
-            disputed = base_query.filter(Return.status == 'disputed').count()
-        except Exception:
-            disputed = 0
-            
-        try:
-            approved = base_query.filter(Return.status == 'approved').count()
-        except Exception:
-            approved = 0
-            
-        try:
-            completed = base_query.filter(
-                Return.status.in_(['completed', 'refund_completed'])
-            ).count()
-        except Exception:
-            completed = 0
-
-        try:
-            total_deductions = db.session.query(func.sum(Return.supplier_deduction))\
-                .filter(
-                    Return.order_id.in_(supplier_order_ids),
-                    Return.status.in_(['approved', 'completed', 'refund_completed'])
-                ).scalar() or 0
-        except Exception:
-            total_deductions = 0
-
-        return success_response(data={
-            'total': total,
-            'pending': pending,
-            'needs_response': needs_response,
-            'disputed': disputed,
-            'approved': approved,
-            'completed': completed,
-            'total_deductions': float(total_deductions)
-        })
+        return success_response(data=returns_analytics_service.supplier_stats(user.supplier_profile.id))
     except Exception as e:
         return success_response(data={
             'total': 0,
@@ -0,0 +1,213 @@
+"""
+Delivery agent dashboard counters.
+
+Keeps one DeliveryAgentStats row per agent in step with their orders so the
+agent dashboard is a single-row read. Every flush that touches an order works
+out how that order's contribution to each counter changed and applies the
+difference as an atomic increment. A nightly reconciliation rebuilds the rows
+from the orders table to absorb anything written outside the ORM.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import case, event, func, inspect
+from app.models import db
+from app.models.order import Order, OrderStatus
+from app.models.user import DeliveryAgentProfile
+from app.models.delivery_agent_stats import DeliveryAgentStats
+
+
+# Statuses shown as "pending" on the agent dashboard
+AGENT_PENDING_STATUSES = [OrderStatus.PAID, OrderStatus.PROCESSING, OrderStatus.SHIPPED]
+
+# Order columns the counters depend on
+TRACKED_FIELDS = (
+    'status', 'assigned_delivery_agent', 'updated_at',
+    'cod_collected_by', 'cod_collected_at', 'cod_amount_collected', 'cod_verified_at',
+)
+
+DAILY_COUNTERS = ('delivered_today', 'cod_collected_today')
+
+
+def _today_start():
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _contributions(values, today_start):
+    """Return {(agent_id, counter): amount} for one order state."""
+    result = {}
+    if not values:
+        return result
+
+    agent_id = values.get('assigned_delivery_agent')
+    status = values.get('status')
+    if agent_id:
+        if status in AGENT_PENDING_STATUSES:
+            result[(agent_id, 'pending_deliveries')] = 1
+        updated_at = values.get('updated_at')
+        if status == OrderStatus.DELIVERED and updated_at and updated_at >= today_start:
+            result[(agent_id, 'delivered_today')] = 1
+
+    collector_id = values.get('cod_collected_by')
+    collected_at = values.get('cod_collected_at')
+    if collector_id and collected_at:
+        amount = Decimal(str(values.get('cod_amount_collected') or 0))
+        if collected_at >= today_start:
+            result[(collector_id, 'cod_collected_today')] = amount
+        if values.get('cod_verified_at') is None:
+            result[(collector_id, 'cod_pending_verification')] = amount
+
+    return result
+
+
+def _order_states(session, order):
+    """Return (old_values, new_values) for the tracked fields of a pending order change."""
+    state = inspect(order)
+    if order in session.new:
+        return None, {field: getattr(order, field) for field in TRACKED_FIELDS}
+
+    old_values, new_values = {}, {}
+    changed = False
+    for field in TRACKED_FIELDS:
+        history = state.attrs[field].history
+        if history.has_changes():
+            changed = True
+            old_values[field] = history.deleted[0] if history.deleted else None
+            new_values[field] = history.added[0] if history.added else None
+        else:
+            old_values[field] = new_values[field] = getattr(order, field)
+
+    if order in session.deleted:
+        return old_values, None
+
+    if session.is_modified(order, include_collections=False):
+        # updated_at is bumped by its onupdate default when the row is written
+        if not state.attrs['updated_at'].history.has_changes():
+            new_values['updated_at'] = datetime.utcnow()
+        changed = True
+
+    return (old_values, new_values) if changed else (None, None)
+
+
+class AgentStatsService:
+    """Service for maintaining and reading delivery agent dashboard counters."""
+
+    def reconcile(self, user_ids=None):
+        """
+        Rebuild counters from the orders table.
+        Limited to user_ids when given, otherwise every delivery agent.
+        Returns the DeliveryAgentStats rows written (not committed).
+        """
+        today_start = _today_start()
+
+        def grouped(column, aggregate, *criteria):
+            query = db.session.query(column, aggregate).filter(*criteria)
+            if user_ids is not None:
+                query = query.filter(column.in_(user_ids))
+            return dict(query.group_by(column).all())
+
+        pending = grouped(
+            Order.assigned_delivery_agent, func.count(Order.id),
+            Order.status.in_(AGENT_PENDING_STATUSES)
+        )
+        delivered = grouped(
+            Order.assigned_delivery_agent, func.count(Order.id),
+            Order.status == OrderStatus.DELIVERED,
+            Order.updated_at >= today_start
+        )
+        cod_today = grouped(
+            Order.cod_collected_by, func.sum(Order.cod_amount_collected),
+            Order.cod_collected_at >= today_start
+        )
+        cod_pending = grouped(
+            Order.cod_collected_by, func.sum(Order.cod_amount_collected),
+            Order.cod_verified_at.is_(None),
+            Order.cod_collected_at.isnot(None)
+        )
+
+        if user_ids is None:
+            user_ids = [row[0] for row in db.session.query(DeliveryAgentProfile.user_id).all()]
+
+        now = datetime.utcnow()
+        rows = []
+        for user_id in user_ids:
+            stats = db.session.get(DeliveryAgentStats, user_id)
+            if not stats:
+                stats = DeliveryAgentStats(user_id=user_id)
+                db.session.add(stats)
+            stats.pending_deliveries = pending.get(user_id, 0)
+            stats.delivered_today = delivered.get(user_id, 0)
+            stats.cod_collected_today = cod_today.get(user_id) or 0
+            stats.cod_pending_verification = cod_pending.get(user_id) or 0
+            stats.stats_date = now.date()
+            stats.reconciled_at = now
+            rows.append(stats)
+
+        return rows
+
+    def get_stats(self, user_id):
+        """Return the agent's counters, building the row on first read."""
+        stats = db.session.get(DeliveryAgentStats, user_id)
+        if not stats:
+            stats = self.reconcile([user_id])[0]
+            db.session.commit()
+        return stats
+
+    def apply_order_changes(self, session):
+        """Fold the pending order changes in this flush into the counter rows."""
+        today_start = _today_start()
+        deltas = {}
+
+        for order in list(session.new) + list(session.dirty) + list(session.deleted):
+            if not isinstance(order, Order):
+                continue
+            old_values, new_values = _order_states(session, order)
+            if old_values is None and new_values is None:
+                continue
+            for key, amount in _contributions(new_values, today_start).items():
+                deltas[key] = deltas.get(key, 0) + amount
+            for key, amount in _contributions(old_values, today_start).items():
+                deltas[key] = deltas.get(key, 0) - amount
+
+        by_agent = {}
+        for (user_id, counter), amount in deltas.items():
+            if amount:
+                by_agent.setdefault(user_id, {})[counter] = amount
+        if not by_agent:
+            return
+
+        today = today_start.date()
+        for user_id, changes in by_agent.items():
+            stats = session.get(DeliveryAgentStats, user_id)
+            if not stats:
+                # Counts already flushed are picked up here; this flush is added below
+                stats = self.reconcile([user_id])[0]
+
+            if stats in session.new:
+                for counter, amount in changes.items():
+                    setattr(stats, counter, (getattr(stats, counter) or 0) + amount)
+                continue
+
+            # Atomic increments; daily counters restart when the stored day is stale
+            same_day = DeliveryAgentStats.stats_date == today
+            for counter in ('pending_deliveries', 'cod_pending_verification'):
+                if counter in changes:
+                    setattr(stats, counter, getattr(DeliveryAgentStats, counter) + changes[counter])
+            for counter in DAILY_COUNTERS:
+                column = getattr(DeliveryAgentStats, counter)
+                setattr(stats, counter, case((same_day, column), else_=0) + changes.get(counter, 0))
+            stats.stats_date = today
+
+
+agent_stats_service = AgentStatsService()
+
+
+def _before_flush(session, flush_context, instances):
+    with session.no_autoflush:
+        agent_stats_service.apply_order_changes(session)
+
+
+def register_listeners():
+    """Keep agent counters in step with order flushes (safe to call repeatedly)."""
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
@@ -0,0 +1,302 @@
+"""
+Inbound provider callback inbox.
+
+Webhook routes only store the callback and acknowledge it, so the response
+time no longer depends on order lookups or outbound email. A worker claims
+pending events in small batches (FOR UPDATE SKIP LOCKED, so several workers
+can drain the inbox together) and applies each one through the handler
+registered for its type. Order and payout lookups go through the indexed
+reference columns, a redelivered callback is stored only once, and handlers
+skip anything already applied, so running an event twice is harmless.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app.models import db
+from app.models.inbound_event import InboundEvent, InboundEventStatus
+from app.models.order import Order, OrderStatus, PaymentStatus
+from app.models.returns import SupplierPayout
+from app.services.email_service import send_payment_confirmation_email
+
+
+class ReplayCache:
+    """
+    Bounded, TTL-limited set of recently stored delivery ids (this process).
+    Rejects provider retries before they reach the database; the inbox's
+    unique constraint still catches duplicates that land on another worker.
+    Ids are only added once their event is stored, so a delivery that failed
+    to store is accepted again when the provider retries it.
+    """
+
+    def __init__(self):
+        self._seen = OrderedDict()  # key -> expiry (monotonic)
+        self._lock = threading.Lock()
+
+    def contains(self, key):
+        """Whether key was added within its TTL."""
+        with self._lock:
+            expires = self._seen.get(key)
+            return expires is not None and expires > time.monotonic()
+
+    def add(self, key, ttl_seconds, max_size):
+        """Remember key for ttl_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            self._seen[key] = now + ttl_seconds
+            self._seen.move_to_end(key)
+            # Entries are in insertion order, so expired ones sit at the front
+            while self._seen and (len(self._seen) > max_size or next(iter(self._seen.values())) <= now):
+                self._seen.popitem(last=False)
+
+
+class CallbackInbox:
+    """Stores provider callbacks and applies them in the background."""
+
+    def __init__(self):
+        self._handlers = {}
+        self._replays = ReplayCache()
+
+    @staticmethod
+    def _settings():
+        """Read worker tuning from app config."""
+        config = current_app.config
+        return {
+            'batch_size': int(config.get('INBOUND_EVENT_BATCH_SIZE', 50)),
+            'max_attempts': int(config.get('INBOUND_EVENT_MAX_ATTEMPTS', 5)),
+            'retry_seconds': int(config.get('INBOUND_EVENT_RETRY_SECONDS', 30)),
+            'replay_ttl': int(config.get('WEBHOOK_REPLAY_TTL_SECONDS', 86400)),
+            'replay_size': int(config.get('WEBHOOK_REPLAY_CACHE_SIZE', 10000)),
+        }
+
+    def register_handler(self, provider, event_type, func):
+        """
+        Register func(payload) for events of this type. The handler returns the
+        resulting status and, optionally, a callable to run after the commit
+        (e.g. sending an email): (InboundEventStatus, after_commit or None).
+        """
+        self._handlers[(provider, event_type)] = func
+
+    def is_replay(self, provider, delivery_id):
+        """Whether this delivery was already stored by this process recently."""
+        return self._replays.contains(f'{provider}:{delivery_id}')
+
+    def remember_delivery(self, provider, delivery_id):
+        """Mark a delivery as stored, so provider retries are dropped before the database."""
+        settings = self._settings()
+        self._replays.add(f'{provider}:{delivery_id}', settings['replay_ttl'], settings['replay_size'])
+
+    def record(self, provider, event_type, reference, payload):
+        """Store a callback and wake the worker. Returns the event, or None for a duplicate."""
+        event = InboundEvent(provider=provider, event_type=event_type, reference=reference, payload=payload)
+        db.session.add(event)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            current_app.logger.info(f'Inbox: duplicate {provider} {event_type} for {reference} ignored')
+            return None
+
+        self.wake()
+        return event
+
+    def wake(self):
+        """Drain the inbox now instead of waiting for the next poll."""
+        from app.services.scheduler_service import scheduler
+        app = current_app._get_current_object()
+
+        def drain_inbound_events():
+            with app.app_context():
+                self.process_pending()
+
+        if scheduler.running:
+            # One queued drain is enough; it picks up everything stored so far
+            scheduler.add_job(func=drain_inbound_events, id='inbound_events_wake',
+                              name='Apply new inbound events', replace_existing=True)
+        else:
+            threading.Thread(target=drain_inbound_events, daemon=True).start()
+
+    def _claim(self, limit):
+        """Lock a batch of due events that no other worker holds."""
+        return InboundEvent.query.filter(
+            InboundEvent.status == InboundEventStatus.PENDING,
+            InboundEvent.available_at <= datetime.utcnow()
+        ).order_by(InboundEvent.available_at).limit(limit).with_for_update(skip_locked=True).all()
+
+    def _apply(self, event, settings):
+        """Apply one claimed event inside a savepoint. Returns its after-commit callable."""
+        handler = self._handlers.get((event.provider, event.event_type))
+        event.attempts += 1
+        try:
+            if not handler:
+                raise ValueError(f'No handler for {event.provider} {event.event_type}')
+            with db.session.begin_nested():
+                status, after_commit = handler(event.payload)
+            event.status = status
+            event.last_error = None
+            event.processed_at = datetime.utcnow()
+            return after_commit
+        except Exception as e:
+            event.last_error = str(e)
+            if event.attempts >= settings['max_attempts']:
+                event.status = InboundEventStatus.FAILED
+                current_app.logger.error(f'Inbox: giving up on event {event.id} after {event.attempts} attempts - {str(e)}')
+            else:
+                event.available_at = datetime.utcnow() + timedelta(seconds=settings['retry_seconds'] * event.attempts)
+                current_app.logger.warning(f'Inbox: event {event.id} failed, will retry - {str(e)}')
+            return None
+
+    def process_pending(self):
+        """Apply every due event. Returns the number of events handled."""
+        settings = self._settings()
+        handled = 0
+
+        while True:
+            events = self._claim(settings['batch_size'])
+            if not events:
+                break
+
+            follow_ups = [self._apply(event, settings) for event in events]
+            db.session.commit()
+            handled += len(events)
+
+            for follow_up in follow_ups:
+                if follow_up:
+                    try:
+                        follow_up()
+                    except Exception as e:
+                        current_app.logger.error(f'Inbox: follow-up failed - {str(e)}')
+
+            if len(events) < settings['batch_size']:
+                break
+
+        return handled
+
+    def backlog(self):
+        """Event counts by status, for monitoring."""
+        rows = db.session.query(InboundEvent.status, db.func.count(InboundEvent.id)).group_by(InboundEvent.status).all()
+        return {status.value: count for status, count in rows}
+
+
+callback_inbox = CallbackInbox()
+
+
+def _confirmation_email(order_id):
+    """After-commit follow-up that emails the payment confirmation."""
+    def send_confirmation():
+        order = db.session.get(Order, order_id)
+        send_payment_confirmation_email(order, order.customer.user.email)
+    return send_confirmation
+
+
+# =============================================================================
+# M-Pesa handlers
+# =============================================================================
+
+def apply_mpesa_stk_callback(payload):
+    """Mark the order paid or failed from an STK Push result."""
+    stk_callback = payload.get('Body', {}).get('stkCallback', {})
+    checkout_request_id = stk_callback.get('CheckoutRequestID')
+    result_code = stk_callback.get('ResultCode')
+    result_desc = stk_callback.get('ResultDesc')
+
+    # Locked so the payment reconciler cannot apply the same result concurrently
+    order = Order.query.filter_by(payment_reference=checkout_request_id).with_for_update().first()
+    if not order:
+        current_app.logger.warning(f'Order not found for checkout ID: {checkout_request_id}')
+        return InboundEventStatus.IGNORED, None
+
+    if order.payment_status == PaymentStatus.COMPLETED:
+        return InboundEventStatus.IGNORED, None
+
+    if result_code != 0:
+        order.payment_status = PaymentStatus.FAILED
+        order.admin_notes = f'M-Pesa payment failed: {result_desc}'
+        current_app.logger.warning(f'Payment FAILED for order {order.order_number}: {result_desc}')
+        return InboundEventStatus.PROCESSED, None
+
+    metadata = {
+        item.get('Name'): item.get('Value')
+        for item in stk_callback.get('CallbackMetadata', {}).get('Item', [])
+    }
+    mpesa_receipt = metadata.get('MpesaReceiptNumber')
+
+    order.payment_status = PaymentStatus.COMPLETED
+    order.status = OrderStatus.PAID
+    order.payment_reference = mpesa_receipt or checkout_request_id
+    order.paid_at = datetime.utcnow()
+    current_app.logger.info(f'Payment COMPLETED for order {order.order_number}, Receipt: {mpesa_receipt}')
+
+    return InboundEventStatus.PROCESSED, _confirmation_email(order.id)
+
+
+def apply_mpesa_b2c_result(payload):
+    """Complete or fail a supplier payout from a B2C result."""
+    result = payload.get('Result', {})
+    conversation_id = result.get('ConversationID')
+    result_code = result.get('ResultCode')
+    result_desc = result.get('ResultDesc')
+
+    payout = SupplierPayout.query.filter_by(reference=conversation_id).first()
+    if not payout:
+        return InboundEventStatus.IGNORED, None
+
+    # The result is authoritative, even after an earlier timeout callback
+    if result_code == 0:
+        payout.status = 'completed'
+        payout.paid_at = payout.paid_at or datetime.utcnow()
+
+        for param in result.get('ResultParameters', {}).get('ResultParameter', []):
+            if param.get('Key') == 'TransactionReceipt':
+                payout.reference = param.get('Value')
+                break
+
+        current_app.logger.info(f'B2C payout successful: {payout.id}')
+    else:
+        payout.status = 'failed'
+        payout.notes = (payout.notes or '') + f'\nFailed: {result_desc}'
+        current_app.logger.warning(f'B2C payout failed: {payout.id} - {result_desc}')
+
+    return InboundEventStatus.PROCESSED, None
+
+
+def apply_mpesa_b2c_timeout(payload):
+    """Fail a supplier payout whose B2C request timed out."""
+    conversation_id = payload.get('Result', {}).get('ConversationID')
+    payout = SupplierPayout.query.filter_by(reference=conversation_id).first() if conversation_id else None
+    if not payout or payout.status in ('completed', 'failed'):
+        return InboundEventStatus.IGNORED, None
+
+    payout.status = 'failed'
+    payout.notes = (payout.notes or '') + '\nFailed: Request timed out'
+    return InboundEventStatus.PROCESSED, None
+
+
+# =============================================================================
+# Paystack handlers
+# =============================================================================
+
+def apply_paystack_charge_success(payload):
+    """Mark the order paid from a verified charge.success webhook."""
+    charge = payload.get('data', {})
+    reference = charge.get('reference')
+
+    order = Order.query.filter_by(payment_reference=reference).with_for_update().first()
+    if not order or charge.get('status') != 'success' or order.payment_status == PaymentStatus.COMPLETED:
+        return InboundEventStatus.IGNORED, None
+
+    order.payment_status = PaymentStatus.COMPLETED
+    order.status = OrderStatus.PAID
+    order.paid_at = datetime.utcnow()
+    current_app.logger.info(f'Payment successful for order {order.order_number}')
+
+    return InboundEventStatus.PROCESSED, _confirmation_email(order.id)
+
+
+callback_inbox.register_handler('mpesa', 'stk_callback', apply_mpesa_stk_callback)
+callback_inbox.register_handler('mpesa', 'b2c_result', apply_mpesa_b2c_result)
+callback_inbox.register_handler('mpesa', 'b2c_timeout', apply_mpesa_b2c_timeout)
+callback_inbox.register_handler('paystack', 'charge.success', apply_paystack_charge_success)
@@ -8,6 +8,7 @@ import cloudinary
 import cloudinary.uploader
 import cloudinary.api
 from flask import current_app
+from app.services.http_client import http_client
 
 
 # Configure Cloudinary
@@ -79,7 +80,9 @@ class CloudinaryService:
                 upload_options['public_id'] = public_id
                 upload_options['overwrite'] = True
 
-            result = cloudinary.uploader.upload(file, **upload_options)
+            # Bounded by the shared HTTP timeout and the Cloudinary circuit breaker
+            upload_options['timeout'] = current_app.config.get('HTTP_READ_TIMEOUT', 30)
+            result = http_client.call('cloudinary', cloudinary.uploader.upload, file, **upload_options)
 
             return {
                 'success': True,
@@ -224,7 +227,10 @@ class CloudinaryService:
             dict: Deletion result
         """
         try:
-            result = cloudinary.uploader.destroy(public_id)
+            result = http_client.call(
+                'cloudinary', cloudinary.uploader.destroy, public_id,
+                timeout=current_app.config.get('HTTP_READ_TIMEOUT', 30)
+            )
 
             return {
                 'success': result.get('result') == 'ok',
@@ -0,0 +1,195 @@
+"""
+Admin dashboard KPIs.
+
+Every KPI comes from one statement: a single-row conditional aggregate per
+table (COUNT ... FILTER), cross joined. The snapshot is cached (app.cache,
+per process) and served stale-while-revalidate: within
+ADMIN_DASHBOARD_CACHE_SECONDS it is returned as is; after that, or once a
+write to users, suppliers, products, orders or returns has marked it stale,
+the cached copy is still returned while one background thread recomputes
+it. Only a snapshot older than ADMIN_DASHBOARD_STALE_SECONDS (or none at
+all) is computed in the request. Snapshots are computed on the read replica
+when one is configured (app.services.read_replica).
+"""
+
+import threading
+import time
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from app.models import db
+from app.models.user import User, UserRole, SupplierProfile
+from app.models.product import Product
+from app.models.order import Order, OrderItem, OrderStatus, PaymentStatus
+from app.models.returns import Return
+from app.services.read_replica import replica_reads
+
+
+CACHE_KEY = 'admin_dashboard_kpis'
+STALE_KEY = 'admin_dashboard_kpis_stale_at'
+
+# Return statuses still waiting on someone
+PENDING_RETURN_STATUSES = ['pending', 'requested', 'pending_review', 'supplier_review', 'disputed']
+
+# Writes to these invalidate the snapshot
+TRACKED_MODELS = (User, SupplierProfile, Product, Order, OrderItem, Return)
+
+
+class DashboardService:
+    """Computes and caches the admin dashboard KPI snapshot."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @staticmethod
+    def _settings():
+        config = current_app.config
+        return {
+            'fresh': int(config.get('ADMIN_DASHBOARD_CACHE_SECONDS', 30)),
+            'stale': int(config.get('ADMIN_DASHBOARD_STALE_SECONDS', 600)),
+        }
+
+    @staticmethod
+    def compute():
+        """Read every KPI in one round trip and return the dashboard payload."""
+        completed = Order.payment_status == PaymentStatus.COMPLETED
+        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        users = select(
+            func.count(User.id).label('total'),
+            func.count(User.id).filter(User.role == UserRole.CUSTOMER).label('customers'),
+            func.count(User.id).filter(User.role == UserRole.SUPPLIER).label('suppliers'),
+        ).subquery()
+        suppliers = select(
+            func.count(SupplierProfile.id).filter(SupplierProfile.is_approved == False).label('pending')
+        ).subquery()
+        products = select(
+            func.count(Product.id).label('total'),
+            func.count(Product.id).filter(Product.is_active == True).label('active'),
+            func.count(Product.id).filter(Product.is_active == True, Product.stock_quantity <= 10).label('low_stock'),
+        ).subquery()
+        orders = select(
+            func.count(Order.id).label('total'),
+            func.count(Order.id).filter(Order.status == OrderStatus.PENDING).label('pending'),
+            func.count(Order.id).filter(completed).label('paid'),
+            func.coalesce(func.sum(Order.total).filter(completed), 0).label('revenue'),
+            func.coalesce(func.sum(Order.total).filter(completed, Order.created_at >= month_start), 0).label('month_revenue'),
+        ).subquery()
+        commission = select(
+            func.coalesce(func.sum(OrderItem.platform_commission), 0).label('total')
+        ).join(Order, Order.id == OrderItem.order_id).where(completed).subquery()
+        returns = select(
+            func.count(Return.id).filter(Return.status.in_(PENDING_RETURN_STATUSES)).label('pending')
+        ).subquery()
+
+        row = db.session.execute(
+            select(users, suppliers.c.pending.label('pending_suppliers'), products, orders,
+                   commission.c.total.label('platform_earnings'), returns.c.pending.label('pending_returns'))
+        ).one()
+        (total_users, customers, suppliers_count, pending_suppliers,
+         total_products, active_products, low_stock,
+         total_orders, pending_orders, paid_orders, total_revenue, month_revenue,
+         platform_earnings, pending_returns) = row
+
+        return {
+            'users': {
+                'total': total_users,
+                'customers': customers,
+                'suppliers': suppliers_count,
+                'pending_suppliers': pending_suppliers
+            },
+            'products': {
+                'total': total_products,
+                'active': active_products,
+                'low_stock': low_stock
+            },
+            'orders': {
+                'total': total_orders,
+                'pending': pending_orders,
+                'paid': paid_orders
+            },
+            'revenue': {
+                'total': float(total_revenue),
+                'this_month': float(month_revenue),
+                'platform_earnings': float(platform_earnings)
+            },
+            'returns': {
+                'pending': pending_returns
+            }
+        }
+
+    def _store(self, started_at):
+        with replica_reads():
+            data = self.compute()
+        settings = self._settings()
+        current_app.cache.set(CACHE_KEY, {'data': data, 'computed_at': started_at}, timeout=settings['stale'])
+        return data
+
+    def _refresh_in_background(self):
+        """Recompute the snapshot on a thread, unless this process already is."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        app = current_app._get_current_object()
+
+        def refresh_dashboard():
+            try:
+                with app.app_context():
+                    self._store(time.time())
+            except Exception as e:
+                app.logger.error(f'Dashboard refresh failed: {str(e)}')
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=refresh_dashboard, daemon=True).start()
+
+    def snapshot(self):
+        """The dashboard payload: cached when possible, refreshed in the background when stale."""
+        settings = self._settings()
+        cached = current_app.cache.get(CACHE_KEY)
+        now = time.time()
+
+        if cached is None or now - cached['computed_at'] > settings['stale']:
+            return self._store(now)
+
+        stale_at = current_app.cache.get(STALE_KEY) or 0
+        if now - cached['computed_at'] > settings['fresh'] or stale_at >= cached['computed_at']:
+            self._refresh_in_background()
+        return cached['data']
+
+    def invalidate(self):
+        """Mark the cached snapshot stale; the next read triggers a refresh."""
+        current_app.cache.set(STALE_KEY, time.time(), timeout=0)
+
+
+dashboard_service = DashboardService()
+
+
+def _before_flush(session, flush_context, instances):
+    if session.info.get('dashboard_changed'):
+        return
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, TRACKED_MODELS):
+            session.info['dashboard_changed'] = True
+            return
+
+
+def _after_commit(session):
+    if session.info.pop('dashboard_changed', False) and has_app_context():
+        dashboard_service.invalidate()
+
+
+def _after_rollback(session):
+    session.info.pop('dashboard_changed', None)
+
+
+def register_listeners():
+    """Mark the dashboard snapshot stale on committed writes (safe to call repeatedly)."""
+    for name, listener in (('before_flush', _before_flush), ('after_commit', _after_commit),
+                           ('after_rollback', _after_rollback)):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
@@ -0,0 +1,142 @@
+"""
+Delivery agent payout generation.
+
+Unpaid delivery fees are summed per agent by one grouped query over the
+confirmed orders, joined to the agent profile for the fee share and M-Pesa
+number. The payouts are inserted together and the orders are claimed by
+their payout with a single UPDATE, so a run costs a few statements per agent
+however many orders there are. A claimed order is never picked up by a later
+run; cancelling its payout releases it.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import case, func, or_
+from app.models import db
+from app.models.order import Order
+from app.models.user import DeliveryAgentProfile
+from app.models.returns import DeliveryPayout, DeliveryPayoutType
+from app.services.ledger_service import ledger_service
+
+
+class DeliveryPayoutService:
+    """Groups confirmed, unpaid deliveries into agent payouts."""
+
+    @staticmethod
+    def _unpaid_by_agent():
+        """One row per agent: profile details, fee totals, confirmation window and order ids."""
+        confirmed_at = func.coalesce(Order.delivery_confirmed_at, Order.customer_confirmed_at, Order.updated_at)
+        return db.session.query(
+            DeliveryAgentProfile.id,
+            DeliveryAgentProfile.user_id,
+            DeliveryAgentProfile.first_name,
+            DeliveryAgentProfile.delivery_fee_percentage,
+            DeliveryAgentProfile.mpesa_number,
+            func.sum(Order.delivery_fee),
+            func.count(Order.id),
+            func.min(confirmed_at),
+            func.max(confirmed_at),
+            func.array_agg(Order.id),
+        ).join(
+            DeliveryAgentProfile, DeliveryAgentProfile.user_id == Order.assigned_delivery_agent
+        ).filter(
+            or_(
+                Order.customer_confirmed_delivery == True,
+                Order.auto_confirmed == True
+            ),
+            Order.delivery_fee_paid == False,
+            Order.delivery_payout_id.is_(None)
+        ).group_by(DeliveryAgentProfile.id).all()
+
+    def generate(self, min_amount=0, created_by=None):
+        """
+        Create a payout per agent with unclaimed confirmed deliveries, claim the
+        orders and credit each agent's pending payout. Agents whose net amount is
+        below min_amount are left for a later run. Not committed; returns the payouts.
+        """
+        now = datetime.utcnow()
+        sequence = DeliveryPayout.query.filter(
+            DeliveryPayout.created_at >= now.replace(hour=0, minute=0, second=0, microsecond=0)
+        ).count()
+
+        payouts = []  # (agent user id, payout)
+        order_ids = []
+
+        for (profile_id, user_id, first_name, fee_percentage, mpesa_number,
+             gross_amount, order_count, period_start, period_end, agent_order_ids) in self._unpaid_by_agent():
+            gross_amount = Decimal(str(gross_amount or 0))
+            net_amount = (gross_amount * Decimal(str(fee_percentage)) / 100).quantize(Decimal('0.01'))
+            if net_amount <= 0 or net_amount < min_amount:
+                current_app.logger.info(f'Delivery payouts: skipping {first_name} - amount too small ({net_amount})')
+                continue
+
+            sequence += 1
+            payout = DeliveryPayout(
+                payout_type=DeliveryPayoutType.AGENT,
+                delivery_agent_id=profile_id,
+                gross_amount=gross_amount,
+                platform_fee=gross_amount - net_amount,
+                net_amount=net_amount,
+                order_count=order_count,
+                order_ids=list(agent_order_ids),
+                mpesa_number=mpesa_number,
+                period_start=period_start or now,
+                period_end=period_end or now
+            )
+            payout.generate_payout_number(sequence)
+            payouts.append((user_id, payout))
+            order_ids.extend(agent_order_ids)
+
+        if not payouts:
+            return []
+
+        db.session.add_all([payout for _, payout in payouts])
+        db.session.flush()
+        agent_payouts = {user_id: payout.id for user_id, payout in payouts}
+
+        # Claim every order for its agent's payout in one statement
+        claimed = Order.query.filter(
+            Order.id.in_(order_ids),
+            Order.delivery_payout_id.is_(None)
+        ).update(
+            {Order.delivery_payout_id: case(agent_payouts, value=Order.assigned_delivery_agent)},
+            synchronize_session=False
+        )
+        if claimed != len(order_ids):
+            raise RuntimeError('Some orders were claimed by another payout run, try again')
+
+        for _, payout in payouts:
+            ledger_service.earning(
+                'agent', payout.delivery_agent_id, payout.net_amount,
+                reference=payout.payout_number, memo='Delivery payout generated', created_by=created_by
+            )
+
+        return [payout for _, payout in payouts]
+
+    @staticmethod
+    def mark_orders_paid(payout, payment_reference):
+        """Mark every order in the payout as paid with one UPDATE."""
+        if not payout.order_ids:
+            return 0
+        return Order.query.filter(Order.id.in_(payout.order_ids)).update({
+            Order.delivery_fee_paid: True,
+            Order.delivery_fee_paid_at: datetime.utcnow(),
+            Order.delivery_payment_reference: payment_reference,
+            Order.delivery_payout_id: payout.id,
+        }, synchronize_session='fetch')
+
+    @staticmethod
+    def release(payout):
+        """Return a cancelled payout's orders to the pool and reverse the agent's credit."""
+        Order.query.filter(Order.delivery_payout_id == payout.id).update(
+            {Order.delivery_payout_id: None}, synchronize_session='fetch'
+        )
+        if payout.payout_type == DeliveryPayoutType.AGENT and payout.delivery_agent_id and payout.net_amount:
+            ledger_service.deduction(
+                'agent', payout.delivery_agent_id, payout.net_amount,
+                reference=payout.payout_number, memo='Delivery payout cancelled'
+            )
+
+
+delivery_payout_service = DeliveryPayoutService()
@@ -0,0 +1,231 @@
+"""
+Delivery dispatch service.
+
+Offers each order to a ranked shortlist of delivery agents in waves instead of
+broadcasting it to every available agent. Agents in the order's zone with the
+lightest workload are offered first; when a wave expires or every agent in it
+rejects, the next wave goes out. Once all waves are exhausted the order is
+escalated to admins for manual assignment.
+"""
+
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import Text, and_, case, cast, false, func
+from app.models import db
+from app.models.order import Order, OrderStatus
+from app.models.user import User, DeliveryAgentProfile
+from app.models.delivery_request import DeliveryRequest, DeliveryRequestStatus
+from app.services.notification_service import notification_service
+from app.services.geo_service import haversine_km
+
+
+# Orders an agent is still working on (used for load balancing)
+ACTIVE_DELIVERY_STATUSES = [
+    OrderStatus.SHIPPED,
+    OrderStatus.OUT_FOR_DELIVERY,
+    OrderStatus.ARRIVED,
+]
+
+# Agents loaded per wave slot for the distance tiebreak
+CANDIDATE_FACTOR = 4
+
+# Orders that may still be offered to agents
+DISPATCHABLE_STATUSES = [
+    OrderStatus.PAID,
+    OrderStatus.PROCESSING,
+    OrderStatus.QUALITY_APPROVED,
+    OrderStatus.PENDING_ASSIGNMENT,
+]
+
+
+class DispatchService:
+    """Service for offering orders to delivery agents in waves."""
+
+    @staticmethod
+    def _settings():
+        """Read dispatch tuning from app config."""
+        config = current_app.config
+        return {
+            'wave_size': int(config.get('DISPATCH_WAVE_SIZE', 3)),
+            'max_waves': int(config.get('DISPATCH_MAX_WAVES', 3)),
+            'offer_timeout': int(config.get('DISPATCH_OFFER_TIMEOUT_MINUTES', 120)),
+        }
+
+    @staticmethod
+    def rank_agents(order, exclude_user_ids=None, limit=None):
+        """
+        Return available agents ordered by suitability for this order.
+        Agents covering the order's zone come first, then the rest;
+        within each group the agent with the fewest active deliveries wins,
+        and ties go to the agent closest to the delivery address when both
+        positions are known.
+
+        Exclusion, zone and workload ordering run in SQL; with a limit only
+        limit * CANDIDATE_FACTOR agents are loaded for the distance tiebreak,
+        so a wave does not read every agent on the platform.
+        """
+        exclude_user_ids = set(exclude_user_ids or [])
+
+        # One grouped query for workload instead of a COUNT per agent
+        workload = db.session.query(
+            Order.assigned_delivery_agent.label('user_id'),
+            func.count(Order.id).label('active')
+        ).filter(
+            Order.assigned_delivery_agent.isnot(None),
+            Order.status.in_(ACTIVE_DELIVERY_STATUSES)
+        ).group_by(Order.assigned_delivery_agent).subquery()
+        active = func.coalesce(workload.c.active, 0)
+
+        # assigned_zones is a JSON list of zone names; match the quoted name
+        zone = order.delivery_zone
+        in_zone = and_(
+            DeliveryAgentProfile.assigned_zones.isnot(None),
+            cast(DeliveryAgentProfile.assigned_zones, Text).contains(json.dumps(zone), autoescape=True)
+        ) if zone else false()
+
+        query = db.session.query(DeliveryAgentProfile, active).select_from(DeliveryAgentProfile).join(
+            User, User.id == DeliveryAgentProfile.user_id
+        ).outerjoin(
+            workload, workload.c.user_id == DeliveryAgentProfile.user_id
+        ).filter(
+            User.is_active == True,
+            DeliveryAgentProfile.is_available == True
+        )
+        if exclude_user_ids:
+            query = query.filter(DeliveryAgentProfile.user_id.notin_(exclude_user_ids))
+        query = query.order_by(case((in_zone, 0), else_=1), active, DeliveryAgentProfile.id)
+        if limit is not None:
+            query = query.limit(limit * CANDIDATE_FACTOR)
+
+        candidates = query.all()
+        if not candidates:
+            return []
+
+        address = order.delivery_address
+        pinned = address is not None and address.has_coordinates
+
+        def distance(agent):
+            if not pinned or agent.current_latitude is None or agent.current_longitude is None:
+                return float('inf')
+            return haversine_km(address.latitude, address.longitude,
+                                agent.current_latitude, agent.current_longitude)
+
+        def sort_key(candidate):
+            agent, load = candidate
+            in_zone = bool(agent.assigned_zones) and zone in agent.assigned_zones
+            return (0 if in_zone else 1, load, distance(agent))
+
+        ranked = [agent for agent, _ in sorted(candidates, key=sort_key)]
+        return ranked[:limit] if limit is not None else ranked
+
+    def offer_next_wave(self, order, timeout_minutes=None):
+        """
+        Offer the order to the next wave of agents.
+
+        Does nothing while the order is assigned, no longer awaiting delivery,
+        or still has live offers. Returns the list of DeliveryRequest rows
+        created (empty if none). Escalates to admins when every wave has been
+        used up.
+        """
+        if order.assigned_delivery_agent or order.status not in DISPATCHABLE_STATUSES:
+            return []
+
+        settings = self._settings()
+        timeout_minutes = timeout_minutes or settings['offer_timeout']
+
+        live_offers = DeliveryRequest.query.filter(
+            DeliveryRequest.order_id == order.id,
+            DeliveryRequest.status == DeliveryRequestStatus.PENDING,
+            DeliveryRequest.expires_at > datetime.utcnow()
+        ).count()
+        if live_offers:
+            return []
+
+        previous = db.session.query(
+            DeliveryRequest.delivery_agent_id, DeliveryRequest.wave
+        ).filter(DeliveryRequest.order_id == order.id).all()
+        offered_agents = {agent_id for agent_id, _ in previous}
+        last_wave = max((wave or 1 for _, wave in previous), default=0)
+
+        if last_wave >= settings['max_waves']:
+            self.escalate(order, last_wave)
+            return []
+
+        shortlist = self.rank_agents(order, exclude_user_ids=offered_agents, limit=settings['wave_size'])
+        if not shortlist:
+            if last_wave:
+                self.escalate(order, last_wave)
+            return []
+
+        wave = last_wave + 1
+        expires_at = datetime.utcnow() + timedelta(minutes=timeout_minutes)
+        order.status = OrderStatus.PENDING_ASSIGNMENT
+
+        created = []
+        for agent in shortlist:
+            delivery_request = DeliveryRequest(
+                order_id=order.id,
+                delivery_agent_id=agent.user_id,
+                wave=wave,
+                expires_at=expires_at
+            )
+            db.session.add(delivery_request)
+            created.append(delivery_request)
+
+            notification_service.create_notification(
+                user_id=agent.user_id,
+                title='New Delivery Available',
+                message=f'Order #{order.order_number} to {order.delivery_zone} - KES {order.delivery_fee} delivery fee. Accept within {timeout_minutes} minutes.',
+                notification_type='info',
+                link='/delivery/available-requests'
+            )
+
+        # Each offer expires on its own deadline rather than waiting for the sweep
+        from app.services.scheduler_service import schedule_deadline
+        db.session.flush()
+        for delivery_request in created:
+            schedule_deadline('delivery_request_expiry', delivery_request.id, expires_at)
+
+        return created
+
+    @staticmethod
+    def escalate(order, waves_used):
+        """Tell admins nobody accepted the order so it can be assigned manually."""
+        notification_service.notify_admins(
+            title='Delivery Needs Manual Assignment',
+            message=f'No agent accepted order #{order.order_number} ({order.delivery_zone}) after {waves_used} dispatch wave(s).',
+            notification_type='warning',
+            link='/admin/orders?status=pending_assignment'
+        )
+
+    def expire_requests(self, request_ids=None):
+        """
+        Expire offers past their deadline and push the affected orders to their next wave.
+        Limited to request_ids when given (timer wheel batches), otherwise a full sweep.
+        Returns (expired_count, order_ids).
+        """
+        now = datetime.utcnow()
+        due = DeliveryRequest.query.filter(
+            DeliveryRequest.status == DeliveryRequestStatus.PENDING,
+            DeliveryRequest.expires_at <= now
+        )
+        if request_ids is not None:
+            if not request_ids:
+                return 0, []
+            due = due.filter(DeliveryRequest.id.in_(request_ids))
+
+        order_ids = [row[0] for row in due.with_entities(DeliveryRequest.order_id).distinct().all()]
+        if not order_ids:
+            return 0, []
+
+        expired_count = due.update({'status': DeliveryRequestStatus.EXPIRED}, synchronize_session=False)
+
+        for order in Order.query.filter(Order.id.in_(order_ids)).all():
+            self.offer_next_wave(order)
+
+        db.session.commit()
+        return expired_count, order_ids
+
+
+dispatch_service = DispatchService()
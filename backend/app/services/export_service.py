@@ -0,0 +1,264 @@
+"""
+Streaming admin exports.
+
+Each dataset is one explicit-column SELECT (names come from joins, not lazy
+loads) executed with yield_per, so PostgreSQL hands rows over through a
+server-side cursor a batch at a time. Rows are written as CSV or NDJSON into
+a small buffer that is flushed every CHUNK_SIZE characters, keeping memory
+flat however large the export is.
+"""
+
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from io import StringIO
+from flask import current_app
+from sqlalchemy import select, or_
+from app.models import db
+from app.models.user import User, CustomerProfile, SupplierProfile, DeliveryAgentProfile, DeliveryCompany
+from app.models.product import Product, Category, Brand
+from app.models.order import Order, OrderStatus, PaymentStatus, PaymentMethod
+from app.models.returns import Return, SupplierPayout, DeliveryPayout, DeliveryPayoutType, RefundPolicy
+from app.models.audit_log import AuditLog
+
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Characters buffered before a chunk is sent
+CHUNK_SIZE = 64 * 1024
+
+
+def _date(value, end=False):
+    """ISO date filter; an end date covers the whole day."""
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed
+
+
+def _bool(value):
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise ValueError(f'Expected true or false, got {value}')
+
+
+def _enum(enum_cls, value):
+    try:
+        return enum_cls(value)
+    except ValueError:
+        raise ValueError(f'Invalid {enum_cls.__name__}: {value}')
+
+
+def _in_period(stmt, column, args):
+    if args.get('start_date'):
+        stmt = stmt.where(column >= _date(args['start_date']))
+    if args.get('end_date'):
+        stmt = stmt.where(column <= _date(args['end_date'], end=True))
+    return stmt
+
+
+class ExportService:
+    """Builds and streams the admin CSV / NDJSON exports."""
+
+    def __init__(self):
+        self.datasets = {
+            'products': self._products,
+            'orders': self._orders,
+            'supplier_payouts': self._supplier_payouts,
+            'delivery_payouts': self._delivery_payouts,
+            'returns': self._returns,
+            'audit_logs': self._audit_logs,
+        }
+
+    @staticmethod
+    def _products(args):
+        stmt = select(
+            Product.id, Product.name, Product.slug, Product.price, Product.stock_quantity,
+            Product.low_stock_threshold, Category.name.label('category'), Brand.name.label('brand'),
+            Product.supplier_id, SupplierProfile.business_name.label('supplier'),
+            Product.is_active, Product.purchase_count, Product.created_at
+        ).outerjoin(Category, Category.id == Product.category_id) \
+         .outerjoin(Brand, Brand.id == Product.brand_id) \
+         .outerjoin(SupplierProfile, SupplierProfile.id == Product.supplier_id)
+
+        if args.get('category'):
+            stmt = stmt.where(or_(Category.id == args['category'], Category.slug == args['category']))
+        if args.get('brand'):
+            stmt = stmt.where(or_(Brand.id == args['brand'], Brand.slug == args['brand']))
+        if args.get('supplier_id'):
+            stmt = stmt.where(Product.supplier_id == args['supplier_id'])
+        if args.get('is_active'):
+            stmt = stmt.where(Product.is_active == _bool(args['is_active']))
+        if args.get('low_stock') and _bool(args['low_stock']):
+            stmt = stmt.where(Product.stock_quantity <= Product.low_stock_threshold)
+        if args.get('search'):
+            stmt = stmt.where(Product.name.ilike(f"%{args['search']}%"))
+        return stmt.order_by(Product.created_at, Product.id)
+
+    @staticmethod
+    def _orders(args):
+        stmt = select(
+            Order.id, Order.order_number, Order.customer_id, User.email.label('customer_email'),
+            Order.status, Order.payment_method, Order.payment_status, Order.payment_reference,
+            Order.delivery_zone, Order.subtotal, Order.delivery_fee, Order.total,
+            Order.assigned_delivery_agent, Order.created_at, Order.paid_at
+        ).outerjoin(CustomerProfile, CustomerProfile.id == Order.customer_id) \
+         .outerjoin(User, User.id == CustomerProfile.user_id)
+
+        if args.get('status'):
+            stmt = stmt.where(Order.status == _enum(OrderStatus, args['status']))
+        if args.get('payment_status'):
+            stmt = stmt.where(Order.payment_status == _enum(PaymentStatus, args['payment_status']))
+        if args.get('payment_method'):
+            stmt = stmt.where(Order.payment_method == _enum(PaymentMethod, args['payment_method']))
+        if args.get('delivery_zone'):
+            stmt = stmt.where(Order.delivery_zone == args['delivery_zone'])
+        if args.get('customer_id'):
+            stmt = stmt.where(Order.customer_id == args['customer_id'])
+        return _in_period(stmt, Order.created_at, args).order_by(Order.created_at, Order.id)
+
+    @staticmethod
+    def _supplier_payouts(args):
+        stmt = select(
+            SupplierPayout.id, SupplierPayout.payout_number, SupplierPayout.supplier_id,
+            SupplierProfile.business_name.label('supplier'), SupplierPayout.amount, SupplierPayout.net_amount,
+            SupplierPayout.status, SupplierPayout.payment_reference, SupplierPayout.reference,
+            SupplierPayout.batch_id, SupplierPayout.created_at, SupplierPayout.paid_at
+        ).outerjoin(SupplierProfile, SupplierProfile.id == SupplierPayout.supplier_id)
+
+        if args.get('status'):
+            stmt = stmt.where(SupplierPayout.status == args['status'])
+        if args.get('supplier_id'):
+            stmt = stmt.where(SupplierPayout.supplier_id == args['supplier_id'])
+        return _in_period(stmt, SupplierPayout.created_at, args) \
+            .order_by(SupplierPayout.created_at, SupplierPayout.id)
+
+    @staticmethod
+    def _delivery_payouts(args):
+        stmt = select(
+            DeliveryPayout.id, DeliveryPayout.payout_number, DeliveryPayout.payout_type,
+            DeliveryPayout.delivery_agent_id,
+            (DeliveryAgentProfile.first_name + ' ' + DeliveryAgentProfile.last_name).label('agent'),
+            DeliveryPayout.delivery_company_id, DeliveryCompany.name.label('company'),
+            DeliveryPayout.gross_amount, DeliveryPayout.platform_fee, DeliveryPayout.net_amount,
+            DeliveryPayout.order_count, DeliveryPayout.status, DeliveryPayout.payment_method,
+            DeliveryPayout.payment_reference, DeliveryPayout.mpesa_number,
+            DeliveryPayout.period_start, DeliveryPayout.period_end,
+            DeliveryPayout.created_at, DeliveryPayout.processed_at
+        ).outerjoin(DeliveryAgentProfile, DeliveryAgentProfile.id == DeliveryPayout.delivery_agent_id) \
+         .outerjoin(DeliveryCompany, DeliveryCompany.id == DeliveryPayout.delivery_company_id)
+
+        if args.get('status'):
+            stmt = stmt.where(DeliveryPayout.status == args['status'])
+        if args.get('payout_type'):
+            stmt = stmt.where(DeliveryPayout.payout_type == _enum(DeliveryPayoutType, args['payout_type']))
+        if args.get('delivery_agent_id'):
+            stmt = stmt.where(DeliveryPayout.delivery_agent_id == args['delivery_agent_id'])
+        if args.get('delivery_company_id'):
+            stmt = stmt.where(DeliveryPayout.delivery_company_id == args['delivery_company_id'])
+        return _in_period(stmt, DeliveryPayout.created_at, args) \
+            .order_by(DeliveryPayout.created_at, DeliveryPayout.id)
+
+    @staticmethod
+    def _returns(args):
+        stmt = select(
+            Return.id, Return.return_number, Return.order_id, Order.order_number,
+            Return.user_id, Return.product_id, Return.reason, Return.status, Return.refund_policy,
+            Return.refund_amount, Return.customer_refund, Return.supplier_deduction,
+            Return.platform_deduction, Return.created_at, Return.refunded_at
+        ).outerjoin(Order, Order.id == Return.order_id)
+
+        if args.get('status'):
+            stmt = stmt.where(Return.status == args['status'])
+        if args.get('refund_policy'):
+            stmt = stmt.where(Return.refund_policy == _enum(RefundPolicy, args['refund_policy']))
+        return _in_period(stmt, Return.created_at, args).order_by(Return.created_at, Return.id)
+
+    @staticmethod
+    def _audit_logs(args):
+        stmt = select(
+            AuditLog.id, AuditLog.created_at, AuditLog.user_id, User.email.label('user_email'),
+            AuditLog.action, AuditLog.entity_type, AuditLog.entity_id, AuditLog.description,
+            AuditLog.ip_address, AuditLog.old_values, AuditLog.new_values
+        ).outerjoin(User, User.id == AuditLog.user_id)
+
+        if args.get('action'):
+            stmt = stmt.where(AuditLog.action == args['action'])
+        if args.get('user_id'):
+            stmt = stmt.where(AuditLog.user_id == args['user_id'])
+        if args.get('entity_type'):
+            stmt = stmt.where(AuditLog.entity_type == args['entity_type'])
+        if args.get('entity_id'):
+            stmt = stmt.where(AuditLog.entity_id == args['entity_id'])
+        return _in_period(stmt, AuditLog.created_at, args).order_by(AuditLog.created_at, AuditLog.id)
+
+    def query(self, dataset, args):
+        """The SELECT for a dataset with the request filters applied; ValueError on bad input."""
+        if dataset not in self.datasets:
+            raise ValueError(f"Unknown export '{dataset}'. Available: {', '.join(self.datasets)}")
+        return self.datasets[dataset](args)
+
+    @staticmethod
+    def _value(value):
+        """Plain JSON value for an exported cell."""
+        if isinstance(value, Enum):
+            return value.value
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value
+
+    @classmethod
+    def _csv_value(cls, value):
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, default=str)
+        return cls._value(value)
+
+    def _rows(self, stmt):
+        """Rows of the SELECT, fetched a batch at a time through a server-side cursor."""
+        batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+        result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+        try:
+            for partition in result.partitions():
+                yield from partition
+        finally:
+            result.close()
+
+    def stream(self, stmt, fmt, headers=None):
+        """Generate the export in chunks; headers override the CSV column titles."""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'. Use csv or ndjson")
+        columns = [column.key for column in stmt.selected_columns]
+        buffer = StringIO()
+
+        if fmt == 'csv':
+            writer = csv.writer(buffer)
+            writer.writerow(headers or columns)
+            write = lambda row: writer.writerow([self._csv_value(v) for v in row])
+        else:
+            write = lambda row: buffer.write(
+                json.dumps(dict(zip(columns, (self._value(v) for v in row))), default=str) + '\n'
+            )
+
+        for row in self._rows(stmt):
+            write(row)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+export_service = ExportService()
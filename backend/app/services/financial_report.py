@@ -0,0 +1,407 @@
+"""
+Admin financial report.
+
+Every figure comes from a grouped aggregate over the period instead of
+walking orders and items in Python: order totals per payment method, item
+commission/earnings, revenue per category and per supplier, refunds by who
+paid them and by category/supplier/policy, payouts, deliveries and the
+previous period. `aggregates()` returns the raw sums; `build()` derives the
+margins, costs and rankings the report endpoint returns.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from app.models import db
+from app.models.order import Order, OrderItem, OrderStatus, PaymentStatus
+from app.models.product import Product, Category
+from app.models.returns import Return, SupplierPayout
+from app.models.user import User, UserRole, SupplierProfile
+
+
+# Return statuses counted as refunds
+REFUNDED_STATUSES = ['approved', 'completed', 'refund_completed']
+
+# Share of delivery fees owed to agents
+DELIVERY_AGENT_SHARE = 0.7
+
+
+def _float(value):
+    return float(value or 0)
+
+
+def _refund_amount():
+    """The refunded amount: customer_refund, else refund_amount (zero counts as missing)."""
+    return func.coalesce(func.nullif(Return.customer_refund, 0), func.nullif(Return.refund_amount, 0), 0)
+
+
+class FinancialReportService:
+    """Builds the admin financial report from SQL aggregates."""
+
+    @staticmethod
+    def _period(start_date, end_date):
+        """Parse the ISO dates into (start, end) datetimes; end covers the whole day."""
+        start = datetime.fromisoformat(start_date) if start_date else None
+        end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59) if end_date else None
+        return start, end
+
+    @staticmethod
+    def _in_period(query, column, start, end):
+        if start:
+            query = query.filter(column >= start)
+        if end:
+            query = query.filter(column <= end)
+        return query
+
+    def _order_totals(self, start, end):
+        """Completed order count and sums, per payment method."""
+        rows = self._in_period(
+            db.session.query(
+                Order.payment_method,
+                func.count(Order.id),
+                func.sum(Order.total),
+                func.sum(Order.subtotal),
+                func.sum(Order.delivery_fee)
+            ).filter(Order.payment_status == PaymentStatus.COMPLETED),
+            Order.created_at, start, end
+        ).group_by(Order.payment_method).all()
+
+        totals = {'count': 0, 'revenue': 0, 'subtotal': 0, 'delivery_fees': 0, 'card_orders': 0,
+                  'by_method': {'mpesa': 0, 'card': 0, 'cash': 0}}
+        for method, count, revenue, subtotal, delivery_fees in rows:
+            method = method.value if hasattr(method, 'value') else str(method)
+            totals['count'] += count
+            totals['revenue'] += _float(revenue)
+            totals['subtotal'] += _float(subtotal)
+            totals['delivery_fees'] += _float(delivery_fees)
+            totals['by_method'][method] = totals['by_method'].get(method, 0) + _float(revenue)
+            if method == 'card':
+                totals['card_orders'] = count
+        return totals
+
+    def _item_totals(self, start, end):
+        """Commission and supplier earnings, overall, per category and per supplier."""
+        def completed_items(*columns):
+            return self._in_period(
+                db.session.query(*columns).join(Order, OrderItem.order_id == Order.id)
+                .filter(Order.payment_status == PaymentStatus.COMPLETED),
+                Order.created_at, start, end
+            )
+
+        commission, earnings = completed_items(
+            func.sum(OrderItem.platform_commission), func.sum(OrderItem.supplier_earnings)
+        ).one()
+
+        categories = completed_items(Category.name, func.sum(OrderItem.subtotal))\
+            .join(Product, OrderItem.product_id == Product.id)\
+            .join(Category, Product.category_id == Category.id)\
+            .group_by(Category.name).all()
+
+        suppliers = completed_items(
+            SupplierProfile.business_name,
+            func.min(SupplierProfile.id),
+            func.sum(OrderItem.subtotal),
+            func.sum(OrderItem.supplier_earnings),
+            func.count(OrderItem.id)
+        ).join(SupplierProfile, OrderItem.supplier_id == SupplierProfile.id)\
+            .group_by(SupplierProfile.business_name).all()
+
+        return {
+            'commission': _float(commission),
+            'supplier_earnings': _float(earnings),
+            'category_revenue': {name: _float(revenue) for name, revenue in categories},
+            'supplier_revenue': {
+                name: {'revenue': _float(revenue), 'earnings': _float(supplier_earnings), 'orders': count}
+                for name, _, revenue, supplier_earnings, count in suppliers
+            },
+            'supplier_ids': {name: supplier_id for name, supplier_id, *_ in suppliers},
+        }
+
+    def _refund_totals(self, start, end):
+        """Refund sums by payer, and counts/amounts by category, supplier and policy."""
+        def refunded(*columns):
+            return self._in_period(
+                db.session.query(*columns).filter(Return.status.in_(REFUNDED_STATUSES)),
+                Return.created_at, start, end
+            )
+
+        refunds = {'count': 0, 'to_customers': 0, 'platform_paid': 0, 'supplier_paid': 0,
+                   'by_category': {}, 'by_supplier': {}, 'by_policy': {}}
+        try:
+            count, to_customers, platform_paid, supplier_paid = refunded(
+                func.count(Return.id),
+                func.sum(_refund_amount()),
+                func.sum(Return.platform_deduction),
+                func.sum(Return.supplier_deduction)
+            ).one()
+            refunds.update(count=count, to_customers=_float(to_customers),
+                           platform_paid=_float(platform_paid), supplier_paid=_float(supplier_paid))
+
+            for name, count, amount in refunded(Category.name, func.count(Return.id), func.sum(_refund_amount()))\
+                    .join(Product, Return.product_id == Product.id)\
+                    .join(Category, Product.category_id == Category.id)\
+                    .group_by(Category.name).all():
+                refunds['by_category'][name] = {'count': count, 'amount': _float(amount)}
+
+            for name, count, amount in refunded(
+                SupplierProfile.business_name, func.count(Return.id), func.sum(_refund_amount())
+            ).join(OrderItem, Return.order_item_id == OrderItem.id)\
+                    .join(SupplierProfile, OrderItem.supplier_id == SupplierProfile.id)\
+                    .group_by(SupplierProfile.business_name).all():
+                refunds['by_supplier'][name] = {'count': count, 'amount': _float(amount)}
+
+            policy = func.coalesce(func.nullif(Return.refund_policy, ''), 'unknown')
+            for name, count, platform_cost, supplier_cost in refunded(
+                policy, func.count(Return.id), func.sum(Return.platform_deduction), func.sum(Return.supplier_deduction)
+            ).group_by(policy).all():
+                refunds['by_policy'][name] = {'count': count, 'platform_cost': _float(platform_cost),
+                                              'supplier_cost': _float(supplier_cost)}
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'Returns query error: {str(e)}')
+        return refunds
+
+    def _payout_totals(self, start, end):
+        """Completed payouts in the period (per supplier) and everything still pending."""
+        payouts = {'total': 0, 'count': 0, 'by_supplier': {}, 'pending_total': 0, 'pending_count': 0}
+        try:
+            # Narrow rows: payouts are few next to order items, and payout days are whole days per payout
+            rows = self._in_period(
+                db.session.query(SupplierPayout.supplier_id, SupplierPayout.amount,
+                                 SupplierPayout.created_at, SupplierPayout.paid_at)
+                .filter(SupplierPayout.status == 'completed'),
+                SupplierPayout.paid_at, start, end
+            ).all()
+            for supplier_id, amount, created_at, paid_at in rows:
+                supplier = payouts['by_supplier'].setdefault(supplier_id, {'paid_out': 0, 'days': []})
+                supplier['paid_out'] += _float(amount)
+                if paid_at:
+                    supplier['days'].append((paid_at - created_at).days)
+            payouts['total'] = sum(_float(amount) for _, amount, _, _ in rows)
+            payouts['count'] = len(rows)
+
+            pending_count, pending_total = db.session.query(
+                func.count(SupplierPayout.id), func.sum(SupplierPayout.amount)
+            ).filter(SupplierPayout.status == 'pending').one()
+            payouts.update(pending_count=pending_count, pending_total=_float(pending_total))
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'Payouts query error: {str(e)}')
+        return payouts
+
+    def aggregates(self, start_date=None, end_date=None):
+        """Raw sums and counts for the period."""
+        start, end = self._period(start_date, end_date)
+
+        delivered_count, delivered_fees = self._in_period(
+            db.session.query(func.count(Order.id), func.sum(Order.delivery_fee)).filter(
+                Order.status == OrderStatus.DELIVERED,
+                Order.assigned_delivery_agent.isnot(None)
+            ),
+            Order.created_at, start, end
+        ).one()
+
+        expected_incoming = self._in_period(
+            db.session.query(func.sum(Order.total)).filter(Order.payment_status == PaymentStatus.PENDING),
+            Order.created_at, start, end
+        ).scalar()
+
+        previous = None
+        if start_date and end_date:
+            period_days = (datetime.fromisoformat(end_date) - datetime.fromisoformat(start_date)).days
+            prev_start = datetime.fromisoformat(start_date) - timedelta(days=period_days)
+            prev_count, prev_revenue = db.session.query(func.count(Order.id), func.sum(Order.total)).filter(
+                Order.payment_status == PaymentStatus.COMPLETED,
+                Order.created_at >= prev_start,
+                Order.created_at < datetime.fromisoformat(start_date)
+            ).one()
+            new_customers = User.query.filter(
+                User.role == UserRole.CUSTOMER,
+                User.created_at >= start,
+                User.created_at <= end
+            ).count()
+            previous = {'count': prev_count, 'revenue': _float(prev_revenue), 'new_customers': new_customers}
+
+        return {
+            'orders': self._order_totals(start, end),
+            'items': self._item_totals(start, end),
+            'refunds': self._refund_totals(start, end),
+            'payouts': self._payout_totals(start, end),
+            'delivered': {'count': delivered_count, 'fees': _float(delivered_fees)},
+            'expected_incoming': _float(expected_incoming),
+            'previous': previous,
+        }
+
+    def build(self, start_date=None, end_date=None):
+        """The full report for the period (dates are ISO strings, either may be omitted)."""
+        raw = self.aggregates(start_date, end_date)
+        orders, items, refunds, payouts = raw['orders'], raw['items'], raw['refunds'], raw['payouts']
+        order_count = orders['count']
+        total_revenue = orders['revenue']
+        total_subtotal = orders['subtotal']
+        total_commission = items['commission']
+        total_supplier_earnings = items['supplier_earnings']
+
+        total_delivery_fees_collected = raw['delivered']['fees']
+        delivery_agent_share = total_delivery_fees_collected * DELIVERY_AGENT_SHARE
+        platform_delivery_earnings = total_delivery_fees_collected * (1 - DELIVERY_AGENT_SHARE)
+
+        net_revenue = total_revenue - refunds['to_customers']
+
+        # Platform earnings: product commission plus its cut of delivery fees,
+        # net of only the refunds the platform paid
+        platform_gross_earnings = total_commission + platform_delivery_earnings
+        platform_net_earnings = platform_gross_earnings - refunds['platform_paid']
+
+        commission_rate = (total_commission / total_subtotal * 100) if total_subtotal > 0 else 0
+        refund_rate = (refunds['count'] / order_count * 100) if order_count else 0
+        avg_order_value = total_revenue / order_count if order_count else 0
+
+        top_categories = sorted(
+            [{'name': k, 'revenue': v} for k, v in items['category_revenue'].items()],
+            key=lambda x: x['revenue'],
+            reverse=True
+        )[:10]
+        top_suppliers = sorted(
+            [{'name': k, **v} for k, v in items['supplier_revenue'].items()],
+            key=lambda x: x['revenue'],
+            reverse=True
+        )[:10]
+
+        # Cash flow
+        outstanding_supplier_payouts = total_supplier_earnings - payouts['total']
+        outstanding_delivery_payouts = delivery_agent_share  # Delivery payouts are not netted here yet
+
+        # Profit margins
+        gross_profit = platform_gross_earnings
+        gross_profit_margin = (gross_profit / total_revenue * 100) if total_revenue > 0 else 0
+        net_profit_margin = (platform_net_earnings / total_revenue * 100) if total_revenue > 0 else 0
+        profit_per_order = platform_net_earnings / order_count if order_count else 0
+
+        # Growth against the previous period of the same length
+        previous = raw['previous']
+        if previous:
+            revenue_growth = ((total_revenue - previous['revenue']) / previous['revenue'] * 100) \
+                if previous['revenue'] > 0 else None
+            order_growth = ((order_count - previous['count']) / previous['count'] * 100) \
+                if previous['count'] > 0 else None
+            new_customers = previous['new_customers']
+            customer_acquisition_cost = (platform_gross_earnings / new_customers) if new_customers > 0 else 0
+        else:
+            revenue_growth = 0
+            order_growth = 0
+            new_customers = 0
+            customer_acquisition_cost = 0
+
+        # Estimated transaction fees: M-Pesa ~1.5%, Paystack ~2.9% + KES 100
+        mpesa_fees = orders['by_method'].get('mpesa', 0) * 0.015
+        paystack_fees = (orders['by_method'].get('card', 0) * 0.029) + (100 * orders['card_orders'])
+        total_transaction_fees = mpesa_fees + paystack_fees
+
+        # Tax (16% VAT inclusive, ~30% corporate tax)
+        vat_rate = 0.16
+        vat_collected = total_revenue * (vat_rate / (1 + vat_rate))
+        tax_liability = platform_net_earnings * 0.30
+
+        supplier_performance = []
+        for name, data in items['supplier_revenue'].items():
+            supplier_payouts = payouts['by_supplier'].get(items['supplier_ids'][name], {'paid_out': 0, 'days': []})
+            days = supplier_payouts['days']
+            supplier_performance.append({
+                'name': name,
+                'revenue': data['revenue'],
+                'earnings': data['earnings'],
+                'orders': data['orders'],
+                'paid_out': supplier_payouts['paid_out'],
+                'pending_payout': data['earnings'] - supplier_payouts['paid_out'],
+                'avg_payout_days': round(sum(days) / len(days), 1) if days else 0
+            })
+        supplier_performance = sorted(supplier_performance, key=lambda x: x['revenue'], reverse=True)[:10]
+
+        return {
+            'revenue': {
+                'total_revenue': float(total_revenue),
+                'total_subtotal': float(total_subtotal),
+                'total_delivery_fees': float(orders['delivery_fees']),
+                'net_revenue': float(net_revenue),
+                'avg_order_value': float(avg_order_value)
+            },
+            'earnings': {
+                'total_commission': float(total_commission),
+                'total_supplier_earnings': float(total_supplier_earnings),
+                'total_delivery_fees_collected': float(total_delivery_fees_collected),
+                'delivery_agent_share': float(delivery_agent_share),
+                'platform_delivery_earnings': float(platform_delivery_earnings),
+                'platform_gross_earnings': float(platform_gross_earnings),
+                'platform_net_earnings': float(platform_net_earnings),
+                'commission_rate': float(commission_rate)
+            },
+            'cash_flow': {
+                'outstanding_supplier_payouts': float(outstanding_supplier_payouts),
+                'outstanding_delivery_payouts': float(outstanding_delivery_payouts),
+                'expected_incoming_revenue': float(raw['expected_incoming']),
+                'net_cash_position': float(platform_net_earnings - outstanding_supplier_payouts - outstanding_delivery_payouts)
+            },
+            'profit_margins': {
+                'gross_profit': float(gross_profit),
+                'gross_profit_margin': float(gross_profit_margin),
+                'net_profit_margin': float(net_profit_margin),
+                'profit_per_order': float(profit_per_order)
+            },
+            'growth': {
+                'revenue_growth': float(revenue_growth) if revenue_growth is not None else None,
+                'order_growth': float(order_growth) if order_growth is not None else None,
+                'new_customers': new_customers,
+                'customer_acquisition_cost': float(customer_acquisition_cost),
+                'has_comparison_data': revenue_growth is not None
+            },
+            'operational_costs': {
+                'mpesa_fees': float(mpesa_fees),
+                'paystack_fees': float(paystack_fees),
+                'total_transaction_fees': float(total_transaction_fees),
+                'net_after_fees': float(platform_net_earnings - total_transaction_fees)
+            },
+            'tax': {
+                'vat_collected': float(vat_collected),
+                'vat_rate': float(vat_rate * 100),
+                'estimated_tax_liability': float(tax_liability),
+                'net_after_tax': float(platform_net_earnings - tax_liability)
+            },
+            'payouts': {
+                'total_payouts': float(payouts['total']),
+                'payout_count': payouts['count'],
+                'pending_payouts': float(payouts['pending_total']),
+                'pending_count': payouts['pending_count']
+            },
+            'refunds': {
+                'total_refunds_to_customers': float(refunds['to_customers']),
+                'platform_paid_refunds': float(refunds['platform_paid']),
+                'supplier_paid_refunds': float(refunds['supplier_paid']),
+                'refund_count': refunds['count'],
+                'refund_rate': float(refund_rate)
+            },
+            'return_analysis': {
+                'by_category': [{'category': k, **v} for k, v in refunds['by_category'].items()],
+                'by_supplier': [{'supplier': k, **v} for k, v in refunds['by_supplier'].items()],
+                'by_policy': [{'policy': k, **v} for k, v in refunds['by_policy'].items()]
+            },
+            'orders': {
+                'total_orders': order_count,
+                'delivered_orders': raw['delivered']['count']
+            },
+            'payment_methods': [
+                {'method': k, 'amount': float(v)}
+                for k, v in orders['by_method'].items()
+                if v > 0
+            ],
+            'top_categories': top_categories,
+            'top_suppliers': top_suppliers,
+            'supplier_performance': supplier_performance,
+            'period': {
+                'start_date': start_date,
+                'end_date': end_date
+            }
+        }
+
+
+financial_report_service = FinancialReportService()
@@ -0,0 +1,263 @@
+"""
+Geospatial delivery routing.
+
+Resolves the delivery zone for a map pin with point-in-polygon tests over
+zone boundaries (GeoJSON Polygon/MultiPolygon), finds the nearest available
+delivery agents, and prices distance-based delivery fees. Zones and agent
+positions are held in in-process grid indexes so a lookup only tests the
+handful of shapes/agents in the surrounding cells; the indexes are rebuilt
+after their TTL or when zones are edited. Addresses without coordinates fall
+back to matching by county name.
+"""
+
+import math
+import threading
+import time
+from collections import defaultdict
+from flask import current_app
+from app.models import db
+from app.models.order import DeliveryZone
+from app.models.user import User, DeliveryAgentProfile
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def parse_coordinates(data, lat_key='latitude', lng_key='longitude'):
+    """
+    Read an optional lat/lng pair from request data.
+    Returns (None, None) when absent; raises ValueError when invalid or half-given.
+    """
+    latitude, longitude = data.get(lat_key), data.get(lng_key)
+    if latitude in (None, '') and longitude in (None, ''):
+        return None, None
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError('Latitude and longitude must both be numbers')
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError('Coordinates out of range')
+    return latitude, longitude
+
+
+def parse_boundary(boundary):
+    """
+    Normalise a GeoJSON Polygon/MultiPolygon geometry into a list of polygons,
+    each a list of rings of (lng, lat) tuples. Raises ValueError if malformed.
+    """
+    if not isinstance(boundary, dict) or boundary.get('type') not in ('Polygon', 'MultiPolygon'):
+        raise ValueError('Boundary must be a GeoJSON Polygon or MultiPolygon')
+
+    coordinates = boundary.get('coordinates') or []
+    polygons = [coordinates] if boundary['type'] == 'Polygon' else coordinates
+
+    result = []
+    for polygon in polygons:
+        rings = []
+        for ring in polygon:
+            points = [(float(lng), float(lat)) for lng, lat, *_ in ring]
+            if len(points) < 3:
+                raise ValueError('Boundary rings need at least 3 positions')
+            rings.append(points)
+        if rings:
+            result.append(rings)
+
+    if not result:
+        raise ValueError('Boundary has no coordinates')
+    return result
+
+
+def point_in_polygon(lng, lat, rings):
+    """Even-odd ray casting test; inner rings act as holes."""
+    inside = False
+    for ring in rings:
+        j = len(ring) - 1
+        for i in range(len(ring)):
+            xi, yi = ring[i]
+            xj, yj = ring[j]
+            if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+                inside = not inside
+            j = i
+    return inside
+
+
+class GridIndex:
+    """Uniform grid over lng/lat; each cell lists the items whose bounds overlap it."""
+
+    def __init__(self, cell_degrees):
+        self.cell = cell_degrees
+        self.cells = defaultdict(list)
+
+    def _key(self, lng, lat):
+        return int(math.floor(lng / self.cell)), int(math.floor(lat / self.cell))
+
+    def insert(self, item, min_lng, min_lat, max_lng, max_lat):
+        x0, y0 = self._key(min_lng, min_lat)
+        x1, y1 = self._key(max_lng, max_lat)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                self.cells[(x, y)].append(item)
+
+    def at(self, lng, lat):
+        return self.cells.get(self._key(lng, lat), [])
+
+    def ring(self, lng, lat, radius):
+        """Items in the square ring of cells `radius` steps from the point's cell."""
+        cx, cy = self._key(lng, lat)
+        if radius == 0:
+            return list(self.cells.get((cx, cy), []))
+        items = []
+        for x in range(cx - radius, cx + radius + 1):
+            for y in (cy - radius, cy + radius):
+                items.extend(self.cells.get((x, y), []))
+        for y in range(cy - radius + 1, cy + radius):
+            for x in (cx - radius, cx + radius):
+                items.extend(self.cells.get((x, y), []))
+        return items
+
+
+class GeoService:
+    """Service for coordinate-based zone resolution, fees and agent lookup."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._zone_index = None
+        self._zone_built_at = 0
+        self._agent_index = None
+        self._agent_built_at = 0
+
+    @staticmethod
+    def _settings():
+        """Read index tuning from app config."""
+        config = current_app.config
+        return {
+            'cell': float(config.get('GEO_INDEX_CELL_DEGREES', 0.1)),
+            'zone_ttl': int(config.get('GEO_ZONE_INDEX_TTL_SECONDS', 300)),
+            'agent_ttl': int(config.get('GEO_AGENT_INDEX_TTL_SECONDS', 30)),
+            'agent_radius_km': float(config.get('GEO_AGENT_SEARCH_RADIUS_KM', 25)),
+        }
+
+    def invalidate_zones(self):
+        """Drop the zone index so the next lookup sees edited boundaries."""
+        with self._lock:
+            self._zone_index = None
+
+    def _zones(self):
+        settings = self._settings()
+        with self._lock:
+            if self._zone_index is None or time.monotonic() - self._zone_built_at > settings['zone_ttl']:
+                index = GridIndex(settings['cell'])
+                zones = DeliveryZone.query.filter(
+                    DeliveryZone.is_active == True,
+                    DeliveryZone.boundary.isnot(None)
+                ).all()
+                for zone in zones:
+                    try:
+                        polygons = parse_boundary(zone.boundary)
+                    except (ValueError, TypeError):
+                        current_app.logger.warning(f'Geo: skipping zone {zone.name} with invalid boundary')
+                        continue
+                    for rings in polygons:
+                        lngs = [p[0] for p in rings[0]]
+                        lats = [p[1] for p in rings[0]]
+                        area = (max(lngs) - min(lngs)) * (max(lats) - min(lats))
+                        index.insert((zone.id, rings, area), min(lngs), min(lats), max(lngs), max(lats))
+                self._zone_index = index
+                self._zone_built_at = time.monotonic()
+            return self._zone_index
+
+    def _agents(self):
+        settings = self._settings()
+        with self._lock:
+            if self._agent_index is None or time.monotonic() - self._agent_built_at > settings['agent_ttl']:
+                index = GridIndex(settings['cell'])
+                rows = db.session.query(
+                    DeliveryAgentProfile.user_id,
+                    DeliveryAgentProfile.current_latitude,
+                    DeliveryAgentProfile.current_longitude
+                ).join(User).filter(
+                    User.is_active == True,
+                    DeliveryAgentProfile.is_available == True,
+                    DeliveryAgentProfile.current_latitude.isnot(None),
+                    DeliveryAgentProfile.current_longitude.isnot(None)
+                ).all()
+                for user_id, lat, lng in rows:
+                    index.insert((user_id, lat, lng), lng, lat, lng, lat)
+                self._agent_index = index
+                self._agent_built_at = time.monotonic()
+            return self._agent_index
+
+    def resolve_zone(self, latitude, longitude):
+        """Return the active zone whose boundary contains the point (smallest wins), or None."""
+        matches = [
+            (area, zone_id)
+            for zone_id, rings, area in self._zones().at(longitude, latitude)
+            if point_in_polygon(longitude, latitude, rings)
+        ]
+        if not matches:
+            return None
+        return db.session.get(DeliveryZone, min(matches)[1])
+
+    @staticmethod
+    def zone_for_county(county):
+        """Return the active zone listing this county, or None."""
+        if not county:
+            return None
+        county = county.strip().lower()
+        for zone in DeliveryZone.query.filter_by(is_active=True).all():
+            if county in [c.lower() for c in zone.counties or []]:
+                return zone
+        return None
+
+    def zone_for_address(self, address):
+        """Resolve an address to a zone by its pin, falling back to its county."""
+        if address.has_coordinates:
+            zone = self.resolve_zone(address.latitude, address.longitude)
+            if zone:
+                return zone
+        return self.zone_for_county(address.county)
+
+    @staticmethod
+    def delivery_fee(zone, latitude=None, longitude=None):
+        """Zone fee, plus fee_per_km from the zone hub when both the hub and the point are known."""
+        fee = float(zone.delivery_fee)
+        if zone.fee_per_km is not None and zone.hub_latitude is not None and zone.hub_longitude is not None \
+                and latitude is not None and longitude is not None:
+            distance = haversine_km(zone.hub_latitude, zone.hub_longitude, latitude, longitude)
+            fee += float(zone.fee_per_km) * distance
+        return round(fee, 2)
+
+    def nearest_agents(self, latitude, longitude, limit=5, max_km=None):
+        """
+        Return [(user_id, distance_km)] for the closest available agents with a
+        known position, nearest first, within max_km.
+        """
+        settings = self._settings()
+        max_km = max_km or settings['agent_radius_km']
+        index = self._agents()
+
+        # Degrees of latitude per cell are the tightest bound, so this covers max_km
+        max_radius = int(math.ceil(max_km / (index.cell * 111.0))) + 1
+        found = []
+        for radius in range(max_radius + 1):
+            for user_id, lat, lng in index.ring(longitude, latitude, radius):
+                distance = haversine_km(latitude, longitude, lat, lng)
+                if distance <= max_km:
+                    found.append((distance, user_id))
+            # Anything outside this ring is at least `radius` cells away
+            if len(found) >= limit and sorted(found)[limit - 1][0] <= radius * index.cell * 111.0 * \
+                    math.cos(math.radians(min(abs(latitude) + radius * index.cell, 89))):
+                break
+
+        return [(user_id, distance) for distance, user_id in sorted(found)[:limit]]
+
+
+geo_service = GeoService()
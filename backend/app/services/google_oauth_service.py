@@ -3,8 +3,8 @@ Google OAuth service for authentication.
 """
 
 import os
-import requests
 from flask import current_app
+from app.services.http_client import http_client
 
 
 class GoogleOAuthService:
@@ -101,7 +101,8 @@ class GoogleOAuthService:
             }
 
         try:
-            response = requests.post(
+            response = http_client.post(
+                'google',
                 cls.GOOGLE_TOKEN_URL,
                 data={
                     'client_id': cls.get_client_id(),
@@ -148,7 +149,8 @@ class GoogleOAuthService:
             dict with user info or error
         """
         try:
-            response = requests.get(
+            response = http_client.get(
+                'google',
                 cls.GOOGLE_USERINFO_URL,
                 headers={'Authorization': f'Bearer {access_token}'}
             )
@@ -192,8 +194,10 @@ class GoogleOAuthService:
         """
         try:
             # Verify token with Google's tokeninfo endpoint
-            response = requests.get(
-                f'https://oauth2.googleapis.com/tokeninfo?id_token={id_token}'
+            response = http_client.get(
+                'google',
+                'https://oauth2.googleapis.com/tokeninfo',
+                params={'id_token': id_token}
             )
 
             if response.status_code != 200:
@@ -0,0 +1,284 @@
+"""
+Shared outbound HTTP client for third-party integrations.
+
+Every payment, OAuth and media provider goes through one pooled
+requests.Session per provider (keep-alive, bounded connection pool), with
+connect/read timeouts on every call, retries with jittered exponential
+backoff for calls that are safe to repeat, a circuit breaker per provider so
+a failing upstream is short-circuited instead of tying up workers, and
+per-provider latency/error metrics for the admin integrations endpoint.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from flask import current_app, has_app_context
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+
+# Methods that can be repeated without side effects
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# Upstream statuses worth retrying (and counted against the breaker)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Statuses from a gateway that could not get an answer from the provider
+GATEWAY_NO_ANSWER = {502, 504}
+
+DEFAULTS = {
+    'HTTP_CONNECT_TIMEOUT': 3.05,
+    'HTTP_READ_TIMEOUT': 30,
+    'HTTP_MAX_RETRIES': 2,
+    'HTTP_BACKOFF_BASE': 0.3,
+    'HTTP_BACKOFF_MAX': 4.0,
+    'HTTP_POOL_MAXSIZE': 10,
+    'HTTP_CIRCUIT_FAILURE_THRESHOLD': 5,
+    'HTTP_CIRCUIT_RESET_SECONDS': 30,
+}
+
+
+def _setting(name):
+    if has_app_context():
+        return current_app.config.get(name, DEFAULTS[name])
+    return DEFAULTS[name]
+
+
+def _never_sent(exc):
+    """Whether the request failed before a connection was made (safe to resend)."""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+        return isinstance(getattr(exc.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without calling the provider while its circuit is open."""
+
+
+def outcome_unknown(exc):
+    """
+    Whether a failed call may still have been acted on by the provider: it
+    was sent but no answer came back (read timeout, connection reset, or a
+    gateway reporting it got none). Calls that were never sent, or that the
+    provider answered, are not.
+    """
+    if isinstance(exc, CircuitOpenError) or _never_sent(exc):
+        return False
+    if not isinstance(exc, requests.exceptions.RequestException):
+        return False
+    response = getattr(exc, 'response', None)
+    return response is None or response.status_code in GATEWAY_NO_ANSWER
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open trial after a cool-down."""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started = None  # Set while the half-open trial request is in flight
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            reset_seconds = float(_setting('HTTP_CIRCUIT_RESET_SECONDS'))
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < reset_seconds:
+                    raise CircuitOpenError(f'{self.provider} is unavailable (circuit open)')
+                self.state = 'half_open'
+            elif self.state == 'half_open':
+                # Everyone else waits on the trial; a trial that never reported back is replaced
+                if self.trial_started is not None and time.monotonic() - self.trial_started < reset_seconds:
+                    raise CircuitOpenError(f'{self.provider} is unavailable (circuit half-open, trial in flight)')
+            else:
+                return
+            # Let one trial request through
+            self.trial_started = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= int(_setting('HTTP_CIRCUIT_FAILURE_THRESHOLD')):
+                if self.state != 'open' and has_app_context():
+                    current_app.logger.warning(f'HTTP: circuit opened for {self.provider} after {self.failures} failures')
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+            self.trial_started = None
+
+
+class ProviderMetrics:
+    """Call counts and a rolling window of latencies for one provider."""
+
+    def __init__(self, window=500):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.short_circuited = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms, error=False):
+        with self._lock:
+            self.calls += 1
+            if error:
+                self.errors += 1
+            self.latencies.append(latency_ms)
+
+    def to_dict(self):
+        with self._lock:
+            ordered = sorted(self.latencies)
+
+            def percentile(p):
+                if not ordered:
+                    return None
+                return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1)
+
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'short_circuited': self.short_circuited,
+                'p50_ms': percentile(0.5),
+                'p95_ms': percentile(0.95),
+                'max_ms': round(ordered[-1], 1) if ordered else None,
+            }
+
+
+class HttpClient:
+    """Pooled, timeout-bounded HTTP client shared by all provider services."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._breakers = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _provider(self, provider):
+        """Return (session, breaker, metrics), creating them on first use in this process."""
+        with self._lock:
+            if provider not in self._sessions:
+                pool_size = int(_setting('HTTP_POOL_MAXSIZE'))
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[provider] = session
+                self._breakers[provider] = CircuitBreaker(provider)
+                self._metrics[provider] = ProviderMetrics()
+            return self._sessions[provider], self._breakers[provider], self._metrics[provider]
+
+    @staticmethod
+    def _backoff(attempt):
+        """Full-jitter exponential backoff."""
+        ceiling = min(float(_setting('HTTP_BACKOFF_MAX')), float(_setting('HTTP_BACKOFF_BASE')) * (2 ** attempt))
+        time.sleep(random.uniform(0, ceiling))
+
+    def request(self, provider, method, url, idempotent=None, timeout=None, retries=None, expected=None, **kwargs):
+        """
+        Send a request to a provider.
+
+        Idempotent calls (GET etc. by default) are retried on connection
+        errors, timeouts and 429/5xx responses. Other calls are only retried
+        when the connection could not be established, so a payment request is
+        never sent twice. expected(response) may mark a 429/5xx as a normal
+        answer (e.g. Daraja's "still processing" 500), which is returned as is:
+        not retried and not counted against the breaker. Raises
+        CircuitOpenError while the provider's circuit is open; other failures
+        surface as the usual requests exceptions.
+        """
+        session, breaker, metrics = self._provider(provider)
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        if timeout is None:
+            timeout = (float(_setting('HTTP_CONNECT_TIMEOUT')), float(_setting('HTTP_READ_TIMEOUT')))
+        if retries is None:
+            retries = int(_setting('HTTP_MAX_RETRIES'))
+
+        attempt = 0
+        while True:
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                metrics.short_circuited += 1
+                raise
+
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                metrics.record((time.perf_counter() - started) * 1000, error=True)
+                breaker.record_failure()
+                if attempt < retries and (idempotent or _never_sent(e)):
+                    attempt += 1
+                    metrics.retries += 1
+                    self._backoff(attempt)
+                    continue
+                raise
+
+            failed = response.status_code in RETRY_STATUSES and not (expected and expected(response))
+            metrics.record((time.perf_counter() - started) * 1000, error=failed)
+            if failed:
+                breaker.record_failure()
+                if attempt < retries and idempotent:
+                    attempt += 1
+                    metrics.retries += 1
+                    self._backoff(attempt)
+                    continue
+            else:
+                breaker.record_success()
+            return response
+
+    def get(self, provider, url, **kwargs):
+        return self.request(provider, 'GET', url, **kwargs)
+
+    def post(self, provider, url, **kwargs):
+        return self.request(provider, 'POST', url, **kwargs)
+
+    def call(self, provider, func, *args, **kwargs):
+        """Run a provider SDK call (e.g. Cloudinary) under the provider's breaker and metrics."""
+        _, breaker, metrics = self._provider(provider)
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            metrics.short_circuited += 1
+            raise
+
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            metrics.record((time.perf_counter() - started) * 1000, error=True)
+            breaker.record_failure()
+            raise
+        metrics.record((time.perf_counter() - started) * 1000)
+        breaker.record_success()
+        return result
+
+    def stats(self):
+        """Per-provider metrics and circuit state."""
+        with self._lock:
+            providers = list(self._metrics)
+        return {
+            provider: {
+                **self._metrics[provider].to_dict(),
+                'circuit': self._breakers[provider].state,
+            }
+            for provider in providers
+        }
+
+
+http_client = HttpClient()
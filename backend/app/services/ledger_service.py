@@ -0,0 +1,189 @@
+"""
+Double-entry ledger for supplier and delivery partner balances.
+
+Every balance change is posted as an append-only pair of ledger entries (the
+partner's leg and a platform leg) and applied to the partner's running totals
+(SupplierProfile.outstanding_balance/total_sales, DeliveryAgentProfile.
+pending_payout/total_earnings, DeliveryCompany.pending_balance/total_paid)
+with a single `SET col = col + :delta` UPDATE, so concurrent postings never
+lose each other. Those columns are the materialized balances: reads stay a
+single-row lookup, and if they ever drift they are rebuilt from the ledger
+with one grouped query per partner type.
+"""
+
+import uuid
+from decimal import Decimal
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from app.models import db
+from app.models.ledger import LedgerEntry, LedgerEntryType
+from app.models.user import SupplierProfile, DeliveryAgentProfile, DeliveryCompany
+
+
+# account type -> (model, balance column, paid-out column)
+ACCOUNTS = {
+    'supplier': (SupplierProfile, 'outstanding_balance', 'total_sales'),
+    'agent': (DeliveryAgentProfile, 'pending_payout', 'total_earnings'),
+    'company': (DeliveryCompany, 'pending_balance', 'total_paid'),
+}
+
+# Platform account on the other side of each entry type
+PLATFORM_ACCOUNTS = {
+    LedgerEntryType.OPENING: 'opening',
+    LedgerEntryType.EARNING: 'sales',
+    LedgerEntryType.DEDUCTION: 'sales',
+    LedgerEntryType.REFUND: 'refunds',
+    LedgerEntryType.PAYOUT: 'cash',
+}
+
+# Entry types that lower the partner's balance
+DEBIT_TYPES = {LedgerEntryType.DEDUCTION, LedgerEntryType.REFUND, LedgerEntryType.PAYOUT}
+
+_OPENING_NAMESPACE = uuid.UUID('6f1c2b9e-4d0a-4c35-9a57-0d8e3b7f21c4')
+
+
+def _money(amount):
+    return Decimal(str(amount)).quantize(Decimal('0.01'))
+
+
+class LedgerService:
+    """Posts ledger transactions and keeps partner balances in step."""
+
+    @staticmethod
+    def _legs(transaction_id, entry_type, account_type, account_id, delta, entry_id=None, **details):
+        """The partner leg and its platform counterpart, summing to zero."""
+        return [
+            LedgerEntry(id=entry_id or str(uuid.uuid4()), transaction_id=transaction_id,
+                        account_type=account_type, account_id=account_id, entry_type=entry_type,
+                        amount=delta, **details),
+            LedgerEntry(transaction_id=transaction_id, account_type='platform',
+                        account_id=PLATFORM_ACCOUNTS[entry_type], entry_type=entry_type,
+                        amount=-delta, **details),
+        ]
+
+    def post(self, entry_type, account_type, account_id, amount, order_id=None, reference=None,
+             memo=None, created_by=None):
+        """
+        Post one transaction and apply it to the partner's running totals.
+        Amount is positive; the entry type decides the direction. Not committed.
+        Returns the transaction id.
+        """
+        amount = _money(amount)
+        if amount <= 0:
+            raise ValueError('Ledger amount must be positive')
+
+        model, balance_column, paid_column = ACCOUNTS[account_type]
+        delta = -amount if entry_type in DEBIT_TYPES else amount
+
+        values = {balance_column: getattr(model, balance_column) + delta}
+        if entry_type == LedgerEntryType.PAYOUT:
+            values[paid_column] = getattr(model, paid_column) + amount
+
+        # Atomic in the database; 'fetch' refreshes any copy already loaded in this session
+        updated = model.query.filter(model.id == account_id).update(values, synchronize_session='fetch')
+        if not updated:
+            raise ValueError(f'Unknown {account_type} account {account_id}')
+
+        transaction_id = str(uuid.uuid4())
+        db.session.add_all(self._legs(
+            transaction_id, entry_type, account_type, account_id, delta,
+            order_id=order_id, reference=reference, memo=memo, created_by=created_by
+        ))
+        return transaction_id
+
+    def earning(self, account_type, account_id, amount, **details):
+        return self.post(LedgerEntryType.EARNING, account_type, account_id, amount, **details)
+
+    def payout(self, account_type, account_id, amount, **details):
+        return self.post(LedgerEntryType.PAYOUT, account_type, account_id, amount, **details)
+
+    def refund(self, account_type, account_id, amount, **details):
+        return self.post(LedgerEntryType.REFUND, account_type, account_id, amount, **details)
+
+    def deduction(self, account_type, account_id, amount, **details):
+        return self.post(LedgerEntryType.DEDUCTION, account_type, account_id, amount, **details)
+
+    @staticmethod
+    def entries(account_type, account_id):
+        """Query for an account's entries, newest first."""
+        return LedgerEntry.query.filter_by(account_type=account_type, account_id=account_id)\
+            .order_by(LedgerEntry.created_at.desc())
+
+    @staticmethod
+    def _totals(account_type):
+        """{account_id: (balance, paid_out)} summed from the ledger in one grouped query."""
+        rows = db.session.query(
+            LedgerEntry.account_id,
+            func.sum(LedgerEntry.amount),
+            func.sum(case((LedgerEntry.entry_type == LedgerEntryType.PAYOUT, -LedgerEntry.amount), else_=0))
+        ).filter(LedgerEntry.account_type == account_type).group_by(LedgerEntry.account_id).all()
+        return {account_id: (_money(balance or 0), _money(paid or 0)) for account_id, balance, paid in rows}
+
+    def open_accounts(self):
+        """
+        Post opening entries for partners whose balances predate the ledger.
+        Entry ids are derived from the account, so concurrent or repeated runs
+        post them once. Commits; returns the number of accounts opened.
+        """
+        opened = 0
+        for account_type, (model, balance_column, paid_column) in ACCOUNTS.items():
+            has_entries = db.session.query(LedgerEntry.account_id).filter(
+                LedgerEntry.account_type == account_type
+            ).distinct().subquery()
+            rows = db.session.query(
+                model.id, getattr(model, balance_column), getattr(model, paid_column)
+            ).filter(
+                ~model.id.in_(db.select(has_entries.c.account_id)),
+                (getattr(model, balance_column) != 0) | (getattr(model, paid_column) != 0)
+            ).all()
+
+            for account_id, balance, paid in rows:
+                balance, paid = _money(balance or 0), _money(paid or 0)
+                transaction_id = str(uuid.uuid5(_OPENING_NAMESPACE, f'{account_type}:{account_id}'))
+                # Opening earnings cover what was paid out before, so the paid-out total rebuilds too
+                legs = self._legs(transaction_id, LedgerEntryType.OPENING, account_type, account_id,
+                                  balance + paid, entry_id=transaction_id, memo='Opening balance')
+                if paid:
+                    legs += self._legs(transaction_id, LedgerEntryType.PAYOUT, account_type, account_id, -paid,
+                                       entry_id=str(uuid.uuid5(_OPENING_NAMESPACE, f'{account_type}:{account_id}:paid')),
+                                       memo='Paid out before ledger')
+                try:
+                    with db.session.begin_nested():
+                        db.session.add_all(legs)
+                    opened += 1
+                except IntegrityError:
+                    pass  # Another worker opened it first
+
+        db.session.commit()
+        return opened
+
+    def rebuild_balances(self, account_type):
+        """
+        Reset the materialized balances of one partner type from the ledger.
+        Returns the accounts that had drifted as [{id, balance, expected, ...}]. Not committed.
+        """
+        model, balance_column, paid_column = ACCOUNTS[account_type]
+        totals = self._totals(account_type)
+        drifted = []
+
+        for account_id, balance, paid in db.session.query(
+            model.id, getattr(model, balance_column), getattr(model, paid_column)
+        ).all():
+            expected_balance, expected_paid = totals.get(account_id, (Decimal('0.00'), Decimal('0.00')))
+            if _money(balance or 0) != expected_balance or _money(paid or 0) != expected_paid:
+                drifted.append({
+                    'id': account_id,
+                    balance_column: float(balance or 0),
+                    f'expected_{balance_column}': float(expected_balance),
+                    paid_column: float(paid or 0),
+                    f'expected_{paid_column}': float(expected_paid),
+                })
+                model.query.filter(model.id == account_id).update(
+                    {balance_column: expected_balance, paid_column: expected_paid},
+                    synchronize_session='fetch'
+                )
+
+        return drifted
+
+
+ledger_service = LedgerService()
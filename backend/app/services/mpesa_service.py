@@ -1,8 +1,25 @@
 import os
 import base64
+import hashlib
 import requests
 from datetime import datetime
 from flask import current_app
+from app.services.http_client import http_client, outcome_unknown
+from app.services.token_cache import SharedTokenCache
+
+
+# Daraja's STK query answer (HTTP 500) for a push the customer has not finished yet
+STK_QUERY_PROCESSING = '500.001.1001'
+
+
+def _stk_still_processing(response):
+    """Whether an STK query response means the transaction is still being processed."""
+    if response.status_code != 500:
+        return False
+    try:
+        return (response.json() or {}).get('errorCode') == STK_QUERY_PROCESSING
+    except ValueError:
+        return False
 
 
 class MPesaService:
@@ -18,48 +35,61 @@ class MPesaService:
         # API URLs (use sandbox for testing, production for live)
         self.environment = os.getenv('MPESA_ENVIRONMENT', 'sandbox')
         
-        if self.environment == 'production':
+        if os.getenv('MPESA_BASE_URL'):
+            # e.g. the local payment simulator
+            self.base_url = os.getenv('MPESA_BASE_URL').rstrip('/')
+        elif self.environment == 'production':
             self.base_url = 'https://api.safaricom.co.ke'
         else:
             self.base_url = 'https://sandbox.safaricom.co.ke'
         
-        self.access_token = None
-        self.access_token_expiry = None
+        # Token shared by all workers, refreshed single-flight before expiry
+        credential = hashlib.sha256(f'{self.base_url}:{self.consumer_key}'.encode()).hexdigest()[:16]
+        self.token_cache = SharedTokenCache(f'mpesa:{self.environment}:{credential}', self._fetch_access_token)
+    
+    def _fetch_access_token(self):
+        """Request a new OAuth access token from M-Pesa. Returns (token, expires_in_seconds)."""
+        url = f'{self.base_url}/oauth/v1/generate?grant_type=client_credentials'
+        
+        # Create basic auth header
+        credentials = f'{self.consumer_key}:{self.consumer_secret}'
+        encoded = base64.b64encode(credentials.encode()).decode()
+        
+        headers = {
+            'Authorization': f'Basic {encoded}',
+            'Content-Type': 'application/json'
+        }
+        
+        response = http_client.get('mpesa', url, headers=headers)
+        response.raise_for_status()
+        
+        data = response.json()
+        # Tokens last 3599 seconds
+        return data['access_token'], int(data.get('expires_in', 3599))
     
     def get_access_token(self):
-        """Get OAuth access token from M-Pesa API."""
+        """Get OAuth access token from M-Pesa API (cached across workers)."""
         try:
-            # Check if we have a valid cached token
-            if self.access_token and self.access_token_expiry:
-                if datetime.utcnow() < self.access_token_expiry:
-                    return self.access_token
-            
-            url = f'{self.base_url}/oauth/v1/generate?grant_type=client_credentials'
-            
-            # Create basic auth header
-            credentials = f'{self.consumer_key}:{self.consumer_secret}'
-            encoded = base64.b64encode(credentials.encode()).decode()
-            
-            headers = {
-                'Authorization': f'Basic {encoded}',
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.access_token = data['access_token']
-            
-            # Token expires in 3599 seconds, cache for 3500 seconds to be safe
-            from datetime import timedelta
-            self.access_token_expiry = datetime.utcnow() + timedelta(seconds=3500)
-            
-            return self.access_token
+            return self.token_cache.get()
         except Exception as e:
             current_app.logger.error(f'M-Pesa auth error: {str(e)}')
             raise Exception(f'Failed to get M-Pesa access token: {str(e)}')
     
+    def _post(self, url, headers, **kwargs):
+        """
+        POST to Daraja with a bearer token. A 401 means the token was revoked
+        or expired early and nothing was processed: the shared token is
+        dropped and the call is sent once more with a fresh one.
+        """
+        response = http_client.post('mpesa', url, headers=headers, **kwargs)
+        if response.status_code == 401:
+            rejected = headers['Authorization'].split(' ', 1)[-1]
+            current_app.logger.warning('M-Pesa rejected the access token, refreshing it')
+            self.token_cache.invalidate(rejected)
+            headers = {**headers, 'Authorization': f'Bearer {self.get_access_token()}'}
+            response = http_client.post('mpesa', url, headers=headers, **kwargs)
+        return response
+
     def generate_password(self, timestamp):
         """Generate password for STK Push request."""
         data = f'{self.business_short_code}{self.passkey}{timestamp}'
@@ -87,11 +117,8 @@ class MPesaService:
             timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
             password = self.generate_password(timestamp)
             
-            # Format phone number (remove leading 0 if present, add 254)
-            if phone_number.startswith('0'):
-                phone_number = '254' + phone_number[1:]
-            elif not phone_number.startswith('254'):
-                phone_number = '254' + phone_number
+            # Format phone number to 254XXXXXXXXX
+            phone_number = self.format_phone_number(phone_number)
             
             # Prepare request
             url = f'{self.base_url}/mpesa/stkpush/v1/processrequest'
@@ -117,7 +144,7 @@ class MPesaService:
             
             current_app.logger.info(f'Initiating STK Push for {phone_number}, amount {amount}')
             
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._post(url, headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
@@ -169,7 +196,18 @@ class MPesaService:
                 'CheckoutRequestID': checkout_request_id
             }
             
-            response = requests.post(url, json=payload, headers=headers)
+            # Status queries are read-only, so they may be retried; "still
+            # processing" is a normal answer, not a provider failure
+            response = self._post(url, headers, json=payload, idempotent=True, expected=_stk_still_processing)
+            if _stk_still_processing(response):
+                return {
+                    'success': False,
+                    'pending': True,
+                    'result_code': None,
+                    'result_desc': response.json().get('errorMessage'),
+                    'merchant_request_id': None,
+                    'checkout_request_id': checkout_request_id
+                }
             response.raise_for_status()
             
             data = response.json()
@@ -218,7 +256,7 @@ class MPesaService:
 
         return True, formatted
 
-    def b2c_payment(self, phone_number, amount, remarks, occasion=''):
+    def b2c_payment(self, phone_number, amount, remarks, occasion='', originator_conversation_id=None):
         """
         Send B2C (Business to Customer) payment to supplier.
         Used to pay suppliers their earnings.
@@ -228,10 +266,13 @@ class MPesaService:
             amount: Amount to send
             remarks: Description/reason for payment
             occasion: Optional occasion description
+            originator_conversation_id: Optional unique ID for this request (e.g. payout number)
 
         Returns:
-            dict: Response from M-Pesa API
+            dict: Response from M-Pesa API. outcome_unknown is set on failures
+            where the request may still have reached M-Pesa, so it must not be resent.
         """
+        response = None
         try:
             access_token = self.get_access_token()
 
@@ -253,7 +294,7 @@ class MPesaService:
             }
 
             payload = {
-                'OriginatorConversationID': f'payout-{datetime.utcnow().strftime("%Y%m%d%H%M%S")}',
+                'OriginatorConversationID': originator_conversation_id or f'payout-{datetime.utcnow().strftime("%Y%m%d%H%M%S%f")}',
                 'InitiatorName': initiator_name,
                 'SecurityCredential': security_credential,
                 'CommandID': 'BusinessPayment',  # For supplier payments
@@ -268,7 +309,7 @@ class MPesaService:
 
             current_app.logger.info(f'Initiating B2C payment to {formatted_phone}, amount {amount}')
 
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._post(url, headers, json=payload)
             response.raise_for_status()
 
             data = response.json()
@@ -287,15 +328,44 @@ class MPesaService:
                 current_app.logger.error(f'Response: {e.response.text}')
             return {
                 'success': False,
+                'outcome_unknown': outcome_unknown(e),
                 'error': f'B2C payment failed: {str(e)}'
             }
         except Exception as e:
             current_app.logger.error(f'B2C error: {str(e)}')
             return {
                 'success': False,
+                # An unreadable answer to a request M-Pesa did receive
+                'outcome_unknown': response is not None,
                 'error': f'Payment failed: {str(e)}'
             }
 
 
+def validate_mpesa_config():
+    """Validate M-Pesa configuration."""
+    required_vars = [
+        'MPESA_CONSUMER_KEY',
+        'MPESA_CONSUMER_SECRET',
+        'MPESA_SHORTCODE',
+        'MPESA_PASSKEY',
+        'MPESA_CALLBACK_URL'
+    ]
+    
+    missing = [var for var in required_vars if not os.getenv(var)]
+    
+    if missing:
+        return {
+            'configured': False,
+            'missing': missing,
+            'message': f"Missing M-Pesa configuration: {', '.join(missing)}"
+        }
+    
+    return {
+        'configured': True,
+        'environment': os.getenv('MPESA_ENVIRONMENT', 'sandbox'),
+        'message': 'M-Pesa configuration is valid'
+    }
+
+
 # Initialize service
 mpesa_service = MPesaService()
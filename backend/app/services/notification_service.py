@@ -28,6 +28,22 @@ class NotificationService:
             print(f"Failed to create notification: {str(e)}")
             return None
 
+    @staticmethod
+    def create_notifications(notifications):
+        """
+        Insert many notifications in one statement. Each item is a dict of
+        user_id, title, message and optionally type (default 'info') and link.
+        """
+        if not notifications:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(Notification), [
+                    {'type': 'info', 'link': None, **notification} for notification in notifications
+                ])
+        except Exception as e:
+            print(f"Failed to create notifications: {str(e)}")
+
     @staticmethod
     def create_audit_log(action, entity_type, entity_id=None, user_id=None,
                         old_values=None, new_values=None, description=None):
@@ -72,5 +88,28 @@ class NotificationService:
         except Exception as e:
             print(f"Failed to notify admins: {str(e)}")
 
+    @staticmethod
+    def notify_auto_confirmed_orders(order_ids):
+        """Tell customers their deliveries were auto-confirmed (one query for all orders)."""
+        from app.models.order import Order
+        from app.models.user import CustomerProfile
+        if not order_ids:
+            return
+        try:
+            rows = db.session.query(Order.id, Order.order_number, CustomerProfile.user_id)\
+                .join(CustomerProfile, Order.customer_id == CustomerProfile.id)\
+                .filter(Order.id.in_(order_ids)).all()
+
+            for order_id, order_number, user_id in rows:
+                NotificationService.create_notification(
+                    user_id=user_id,
+                    title='Delivery Confirmed',
+                    message=f'Your order #{order_number} has been automatically confirmed as delivered.',
+                    notification_type='success',
+                    link=f'/orders/{order_id}'
+                )
+        except Exception as e:
+            print(f"Failed to notify customers of auto-confirmation: {str(e)}")
+
 
 notification_service = NotificationService()
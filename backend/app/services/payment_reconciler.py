@@ -0,0 +1,251 @@
+"""
+Background reconciliation of stuck payments.
+
+An M-Pesa order whose STK callback never arrives, or a card order whose
+customer never came back from the Paystack redirect, stays pending. The
+reconciler picks up pending orders older than a few minutes in batches,
+asks the provider for their status from a bounded thread pool, and applies
+final results under a row lock, so a callback landing at the same moment is
+never applied twice. Orders still unresolved after the stale cut-off are
+failed. Supplier payouts left in processing without a B2C reference (the
+request may or may not have reached M-Pesa) cannot be verified here and
+are reported for manual review.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from app.models import db
+from app.models.order import Order, OrderStatus, PaymentMethod, PaymentStatus
+from app.models.returns import SupplierPayout, PayoutBatch
+from app.services.mpesa_service import mpesa_service
+from app.services.paystack_service import paystack_service
+from app.services.email_service import send_payment_confirmation_email
+
+
+# STK query result code for a request the customer cancelled
+MPESA_CANCELLED = '1032'
+
+# Paystack statuses that will not change any more
+PAYSTACK_FAILED_STATUSES = {'failed', 'reversed'}
+
+
+class PaymentReconciler:
+    """Resolves pending payments by querying the provider instead of waiting for callbacks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.last_run = None
+
+    @staticmethod
+    def _settings():
+        """Read reconciliation tuning from app config."""
+        config = current_app.config
+        return {
+            'after_minutes': int(config.get('PAYMENT_RECONCILE_AFTER_MINUTES', 5)),
+            'recheck_minutes': int(config.get('PAYMENT_RECONCILE_RECHECK_MINUTES', 10)),
+            'stale_hours': int(config.get('PAYMENT_RECONCILE_STALE_HOURS', 24)),
+            'batch_size': int(config.get('PAYMENT_RECONCILE_BATCH_SIZE', 100)),
+            'max_workers': int(config.get('PAYMENT_RECONCILE_MAX_WORKERS', 4)),
+        }
+
+    @staticmethod
+    def _pending_orders():
+        return Order.query.filter(
+            Order.payment_status == PaymentStatus.PENDING,
+            Order.payment_method.in_([PaymentMethod.MPESA, PaymentMethod.CARD]),
+            Order.payment_reference.isnot(None)
+        )
+
+    @staticmethod
+    def _stuck_payouts(cutoff):
+        """Payouts claimed for B2C that never got a reference, well after their batch ended."""
+        return SupplierPayout.query.outerjoin(PayoutBatch, SupplierPayout.batch_id == PayoutBatch.id).filter(
+            SupplierPayout.status == 'processing',
+            SupplierPayout.reference.is_(None),
+            or_(
+                PayoutBatch.finished_at <= cutoff,
+                (SupplierPayout.batch_id.is_(None)) & (SupplierPayout.created_at <= cutoff)
+            )
+        )
+
+    @staticmethod
+    def _query_provider(app, method, reference):
+        """Ask the provider for a payment's status (runs in a pool thread; no database access)."""
+        with app.app_context():
+            if method == PaymentMethod.MPESA:
+                result = mpesa_service.query_stk_push_status(reference)
+                if result.get('pending'):
+                    # Daraja's 500.001.1001: the customer has not finished the push yet
+                    return 'pending', None
+                code = result.get('result_code')
+                if code is None or code == '':
+                    return 'pending', None
+                code = str(code)
+                if code == '0':
+                    return 'completed', None
+                if code == MPESA_CANCELLED:
+                    return 'failed', 'Payment cancelled by user'
+                return 'failed', f"M-Pesa payment failed: {result.get('result_desc')}"
+
+            result = paystack_service.verify_transaction(reference)
+            if not result.get('success'):
+                raise Exception(result.get('error', 'Paystack verification failed'))
+            if result['status'] == 'success':
+                return 'completed', None
+            if result['status'] in PAYSTACK_FAILED_STATUSES:
+                return 'failed', f"Paystack payment status: {result['status']}"
+            return 'pending', None
+
+    @staticmethod
+    def _apply(order_id, outcome, note):
+        """
+        Apply a provider result to a still-pending order under a row lock,
+        stamping when it was checked. Returns True when the payment status changed.
+        """
+        order = Order.query.filter_by(id=order_id).with_for_update().first()
+        if not order or order.payment_status != PaymentStatus.PENDING:
+            return False
+
+        order.payment_checked_at = datetime.utcnow()
+        if outcome == 'completed':
+            order.payment_status = PaymentStatus.COMPLETED
+            order.status = OrderStatus.PAID
+            order.paid_at = datetime.utcnow()
+        elif outcome == 'failed':
+            order.payment_status = PaymentStatus.FAILED
+            order.admin_notes = note
+        else:
+            return False
+        return True
+
+    def check_order(self, order):
+        """
+        Query the provider for one pending order and apply the result.
+        Returns 'completed', 'failed' or 'pending'; provider errors leave it pending.
+        """
+        app = current_app._get_current_object()
+        try:
+            outcome, note = self._query_provider(app, order.payment_method, order.payment_reference)
+        except Exception as e:
+            current_app.logger.error(f'Reconcile: query failed for order {order.order_number} - {str(e)}')
+            outcome, note = 'pending', None
+
+        changed = self._apply(order.id, outcome, note)
+        db.session.commit()
+
+        if changed and outcome == 'completed':
+            self._send_confirmation(order.id)
+        return outcome if changed else order.payment_status.value
+
+    @staticmethod
+    def _send_confirmation(order_id):
+        try:
+            order = db.session.get(Order, order_id)
+            send_payment_confirmation_email(order, order.customer.user.email)
+        except Exception as e:
+            current_app.logger.error(f'Failed to send payment email: {str(e)}')
+
+    def run(self):
+        """
+        Reconcile one batch of pending payments.
+        Returns counts of completed, failed (stale included), still pending,
+        stale and errored payments, plus payouts stuck without a reference.
+        """
+        settings = self._settings()
+        now = datetime.utcnow()
+        stale_cutoff = now - timedelta(hours=settings['stale_hours'])
+        counts = {'checked': 0, 'completed': 0, 'failed': 0, 'pending': 0, 'stale': 0, 'errors': 0}
+
+        orders = self._pending_orders().filter(
+            Order.created_at <= now - timedelta(minutes=settings['after_minutes']),
+            or_(
+                Order.payment_checked_at.is_(None),
+                Order.payment_checked_at <= now - timedelta(minutes=settings['recheck_minutes'])
+            )
+        ).order_by(Order.created_at).limit(settings['batch_size']).all()
+
+        # Plain tuples: pool threads never touch ORM objects
+        jobs = [(order.id, order.order_number, order.payment_method, order.payment_reference, order.created_at)
+                for order in orders]
+        db.session.commit()
+
+        if jobs:
+            app = current_app._get_current_object()
+            paid = []
+
+            with ThreadPoolExecutor(max_workers=min(settings['max_workers'], len(jobs))) as pool:
+                futures = {
+                    pool.submit(self._query_provider, app, method, reference): (order_id, order_number, created_at)
+                    for order_id, order_number, method, reference, created_at in jobs
+                }
+                for future in as_completed(futures):
+                    order_id, order_number, created_at = futures[future]
+                    counts['checked'] += 1
+                    try:
+                        outcome, note = future.result()
+                    except Exception as e:
+                        current_app.logger.warning(f'Reconcile: query failed for order {order_number} - {str(e)}')
+                        counts['errors'] += 1
+                        outcome, note = 'pending', None
+
+                    if outcome == 'pending' and created_at <= stale_cutoff:
+                        outcome, note = 'failed', f"No payment confirmation after {settings['stale_hours']}h"
+                        counts['stale'] += 1
+
+                    try:
+                        if self._apply(order_id, outcome, note):
+                            counts[outcome] += 1
+                            if outcome == 'completed':
+                                paid.append(order_id)
+                        else:
+                            counts['pending'] += 1
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        counts['errors'] += 1
+                        current_app.logger.error(f'Reconcile: failed to update order {order_number} - {str(e)}')
+
+            for order_id in paid:
+                self._send_confirmation(order_id)
+
+        stuck = self._stuck_payouts(now - timedelta(minutes=settings['after_minutes'])).all()
+        counts['stuck_payouts'] = len(stuck)
+        if stuck:
+            current_app.logger.warning(
+                f"Reconcile: {len(stuck)} payouts processing without a B2C reference - check M-Pesa before resending: "
+                f"{', '.join(p.payout_number or p.id for p in stuck)}"
+            )
+
+        with self._lock:
+            self.last_run = {'finished_at': datetime.utcnow().isoformat(), **counts}
+        current_app.logger.info(f'Reconcile: {counts}')
+        return counts
+
+    def summary(self):
+        """Current backlog and the last run's counts (this worker)."""
+        settings = self._settings()
+        now = datetime.utcnow()
+        pending = self._pending_orders()
+        stuck = self._stuck_payouts(now - timedelta(minutes=settings['after_minutes'])).all()
+        with self._lock:
+            last_run = dict(self.last_run) if self.last_run else None
+        return {
+            'pending_payments': pending.count(),
+            'due_for_check': pending.filter(
+                Order.created_at <= now - timedelta(minutes=settings['after_minutes'])
+            ).count(),
+            'stale_payments': pending.filter(
+                Order.created_at <= now - timedelta(hours=settings['stale_hours'])
+            ).count(),
+            'stuck_payouts': [
+                {'id': p.id, 'payout_number': p.payout_number, 'batch_id': p.batch_id, 'notes': p.notes}
+                for p in stuck
+            ],
+            'last_run': last_run,
+        }
+
+
+payment_reconciler = PaymentReconciler()
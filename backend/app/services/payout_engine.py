@@ -0,0 +1,235 @@
+"""
+Batch M-Pesa B2C payout engine.
+
+Supplier payouts are claimed into a PayoutBatch (status -> processing) in one
+statement, so two batches can never pick up the same payout. The batch then
+runs in the background: suppliers are loaded in one query, B2C requests go
+out through a bounded thread pool behind a rate limiter, and every payout's
+result is committed as soon as it comes back. Only a definitive rejection
+returns a payout to pending. One left in processing without a reference,
+after a crash or a B2C call that timed out or was reset once sent, may or
+may not have reached M-Pesa and is left for reconciliation rather than resent.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from flask import current_app
+from app.models import db
+from app.models.user import SupplierProfile
+from app.models.returns import SupplierPayout, PayoutBatch, PayoutBatchStatus
+from app.services.mpesa_service import mpesa_service
+from app.services.ledger_service import ledger_service
+
+
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` acquisitions per second, bursting to `rate`."""
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PayoutEngine:
+    """Creates, runs and reports on supplier B2C payout batches."""
+
+    def __init__(self):
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _settings():
+        """Read engine tuning from app config."""
+        config = current_app.config
+        return {
+            'max_workers': int(config.get('PAYOUT_MAX_WORKERS', 8)),
+            'rate': float(config.get('PAYOUT_B2C_RATE_PER_SECOND', 5)),
+        }
+
+    def _limiter(self, provider, rate):
+        """One limiter per provider, shared by every batch in this process."""
+        with self._lock:
+            limiter = self._limiters.get(provider)
+            if limiter is None or limiter.rate != rate:
+                limiter = self._limiters[provider] = RateLimiter(rate)
+            return limiter
+
+    def create_batch(self, payout_ids=None, created_by=None, source='admin'):
+        """
+        Claim pending payouts (all of them when payout_ids is None) into a new batch.
+        Commits and returns the batch; total_count is 0 when nothing was claimable.
+        """
+        batch = PayoutBatch(source=source, created_by=created_by)
+        db.session.add(batch)
+        db.session.flush()
+
+        claim = SupplierPayout.query.filter(SupplierPayout.status == 'pending')
+        if payout_ids is not None:
+            claim = claim.filter(SupplierPayout.id.in_(payout_ids))
+        batch.total_count = claim.update(
+            {'status': 'processing', 'batch_id': batch.id},
+            synchronize_session=False
+        )
+
+        if not batch.total_count:
+            batch.status = PayoutBatchStatus.COMPLETED
+            batch.finished_at = datetime.utcnow()
+
+        db.session.commit()
+        return batch
+
+    def start_batch(self, batch_id):
+        """Run the batch in the background (scheduler thread pool, or a thread if it isn't running)."""
+        from app.services.scheduler_service import scheduler
+        app = current_app._get_current_object()
+
+        def run_payout_batch():
+            with app.app_context():
+                self.run_batch(batch_id)
+
+        if scheduler.running:
+            scheduler.add_job(func=run_payout_batch, id=f'payout_batch_{batch_id}', name='Run supplier payout batch')
+        else:
+            threading.Thread(target=run_payout_batch, daemon=True).start()
+
+    @staticmethod
+    def _submit(app, limiter, phone, amount, payout_number, supplier_name):
+        """Send one B2C request (runs in a pool thread; no database access)."""
+        with app.app_context():
+            limiter.acquire()
+            return mpesa_service.b2c_payment(
+                phone_number=phone,
+                amount=amount,
+                remarks=f'Supplier Payout {payout_number} - {supplier_name}',
+                occasion='Supplier Payout',
+                originator_conversation_id=f'payout-{payout_number}'
+            )
+
+    def _record(self, batch, payout, response, settle_on_accept):
+        """Persist one payout's result and the batch counters."""
+        if response.get('success'):
+            conversation_id = response.get('conversation_id')
+            payout.reference = conversation_id  # Matched by the B2C result callback
+            payout.payment_reference = conversation_id
+            payout.notes = f'B2C submitted in batch {batch.id}. ConversationID: {conversation_id}'
+            if settle_on_accept:
+                payout.status = 'completed'
+                payout.paid_at = datetime.utcnow()
+                ledger_service.payout('supplier', payout.supplier_id, payout.net_amount or payout.amount,
+                                      reference=payout.payout_number, memo=f'B2C batch {batch.id}')
+            batch.submitted_count += 1
+        elif response.get('outcome_unknown'):
+            # The request may have reached M-Pesa: stay processing, for reconciliation rather than a resend
+            payout.notes = f"B2C outcome unknown in batch {batch.id}: {response.get('error', 'no response')}"
+            batch.failed_count += 1
+        else:
+            payout.status = 'pending'
+            payout.notes = f"Auto-payment failed: {response.get('error', 'Unknown error')}"
+            batch.failed_count += 1
+        db.session.commit()
+
+    def run_batch(self, batch_id):
+        """
+        Submit every claimed payout in a queued batch. A batch that was already
+        started is never re-run, since its unanswered payouts may have reached M-Pesa.
+        """
+        batch = db.session.get(PayoutBatch, batch_id)
+        if not batch or batch.status != PayoutBatchStatus.QUEUED:
+            return batch
+
+        settings = self._settings()
+        settle_on_accept = batch.source == 'scheduler'
+        app = current_app._get_current_object()
+
+        try:
+            batch.status = PayoutBatchStatus.RUNNING
+            batch.started_at = batch.started_at or datetime.utcnow()
+            db.session.commit()
+
+            # Claimed payouts that have not been submitted yet
+            payouts = SupplierPayout.query.filter(
+                SupplierPayout.batch_id == batch.id,
+                SupplierPayout.status == 'processing',
+                SupplierPayout.reference.is_(None)
+            ).all()
+
+            suppliers = {
+                s.id: s for s in SupplierProfile.query.filter(
+                    SupplierProfile.id.in_({p.supplier_id for p in payouts})
+                ).all()
+            } if payouts else {}
+
+            jobs = []
+            for payout in payouts:
+                supplier = suppliers.get(payout.supplier_id)
+                phone = supplier.mpesa_number if supplier else None
+                is_valid, formatted = mpesa_service.validate_phone_number(phone) if phone else (False, None)
+                if not is_valid:
+                    self._record(batch, payout, {
+                        'success': False,
+                        'error': f'Invalid M-Pesa number: {formatted}' if phone else 'Supplier has no M-Pesa number'
+                    }, settle_on_accept)
+                    continue
+                if not payout.payout_number:
+                    payout.generate_payout_number()
+                    db.session.commit()
+                jobs.append((payout, formatted, float(payout.net_amount or payout.amount), supplier.business_name))
+
+            if jobs:
+                # Warm the shared token once instead of from every pool thread
+                try:
+                    mpesa_service.get_access_token()
+                except Exception as e:
+                    # Nothing has been sent yet, so every payout can safely go back to pending
+                    for payout, *_ in jobs:
+                        self._record(batch, payout, {'success': False, 'error': str(e)}, settle_on_accept)
+                    jobs = []
+
+            if jobs:
+                limiter = self._limiter('mpesa_b2c', settings['rate'])
+
+                with ThreadPoolExecutor(max_workers=min(settings['max_workers'], len(jobs))) as pool:
+                    futures = {
+                        pool.submit(self._submit, app, limiter, phone, amount, payout.payout_number, name): payout
+                        for payout, phone, amount, name in jobs
+                    }
+                    for future in as_completed(futures):
+                        payout = futures[future]
+                        try:
+                            response = future.result()
+                        except Exception as e:
+                            response = {'success': False, 'error': str(e)}
+                        self._record(batch, payout, response, settle_on_accept)
+
+            batch.status = PayoutBatchStatus.COMPLETED
+        except Exception as e:
+            db.session.rollback()
+            batch = db.session.get(PayoutBatch, batch_id)
+            batch.status = PayoutBatchStatus.FAILED
+            batch.error = str(e)
+            current_app.logger.error(f'Payout batch {batch_id} failed: {str(e)}')
+
+        batch.finished_at = datetime.utcnow()
+        db.session.commit()
+        current_app.logger.info(
+            f'Payout batch {batch_id}: {batch.submitted_count} submitted, {batch.failed_count} failed of {batch.total_count}'
+        )
+        return batch
+
+
+payout_engine = PayoutEngine()
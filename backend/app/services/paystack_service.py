@@ -2,9 +2,12 @@
 Paystack payment service for card payments.
 """
 
+import hashlib
+import hmac
 import os
 import requests
 from flask import current_app
+from app.services.http_client import http_client
 
 
 class PaystackService:
@@ -13,12 +16,22 @@ class PaystackService:
     def __init__(self):
         self.secret_key = os.getenv('PAYSTACK_SECRET_KEY')
         self.public_key = os.getenv('PAYSTACK_PUBLIC_KEY')
-        self.base_url = 'https://api.paystack.co'
+        self.base_url = os.getenv('PAYSTACK_BASE_URL', 'https://api.paystack.co').rstrip('/')
         
     def is_configured(self):
         """Check if Paystack is properly configured."""
         return bool(self.secret_key and self.public_key)
     
+    def verify_webhook_signature(self, raw_body, signature):
+        """
+        Check the x-paystack-signature header: HMAC-SHA512 of the raw request
+        body keyed with the secret key, compared in constant time.
+        """
+        if not self.secret_key or not signature:
+            return False
+        expected = hmac.new(self.secret_key.encode(), raw_body, hashlib.sha512).hexdigest()
+        return hmac.compare_digest(expected, signature.strip().lower())
+    
     def _get_headers(self):
         """Get authorization headers for Paystack API."""
         return {
@@ -62,11 +75,11 @@ class PaystackService:
             if callback_url:
                 payload['callback_url'] = callback_url
             
-            response = requests.post(
+            response = http_client.post(
+                'paystack',
                 f'{self.base_url}/transaction/initialize',
                 json=payload,
-                headers=self._get_headers(),
-                timeout=30
+                headers=self._get_headers()
             )
             
             data = response.json()
@@ -108,10 +121,10 @@ class PaystackService:
             dict: Verification result
         """
         try:
-            response = requests.get(
+            response = http_client.get(
+                'paystack',
                 f'{self.base_url}/transaction/verify/{reference}',
-                headers=self._get_headers(),
-                timeout=30
+                headers=self._get_headers()
             )
             
             data = response.json()
@@ -163,11 +176,11 @@ class PaystackService:
             if merchant_note:
                 payload['merchant_note'] = merchant_note
             
-            response = requests.post(
+            response = http_client.post(
+                'paystack',
                 f'{self.base_url}/refund',
                 json=payload,
-                headers=self._get_headers(),
-                timeout=30
+                headers=self._get_headers()
             )
             
             data = response.json()
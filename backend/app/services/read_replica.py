@@ -0,0 +1,121 @@
+"""
+Read-replica routing.
+
+Analytics, reports and exports can run on a read replica with its own
+connection pool (REPLICA_DATABASE_URL, bound as 'replica'), so a heavy
+report cannot starve checkout of primary connections. Code opts in with
+the reads_from_replica decorator or the replica_reads() context manager.
+While either is active, db.session sends its plain SELECTs to the replica
+(see RoutingSession); writes, locking reads and any read after the session
+has written in the block still go to the primary.
+
+Routing falls back to the primary when no replica is configured, when the
+replica cannot be reached, or when its replay lag exceeds
+REPLICA_MAX_LAG_SECONDS. Lag is measured at most every
+REPLICA_LAG_CHECK_SECONDS per process, by one caller at a time; others use
+the last reading meanwhile.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app
+from sqlalchemy import text
+from app.models import db, REPLICA_BIND, REPLICA_WROTE, USE_REPLICA
+
+
+# Seconds since the last replayed transaction, or 0 when fully caught up.
+# NULL (reported as 0) when the server is not replaying, i.e. not a replica.
+LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReplicaRouter:
+    """Decides per process whether the replica is fit for reads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = 0
+        self._lag = None
+        self._error = None
+
+    @staticmethod
+    def _settings():
+        config = current_app.config
+        return {
+            'max_lag': float(config.get('REPLICA_MAX_LAG_SECONDS', 10)),
+            'check_every': float(config.get('REPLICA_LAG_CHECK_SECONDS', 15))
+        }
+
+    @staticmethod
+    def engine():
+        """The replica engine, or None when no replica is configured."""
+        return db.engines.get(REPLICA_BIND)
+
+    def _measure(self, engine):
+        try:
+            with engine.connect() as conn:
+                lag = conn.execute(LAG_SQL).scalar() if engine.dialect.name == 'postgresql' else 0
+            self._lag, self._error = float(lag or 0), None
+        except Exception as e:
+            self._lag, self._error = None, str(e)
+            current_app.logger.warning(f'Read replica unavailable, using the primary: {str(e)}')
+
+    def available(self):
+        """True when reads may go to the replica right now."""
+        engine = self.engine()
+        if engine is None:
+            return False
+
+        settings = self._settings()
+        # Only one caller probes; the rest go on with the last reading
+        if time.time() - self._checked_at >= settings['check_every'] and self._lock.acquire(blocking=False):
+            try:
+                if time.time() - self._checked_at >= settings['check_every']:
+                    self._measure(engine)
+                    self._checked_at = time.time()
+            finally:
+                self._lock.release()
+
+        lag = self._lag
+        return lag is not None and lag <= settings['max_lag']
+
+    def status(self):
+        """Replica configuration and the last lag reading (this process)."""
+        configured = self.engine() is not None
+        return {
+            'configured': configured,
+            'in_use': self.available() if configured else False,
+            'lag_seconds': self._lag,
+            'max_lag_seconds': self._settings()['max_lag'],
+            'error': self._error
+        }
+
+    @contextmanager
+    def replica_reads(self):
+        """Send db.session reads to the replica (when it is usable) inside the block."""
+        info = db.session.info
+        previous = info.get(USE_REPLICA, False)
+        info[USE_REPLICA] = previous or self.available()
+        try:
+            yield info[USE_REPLICA]
+        finally:
+            info[USE_REPLICA] = previous
+            if not previous:
+                info.pop(REPLICA_WROTE, None)
+
+
+replica_router = ReplicaRouter()
+replica_reads = replica_router.replica_reads
+
+
+def reads_from_replica(fn):
+    """Route a view's or job's reads to the read replica (see ReplicaRouter)."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return fn(*args, **kwargs)
+    return wrapper
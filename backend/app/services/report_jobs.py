@@ -0,0 +1,243 @@
+"""
+Background report jobs.
+
+Reports that can outlast a web request (financial reports over long date
+ranges) are submitted as jobs instead: the spec, a report type plus its
+normalised parameters, is stored in report_jobs and the worker runs it on
+the scheduler's thread pool, reading from the replica when one is
+configured. The JSON result is kept until REPORT_JOB_RESULT_TTL_SECONDS
+and can be downloaded as JSON or CSV. Submitting a spec that is already
+queued, running or has an unexpired result returns that job instead of
+computing the report again.
+
+Workers claim one job at a time (FOR UPDATE SKIP LOCKED, so every process
+can take part). A job left running for longer than
+REPORT_JOB_TIMEOUT_SECONDS, because its worker died, is queued again until
+it has been tried REPORT_JOB_MAX_ATTEMPTS times.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import threading
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_
+from app.models import db
+from app.models.report_job import ReportJob, ReportJobStatus
+from app.services.financial_report import financial_report_service
+from app.services.read_replica import replica_reads
+
+
+def _iso_date(value, field):
+    """A YYYY-MM-DD string (None when empty); raises ValueError otherwise."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid {field} '{value}'. Use YYYY-MM-DD")
+
+
+def _financial_params(params):
+    start_date = _iso_date(params.get('start_date'), 'start_date')
+    end_date = _iso_date(params.get('end_date'), 'end_date')
+    if start_date and end_date and start_date > end_date:
+        raise ValueError('start_date must not be after end_date')
+    return {'start_date': start_date, 'end_date': end_date}
+
+
+def _flatten(value, prefix=''):
+    """(field path, value) pairs for every scalar in a nested result."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f'{prefix}.{key}' if prefix else str(key))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from _flatten(item, f'{prefix}[{index}]')
+    else:
+        yield prefix, value
+
+
+def render_csv(result):
+    """A stored result as two-column CSV (field path, value)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['field', 'value'])
+    writer.writerows(_flatten(result))
+    return buffer.getvalue()
+
+
+class ReportJobService:
+    """Queues long-running reports and runs them in the background."""
+
+    def __init__(self):
+        self._reports = {}
+
+    @staticmethod
+    def _settings():
+        """Read worker tuning from app config."""
+        config = current_app.config
+        return {
+            'ttl': int(config.get('REPORT_JOB_RESULT_TTL_SECONDS', 86400)),
+            'timeout': int(config.get('REPORT_JOB_TIMEOUT_SECONDS', 1800)),
+            'max_attempts': int(config.get('REPORT_JOB_MAX_ATTEMPTS', 2)),
+        }
+
+    def register_report(self, report_type, build, normalize):
+        """
+        Register a report type. normalize(params) returns the canonical
+        parameters (raising ValueError for bad input); build(params) returns
+        the JSON-serialisable result.
+        """
+        self._reports[report_type] = {'build': build, 'normalize': normalize}
+
+    @property
+    def report_types(self):
+        return sorted(self._reports)
+
+    @staticmethod
+    def spec_hash(report_type, params):
+        return hashlib.sha256(json.dumps([report_type, params], sort_keys=True).encode()).hexdigest()
+
+    def submit(self, report_type, params=None, requested_by=None):
+        """Queue a report, or reuse a matching job. Returns (job, reused)."""
+        report = self._reports.get(report_type)
+        if not report:
+            raise ValueError(f"Unknown report '{report_type}'. Use one of: {', '.join(self.report_types)}")
+        params = report['normalize'](params or {})
+        spec_hash = self.spec_hash(report_type, params)
+
+        existing = ReportJob.query.filter(
+            ReportJob.spec_hash == spec_hash,
+            or_(
+                ReportJob.status.in_([ReportJobStatus.PENDING, ReportJobStatus.RUNNING]),
+                and_(ReportJob.status == ReportJobStatus.COMPLETED, ReportJob.expires_at > datetime.utcnow())
+            )
+        ).order_by(ReportJob.created_at.desc()).first()
+        if existing:
+            return existing, True
+
+        job = ReportJob(report_type=report_type, params=params, spec_hash=spec_hash, requested_by=requested_by)
+        db.session.add(job)
+        db.session.commit()
+        self.wake()
+        return job, False
+
+    def wake(self):
+        """Run queued reports now instead of waiting for the next poll."""
+        from app.services.scheduler_service import scheduler
+        app = current_app._get_current_object()
+
+        def run_report_jobs():
+            with app.app_context():
+                self.process_pending()
+
+        if scheduler.running:
+            # One queued run is enough; it works through everything submitted so far
+            scheduler.add_job(func=run_report_jobs, id='report_jobs_wake',
+                              name='Run new report jobs', replace_existing=True)
+        else:
+            threading.Thread(target=run_report_jobs, daemon=True).start()
+
+    def _requeue_stalled(self, settings):
+        """Queue again (or fail) jobs whose worker stopped before finishing."""
+        stalled = ReportJob.query.filter(
+            ReportJob.status == ReportJobStatus.RUNNING,
+            ReportJob.started_at <= datetime.utcnow() - timedelta(seconds=settings['timeout'])
+        ).with_for_update(skip_locked=True).all()
+
+        for job in stalled:
+            if job.attempts >= settings['max_attempts']:
+                self._fail(job, 'Report did not finish in time', settings)
+            else:
+                job.status = ReportJobStatus.PENDING
+                current_app.logger.warning(f'Report job {job.id} stalled, queued again')
+        db.session.commit()
+
+    def _claim(self):
+        """
+        Mark the oldest queued job as running, unless another worker holds it.
+        Returns its (id, report_type, params), read before the commit so that
+        running it does not reload the job and leave a primary transaction
+        open for the whole build; None when nothing is queued.
+        """
+        job = ReportJob.query.filter(ReportJob.status == ReportJobStatus.PENDING)\
+            .order_by(ReportJob.created_at).limit(1).with_for_update(skip_locked=True).first()
+        claimed = None
+        if job:
+            job.status = ReportJobStatus.RUNNING
+            job.started_at = datetime.utcnow()
+            job.attempts += 1
+            claimed = (job.id, job.report_type, job.params)
+        db.session.commit()
+        return claimed
+
+    @staticmethod
+    def _fail(job, error, settings):
+        job.status = ReportJobStatus.FAILED
+        job.error = error
+        job.completed_at = datetime.utcnow()
+        job.expires_at = job.completed_at + timedelta(seconds=settings['ttl'])
+
+    def _run(self, job_id, report_type, params, settings):
+        """Build one claimed job's report and store the result."""
+        started = datetime.utcnow()
+        try:
+            report = self._reports.get(report_type)
+            if not report:
+                raise ValueError(f'No report registered for {report_type}')
+            with replica_reads():
+                result = report['build'](params)
+
+            job = db.session.get(ReportJob, job_id)
+            job.result = result
+            job.status = ReportJobStatus.COMPLETED
+            job.error = None
+            job.completed_at = datetime.utcnow()
+            job.expires_at = job.completed_at + timedelta(seconds=settings['ttl'])
+            db.session.commit()
+            current_app.logger.info(
+                f'Report job {job_id} ({report_type}) completed in {(job.completed_at - started).total_seconds():.1f}s'
+            )
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(ReportJob, job_id)
+            if job.attempts >= settings['max_attempts']:
+                self._fail(job, str(e), settings)
+                current_app.logger.error(f'Report job {job_id} failed after {job.attempts} attempts - {str(e)}')
+            else:
+                job.status = ReportJobStatus.PENDING
+                job.error = str(e)
+                current_app.logger.warning(f'Report job {job_id} failed, will retry - {str(e)}')
+            db.session.commit()
+
+    def process_pending(self):
+        """Run every queued job. Returns the number of jobs run."""
+        settings = self._settings()
+        self._requeue_stalled(settings)
+
+        ran = 0
+        while True:
+            claimed = self._claim()
+            if not claimed:
+                break
+            self._run(*claimed, settings)
+            ran += 1
+        return ran
+
+    def purge_expired(self):
+        """Delete jobs whose result has expired. Returns the number deleted."""
+        deleted = ReportJob.query.filter(ReportJob.expires_at <= datetime.utcnow()).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+
+report_job_service = ReportJobService()
+
+report_job_service.register_report(
+    'financial',
+    lambda params: financial_report_service.build(params['start_date'], params['end_date']),
+    _financial_params
+)
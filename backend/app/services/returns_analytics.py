@@ -0,0 +1,136 @@
+"""
+Returns analytics.
+
+The admin returns summary and the supplier return stats each come from one
+grouped query (per status, and for suppliers per "awaiting their response"),
+with every count derived from those rows instead of a COUNT per status.
+Supplier returns are those on orders holding one of the supplier's items.
+
+Both are cached in app.cache: the admin summary under one key, supplier
+stats per supplier. A committed write to a return drops the admin summary
+and the stats of every supplier with items on that return's order.
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from app.models import db
+from app.models.order import OrderItem
+from app.models.returns import Return
+
+
+SUMMARY_KEY = 'returns_analytics'
+SUPPLIER_KEY = 'returns_stats:{}'
+
+ADMIN_PENDING = ('pending', 'requested', 'pending_review', 'supplier_review')
+SUPPLIER_PENDING = ('requested', 'pending', 'supplier_review')
+COMPLETED = ('completed', 'refund_completed')
+DEDUCTED = ('approved', 'completed', 'refund_completed')
+
+
+def _count(rows, statuses):
+    return sum(row['count'] for row in rows if row['status'] in statuses)
+
+
+class ReturnsAnalyticsService:
+    """Grouped, cached return breakdowns for the admin and supplier dashboards."""
+
+    @staticmethod
+    def _timeout():
+        return int(current_app.config.get('RETURNS_ANALYTICS_CACHE_SECONDS', 60))
+
+    @staticmethod
+    def compute_summary():
+        """Platform-wide return counts per status, in one query."""
+        rows = [{'status': status, 'count': count} for status, count in db.session.query(
+            Return.status, func.count(Return.id)
+        ).group_by(Return.status).all()]
+
+        return {
+            'total_returns': sum(row['count'] for row in rows),
+            'pending': _count(rows, ADMIN_PENDING),
+            'approved': _count(rows, ('approved',)),
+            'rejected': _count(rows, ('rejected',)),
+            'completed': _count(rows, COMPLETED),
+            'disputed': _count(rows, ('disputed',)),
+            'by_status': [{'status': str(row['status']), 'count': row['count']} for row in rows]
+        }
+
+    @staticmethod
+    def compute_supplier_stats(supplier_id):
+        """A supplier's return counts and deductions, in one query."""
+        supplier_order_ids = select(OrderItem.order_id).where(OrderItem.supplier_id == supplier_id)
+        awaiting = Return.supplier_action.is_(None)
+        rows = [{'status': status, 'awaiting': bool(awaiting_response), 'count': count, 'deductions': deductions}
+                for status, awaiting_response, count, deductions in db.session.query(
+                    Return.status,
+                    awaiting,
+                    func.count(Return.id),
+                    func.coalesce(func.sum(Return.supplier_deduction), 0)
+                ).filter(Return.order_id.in_(supplier_order_ids)).group_by(Return.status, awaiting).all()]
+
+        return {
+            'total': sum(row['count'] for row in rows),
+            'pending': _count(rows, SUPPLIER_PENDING),
+            'needs_response': _count([row for row in rows if row['awaiting']], SUPPLIER_PENDING),
+            'disputed': _count(rows, ('disputed',)),
+            'approved': _count(rows, ('approved',)),
+            'completed': _count(rows, COMPLETED),
+            'total_deductions': float(sum(row['deductions'] for row in rows if row['status'] in DEDUCTED))
+        }
+
+    def summary(self):
+        data = current_app.cache.get(SUMMARY_KEY)
+        if data is None:
+            data = self.compute_summary()
+            current_app.cache.set(SUMMARY_KEY, data, timeout=self._timeout())
+        return data
+
+    def supplier_stats(self, supplier_id):
+        key = SUPPLIER_KEY.format(supplier_id)
+        data = current_app.cache.get(key)
+        if data is None:
+            data = self.compute_supplier_stats(supplier_id)
+            current_app.cache.set(key, data, timeout=self._timeout())
+        return data
+
+    def invalidate(self, supplier_ids=()):
+        """Drop the admin summary and these suppliers' stats."""
+        current_app.cache.delete_many(SUMMARY_KEY, *[SUPPLIER_KEY.format(s) for s in supplier_ids])
+
+
+returns_analytics_service = ReturnsAnalyticsService()
+
+
+def _before_flush(session, flush_context, instances):
+    order_ids = {obj.order_id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+                 if isinstance(obj, Return) and obj.order_id}
+    if order_ids:
+        session.info.setdefault('returns_changed_orders', set()).update(order_ids)
+
+
+def _after_flush(session, flush_context):
+    order_ids = session.info.pop('returns_changed_orders', None)
+    if order_ids:
+        supplier_ids = session.connection().execute(
+            select(OrderItem.supplier_id).where(OrderItem.order_id.in_(order_ids)).distinct()
+        ).scalars()
+        session.info.setdefault('returns_changed_suppliers', set()).update(supplier_ids)
+
+
+def _after_commit(session):
+    supplier_ids = session.info.pop('returns_changed_suppliers', None)
+    if supplier_ids is not None and has_app_context():
+        returns_analytics_service.invalidate(supplier_ids)
+
+
+def _after_rollback(session):
+    session.info.pop('returns_changed_orders', None)
+    session.info.pop('returns_changed_suppliers', None)
+
+
+def register_listeners():
+    """Drop cached return analytics on committed return changes (safe to call repeatedly)."""
+    for name, listener in (('before_flush', _before_flush), ('after_flush', _after_flush),
+                           ('after_commit', _after_commit), ('after_rollback', _after_rollback)):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
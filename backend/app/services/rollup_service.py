@@ -0,0 +1,344 @@
+"""
+Daily sales rollups for the analytics dashboards.
+
+Completed orders are summed per day into two tables: order totals per hour,
+zone and payment method, and item totals per hour, product (with its
+supplier and category), zone and payment method. The dashboards read these
+instead of aggregating the full order history on every load.
+
+Rollups are maintained a day at a time. A commit that changed a completed
+order (or its items) marks the order's day dirty in rollup_days, after the
+commit and in a short transaction of its own, skipping days that are
+already dirty, so payment transactions never wait on the same rollup_days
+row. A scheduler job rebuilds dirty days from the orders table with one
+grouped INSERT ... SELECT per table. Rebuilds are serialised by an advisory
+lock, so concurrent refreshes never double count. A rebuild marks its days
+clean (committed) before reading the orders, so a change that lands during
+the rebuild simply marks the day dirty again without waiting for it.
+backfill() rebuilds any range of history in chunks.
+"""
+
+from datetime import date, datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import Integer, case, cast, distinct, event, extract, func, inspect, insert, select, text
+from app.models import db
+from app.models.order import Order, OrderItem, PaymentStatus
+from app.models.product import Product
+from app.models.analytics import DailySalesRollup, DailyOrderRollup, RollupDay
+
+
+# Order columns the rollups depend on
+TRACKED_FIELDS = (
+    'payment_status', 'created_at', 'total', 'subtotal', 'delivery_fee', 'delivery_zone', 'payment_method',
+)
+
+MARK_DIRTY_SQL = text("""
+    INSERT INTO rollup_days (day, dirty, updated_at) VALUES (:day, :dirty, :now)
+    ON CONFLICT (day) DO UPDATE SET dirty = :dirty, updated_at = :now
+""")
+
+# pg_advisory_xact_lock key serialising rollup rebuilds across processes
+REBUILD_LOCK_KEY = 4242001
+
+
+def _day_start(day):
+    return datetime(day.year, day.month, day.day)
+
+
+def _rollup_days(values):
+    """The day a completed order state contributes to, if any."""
+    if values and values.get('payment_status') == PaymentStatus.COMPLETED and values.get('created_at'):
+        return {values['created_at'].date()}
+    return set()
+
+
+def _order_states(session, order):
+    """Return (old_values, new_values) for the tracked fields of a pending order change."""
+    if order in session.new:
+        return None, {field: getattr(order, field) for field in TRACKED_FIELDS}
+
+    state = inspect(order)
+    old_values, new_values = {}, {}
+    changed = False
+    for field in TRACKED_FIELDS:
+        history = state.attrs[field].history
+        if history.has_changes():
+            changed = True
+            old_values[field] = history.deleted[0] if history.deleted else None
+            new_values[field] = history.added[0] if history.added else None
+        else:
+            old_values[field] = new_values[field] = getattr(order, field)
+
+    if order in session.deleted:
+        return old_values, None
+    return (old_values, new_values) if changed else (None, None)
+
+
+class RollupService:
+    """Builds and maintains the daily sales rollups."""
+
+    @staticmethod
+    def _completed_between(start, end):
+        """Criteria for completed orders created on days start..end (inclusive)."""
+        return (
+            Order.payment_status == PaymentStatus.COMPLETED,
+            Order.created_at >= _day_start(start),
+            Order.created_at < _day_start(end) + timedelta(days=1),
+        )
+
+    def _insert_sales(self, start, end):
+        """Sum completed order items for the days into daily_sales_rollups."""
+        first_product = lambda *partition: func.min(OrderItem.product_id).over(partition_by=partition)
+        items = select(
+            Order.id.label('order_id'),
+            func.date(Order.created_at).label('day'),
+            cast(extract('hour', Order.created_at), Integer).label('hour'),
+            Order.delivery_zone,
+            Order.payment_method,
+            OrderItem.product_id,
+            OrderItem.supplier_id,
+            Product.category_id,
+            OrderItem.subtotal,
+            OrderItem.platform_commission,
+            OrderItem.supplier_earnings,
+            OrderItem.quantity,
+            # An order is counted for a supplier / category on its lowest product id only
+            first_product(Order.id, OrderItem.supplier_id).label('supplier_first'),
+            first_product(Order.id, Product.category_id).label('category_first'),
+        ).select_from(OrderItem)\
+            .join(Order, Order.id == OrderItem.order_id)\
+            .outerjoin(Product, Product.id == OrderItem.product_id)\
+            .where(*self._completed_between(start, end)).subquery()
+
+        counted_once = lambda first: func.count(distinct(case((items.c.product_id == first, items.c.order_id))))
+        dimensions = (items.c.day, items.c.hour, items.c.product_id, items.c.supplier_id,
+                      items.c.category_id, items.c.delivery_zone, items.c.payment_method)
+        rows = select(
+            *dimensions,
+            func.sum(items.c.subtotal),
+            func.sum(items.c.platform_commission),
+            func.sum(items.c.supplier_earnings),
+            func.sum(items.c.quantity),
+            func.count(),
+            func.count(distinct(items.c.order_id)),
+            counted_once(items.c.supplier_first),
+            counted_once(items.c.category_first),
+        ).group_by(*dimensions)
+
+        db.session.execute(insert(DailySalesRollup).from_select([
+            'day', 'hour', 'product_id', 'supplier_id', 'category_id', 'delivery_zone', 'payment_method',
+            'revenue', 'commission', 'supplier_earnings', 'items_sold', 'line_count',
+            'product_orders', 'supplier_orders', 'category_orders',
+        ], rows))
+
+    def _insert_orders(self, start, end):
+        """Sum completed orders for the days into daily_order_rollups."""
+        item_totals = select(
+            OrderItem.order_id,
+            func.sum(OrderItem.quantity).label('items_sold'),
+            func.sum(OrderItem.platform_commission).label('commission'),
+            func.sum(OrderItem.supplier_earnings).label('supplier_earnings'),
+        ).join(Order, Order.id == OrderItem.order_id)\
+            .where(*self._completed_between(start, end))\
+            .group_by(OrderItem.order_id).subquery()
+
+        day = func.date(Order.created_at)
+        hour = cast(extract('hour', Order.created_at), Integer)
+        rows = select(
+            day, hour, Order.delivery_zone, Order.payment_method,
+            func.count(Order.id),
+            func.sum(Order.total),
+            func.sum(Order.subtotal),
+            func.sum(Order.delivery_fee),
+            func.coalesce(func.sum(item_totals.c.items_sold), 0),
+            func.coalesce(func.sum(item_totals.c.commission), 0),
+            func.coalesce(func.sum(item_totals.c.supplier_earnings), 0),
+        ).select_from(Order)\
+            .outerjoin(item_totals, item_totals.c.order_id == Order.id)\
+            .where(*self._completed_between(start, end))\
+            .group_by(day, hour, Order.delivery_zone, Order.payment_method)
+
+        db.session.execute(insert(DailyOrderRollup).from_select([
+            'day', 'hour', 'delivery_zone', 'payment_method',
+            'order_count', 'revenue', 'subtotal', 'delivery_fees', 'items_sold', 'commission', 'supplier_earnings',
+        ], rows))
+
+    @staticmethod
+    def _suppliers_between(start, end):
+        return {supplier_id for (supplier_id,) in db.session.query(DailySalesRollup.supplier_id).filter(
+            DailySalesRollup.day >= start, DailySalesRollup.day <= end
+        ).distinct()}
+
+    @staticmethod
+    def _set_days(start, end, days, dirty):
+        """Set days start..end (and rows for days) dirty or clean, committed on a connection of its own."""
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            if days:
+                conn.execute(MARK_DIRTY_SQL, [{'day': d, 'dirty': dirty, 'now': now} for d in sorted(days)])
+            values = {RollupDay.dirty: dirty, RollupDay.updated_at: now}
+            if not dirty:
+                values[RollupDay.refreshed_at] = now
+            conn.execute(RollupDay.__table__.update().where(
+                RollupDay.day >= start, RollupDay.day <= end
+            ).values({column.name: value for column, value in values.items()}))
+
+    def mark_dirty(self, days):
+        """
+        Mark days dirty in a short transaction of their own. Days already
+        dirty are skipped with a plain read, so concurrent payments do not
+        queue on the same row.
+        """
+        with db.engine.begin() as conn:
+            already = {_as_date(d) for d in conn.execute(
+                select(RollupDay.day).where(RollupDay.day.in_(days), RollupDay.dirty == True)
+            ).scalars()}
+            todo = sorted(set(days) - already)
+            if todo:
+                now = datetime.utcnow()
+                conn.execute(MARK_DIRTY_SQL, [{'day': d, 'dirty': True, 'now': now} for d in todo])
+        return todo
+
+    def rebuild(self, start, end):
+        """
+        Replace the rollups for days start..end (inclusive) from the orders table.
+        The days are marked clean (committed) before the orders are read, so
+        changes committed during the rebuild mark them dirty again; they are
+        marked dirty again if the rebuild fails. The rollups are not committed.
+        """
+        if db.engine.dialect.name == 'postgresql':
+            # Serialises rebuilds until commit; dirty marks never take this lock
+            db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': REBUILD_LOCK_KEY})
+
+        order_days = db.session.query(func.date(Order.created_at)).filter(
+            *self._completed_between(start, end)
+        ).distinct().all()
+        days = {_as_date(d) for (d,) in order_days}
+        self._set_days(start, end, days, dirty=False)
+
+        try:
+            self._replace(start, end)
+        except Exception:
+            db.session.rollback()
+            self._set_days(start, end, days, dirty=True)
+            raise
+
+    def _replace(self, start, end):
+        suppliers = self._suppliers_between(start, end)
+        DailySalesRollup.query.filter(DailySalesRollup.day >= start, DailySalesRollup.day <= end)\
+            .delete(synchronize_session=False)
+        DailyOrderRollup.query.filter(DailyOrderRollup.day >= start, DailyOrderRollup.day <= end)\
+            .delete(synchronize_session=False)
+        self._insert_sales(start, end)
+        self._insert_orders(start, end)
+
+        # Cached supplier analytics for these suppliers are dropped on commit
+        suppliers |= self._suppliers_between(start, end)
+        if suppliers:
+            db.session.info.setdefault('rollup_changed_suppliers', set()).update(suppliers)
+
+    def refresh_dirty(self, limit=None):
+        """Rebuild dirty days, newest first, committing each. Returns the days rebuilt."""
+        if limit is None:
+            limit = int(current_app.config.get('ANALYTICS_ROLLUP_BATCH_DAYS', 31))
+
+        days = [_as_date(d) for (d,) in db.session.query(RollupDay.day).filter(
+            RollupDay.dirty == True
+        ).order_by(RollupDay.day.desc()).limit(limit).all()]
+
+        for day in days:
+            self.rebuild(day, day)
+            db.session.commit()
+        return days
+
+    def backfill(self, start=None, end=None, chunk_days=31):
+        """
+        Rebuild every day from start to end (defaulting to the first and last
+        order), committing a chunk at a time. Returns the number of days covered.
+        """
+        if start is None or end is None:
+            first, last = db.session.query(func.min(Order.created_at), func.max(Order.created_at)).one()
+            if first is None:
+                return 0
+            start = start or first.date()
+            end = end or last.date()
+
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+            self.rebuild(chunk_start, chunk_end)
+            db.session.commit()
+            chunk_start = chunk_end + timedelta(days=1)
+        return (end - start).days + 1
+
+    def queue_backfill(self):
+        """
+        On a database without rollups, mark every day with completed orders
+        dirty so the refresh job builds the history in the background.
+        Returns the number of days queued.
+        """
+        if db.session.query(RollupDay.day).first() is not None:
+            return 0
+        days = [_as_date(d) for (d,) in db.session.query(func.date(Order.created_at)).filter(
+            Order.payment_status == PaymentStatus.COMPLETED
+        ).distinct().all()]
+        if days:
+            now = datetime.utcnow()
+            db.session.execute(MARK_DIRTY_SQL, [{'day': d, 'dirty': True, 'now': now} for d in days])
+        return len(days)
+
+    def changed_days(self, session):
+        """Days whose rollups the pending changes in this flush affect."""
+        days = set()
+
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, Order):
+                old_values, new_values = _order_states(session, obj)
+                if old_values is None and new_values is None:
+                    continue
+                days |= _rollup_days(old_values) | _rollup_days(new_values)
+            elif isinstance(obj, OrderItem):
+                if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+                    continue
+                order = obj.order
+                if order is not None:
+                    days |= _rollup_days({field: getattr(order, field) for field in TRACKED_FIELDS})
+
+        return days
+
+
+rollup_service = RollupService()
+
+
+def _as_date(value):
+    """Dates come back as strings from SQLite's date()."""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _before_flush(session, flush_context, instances):
+    with session.no_autoflush:
+        days = rollup_service.changed_days(session)
+    if days:
+        session.info.setdefault('rollup_dirty_days', set()).update(days)
+
+
+def _after_commit(session):
+    days = session.info.pop('rollup_dirty_days', None)
+    if days and has_app_context():
+        try:
+            rollup_service.mark_dirty(days)
+        except Exception as e:
+            # The nightly rebuild of recent days still picks these up
+            current_app.logger.error(f'Rollups: failed to mark days dirty {sorted(days)} - {str(e)}')
+
+
+def _after_rollback(session):
+    session.info.pop('rollup_dirty_days', None)
+
+
+def register_listeners():
+    """Mark rollup days dirty as orders change (safe to call repeatedly)."""
+    for name, listener in (('before_flush', _before_flush), ('after_commit', _after_commit),
+                           ('after_rollback', _after_rollback)):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
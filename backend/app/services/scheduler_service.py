@@ -3,6 +3,10 @@ Automated Scheduler Service for Electronics Shop.
 Handles automatic payment processing, order confirmations, and payouts.
 """
 
+import heapq
+import math
+import threading
+from collections import defaultdict
 from datetime import datetime, timedelta
 from flask import current_app
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -12,6 +16,92 @@ from apscheduler.triggers.interval import IntervalTrigger
 
 scheduler = BackgroundScheduler()
 
+# Granularity of the deadline timer wheel; events fire at most this late
+TIMER_RESOLUTION_SECONDS = 15
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class TimerWheel:
+    """
+    In-process timer wheel for one-shot deadline events.
+
+    Events are hashed into slots of TIMER_RESOLUTION_SECONDS by their deadline
+    and each slot is handed to its handler as one batch once the deadline
+    passes. A tick with nothing due is a heap peek, so the database is only
+    touched when something actually expires. Events live in memory, so
+    polling sweeps remain as a safety net across restarts.
+    """
+
+    def __init__(self, resolution_seconds=TIMER_RESOLUTION_SECONDS):
+        self.resolution = resolution_seconds
+        self._lock = threading.Lock()
+        self._slots = {}  # slot number -> {handler name: set of keys}
+        self._heap = []  # slot numbers in deadline order
+        self._handlers = {}
+
+    def _slot_for(self, when):
+        return math.ceil((when - _EPOCH).total_seconds() / self.resolution)
+
+    def register_handler(self, name, func):
+        """Register func(keys) to receive batches of due keys for events named name."""
+        self._handlers[name] = func
+
+    def schedule(self, name, key, run_at):
+        """Schedule key to be handed to handler name once run_at (naive UTC) has passed."""
+        slot = self._slot_for(run_at)
+        with self._lock:
+            if slot not in self._slots:
+                self._slots[slot] = defaultdict(set)
+                heapq.heappush(self._heap, slot)
+            self._slots[slot][name].add(key)
+
+    def pop_due(self, now=None):
+        """Remove and return {handler name: [keys]} for every slot that is due."""
+        current = self._slot_for(now or datetime.utcnow())
+        due = defaultdict(set)
+        with self._lock:
+            while self._heap and self._heap[0] <= current:
+                slot = heapq.heappop(self._heap)
+                for name, keys in self._slots.pop(slot, {}).items():
+                    due[name].update(keys)
+        return {name: sorted(keys) for name, keys in due.items()}
+
+    def pending_count(self):
+        """Number of keys still waiting for their deadline."""
+        with self._lock:
+            return sum(len(keys) for slot in self._slots.values() for keys in slot.values())
+
+    def tick(self):
+        """Run handlers for everything that is due. Called by the scheduler."""
+        for name, keys in self.pop_due().items():
+            handler = self._handlers.get(name)
+            if not handler:
+                continue
+            try:
+                handler(keys)
+            except Exception as e:
+                from app.models import db
+                db.session.rollback()
+                current_app.logger.error(f'Scheduler: Timer handler {name} failed - {str(e)}')
+
+
+timer_wheel = TimerWheel()
+
+
+def schedule_deadline(name, key, run_at):
+    """Register a one-shot deadline event on the shared timer wheel."""
+    timer_wheel.schedule(name, key, run_at)
+
+
+def _with_app_context(app, func):
+    """Wrap a job that expects to run inside the application context."""
+    def job():
+        with app.app_context():
+            func()
+    job.__name__ = func.__name__
+    return job
+
 
 def process_auto_confirmations():
     """
@@ -21,27 +111,18 @@ def process_auto_confirmations():
     from app import create_app
     from app.models import db
     from app.models.order import Order
+    from app.services.notification_service import notification_service
 
     app = create_app()
     with app.app_context():
         try:
-            # Find orders ready for auto-confirmation
-            orders = Order.query.filter(
-                Order.delivery_confirmed_by_agent == True,
-                Order.customer_confirmed_delivery == False,
-                Order.customer_dispute == False,
-                Order.auto_confirmed == False,
-                Order.auto_confirm_deadline <= datetime.utcnow()
-            ).all()
+            # Confirm every due order in one statement (served by ix_orders_auto_confirm_due)
+            confirmed_ids = Order.auto_confirm_due_deliveries()
 
-            confirmed_count = 0
-            for order in orders:
-                if order.auto_confirm_delivery():
-                    confirmed_count += 1
-
-            if confirmed_count > 0:
+            if confirmed_ids:
+                notification_service.notify_auto_confirmed_orders(confirmed_ids)
                 db.session.commit()
-                current_app.logger.info(f'Scheduler: Auto-confirmed {confirmed_count} orders')
+                current_app.logger.info(f'Scheduler: Auto-confirmed {len(confirmed_ids)} orders')
 
         except Exception as e:
             db.session.rollback()
@@ -55,112 +136,58 @@ def generate_and_process_delivery_payouts():
     """
     from app import create_app
     from app.models import db
-    from app.models.user import User, DeliveryAgentProfile
-    from app.models.order import Order
-    from app.models.returns import DeliveryPayout, DeliveryPayoutType
     from app.services.mpesa_service import mpesa_service
+    from app.services.ledger_service import ledger_service
+    from app.services.delivery_payout_service import delivery_payout_service
 
     app = create_app()
     with app.app_context():
         try:
-            # Step 1: Find confirmed orders with unpaid delivery fees
-            orders = Order.query.filter(
-                db.or_(
-                    Order.customer_confirmed_delivery == True,
-                    Order.auto_confirmed == True
-                ),
-                Order.delivery_fee_paid == False,
-                Order.assigned_delivery_agent.isnot(None)
-            ).all()
+            # Step 1: One payout per agent from their unclaimed confirmed deliveries (min 100 KES)
+            payouts = delivery_payout_service.generate(min_amount=100)
+            db.session.commit()
 
-            if not orders:
+            if not payouts:
                 current_app.logger.info('Scheduler: No delivery payouts to process')
                 return
 
-            # Step 2: Group orders by delivery agent
-            agent_orders = {}
-            for order in orders:
-                agent_id = order.assigned_delivery_agent
-                if agent_id not in agent_orders:
-                    agent_orders[agent_id] = []
-                agent_orders[agent_id].append(order)
-
-            payouts_created = 0
+            payouts_created = len(payouts)
             payments_initiated = 0
 
-            for agent_id, orders_list in agent_orders.items():
-                user = User.query.get(agent_id)
-                if not user or not user.delivery_agent_profile:
+            # Step 2: Process M-Pesa payment if number is configured
+            for payout in payouts:
+                if not payout.mpesa_number:
+                    continue
+                is_valid, formatted = mpesa_service.validate_phone_number(payout.mpesa_number)
+                if not is_valid:
                     continue
 
-                profile = user.delivery_agent_profile
+                payout.status = 'processing'
+                db.session.commit()
 
-                # Calculate totals
-                gross_amount = sum(float(o.delivery_fee) for o in orders_list)
-                fee_percentage = float(profile.delivery_fee_percentage) / 100
-                net_amount = gross_amount * fee_percentage
-                platform_fee = gross_amount - net_amount
+                response = mpesa_service.b2c_payment(
+                    phone_number=formatted,
+                    amount=float(payout.net_amount),
+                    remarks=f'Delivery Payout {payout.payout_number}',
+                    occasion='Auto Delivery Payment'
+                )
 
-                # Skip small amounts (less than 100 KES)
-                if net_amount < 100:
-                    current_app.logger.info(f'Scheduler: Skipping payout for {profile.first_name} - amount too small ({net_amount})')
-                    continue
+                if response.get('success'):
+                    payout.payment_reference = response.get('conversation_id')
+                    payout.status = 'completed'
+                    payout.processed_at = datetime.utcnow()
+                    payout.notes = f"Auto-processed via scheduler. ConversationID: {response.get('conversation_id')}"
 
-                # Create payout
-                payout = DeliveryPayout(
-                    payout_type=DeliveryPayoutType.AGENT,
-                    delivery_agent_id=profile.id,
-                    gross_amount=gross_amount,
-                    platform_fee=platform_fee,
-                    net_amount=net_amount,
-                    order_count=len(orders_list),
-                    order_ids=[o.id for o in orders_list],
-                    mpesa_number=profile.mpesa_number,
-                    period_start=min(o.delivery_confirmed_at for o in orders_list if o.delivery_confirmed_at),
-                    period_end=max(o.delivery_confirmed_at for o in orders_list if o.delivery_confirmed_at)
-                )
-                payout.generate_payout_number()
-                db.session.add(payout)
-                db.session.flush()  # Get the payout ID
-                payouts_created += 1
-
-                # Step 3: Process M-Pesa payment if number is configured
-                if profile.mpesa_number:
-                    is_valid, formatted = mpesa_service.validate_phone_number(profile.mpesa_number)
-                    if is_valid:
-                        payout.status = 'processing'
-                        db.session.commit()
-
-                        response = mpesa_service.b2c_payment(
-                            phone_number=formatted,
-                            amount=float(net_amount),
-                            remarks=f'Delivery Payout {payout.payout_number}',
-                            occasion='Auto Delivery Payment'
-                        )
-
-                        if response.get('success'):
-                            payout.payment_reference = response.get('conversation_id')
-                            payout.status = 'completed'
-                            payout.processed_at = datetime.utcnow()
-                            payout.notes = f"Auto-processed via scheduler. ConversationID: {response.get('conversation_id')}"
-
-                            # Mark orders as paid
-                            for order in orders_list:
-                                order.delivery_fee_paid = True
-                                order.delivery_fee_paid_at = datetime.utcnow()
-                                order.delivery_payment_reference = response.get('conversation_id')
-
-                            # Update agent stats
-                            profile.total_earnings += float(net_amount)
-                            profile.pending_payout = 0
-
-                            payments_initiated += 1
-                        else:
-                            payout.status = 'pending'
-                            payout.notes = f"Auto-payment failed: {response.get('error', 'Unknown')}"
-                            profile.pending_payout += float(net_amount)
+                    delivery_payout_service.mark_orders_paid(payout, response.get('conversation_id'))
+                    ledger_service.payout('agent', payout.delivery_agent_id, payout.net_amount,
+                                          reference=payout.payout_number, memo='Auto-processed via scheduler')
+
+                    payments_initiated += 1
+                else:
+                    payout.status = 'pending'
+                    payout.notes = f"Auto-payment failed: {response.get('error', 'Unknown')}"
+                db.session.commit()
 
-            db.session.commit()
             current_app.logger.info(
                 f'Scheduler: Created {payouts_created} delivery payouts, '
                 f'initiated {payments_initiated} M-Pesa payments'
@@ -179,9 +206,8 @@ def generate_and_process_supplier_payouts():
     from app import create_app
     from app.models import db
     from app.models.user import SupplierProfile
-    from app.models.order import Order, OrderItem, OrderStatus
     from app.models.returns import SupplierPayout
-    from app.services.mpesa_service import mpesa_service
+    from app.services.payout_engine import payout_engine
 
     app = create_app()
     with app.app_context():
@@ -197,61 +223,46 @@ def generate_and_process_supplier_payouts():
                 current_app.logger.info('Scheduler: No supplier payouts to process')
                 return
 
-            payouts_processed = 0
-
-            for supplier in suppliers:
-                # Check if there's already a pending/processing payout
-                existing_payout = SupplierPayout.query.filter(
-                    SupplierPayout.supplier_id == supplier.id,
+            # Suppliers that already have a pending/processing payout (one query)
+            busy = {
+                row[0] for row in db.session.query(SupplierPayout.supplier_id).filter(
+                    SupplierPayout.supplier_id.in_([s.id for s in suppliers]),
                     SupplierPayout.status.in_(['pending', 'processing'])
-                ).first()
+                ).distinct().all()
+            }
 
-                if existing_payout:
+            payout_ids = []
+            for supplier in suppliers:
+                if supplier.id in busy:
                     continue
 
                 amount = float(supplier.outstanding_balance)
-                if amount < 100:
-                    continue
 
                 # Create payout record
                 payout = SupplierPayout(
                     supplier_id=supplier.id,
                     amount=amount,
-                    status='processing'
+                    net_amount=amount,
+                    status='pending'
                 )
+                payout.generate_payout_number()
                 db.session.add(payout)
                 db.session.flush()
-
-                # Process M-Pesa payment
-                is_valid, formatted = mpesa_service.validate_phone_number(supplier.mpesa_number)
-                if is_valid:
-                    response = mpesa_service.b2c_payment(
-                        phone_number=formatted,
-                        amount=amount,
-                        remarks=f'Supplier Payout - {supplier.business_name}',
-                        occasion='Auto Supplier Payment'
-                    )
-
-                    if response.get('success'):
-                        payout.status = 'completed'
-                        payout.reference = response.get('conversation_id')
-                        payout.paid_at = datetime.utcnow()
-                        payout.notes = f"Auto-processed. ConversationID: {response.get('conversation_id')}"
-
-                        # Update supplier balances
-                        supplier.total_sales += amount  # Add to total sales (lifetime earnings)
-                        supplier.outstanding_balance = 0  # Clear pending balance
-
-                        payouts_processed += 1
-                    else:
-                        payout.status = 'pending'
-                        payout.notes = f"Auto-payment failed: {response.get('error', 'Unknown')}"
-                else:
-                    payout.status = 'pending'
-                    payout.notes = f"Invalid M-Pesa number: {formatted}"
+                payout_ids.append(payout.id)
 
             db.session.commit()
-            current_app.logger.info(f'Scheduler: Processed {payouts_processed} supplier payouts')
+
+            if not payout_ids:
+                current_app.logger.info('Scheduler: No supplier payouts to process')
+                return
+
+            # Send them concurrently through the payout engine (already in the background here)
+            batch = payout_engine.create_batch(payout_ids, source='scheduler')
+            batch = payout_engine.run_batch(batch.id)
+
+            current_app.logger.info(
+                f'Scheduler: Processed {batch.submitted_count} supplier payouts, {batch.failed_count} failed'
+            )
 
         except Exception as e:
             db.session.rollback()
@@ -293,22 +304,108 @@ def init_scheduler(app):
     )
     
     # 4. Auto-notify delivery agents - runs every 5 minutes
-    from app.jobs.delivery_assignment import auto_notify_delivery_agents, expire_old_delivery_requests
+    from app.jobs.delivery_assignment import (
+        auto_notify_delivery_agents, expire_old_delivery_requests, reconcile_delivery_agent_stats
+    )
     
     scheduler.add_job(
-        func=auto_notify_delivery_agents,
+        func=_with_app_context(app, auto_notify_delivery_agents),
         trigger=IntervalTrigger(minutes=5),
         id='auto_notify_agents',
-        name='Auto-notify delivery agents for ready orders (every 5 min)',
+        name='Offer ready orders to the first dispatch wave (every 5 min)',
         replace_existing=True
     )
     
-    # 5. Expire old delivery requests - runs every 10 minutes
+    # 5. Expire delivery requests at their own deadline via the timer wheel
+    from app.services.dispatch_service import dispatch_service
+
+    timer_wheel.register_handler('delivery_request_expiry', dispatch_service.expire_requests)
+
     scheduler.add_job(
-        func=expire_old_delivery_requests,
-        trigger=IntervalTrigger(minutes=10),
+        func=_with_app_context(app, timer_wheel.tick),
+        trigger=IntervalTrigger(seconds=TIMER_RESOLUTION_SECONDS),
+        id='timer_wheel_tick',
+        name=f'Process due deadline events (every {TIMER_RESOLUTION_SECONDS}s)',
+        replace_existing=True
+    )
+
+    # 6. Safety-net sweep for expiries missed by the timer wheel (e.g. after a restart)
+    scheduler.add_job(
+        func=_with_app_context(app, expire_old_delivery_requests),
+        trigger=IntervalTrigger(minutes=30),
         id='expire_delivery_requests',
-        name='Expire old delivery requests (every 10 min)',
+        name='Sweep expired delivery requests (every 30 min)',
+        replace_existing=True
+    )
+
+    # 7. Rebuild delivery agent dashboard counters - daily just after midnight
+    scheduler.add_job(
+        func=_with_app_context(app, reconcile_delivery_agent_stats),
+        trigger=CronTrigger(hour=0, minute=5),
+        id='reconcile_agent_stats',
+        name='Reconcile delivery agent dashboard counters (daily)',
+        replace_existing=True
+    )
+
+    # 8. Apply stored provider callbacks (routes also wake this on receipt)
+    from app.services.callback_inbox import callback_inbox
+
+    poll_seconds = int(app.config.get('INBOUND_EVENT_POLL_SECONDS', 10))
+    scheduler.add_job(
+        func=_with_app_context(app, callback_inbox.process_pending),
+        trigger=IntervalTrigger(seconds=poll_seconds),
+        id='process_inbound_events',
+        name=f'Apply inbound provider callbacks (every {poll_seconds}s)',
+        replace_existing=True
+    )
+
+    # 9. Resolve payments whose callback never arrived
+    from app.services.payment_reconciler import payment_reconciler
+
+    scheduler.add_job(
+        func=_with_app_context(app, payment_reconciler.run),
+        trigger=IntervalTrigger(minutes=5),
+        id='reconcile_payments',
+        name='Reconcile stuck M-Pesa and Paystack payments (every 5 min)',
+        replace_existing=True
+    )
+
+    # 10. Keep the analytics dashboard rollups current
+    from app.jobs.analytics_rollups import refresh_sales_rollups, rebuild_recent_sales_rollups
+
+    scheduler.add_job(
+        func=_with_app_context(app, refresh_sales_rollups),
+        trigger=IntervalTrigger(minutes=1),
+        id='refresh_sales_rollups',
+        name='Rebuild analytics rollups for changed days (every minute)',
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        func=_with_app_context(app, rebuild_recent_sales_rollups),
+        trigger=CronTrigger(hour=0, minute=15),
+        id='rebuild_recent_sales_rollups',
+        name='Rebuild analytics rollups for recent days (daily)',
+        replace_existing=True
+    )
+
+    # 11. Run queued admin report jobs (submissions also wake this) and purge expired results
+    from app.services.report_jobs import report_job_service
+
+    report_poll_seconds = int(app.config.get('REPORT_JOB_POLL_SECONDS', 60))
+    scheduler.add_job(
+        func=_with_app_context(app, report_job_service.process_pending),
+        trigger=IntervalTrigger(seconds=report_poll_seconds),
+        id='process_report_jobs',
+        name=f'Run queued report jobs (every {report_poll_seconds}s)',
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        func=_with_app_context(app, report_job_service.purge_expired),
+        trigger=IntervalTrigger(hours=1),
+        id='purge_report_jobs',
+        name='Delete expired report job results (hourly)',
         replace_existing=True
     )
 
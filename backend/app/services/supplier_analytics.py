@@ -0,0 +1,312 @@
+"""
+Supplier analytics and dashboard counters.
+
+Every sales figure on the supplier analytics page (daily sales, monthly
+earnings, top products, categories, peak hours, totals and the MoM / YoY
+periods) comes from one statement over the supplier's daily sales rollups:
+a CTE selects the supplier's rollup rows once, and each section is a
+grouped SELECT over it, UNION ALLed together and tagged with its section
+name. Top products and categories are ranked with ROW_NUMBER() in SQL.
+Returns, customers and stock are read live.
+
+The payload is cached per supplier for SUPPLIER_ANALYTICS_CACHE_SECONDS.
+When the rollup refresh rebuilds a day (new paid orders, refunds), the
+suppliers on that day have their cached payload dropped once it commits.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import Integer, Numeric, String, cast, event, func, literal, null, select, true, union_all
+from app.models import db
+from app.models.order import Order, OrderItem, PaymentStatus
+from app.models.product import Product, Category
+from app.models.returns import Return
+from app.models.analytics import DailySalesRollup
+
+
+CACHE_KEY = 'supplier_analytics:{}'
+
+# Session info key the rollup rebuild fills with the suppliers it touched
+CHANGED_SUPPLIERS = 'rollup_changed_suppliers'
+
+TOP_PRODUCTS = 10
+
+
+def _month_starts(month_start, count=12):
+    """First day of the last `count` months, oldest first, ending with month_start."""
+    months = [month_start]
+    while len(months) < count:
+        months.insert(0, (months[0] - timedelta(days=1)).replace(day=1))
+    return months
+
+
+def _growth(current, previous):
+    return ((float(current) - float(previous)) / float(previous) * 100) if previous > 0 else 0
+
+
+class SupplierAnalyticsService:
+    """Computes and caches the supplier analytics payload."""
+
+    @staticmethod
+    def _sales_sections(supplier_id, today):
+        """
+        One round trip for every rollup-based figure. Returns
+        {section: [row, ...]} where each row has key, label, price, rank,
+        earnings, commission, units, lines and orders.
+        """
+        month_start = today.replace(day=1)
+        last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+        year_start = today.replace(month=1, day=1)
+        last_year_start = year_start.replace(year=year_start.year - 1)
+
+        sales = select(
+            DailySalesRollup.day, DailySalesRollup.hour, DailySalesRollup.product_id,
+            DailySalesRollup.category_id, DailySalesRollup.supplier_earnings, DailySalesRollup.commission,
+            DailySalesRollup.items_sold, DailySalesRollup.line_count,
+            DailySalesRollup.supplier_orders, DailySalesRollup.product_orders
+        ).where(DailySalesRollup.supplier_id == supplier_id).cte('supplier_sales')
+
+        def section(name, key, orders=sales.c.supplier_orders, label=None, price=None, rank=None):
+            return (
+                literal(name, String).label('section'),
+                cast(key, String).label('key'),
+                (label if label is not None else cast(null(), String)).label('label'),
+                (price if price is not None else cast(null(), Numeric(12, 2))).label('price'),
+                (rank if rank is not None else cast(null(), Integer)).label('rank'),
+                func.coalesce(func.sum(sales.c.supplier_earnings), 0).label('earnings'),
+                func.coalesce(func.sum(sales.c.commission), 0).label('commission'),
+                func.coalesce(func.sum(sales.c.items_sold), 0).label('units'),
+                func.coalesce(func.sum(sales.c.line_count), 0).label('lines'),
+                func.coalesce(func.sum(orders), 0).label('orders'),
+            )
+
+        def ranked(name, key, label, order_by, join, orders=sales.c.supplier_orders, price=None, limit=None):
+            rank = func.row_number().over(order_by=(order_by.desc(), key))
+            grouped = select(*section(name, key, orders=orders, label=label, price=price, rank=rank))\
+                .select_from(sales).join(*join)\
+                .group_by(*[c for c in (key, label, price) if c is not None]).subquery()
+            query = select(*grouped.c)
+            return query.where(grouped.c.rank <= limit) if limit else query
+
+        def period(name, start, end=None):
+            query = select(*section(name, literal(name, String))).where(sales.c.day >= start)
+            return query.where(sales.c.day < end) if end else query
+
+        parts = [
+            select(*section('daily', sales.c.day)).where(sales.c.day >= today - timedelta(days=30))
+                .group_by(sales.c.day),
+            select(*section('monthly', func.to_char(sales.c.day, 'YYYY-MM')))
+                .where(sales.c.day >= _month_starts(month_start)[0])
+                .group_by(func.to_char(sales.c.day, 'YYYY-MM')),
+            select(*section('hourly', sales.c.hour)).where(sales.c.day >= today - timedelta(days=90))
+                .group_by(sales.c.hour),
+            ranked('products', sales.c.product_id, Product.name, func.sum(sales.c.items_sold),
+                   (Product, Product.id == sales.c.product_id), orders=sales.c.product_orders,
+                   price=Product.price, limit=TOP_PRODUCTS),
+            ranked('categories', sales.c.category_id, Category.name, func.sum(sales.c.supplier_earnings),
+                   (Category, Category.id == sales.c.category_id)),
+            select(*section('total', literal('total', String))),
+            period('this_month', month_start),
+            period('last_month', last_month_start, month_start),
+            period('this_year', year_start),
+            period('last_year', last_year_start, year_start),
+        ]
+
+        sections = {}
+        for row in db.session.execute(union_all(*parts)).mappings():
+            sections.setdefault(row['section'], []).append(row)
+        return sections
+
+    @staticmethod
+    def _return_analysis(supplier_id):
+        supplier_order_ids = select(OrderItem.order_id).where(OrderItem.supplier_id == supplier_id).distinct()
+        by_reason = db.session.query(Return.reason, func.count(Return.id))\
+            .filter(Return.order_id.in_(supplier_order_ids)).group_by(Return.reason).all()
+        return by_reason, sum(count for _, count in by_reason)
+
+    @staticmethod
+    def _customer_metrics(supplier_id):
+        per_customer = db.session.query(
+            Order.customer_id, func.count(func.distinct(Order.id)).label('orders')
+        ).join(OrderItem, OrderItem.order_id == Order.id).filter(
+            OrderItem.supplier_id == supplier_id,
+            Order.payment_status == PaymentStatus.COMPLETED
+        ).group_by(Order.customer_id).subquery()
+
+        unique_customers, repeat_customers = db.session.query(
+            func.count(),
+            func.count().filter(per_customer.c.orders > 1)
+        ).select_from(per_customer).one()
+        return unique_customers or 0, repeat_customers or 0
+
+    @staticmethod
+    def _inventory(supplier_id):
+        active = (Product.supplier_id == supplier_id, Product.is_active == True)
+        avg_inventory = db.session.query(func.avg(Product.stock_quantity)).filter(*active).scalar() or 0
+        low_stock_products = db.session.query(
+            Product.id, Product.name, Product.stock_quantity, Product.low_stock_threshold
+        ).filter(*active, Product.stock_quantity <= Product.low_stock_threshold)\
+            .order_by(Product.stock_quantity).limit(10).all()
+        return float(avg_inventory), low_stock_products
+
+    def build(self, supplier_id):
+        """Compute the analytics payload for a supplier."""
+        today = datetime.utcnow().date()
+        sections = self._sales_sections(supplier_id, today)
+        one = lambda name: sections[name][0]
+
+        daily_sales = sorted(sections.get('daily', []), key=lambda r: r['key'])
+        by_month = {r['key']: r for r in sections.get('monthly', [])}
+        monthly_earnings = []
+        for m_start in _month_starts(today.replace(day=1)):
+            row = by_month.get(m_start.strftime('%Y-%m'))
+            monthly_earnings.append({
+                'month': m_start.strftime('%b %Y'),
+                'earnings': float(row['earnings']) if row else 0.0,
+                'orders': row['orders'] if row else 0
+            })
+
+        total = one('total')
+        total_items_sold = total['units']
+        total_earnings = float(total['earnings'])
+        total_revenue = total_earnings + float(total['commission'])
+        platform_commission = total_revenue - total_earnings
+        profit_margin = (total_earnings / total_revenue * 100) if total_revenue > 0 else 0
+
+        returns_by_reason, total_returns = self._return_analysis(supplier_id)
+        return_rate = (total_returns / total_items_sold * 100) if total_items_sold > 0 else 0
+
+        avg_inventory, low_stock_products = self._inventory(supplier_id)
+        inventory_turnover = (float(total_items_sold) / avg_inventory) if avg_inventory > 0 else 0
+
+        unique_customers, repeat_customers = self._customer_metrics(supplier_id)
+        repeat_rate = (repeat_customers / unique_customers * 100) if unique_customers > 0 else 0
+
+        periods = {name: float(one(name)['earnings']) for name in ('this_month', 'last_month', 'this_year', 'last_year')}
+
+        return {
+            'daily_sales': [{'date': r['key'], 'earnings': float(r['earnings']), 'items_sold': r['lines'], 'orders': r['orders']} for r in daily_sales],
+            'top_products': [{'id': r['key'], 'name': r['label'], 'price': float(r['price']), 'quantity_sold': r['units'], 'earnings': float(r['earnings']), 'orders': r['orders']}
+                             for r in sorted(sections.get('products', []), key=lambda r: r['rank'])],
+            'monthly_earnings': monthly_earnings,
+            'category_performance': [{'name': r['label'], 'earnings': float(r['earnings']), 'quantity': r['units']}
+                                     for r in sorted(sections.get('categories', []), key=lambda r: r['rank'])],
+            'return_analysis': {
+                'total_returns': total_returns,
+                'return_rate': round(return_rate, 2),
+                'by_reason': [{'reason': reason, 'count': count} for reason, count in returns_by_reason]
+            },
+            'profit_metrics': {
+                'total_revenue': total_revenue,
+                'total_earnings': total_earnings,
+                'platform_commission': platform_commission,
+                'profit_margin': round(profit_margin, 2)
+            },
+            'inventory_metrics': {
+                'turnover_rate': round(inventory_turnover, 2),
+                'avg_inventory': round(avg_inventory, 2),
+                'low_stock_count': len(low_stock_products),
+                'low_stock_products': [{'id': p.id, 'name': p.name, 'stock': p.stock_quantity, 'threshold': p.low_stock_threshold} for p in low_stock_products]
+            },
+            'customer_metrics': {
+                'unique_customers': unique_customers,
+                'repeat_customers': repeat_customers,
+                'repeat_rate': round(repeat_rate, 2)
+            },
+            'aov_trend': [{'date': r['key'], 'aov': float(r['earnings']) / r['lines'] if r['lines'] else 0.0} for r in daily_sales],
+            'growth_metrics': {
+                'mom_growth': round(_growth(periods['this_month'], periods['last_month']), 2),
+                'yoy_growth': round(_growth(periods['this_year'], periods['last_year']), 2),
+                'this_month': periods['this_month'],
+                'last_month': periods['last_month'],
+                'this_year': periods['this_year'],
+                'last_year': periods['last_year']
+            },
+            'peak_hours': [{'hour': int(r['key']), 'orders': r['orders'], 'earnings': float(r['earnings'])}
+                           for r in sorted(sections.get('hourly', []), key=lambda r: int(r['key']))]
+        }
+
+    @staticmethod
+    def dashboard(supplier_profile):
+        """
+        The supplier dashboard counters in one statement. Order figures read
+        ix_order_items_supplier_order (quantity and earnings are included in
+        it) and look each order up by key; returns go through ix_returns_order_id.
+        """
+        supplier_id = supplier_profile.id
+        completed = Order.payment_status == PaymentStatus.COMPLETED
+        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        products = select(
+            func.count(Product.id).label('total'),
+            func.count(Product.id).filter(Product.is_active == True).label('active'),
+            func.count(Product.id).filter(
+                Product.is_active == True, Product.stock_quantity <= Product.low_stock_threshold
+            ).label('low_stock'),
+        ).where(Product.supplier_id == supplier_id).subquery()
+        orders = select(
+            func.count(func.distinct(OrderItem.order_id)).label('total'),
+            func.coalesce(func.sum(OrderItem.quantity).filter(completed), 0).label('items_sold'),
+            func.coalesce(func.sum(OrderItem.supplier_earnings).filter(completed, Order.created_at >= month_start), 0)
+                .label('month_sales'),
+        ).join(Order, Order.id == OrderItem.order_id).where(OrderItem.supplier_id == supplier_id).subquery()
+        returns = select(func.count(Return.id)).where(
+            Return.order_id.in_(select(OrderItem.order_id).where(OrderItem.supplier_id == supplier_id))
+        ).scalar_subquery()
+
+        (total_products, active_products, low_stock,
+         total_orders, items_sold, month_sales, total_returns) = db.session.execute(
+            select(products, orders, returns).select_from(products.join(orders, true()))
+        ).one()
+
+        return {
+            'products': {
+                'total': total_products,
+                'active': active_products,
+                'low_stock': low_stock
+            },
+            'orders': {
+                'total': total_orders,
+                'items_sold': int(items_sold)
+            },
+            'earnings': {
+                'total': float(supplier_profile.total_sales),
+                'pending': float(supplier_profile.outstanding_balance),
+                'this_month': float(month_sales)
+            },
+            'returns': total_returns
+        }
+
+    def get(self, supplier_id):
+        """The supplier's analytics payload, from cache when available."""
+        key = CACHE_KEY.format(supplier_id)
+        data = current_app.cache.get(key)
+        if data is None:
+            data = self.build(supplier_id)
+            timeout = int(current_app.config.get('SUPPLIER_ANALYTICS_CACHE_SECONDS', 300))
+            current_app.cache.set(key, data, timeout=timeout)
+        return data
+
+    def invalidate(self, supplier_ids):
+        """Drop the cached payload for these suppliers."""
+        current_app.cache.delete_many(*[CACHE_KEY.format(supplier_id) for supplier_id in supplier_ids])
+
+
+supplier_analytics_service = SupplierAnalyticsService()
+
+
+def _after_commit(session):
+    supplier_ids = session.info.pop(CHANGED_SUPPLIERS, None)
+    if supplier_ids and has_app_context():
+        supplier_analytics_service.invalidate(supplier_ids)
+
+
+def _after_rollback(session):
+    session.info.pop(CHANGED_SUPPLIERS, None)
+
+
+def register_listeners():
+    """Drop cached supplier analytics when rebuilt rollups commit (safe to call repeatedly)."""
+    for name, listener in (('after_commit', _after_commit), ('after_rollback', _after_rollback)):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
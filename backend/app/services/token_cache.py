@@ -0,0 +1,130 @@
+"""
+Shared OAuth token cache.
+
+Provider access tokens are cached in process memory for the fast path and in
+the provider_tokens table so every gunicorn worker reuses the same token.
+Refreshes are single-flight: within a process a lock lets one thread fetch
+while the others wait, and across processes the token row is locked
+(SELECT ... FOR UPDATE) so only one worker calls the provider while the rest
+pick up its result. Tokens are refreshed a margin before they expire (at
+most half their lifetime, so short-lived tokens are not refreshed on every
+call); if a refresh fails while the old token is still valid, the old token
+keeps being served and the refresh is retried shortly after. A token the
+provider rejects is invalidated for every worker, so the next call fetches
+a new one.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+from app.models import db
+from app.models.provider_token import ProviderToken
+
+
+# Back-off before retrying a failed proactive refresh
+REFRESH_RETRY_SECONDS = 30
+
+
+class SharedTokenCache:
+    """Process- and worker-shared cache for one provider credential's access token."""
+
+    def __init__(self, key, fetch):
+        """
+        Args:
+            key: Unique cache key for the provider/credential
+            fetch: Callable returning (token, expires_in_seconds) from the provider
+        """
+        self.key = key
+        self.fetch = fetch
+        self._token = None
+        self._expires_at = None
+        self._refresh_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _refresh_due(expires_at, issued_at):
+        """When a token should be refreshed: the configured margin before expiry, capped at half its lifetime."""
+        margin = timedelta(seconds=int(current_app.config.get('MPESA_TOKEN_REFRESH_MARGIN_SECONDS', 300)))
+        return expires_at - min(margin, (expires_at - issued_at) / 2)
+
+    def get(self):
+        """Return a valid access token, refreshing it if due."""
+        if self._token and datetime.utcnow() < self._refresh_at:
+            return self._token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            now = datetime.utcnow()
+            if self._token and now < self._refresh_at:
+                return self._token
+
+            try:
+                token, expires_at, refresh_at = self._load_or_refresh()
+            except Exception as e:
+                if self._token and now < self._expires_at:
+                    current_app.logger.warning(f'Token refresh for {self.key} failed, using current token: {str(e)}')
+                    self._refresh_at = now + timedelta(seconds=REFRESH_RETRY_SECONDS)
+                    return self._token
+                raise
+
+            self._token = token
+            self._expires_at = expires_at
+            self._refresh_at = refresh_at
+            return token
+
+    def invalidate(self, token):
+        """
+        Drop a token the provider rejected, here and in the shared row, so
+        the next get() fetches a new one. A newer token is left alone.
+        """
+        table = ProviderToken.__table__
+        with self._lock:
+            if self._token == token:
+                self._token = None
+            with db.engine.begin() as conn:
+                conn.execute(update(table).where(table.c.key == self.key, table.c.token == token).values(
+                    expires_at=datetime.utcnow(), updated_at=datetime.utcnow()
+                ))
+
+    def _load_or_refresh(self):
+        """Read the shared token, or refresh it under a row lock. Returns (token, expires_at, refresh_at)."""
+        table = ProviderToken.__table__
+
+        # Own connection so the request's session/transaction is never committed here
+        with db.engine.connect() as conn:
+            with conn.begin():
+                row = conn.execute(select(table).where(table.c.key == self.key)).first()
+            if row and row.token:
+                refresh_at = self._refresh_due(row.expires_at, row.updated_at)
+                if refresh_at > datetime.utcnow():
+                    return row.token, row.expires_at, refresh_at
+
+            if not row:
+                try:
+                    with conn.begin():
+                        conn.execute(insert(table).values(
+                            key=self.key, token='', expires_at=datetime.utcnow(), updated_at=datetime.utcnow()
+                        ))
+                except IntegrityError:
+                    pass  # Another worker created it first
+
+            with conn.begin():
+                # Waits here while another worker is refreshing, then sees its token
+                row = conn.execute(
+                    select(table).where(table.c.key == self.key).with_for_update()
+                ).first()
+                if row.token:
+                    refresh_at = self._refresh_due(row.expires_at, row.updated_at)
+                    if refresh_at > datetime.utcnow():
+                        return row.token, row.expires_at, refresh_at
+
+                token, expires_in = self.fetch()
+                issued_at = datetime.utcnow()
+                expires_at = issued_at + timedelta(seconds=int(expires_in))
+                conn.execute(update(table).where(table.c.key == self.key).values(
+                    token=token, expires_at=expires_at, updated_at=issued_at
+                ))
+                current_app.logger.info(f'Refreshed access token {self.key} (expires {expires_at.isoformat()})')
+                return token, expires_at, self._refresh_due(expires_at, issued_at)
@@ -0,0 +1,18 @@
+import base64
+from datetime import datetime
+
+
+def encode_cursor(timestamp, row_id):
+    """Encode a (timestamp, id) keyset position as an opaque URL-safe cursor."""
+    raw = f'{timestamp.isoformat() if timestamp else ""}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split('|', 1)
+        return (datetime.fromisoformat(timestamp) if timestamp else None), row_id
+    except Exception:
+        raise ValueError('Invalid cursor')
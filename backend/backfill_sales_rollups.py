@@ -0,0 +1,29 @@
+"""
+Rebuild the daily sales rollups behind the analytics dashboards.
+
+Without arguments every day from the first order to the last is rebuilt;
+--start/--end (YYYY-MM-DD, inclusive) limit the range. Safe to re-run: each
+day's rollups are replaced, a month at a time.
+
+Usage:
+    python backfill_sales_rollups.py [--start 2025-01-01] [--end 2025-12-31]
+"""
+
+import argparse
+from datetime import date
+from app import create_app
+from app.services.rollup_service import rollup_service
+
+
+parser = argparse.ArgumentParser(description='Rebuild the daily sales rollups')
+parser.add_argument('--start', type=date.fromisoformat, help='First day to rebuild (default: first order)')
+parser.add_argument('--end', type=date.fromisoformat, help='Last day to rebuild (default: last order)')
+parser.add_argument('--chunk-days', type=int, default=31, help='Days rebuilt per transaction')
+args = parser.parse_args()
+
+app = create_app()
+
+with app.app_context():
+    print("Rebuilding analytics rollups...")
+    days = rollup_service.backfill(args.start, args.end, chunk_days=args.chunk_days)
+    print(f"✓ Rebuilt rollups for {days} days")
@@ -0,0 +1,186 @@
+"""
+Benchmark the supplier dashboard queries.
+
+Seeds a throwaway supplier with --items order items (about three per order,
+two thirds of the orders paid, spread over the last year) plus a few returns,
+then times the previous seven-query dashboard against the combined
+statement in SupplierAnalyticsService.dashboard and checks both return the
+same figures. On PostgreSQL the combined statement's plan is printed too.
+Everything is rolled back at the end unless --keep is given.
+
+Usage:
+    python benchmark_supplier_dashboard.py [--items 100000] [--runs 20] [--keep]
+"""
+
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, insert, text
+from app import create_app
+from app.models import db
+from app.models.user import User, UserRole, SupplierProfile, CustomerProfile
+from app.models.address import Address
+from app.models.order import Order, OrderItem, OrderStatus, PaymentMethod, PaymentStatus
+from app.models.product import Product, Category, Brand
+from app.models.returns import Return
+from app.services.supplier_analytics import supplier_analytics_service
+
+
+parser = argparse.ArgumentParser(description='Benchmark the supplier dashboard queries')
+parser.add_argument('--items', type=int, default=100000, help='Order items to seed for the supplier')
+parser.add_argument('--runs', type=int, default=20, help='Timed runs per variant')
+parser.add_argument('--keep', action='store_true', help='Commit the seeded data instead of rolling back')
+args = parser.parse_args()
+
+CHUNK = 5000
+
+
+def seed(item_count):
+    """Create a supplier with item_count order items; returns its profile."""
+    tag = uuid.uuid4().hex[:8]
+    supplier_user = User(email=f'bench-supplier-{tag}@example.com', role=UserRole.SUPPLIER)
+    customer_user = User(email=f'bench-customer-{tag}@example.com', role=UserRole.CUSTOMER)
+    db.session.add_all([supplier_user, customer_user])
+    db.session.flush()
+
+    supplier = SupplierProfile(user_id=supplier_user.id, business_name=f'Bench {tag}', contact_person='Bench',
+                               phone_number='0700000000', mpesa_number='254700000000')
+    customer = CustomerProfile(user_id=customer_user.id, first_name='Bench', last_name=tag, phone_number='0700000000')
+    address = Address(user_id=customer_user.id, label='Home', full_name='Bench', phone_number='0700000000',
+                      address_line_1='Bench Street', city='Nairobi', county='Nairobi')
+    category = Category(name=f'Bench {tag}', slug=f'bench-{tag}')
+    brand = Brand(name=f'Bench {tag}')
+    db.session.add_all([supplier, customer, address, category, brand])
+    db.session.flush()
+
+    products = []
+    for i in range(20):
+        price = 500 * (i + 1)
+        product = Product(supplier_id=supplier.id, category_id=category.id, brand_id=brand.id,
+                          name=f'Bench {tag} {i}', slug=f'bench-{tag}-{i}', short_description='Benchmark product',
+                          long_description='Benchmark product', warranty_period_months=12, price=price,
+                          supplier_earnings=price * 0.75, platform_commission=price * 0.25,
+                          stock_quantity=random.randint(0, 40), is_active=i % 5 != 0)
+        products.append(product)
+    db.session.add_all(products)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    orders, items, returns = [], [], []
+    remaining = item_count
+    while remaining > 0:
+        order_id = str(uuid.uuid4())
+        count = min(remaining, random.randint(1, 5))
+        remaining -= count
+        paid = random.random() < 2 / 3
+        subtotal = 0
+        for _ in range(count):
+            product = random.choice(products)
+            quantity = random.randint(1, 3)
+            line = float(product.price) * quantity
+            subtotal += line
+            items.append({
+                'id': str(uuid.uuid4()), 'order_id': order_id, 'product_id': product.id,
+                'supplier_id': supplier.id, 'product_name': product.name, 'product_price': product.price,
+                'quantity': quantity, 'subtotal': line, 'supplier_earnings': line * 0.75,
+                'platform_commission': line * 0.25, 'warranty_period_months': 12,
+            })
+        orders.append({
+            'id': order_id, 'order_number': f'BENCH-{tag}-{len(orders)}', 'customer_id': customer.id,
+            'delivery_address_id': address.id, 'delivery_zone': 'Nairobi', 'delivery_fee': 300,
+            'subtotal': subtotal, 'total': subtotal + 300, 'payment_method': PaymentMethod.MPESA,
+            'payment_status': PaymentStatus.COMPLETED if paid else PaymentStatus.PENDING,
+            'status': OrderStatus.DELIVERED if paid else OrderStatus.PENDING,
+            'created_at': now - timedelta(minutes=random.randint(0, 365 * 24 * 60)),
+        })
+        if paid and random.random() < 0.03:
+            returns.append({'order_id': order_id, 'user_id': customer_user.id, 'reason': 'Benchmark',
+                            'status': 'pending', 'refund_amount': 0})
+
+    for table, rows in ((Order, orders), (OrderItem, items), (Return, returns)):
+        for start in range(0, len(rows), CHUNK):
+            db.session.execute(insert(table), rows[start:start + CHUNK])
+    print(f"  Seeded {len(orders)} orders, {len(items)} items and {len(returns)} returns")
+    return supplier
+
+
+def legacy_dashboard(supplier):
+    """The dashboard as it was computed before: one query per figure."""
+    supplier_id = supplier.id
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    total_products = Product.query.filter_by(supplier_id=supplier_id).count()
+    active_products = Product.query.filter_by(supplier_id=supplier_id, is_active=True).count()
+    total_orders = db.session.query(Order.id).join(OrderItem).filter(OrderItem.supplier_id == supplier_id).distinct().count()
+    month_sales = db.session.query(func.sum(OrderItem.supplier_earnings)).join(Order).filter(
+        OrderItem.supplier_id == supplier_id, Order.payment_status == PaymentStatus.COMPLETED,
+        Order.created_at >= month_start
+    ).scalar() or 0
+    items_sold = db.session.query(func.sum(OrderItem.quantity)).join(Order).filter(
+        OrderItem.supplier_id == supplier_id, Order.payment_status == PaymentStatus.COMPLETED
+    ).scalar() or 0
+    total_returns = db.session.query(func.count(Return.id.distinct()))\
+        .join(Order, Return.order_id == Order.id)\
+        .join(OrderItem, OrderItem.order_id == Order.id)\
+        .filter(OrderItem.supplier_id == supplier_id).scalar() or 0
+    low_stock = Product.query.filter(
+        Product.supplier_id == supplier_id, Product.is_active == True,
+        Product.stock_quantity <= Product.low_stock_threshold
+    ).count()
+    return {
+        'products': {'total': total_products, 'active': active_products, 'low_stock': low_stock},
+        'orders': {'total': total_orders, 'items_sold': int(items_sold)},
+        'earnings': {'total': float(supplier.total_sales), 'pending': float(supplier.outstanding_balance),
+                     'this_month': float(month_sales)},
+        'returns': total_returns
+    }
+
+
+def timed(label, fn, runs):
+    fn()  # Warm up
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"  {label:<10} mean {statistics.mean(samples):8.2f} ms   p50 {samples[len(samples) // 2]:8.2f} ms   p95 {p95:8.2f} ms")
+    return result
+
+
+app = create_app()
+
+with app.app_context():
+    print(f"Seeding a supplier with {args.items} order items...")
+    supplier = seed(args.items)
+    is_postgres = db.engine.dialect.name == 'postgresql'
+    if is_postgres:
+        db.session.execute(text('ANALYZE orders, order_items, returns, products'))
+
+    print(f"Timing {args.runs} runs each...")
+    legacy = timed('legacy', lambda: legacy_dashboard(supplier), args.runs)
+    combined = timed('combined', lambda: supplier_analytics_service.dashboard(supplier), args.runs)
+    print("✓ Results match" if legacy == combined else f"✗ Results differ:\n  legacy   {legacy}\n  combined {combined}")
+
+    if is_postgres:
+        print("\nCombined statement plan:")
+        captured = []
+        listener = lambda conn, cursor, statement, parameters, context, executemany: captured.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        supplier_analytics_service.dashboard(supplier)
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        statement, parameters = captured[-1]
+        for (line,) in db.session.connection().exec_driver_sql(
+            'EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters
+        ):
+            print(f"  {line}")
+
+    if args.keep:
+        db.session.commit()
+        print(f"\nKept the seeded data (supplier {supplier.id})")
+    else:
+        db.session.rollback()
+        print("\nRolled back the seeded data")
@@ -0,0 +1,520 @@
+"""
+Compare the admin financial report against the original per-item implementation.
+
+legacy_report() is the report loop as it was before the grouped-query rewrite
+(app/services/financial_report.py), kept here as the reference. Both are run
+over several date ranges against the configured database and every number is
+compared within 0.01; list sections are compared regardless of order.
+
+Usage:
+    python compare_financial_report.py [START_DATE END_DATE ...]
+"""
+
+import sys
+from datetime import datetime, timedelta
+from flask import current_app
+from app import create_app
+from app.models import db
+from app.models.user import User, UserRole, SupplierProfile
+from app.models.order import Order, OrderItem, OrderStatus, PaymentStatus
+from app.models.product import Product
+from app.models.returns import Return, SupplierPayout
+from app.services.financial_report import financial_report_service
+
+TOLERANCE = 0.01
+
+# Keys identifying an entry in each list section of the report
+LIST_KEYS = {
+    'by_category': 'category',
+    'by_supplier': 'supplier',
+    'by_policy': 'policy',
+    'payment_methods': 'method',
+}
+
+
+def legacy_report(start_date=None, end_date=None):
+    """The financial report computed the original way: load every order and walk its items."""
+    query = Order.query.filter(Order.payment_status == PaymentStatus.COMPLETED)
+
+    if start_date:
+        query = query.filter(Order.created_at >= datetime.fromisoformat(start_date))
+    if end_date:
+        end_dt = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
+        query = query.filter(Order.created_at <= end_dt)
+
+    orders = query.all()
+
+    # Initialize metrics
+    total_revenue = 0
+    total_subtotal = 0
+    total_delivery_fees = 0
+    total_commission = 0
+    total_supplier_earnings = 0
+    payment_method_breakdown = {'mpesa': 0, 'card': 0, 'cash': 0}
+    category_revenue = {}
+    supplier_revenue = {}
+
+    # Calculate order metrics
+    for order in orders:
+        total_revenue += float(order.total)
+        total_subtotal += float(order.subtotal)
+        total_delivery_fees += float(order.delivery_fee)
+
+        # Payment method breakdown
+        method = order.payment_method.value if hasattr(order.payment_method, 'value') else str(order.payment_method)
+        payment_method_breakdown[method] = payment_method_breakdown.get(method, 0) + float(order.total)
+
+        # Process order items
+        for item in order.items:
+            total_commission += float(item.platform_commission)
+            total_supplier_earnings += float(item.supplier_earnings)
+
+            # Category revenue
+            if item.product_id:
+                product = Product.query.get(item.product_id)
+                if product and product.category:
+                    cat_name = product.category.name
+                    category_revenue[cat_name] = category_revenue.get(cat_name, 0) + float(item.subtotal)
+
+            # Supplier revenue
+            if item.supplier_id:
+                supplier = SupplierProfile.query.get(item.supplier_id)
+                if supplier:
+                    supplier_name = supplier.business_name
+                    if supplier_name not in supplier_revenue:
+                        supplier_revenue[supplier_name] = {
+                            'revenue': 0,
+                            'earnings': 0,
+                            'orders': 0
+                        }
+                    supplier_revenue[supplier_name]['revenue'] += float(item.subtotal)
+                    supplier_revenue[supplier_name]['earnings'] += float(item.supplier_earnings)
+                    supplier_revenue[supplier_name]['orders'] += 1
+
+    # Calculate refunds - separate by who pays
+    try:
+        returns_query = Return.query.filter(
+            Return.status.in_(['approved', 'completed', 'refund_completed'])
+        )
+        if start_date:
+            returns_query = returns_query.filter(Return.created_at >= datetime.fromisoformat(start_date))
+        if end_date:
+            end_dt = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
+            returns_query = returns_query.filter(Return.created_at <= end_dt)
+
+        returns = returns_query.all()
+        total_refunds_to_customers = sum(float(r.customer_refund or r.refund_amount or 0) for r in returns)
+        platform_paid_refunds = sum(float(r.platform_deduction or 0) for r in returns)
+        supplier_paid_refunds = sum(float(r.supplier_deduction or 0) for r in returns)
+        refund_count = len(returns)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Returns query error: {str(e)}')
+        returns = []
+        total_refunds_to_customers = 0
+        platform_paid_refunds = 0
+        supplier_paid_refunds = 0
+        refund_count = 0
+
+    # Calculate supplier payouts
+    try:
+        payouts_query = SupplierPayout.query.filter_by(status='completed')
+        if start_date:
+            payouts_query = payouts_query.filter(SupplierPayout.paid_at >= datetime.fromisoformat(start_date))
+        if end_date:
+            end_dt = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
+            payouts_query = payouts_query.filter(SupplierPayout.paid_at <= end_dt)
+
+        payouts = payouts_query.all()
+        total_payouts = sum(float(p.amount) for p in payouts)
+        payout_count = len(payouts)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Payouts query error: {str(e)}')
+        payouts = []
+        total_payouts = 0
+        payout_count = 0
+
+    # Calculate pending payouts
+    try:
+        pending_payouts = SupplierPayout.query.filter_by(status='pending').all()
+        total_pending_payouts = sum(float(p.amount) for p in pending_payouts)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Pending payouts query error: {str(e)}')
+        pending_payouts = []
+        total_pending_payouts = 0
+
+    # Calculate delivery agent earnings
+    delivery_query = Order.query.filter(
+        Order.status == OrderStatus.DELIVERED,
+        Order.assigned_delivery_agent.isnot(None)
+    )
+    if start_date:
+        delivery_query = delivery_query.filter(Order.created_at >= datetime.fromisoformat(start_date))
+    if end_date:
+        end_dt = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
+        delivery_query = delivery_query.filter(Order.created_at <= end_dt)
+
+    # Calculate delivery agent earnings (what we owe them)
+    delivered_orders = delivery_query.all()
+    total_delivery_fees_collected = sum(float(o.delivery_fee) for o in delivered_orders)
+    delivery_agent_share = sum(float(o.delivery_fee) * 0.7 for o in delivered_orders)  # 70% to agent
+    platform_delivery_earnings = sum(float(o.delivery_fee) * 0.3 for o in delivered_orders)  # 30% to platform
+
+    # Calculate net metrics
+    net_revenue = total_revenue - total_refunds_to_customers
+
+    # Platform's actual earnings breakdown:
+    # 1. Commission from products (25%)
+    # 2. Cut from delivery fees (30%)
+    # Total platform earnings before payouts
+    platform_gross_earnings = total_commission + platform_delivery_earnings
+
+    # Platform net earnings after only the refunds IT paid
+    platform_net_earnings = platform_gross_earnings - platform_paid_refunds
+
+    # Calculate margins and ratios
+    commission_rate = (total_commission / total_subtotal * 100) if total_subtotal > 0 else 0
+    refund_rate = (refund_count / len(orders) * 100) if orders else 0
+    avg_order_value = total_revenue / len(orders) if orders else 0
+
+    # Top categories
+    top_categories = sorted(
+        [{'name': k, 'revenue': v} for k, v in category_revenue.items()],
+        key=lambda x: x['revenue'],
+        reverse=True
+    )[:10]
+
+    # Top suppliers
+    top_suppliers = sorted(
+        [{'name': k, **v} for k, v in supplier_revenue.items()],
+        key=lambda x: x['revenue'],
+        reverse=True
+    )[:10]
+
+    # ===== ADDITIONAL COMPREHENSIVE METRICS =====
+
+    # 1. CASH FLOW ANALYSIS
+    outstanding_supplier_payouts = total_supplier_earnings - total_payouts
+    outstanding_delivery_payouts = delivery_agent_share - 0  # Assume no delivery payouts tracked yet
+    pending_orders_query = Order.query.filter(Order.payment_status == PaymentStatus.PENDING)
+    if start_date:
+        pending_orders_query = pending_orders_query.filter(Order.created_at >= datetime.fromisoformat(start_date))
+    if end_date:
+        pending_orders_query = pending_orders_query.filter(Order.created_at <= datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59))
+    expected_incoming = sum(float(o.total) for o in pending_orders_query.all())
+
+    # 2. PROFIT MARGINS
+    gross_profit = platform_gross_earnings
+    gross_profit_margin = (gross_profit / total_revenue * 100) if total_revenue > 0 else 0
+    net_profit_margin = (platform_net_earnings / total_revenue * 100) if total_revenue > 0 else 0
+    profit_per_order = platform_net_earnings / len(orders) if orders else 0
+
+    # 3. GROWTH METRICS (compare to previous period)
+    if start_date and end_date:
+        period_days = (datetime.fromisoformat(end_date) - datetime.fromisoformat(start_date)).days
+        prev_start = (datetime.fromisoformat(start_date) - timedelta(days=period_days)).isoformat()
+        prev_end = start_date
+
+
+        prev_orders = Order.query.filter(
+            Order.payment_status == PaymentStatus.COMPLETED,
+            Order.created_at >= datetime.fromisoformat(prev_start),
+            Order.created_at < datetime.fromisoformat(prev_end)
+        ).all()
+
+        prev_revenue = sum(float(o.total) for o in prev_orders)
+
+        # Calculate growth - return None if no previous data to indicate "N/A"
+        if prev_revenue > 0:
+            revenue_growth = ((total_revenue - prev_revenue) / prev_revenue * 100)
+        else:
+            revenue_growth = None  # No previous data
+
+        if len(prev_orders) > 0:
+            order_growth = ((len(orders) - len(prev_orders)) / len(prev_orders) * 100)
+        else:
+            order_growth = None  # No previous data
+
+
+        # Customer acquisition (new customers in period)
+        new_customers = User.query.filter(
+            User.role == UserRole.CUSTOMER,
+            User.created_at >= datetime.fromisoformat(start_date),
+            User.created_at <= datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
+        ).count()
+        customer_acquisition_cost = (platform_gross_earnings / new_customers) if new_customers > 0 else 0
+    else:
+        revenue_growth = 0
+        order_growth = 0
+        new_customers = 0
+        customer_acquisition_cost = 0
+
+    # 4. OPERATIONAL COSTS (estimated transaction fees)
+    # M-Pesa: ~1.5% fee, Paystack: ~2.9% + KES 100
+    mpesa_revenue = payment_method_breakdown.get('mpesa', 0)
+    card_revenue = payment_method_breakdown.get('card', 0)
+    mpesa_fees = mpesa_revenue * 0.015
+    paystack_fees = (card_revenue * 0.029) + (100 * len([o for o in orders if o.payment_method.value == 'card']))
+    total_transaction_fees = mpesa_fees + paystack_fees
+
+    # 5. TAX INFORMATION (16% VAT in Kenya)
+    vat_rate = 0.16
+    vat_collected = total_revenue * (vat_rate / (1 + vat_rate))  # VAT inclusive
+    tax_liability = platform_net_earnings * 0.30  # Estimated 30% corporate tax
+
+    # 6. SUPPLIER PERFORMANCE
+    supplier_performance = []
+    try:
+        for supplier_name, data in supplier_revenue.items():
+            supplier_profile = SupplierProfile.query.filter_by(business_name=supplier_name).first()
+            if supplier_profile:
+                supplier_payouts_made = sum(float(p.amount) for p in payouts if p.supplier_id == supplier_profile.id)
+                pending_payout = data['earnings'] - supplier_payouts_made
+
+                # Calculate average payout time
+                supplier_completed_payouts = [p for p in payouts if p.supplier_id == supplier_profile.id and p.paid_at]
+                if supplier_completed_payouts:
+                    avg_payout_days = sum(
+                        (p.paid_at - p.created_at).days for p in supplier_completed_payouts
+                    ) / len(supplier_completed_payouts)
+                else:
+                    avg_payout_days = 0
+
+                supplier_performance.append({
+                    'name': supplier_name,
+                    'revenue': data['revenue'],
+                    'earnings': data['earnings'],
+                    'orders': data['orders'],
+                    'paid_out': supplier_payouts_made,
+                    'pending_payout': pending_payout,
+                    'avg_payout_days': round(avg_payout_days, 1)
+                })
+
+        supplier_performance = sorted(supplier_performance, key=lambda x: x['revenue'], reverse=True)[:10]
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Supplier performance error: {str(e)}')
+        supplier_performance = []
+
+    # 7. RETURN RATE ANALYSIS
+    # By category
+    return_by_category = {}
+    return_by_supplier = {}
+    return_by_policy = {}
+
+    try:
+        for ret in returns:
+            if ret.product_id:
+                product = Product.query.get(ret.product_id)
+                if product and product.category:
+                    cat_name = product.category.name
+                    if cat_name not in return_by_category:
+                        return_by_category[cat_name] = {'count': 0, 'amount': 0}
+                    return_by_category[cat_name]['count'] += 1
+                    return_by_category[cat_name]['amount'] += float(ret.customer_refund or ret.refund_amount or 0)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Return by category error: {str(e)}')
+
+    # By supplier
+    try:
+        for ret in returns:
+            if ret.order_item_id:
+                item = OrderItem.query.get(ret.order_item_id)
+                if item and item.supplier_id:
+                    supplier = SupplierProfile.query.get(item.supplier_id)
+                    if supplier:
+                        sup_name = supplier.business_name
+                        if sup_name not in return_by_supplier:
+                            return_by_supplier[sup_name] = {'count': 0, 'amount': 0}
+                        return_by_supplier[sup_name]['count'] += 1
+                        return_by_supplier[sup_name]['amount'] += float(ret.customer_refund or ret.refund_amount or 0)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Return by supplier error: {str(e)}')
+
+    # By policy
+    try:
+        for ret in returns:
+            policy = ret.refund_policy or 'unknown'
+            if policy not in return_by_policy:
+                return_by_policy[policy] = {'count': 0, 'platform_cost': 0, 'supplier_cost': 0}
+            return_by_policy[policy]['count'] += 1
+            return_by_policy[policy]['platform_cost'] += float(ret.platform_deduction or 0)
+            return_by_policy[policy]['supplier_cost'] += float(ret.supplier_deduction or 0)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Return by policy error: {str(e)}')
+
+    return {
+        # Revenue Metrics
+        'revenue': {
+            'total_revenue': float(total_revenue),
+            'total_subtotal': float(total_subtotal),
+            'total_delivery_fees': float(total_delivery_fees),
+            'net_revenue': float(net_revenue),
+            'avg_order_value': float(avg_order_value)
+        },
+
+        # Commission & Earnings
+        'earnings': {
+            'total_commission': float(total_commission),
+            'total_supplier_earnings': float(total_supplier_earnings),
+            'total_delivery_fees_collected': float(total_delivery_fees_collected),
+            'delivery_agent_share': float(delivery_agent_share),
+            'platform_delivery_earnings': float(platform_delivery_earnings),
+            'platform_gross_earnings': float(platform_gross_earnings),
+            'platform_net_earnings': float(platform_net_earnings),
+            'commission_rate': float(commission_rate)
+        },
+
+        # Cash Flow Analysis
+        'cash_flow': {
+            'outstanding_supplier_payouts': float(outstanding_supplier_payouts),
+            'outstanding_delivery_payouts': float(outstanding_delivery_payouts),
+            'expected_incoming_revenue': float(expected_incoming),
+            'net_cash_position': float(platform_net_earnings - outstanding_supplier_payouts - outstanding_delivery_payouts)
+        },
+
+        # Profit Margins
+        'profit_margins': {
+            'gross_profit': float(gross_profit),
+            'gross_profit_margin': float(gross_profit_margin),
+            'net_profit_margin': float(net_profit_margin),
+            'profit_per_order': float(profit_per_order)
+        },
+
+        # Growth Metrics
+        'growth': {
+            'revenue_growth': float(revenue_growth) if revenue_growth is not None else None,
+            'order_growth': float(order_growth) if order_growth is not None else None,
+            'new_customers': new_customers,
+            'customer_acquisition_cost': float(customer_acquisition_cost),
+            'has_comparison_data': revenue_growth is not None
+        },
+
+        # Operational Costs
+        'operational_costs': {
+            'mpesa_fees': float(mpesa_fees),
+            'paystack_fees': float(paystack_fees),
+            'total_transaction_fees': float(total_transaction_fees),
+            'net_after_fees': float(platform_net_earnings - total_transaction_fees)
+        },
+
+        # Tax Information
+        'tax': {
+            'vat_collected': float(vat_collected),
+            'vat_rate': float(vat_rate * 100),
+            'estimated_tax_liability': float(tax_liability),
+            'net_after_tax': float(platform_net_earnings - tax_liability)
+        },
+
+        # Payouts
+        'payouts': {
+            'total_payouts': float(total_payouts),
+            'payout_count': payout_count,
+            'pending_payouts': float(total_pending_payouts),
+            'pending_count': len(pending_payouts)
+        },
+
+        # Refunds
+        'refunds': {
+            'total_refunds_to_customers': float(total_refunds_to_customers),
+            'platform_paid_refunds': float(platform_paid_refunds),
+            'supplier_paid_refunds': float(supplier_paid_refunds),
+            'refund_count': refund_count,
+            'refund_rate': float(refund_rate)
+        },
+
+        # Return Analysis
+        'return_analysis': {
+            'by_category': [{'category': k, **v} for k, v in return_by_category.items()],
+            'by_supplier': [{'supplier': k, **v} for k, v in return_by_supplier.items()],
+            'by_policy': [{'policy': k, **v} for k, v in return_by_policy.items()]
+        },
+
+        # Order Metrics
+        'orders': {
+            'total_orders': len(orders),
+            'delivered_orders': len(delivered_orders)
+        },
+
+        # Payment Methods
+        'payment_methods': [
+            {'method': k, 'amount': float(v)}
+            for k, v in payment_method_breakdown.items()
+            if v > 0
+        ],
+
+        # Top Performers
+        'top_categories': top_categories,
+        'top_suppliers': top_suppliers,
+        'supplier_performance': supplier_performance,
+
+        # Date Range
+        'period': {
+            'start_date': start_date,
+            'end_date': end_date
+        }
+    }
+
+
+def _normalize(value, key=None):
+    """Turn list sections into dicts keyed by name so ordering does not matter."""
+    if isinstance(value, dict):
+        return {k: _normalize(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        name = LIST_KEYS.get(key, 'name')
+        return {str(entry.get(name)): _normalize(entry) for entry in value}
+    return value
+
+
+def diff(expected, actual, path=''):
+    """Yield a line per value that differs between two normalized reports."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(set(expected) | set(actual), key=str):
+            if key not in actual or key not in expected:
+                yield f'{path}.{key}: expected {expected.get(key)!r}, got {actual.get(key)!r}'
+            else:
+                yield from diff(expected[key], actual[key], f'{path}.{key}')
+    elif isinstance(expected, (int, float)) and isinstance(actual, (int, float)) \
+            and not isinstance(expected, bool) and not isinstance(actual, bool):
+        if abs(expected - actual) > TOLERANCE:
+            yield f'{path}: expected {expected}, got {actual}'
+    elif expected != actual:
+        yield f'{path}: expected {expected!r}, got {actual!r}'
+
+
+def default_ranges():
+    today = datetime.utcnow().date()
+    return [
+        (None, None),
+        ((today - timedelta(days=7)).isoformat(), today.isoformat()),
+        ((today - timedelta(days=30)).isoformat(), today.isoformat()),
+        ((today - timedelta(days=365)).isoformat(), today.isoformat()),
+        ((today + timedelta(days=1)).isoformat(), (today + timedelta(days=30)).isoformat()),
+    ]
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    ranges = list(zip(args[::2], args[1::2])) if args else default_ranges()
+
+    app = create_app()
+    with app.app_context():
+        failures = 0
+        for start_date, end_date in ranges:
+            expected = _normalize(legacy_report(start_date, end_date))
+            actual = _normalize(financial_report_service.build(start_date, end_date))
+            differences = list(diff(expected, actual))
+            label = f'{start_date or "-"} .. {end_date or "-"}'
+            if differences:
+                failures += 1
+                print(f'MISMATCH {label}')
+                for line in differences:
+                    print(f'  {line}')
+            else:
+                print(f'OK {label}')
+        sys.exit(1 if failures else 0)
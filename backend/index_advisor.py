@@ -0,0 +1,197 @@
+"""
+Index advisor for the hottest order queries.
+
+Runs EXPLAIN on a catalogue of the app's real order queries (agent queues,
+COD collections, payment lookups, reconciliation, confirmations, sales
+reports) with sample ids taken from the database, and flags every
+sequential scan on a table with at least --min-rows rows. Each flagged query
+is explained again with enable_seqscan off to tell "the planner preferred a
+scan" apart from "no index can serve this". Run it against a seeded
+database (seed_all.py, or benchmark_supplier_dashboard.py --keep); the
+planner rightly scans small tables. Tables without statistics are
+analysed first.
+
+Exits with status 1 when any query is flagged, so it can gate CI.
+
+Usage:
+    python index_advisor.py [--analyze] [--min-rows 1000] [--only delivery.]
+"""
+
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, select, text
+from app import create_app
+from app.models import db
+from app.models.order import Order, OrderItem, OrderStatus, PaymentMethod, PaymentStatus
+from app.services.payment_reconciler import PaymentReconciler
+
+
+parser = argparse.ArgumentParser(description='EXPLAIN the hot order queries and flag sequential scans')
+parser.add_argument('--analyze', action='store_true', help='Use EXPLAIN ANALYZE (runs the queries)')
+parser.add_argument('--min-rows', type=int, default=1000, help='Ignore sequential scans on smaller tables')
+parser.add_argument('--only', default='', help='Only queries whose name starts with this prefix')
+args = parser.parse_args()
+
+MISSING_ID = '00000000-0000-0000-0000-000000000000'
+AGENT_PENDING = [OrderStatus.PAID, OrderStatus.PROCESSING, OrderStatus.SHIPPED]
+
+
+def busiest(column):
+    """The most frequent non-null value of an orders column, as a realistic sample."""
+    value = db.session.query(column).filter(column.isnot(None))\
+        .group_by(column).order_by(func.count().desc()).limit(1).scalar()
+    return value or MISSING_ID
+
+
+def samples():
+    now = datetime.utcnow()
+    return {
+        'now': now,
+        'agent': busiest(Order.assigned_delivery_agent),
+        'collector': busiest(Order.cod_collected_by),
+        'customer': busiest(Order.customer_id),
+        'supplier': db.session.query(OrderItem.supplier_id).limit(1).scalar() or MISSING_ID,
+        'reference': db.session.query(Order.payment_reference)
+            .filter(Order.payment_reference.isnot(None)).limit(1).scalar() or 'ws_CO_000000000000',
+    }
+
+
+# (name, where it runs, statement builder)
+CATALOGUE = [
+    ('delivery.agent_orders', 'GET /delivery/orders?status=pending', lambda s: select(Order).where(
+        Order.assigned_delivery_agent == s['agent'], Order.status.in_(AGENT_PENDING)
+    ).order_by(Order.created_at.desc()).limit(20)),
+    ('delivery.agent_delivered', 'GET /delivery/orders?status=delivered', lambda s: select(Order).where(
+        Order.assigned_delivery_agent == s['agent'], Order.status == OrderStatus.DELIVERED
+    ).order_by(Order.created_at.desc()).limit(20)),
+    ('delivery.agent_load', 'dispatch: open orders per agent', lambda s: select(func.count(Order.id)).where(
+        Order.assigned_delivery_agent == s['agent'], Order.status.in_(AGENT_PENDING)
+    )),
+    ('delivery.cod_collections', 'GET /delivery/cod-collections', lambda s: select(Order).where(
+        Order.cod_collected_by == s['collector'], Order.cod_collected_at.isnot(None)
+    ).order_by(Order.cod_collected_at.desc()).limit(20)),
+    ('delivery.agent_cod_30d', 'GET /admin/delivery-agents/<id>/stats', lambda s: select(
+        func.sum(Order.cod_amount_collected)
+    ).where(Order.cod_collected_by == s['collector'], Order.cod_collected_at >= s['now'] - timedelta(days=30))),
+    ('delivery.pending_confirmations', 'GET /delivery/admin/pending-confirmations', lambda s: select(Order).where(
+        Order.delivery_confirmed_by_agent == True,
+        Order.customer_confirmed_delivery == False,
+        Order.customer_dispute == False
+    ).order_by(Order.auto_confirm_deadline.asc()).limit(20)),
+    ('admin.cod_unverified', 'GET /admin/orders/cod-collected', lambda s: select(Order).where(
+        Order.payment_method == PaymentMethod.CASH,
+        Order.cod_collected_at.isnot(None),
+        Order.cod_verified_at.is_(None)
+    ).order_by(Order.cod_collected_at.desc()).limit(20)),
+    ('jobs.auto_confirm_due', 'hourly auto-confirm job', lambda s: select(Order.id).where(
+        Order.delivery_confirmed_by_agent == True,
+        Order.customer_confirmed_delivery == False,
+        Order.customer_dispute == False,
+        Order.auto_confirmed == False,
+        Order.auto_confirm_deadline <= s['now']
+    )),
+    ('jobs.reconcile_pending', 'payment reconciliation job', lambda s: PaymentReconciler._pending_orders().filter(
+        Order.created_at <= s['now'] - timedelta(minutes=10),
+        or_(Order.payment_checked_at.is_(None), Order.payment_checked_at <= s['now'] - timedelta(minutes=10))
+    ).order_by(Order.created_at).limit(100).statement),
+    ('payments.by_reference', 'M-Pesa / Paystack callbacks', lambda s: select(Order).where(
+        Order.payment_reference == s['reference']
+    )),
+    ('orders.customer_history', 'GET /orders', lambda s: select(Order).where(
+        Order.customer_id == s['customer']
+    ).order_by(Order.created_at.desc()).limit(20)),
+    ('reports.paid_orders_30d', 'financial report / analytics', lambda s: select(
+        func.count(Order.id), func.sum(Order.total)
+    ).where(Order.payment_status == PaymentStatus.COMPLETED, Order.created_at >= s['now'] - timedelta(days=30))),
+    ('supplier.dashboard_items', 'GET /supplier/dashboard', lambda s: select(
+        func.count(func.distinct(OrderItem.order_id)), func.sum(OrderItem.quantity)
+    ).join(Order, Order.id == OrderItem.order_id).where(OrderItem.supplier_id == s['supplier'])),
+]
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def explain(stmt, analyze=False):
+    """The JSON plan for a statement, with its parameters inlined."""
+    sql = str(stmt.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+    (plan,) = db.session.execute(text(f'EXPLAIN ({options}) {sql}')).one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def table_rows():
+    """
+    Planner row estimates for every table. Tables that were never analysed
+    (reltuples -1, or 0 before PostgreSQL 14) are analysed first, so on a
+    freshly seeded database neither the plans nor --min-rows see empty tables.
+    """
+    never_analyzed = db.session.execute(text(
+        "SELECT relname FROM pg_stat_user_tables "
+        "WHERE schemaname = current_schema() AND last_analyze IS NULL AND last_autoanalyze IS NULL"
+    )).scalars().all()
+    for name in never_analyzed:
+        db.session.execute(text(f'ANALYZE "{name}"'))
+    if never_analyzed:
+        db.session.commit()  # Keep the statistics (ANALYZE is transactional)
+
+    rows = {}
+    for name, estimate in db.session.execute(text(
+        "SELECT c.relname, c.reltuples FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind = 'r' AND n.nspname = current_schema()"
+    )):
+        if estimate < 0:
+            # Still no statistics (e.g. ANALYZE not permitted): count instead
+            estimate = db.session.execute(text(f'SELECT count(*) FROM "{name}"')).scalar()
+        rows[name] = int(estimate)
+    return rows
+
+
+app = create_app()
+
+with app.app_context():
+    if db.engine.dialect.name != 'postgresql':
+        print("The index advisor needs PostgreSQL (EXPLAIN output differs on other databases)")
+        sys.exit(2)
+
+    sample = samples()
+    rows = table_rows()
+    flagged = 0
+
+    print(f"Explaining {len(CATALOGUE)} queries (sequential scans flagged on tables with >= {args.min_rows} rows)\n")
+    for name, source, build in CATALOGUE:
+        if not name.startswith(args.only):
+            continue
+        stmt = build(sample)
+        result = explain(stmt, analyze=args.analyze)
+        nodes = list(plan_nodes(result['Plan']))
+        indexes = sorted({n['Index Name'] for n in nodes if 'Index Name' in n})
+        scans = sorted({n['Relation Name'] for n in nodes
+                        if n['Node Type'] == 'Seq Scan' and rows.get(n['Relation Name'], 0) >= args.min_rows})
+
+        timing = f"{result['Execution Time']:.2f} ms" if args.analyze else f"cost {result['Plan']['Total Cost']:.0f}"
+        print(f"{'✗' if scans else '✓'} {name:<32} {timing:>14}  {source}")
+        print(f"    indexes: {', '.join(indexes) or '-'}")
+
+        if scans:
+            flagged += 1
+            # Would an index serve it at all? Ask again with sequential scans priced out
+            db.session.execute(text('SET LOCAL enable_seqscan = off'))
+            forced = list(plan_nodes(explain(stmt)['Plan']))
+            db.session.execute(text('SET LOCAL enable_seqscan = on'))
+            usable = sorted({n['Index Name'] for n in forced if 'Index Name' in n})
+            still_scanned = sorted({n['Relation Name'] for n in forced if n['Node Type'] == 'Seq Scan'})
+            for table in scans:
+                verdict = 'no usable index' if table in still_scanned else f"planner chose a scan over {', '.join(usable)}"
+                print(f"    seq scan on {table} (~{rows[table]} rows): {verdict}")
+
+    db.session.rollback()
+    print(f"\n{flagged} queries flagged" if flagged else "\n✓ No sequential scans on large tables")
+    sys.exit(1 if flagged else 0)
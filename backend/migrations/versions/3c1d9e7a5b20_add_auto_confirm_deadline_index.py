@@ -0,0 +1,33 @@
+"""Add partial index for due delivery auto-confirmations
+
+Revision ID: 3c1d9e7a5b20
+Revises: 7f2056a3049f
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1d9e7a5b20'
+down_revision = '7f2056a3049f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_orders_auto_confirm_due',
+        'orders',
+        ['auto_confirm_deadline'],
+        unique=False,
+        postgresql_where=sa.text(
+            'delivery_confirmed_by_agent AND NOT customer_confirmed_delivery '
+            'AND NOT customer_dispute AND NOT auto_confirmed'
+        )
+    )
+
+
+def downgrade():
+    op.drop_index('ix_orders_auto_confirm_due', table_name='orders')
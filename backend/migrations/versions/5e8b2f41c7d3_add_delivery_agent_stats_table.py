@@ -0,0 +1,35 @@
+"""Add delivery agent stats table
+
+Revision ID: 5e8b2f41c7d3
+Revises: 3c1d9e7a5b20
+Create Date: 2026-10-18 10:02:17.463921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b2f41c7d3'
+down_revision = '3c1d9e7a5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('delivery_agent_stats',
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('pending_deliveries', sa.Integer(), nullable=False),
+    sa.Column('delivered_today', sa.Integer(), nullable=False),
+    sa.Column('cod_collected_today', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('cod_pending_verification', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('stats_date', sa.Date(), nullable=False),
+    sa.Column('reconciled_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('delivery_agent_stats')
@@ -0,0 +1,50 @@
+"""Add geospatial delivery columns
+
+Revision ID: 8a4c6d2e9f15
+Revises: 5e8b2f41c7d3
+Create Date: 2026-10-18 11:20:44.205731
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4c6d2e9f15'
+down_revision = '5e8b2f41c7d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('addresses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+    with op.batch_alter_table('delivery_zones', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('boundary', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('hub_latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('hub_longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('fee_per_km', sa.Numeric(precision=10, scale=2), nullable=True))
+
+    with op.batch_alter_table('delivery_agent_profiles', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('current_latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('current_longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('location_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('delivery_agent_profiles', schema=None) as batch_op:
+        batch_op.drop_column('location_updated_at')
+        batch_op.drop_column('current_longitude')
+        batch_op.drop_column('current_latitude')
+
+    with op.batch_alter_table('delivery_zones', schema=None) as batch_op:
+        batch_op.drop_column('fee_per_km')
+        batch_op.drop_column('hub_longitude')
+        batch_op.drop_column('hub_latitude')
+        batch_op.drop_column('boundary')
+
+    with op.batch_alter_table('addresses', schema=None) as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
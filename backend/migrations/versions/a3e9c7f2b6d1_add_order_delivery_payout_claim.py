@@ -0,0 +1,49 @@
+"""Add delivery payout claim to orders
+
+Revision ID: a3e9c7f2b6d1
+Revises: f1c5a8e3d7b2
+Create Date: 2026-10-18 19:12:44.108372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3e9c7f2b6d1'
+down_revision = 'f1c5a8e3d7b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('delivery_payout_id', sa.String(length=36), nullable=True))
+        batch_op.create_foreign_key('fk_orders_delivery_payout_id', 'delivery_payouts', ['delivery_payout_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_orders_delivery_payout_id'), ['delivery_payout_id'], unique=False)
+
+    op.create_index(
+        'ix_orders_delivery_fee_unclaimed',
+        'orders',
+        ['assigned_delivery_agent'],
+        unique=False,
+        postgresql_where=sa.text('NOT delivery_fee_paid AND delivery_payout_id IS NULL')
+    )
+
+    # Orders already listed on an open delivery payout belong to it
+    op.execute("""
+        UPDATE orders SET delivery_payout_id = p.id
+        FROM delivery_payouts p, json_array_elements_text(p.order_ids) AS claimed(order_id)
+        WHERE orders.id = claimed.order_id AND p.status IN ('pending', 'processing')
+          AND orders.delivery_payout_id IS NULL AND NOT orders.delivery_fee_paid
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_orders_delivery_fee_unclaimed', table_name='orders',
+                  postgresql_where=sa.text('NOT delivery_fee_paid AND delivery_payout_id IS NULL'))
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_orders_delivery_payout_id'))
+        batch_op.drop_constraint('fk_orders_delivery_payout_id', type_='foreignkey')
+        batch_op.drop_column('delivery_payout_id')
@@ -0,0 +1,30 @@
+"""Add provider tokens table
+
+Revision ID: b7d3e9a1c4f2
+Revises: 8a4c6d2e9f15
+Create Date: 2026-10-18 12:41:09.552018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e9a1c4f2'
+down_revision = '8a4c6d2e9f15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('provider_tokens',
+    sa.Column('key', sa.String(length=100), nullable=False),
+    sa.Column('token', sa.Text(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('provider_tokens')
@@ -0,0 +1,30 @@
+"""Add payment phone change queue index
+
+Revision ID: b8d4f1a6c3e9
+Revises: a3e9c7f2b6d1
+Create Date: 2026-10-18 20:03:29.551874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d4f1a6c3e9'
+down_revision = 'a3e9c7f2b6d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('supplier_profiles', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_supplier_profiles_phone_change_queue',
+            ['payment_phone_change_status', 'payment_phone_change_requested_at', 'id'],
+            unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('supplier_profiles', schema=None) as batch_op:
+        batch_op.drop_index('ix_supplier_profiles_phone_change_queue')
@@ -0,0 +1,48 @@
+"""Add payout batches
+
+Revision ID: c2f8a5d7e3b1
+Revises: b7d3e9a1c4f2
+Create Date: 2026-10-18 13:58:31.774102
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f8a5d7e3b1'
+down_revision = 'b7d3e9a1c4f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('payout_batches',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('source', sa.String(length=20), nullable=False),
+    sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'COMPLETED', 'FAILED', name='payoutbatchstatus'), nullable=False),
+    sa.Column('total_count', sa.Integer(), nullable=False),
+    sa.Column('submitted_count', sa.Integer(), nullable=False),
+    sa.Column('failed_count', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_by', sa.String(length=36), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('supplier_payouts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('batch_id', sa.String(length=36), nullable=True))
+        batch_op.create_index(batch_op.f('ix_supplier_payouts_batch_id'), ['batch_id'], unique=False)
+        batch_op.create_foreign_key('fk_supplier_payouts_batch_id', 'payout_batches', ['batch_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('supplier_payouts', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_supplier_payouts_batch_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_supplier_payouts_batch_id'))
+        batch_op.drop_column('batch_id')
+
+    op.drop_table('payout_batches')
+    sa.Enum(name='payoutbatchstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,90 @@
+"""Add daily sales rollup tables
+
+Revision ID: c5f2a9d8e1b4
+Revises: b8d4f1a6c3e9
+Create Date: 2026-10-18 21:04:37.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f2a9d8e1b4'
+down_revision = 'b8d4f1a6c3e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_sales_rollups',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('hour', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.String(length=36), nullable=False),
+    sa.Column('supplier_id', sa.String(length=36), nullable=False),
+    sa.Column('category_id', sa.String(length=36), nullable=True),
+    sa.Column('delivery_zone', sa.String(length=100), nullable=False),
+    sa.Column('payment_method', sa.String(length=20), nullable=False),
+    sa.Column('revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('commission', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('supplier_earnings', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('items_sold', sa.Integer(), nullable=False),
+    sa.Column('line_count', sa.Integer(), nullable=False),
+    sa.Column('product_orders', sa.Integer(), nullable=False),
+    sa.Column('supplier_orders', sa.Integer(), nullable=False),
+    sa.Column('category_orders', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('daily_sales_rollups', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_daily_sales_rollups_day'), ['day'], unique=False)
+        batch_op.create_index(batch_op.f('ix_daily_sales_rollups_product_id'), ['product_id'], unique=False)
+        batch_op.create_index('ix_daily_sales_rollups_supplier_day', ['supplier_id', 'day'], unique=False)
+        batch_op.create_index('ix_daily_sales_rollups_category_day', ['category_id', 'day'], unique=False)
+
+    op.create_table('daily_order_rollups',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('hour', sa.Integer(), nullable=False),
+    sa.Column('delivery_zone', sa.String(length=100), nullable=False),
+    sa.Column('payment_method', sa.String(length=20), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('subtotal', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('delivery_fees', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('items_sold', sa.Integer(), nullable=False),
+    sa.Column('commission', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('supplier_earnings', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('daily_order_rollups', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_daily_order_rollups_day'), ['day'], unique=False)
+
+    op.create_table('rollup_days',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('dirty', sa.Boolean(), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+
+    # Queue every day with completed orders; the refresh job builds them
+    op.execute("""
+        INSERT INTO rollup_days (day, dirty, updated_at)
+        SELECT DISTINCT date(created_at), TRUE, now() FROM orders WHERE payment_status = 'COMPLETED'
+    """)
+
+
+def downgrade():
+    op.drop_table('rollup_days')
+
+    with op.batch_alter_table('daily_order_rollups', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_daily_order_rollups_day'))
+    op.drop_table('daily_order_rollups')
+
+    with op.batch_alter_table('daily_sales_rollups', schema=None) as batch_op:
+        batch_op.drop_index('ix_daily_sales_rollups_category_day')
+        batch_op.drop_index('ix_daily_sales_rollups_supplier_day')
+        batch_op.drop_index(batch_op.f('ix_daily_sales_rollups_product_id'))
+        batch_op.drop_index(batch_op.f('ix_daily_sales_rollups_day'))
+    op.drop_table('daily_sales_rollups')
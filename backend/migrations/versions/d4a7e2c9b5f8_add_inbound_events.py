@@ -0,0 +1,59 @@
+"""Add inbound events and payment reference indexes
+
+Revision ID: d4a7e2c9b5f8
+Revises: c2f8a5d7e3b1
+Create Date: 2026-10-18 15:12:06.418337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7e2c9b5f8'
+down_revision = 'c2f8a5d7e3b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('inbound_events',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('provider', sa.String(length=20), nullable=False),
+    sa.Column('event_type', sa.String(length=50), nullable=False),
+    sa.Column('reference', sa.String(length=100), nullable=True),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'PROCESSED', 'IGNORED', 'FAILED', name='inboundeventstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('received_at', sa.DateTime(), nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('provider', 'event_type', 'reference', name='uq_inbound_events_reference')
+    )
+    op.create_index(
+        'ix_inbound_events_pending',
+        'inbound_events',
+        ['available_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'PENDING'")
+    )
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_orders_payment_reference'), ['payment_reference'], unique=False)
+
+    with op.batch_alter_table('supplier_payouts', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_supplier_payouts_reference'), ['reference'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('supplier_payouts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_supplier_payouts_reference'))
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_orders_payment_reference'))
+
+    op.drop_index('ix_inbound_events_pending', table_name='inbound_events', postgresql_where=sa.text("status = 'PENDING'"))
+    op.drop_table('inbound_events')
+    sa.Enum(name='inboundeventstatus').drop(op.get_bind(), checkfirst=True)
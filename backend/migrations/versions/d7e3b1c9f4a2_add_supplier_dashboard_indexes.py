@@ -0,0 +1,34 @@
+"""Add supplier dashboard indexes
+
+Revision ID: d7e3b1c9f4a2
+Revises: c5f2a9d8e1b4
+Create Date: 2026-10-18 23:41:09.204815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e3b1c9f4a2'
+down_revision = 'c5f2a9d8e1b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_order_items_supplier_order',
+        'order_items',
+        ['supplier_id', 'order_id'],
+        unique=False,
+        postgresql_include=['quantity', 'supplier_earnings']
+    )
+    op.create_index('ix_orders_payment_status_created', 'orders', ['payment_status', 'created_at'], unique=False)
+    op.create_index('ix_returns_order_id', 'returns', ['order_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_returns_order_id', table_name='returns')
+    op.drop_index('ix_orders_payment_status_created', table_name='orders')
+    op.drop_index('ix_order_items_supplier_order', table_name='order_items')
@@ -0,0 +1,60 @@
+"""Add composite and partial indexes for hot order filters
+
+Revision ID: e2a8c4f7b913
+Revises: d7e3b1c9f4a2
+Create Date: 2026-10-19 00:12:53.871046
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a8c4f7b913'
+down_revision = 'd7e3b1c9f4a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Leads with assigned_delivery_agent, so it replaces the single-column index
+    op.create_index(
+        'ix_orders_agent_status_created',
+        'orders',
+        ['assigned_delivery_agent', 'status', 'created_at'],
+        unique=False
+    )
+    op.drop_index('ix_orders_assigned_delivery_agent', table_name='orders')
+
+    op.create_index(
+        'ix_orders_cod_collector',
+        'orders',
+        ['cod_collected_by', 'cod_collected_at'],
+        unique=False,
+        postgresql_where=sa.text('cod_collected_at IS NOT NULL')
+    )
+    op.create_index(
+        'ix_orders_cod_unverified',
+        'orders',
+        ['cod_collected_at'],
+        unique=False,
+        postgresql_where=sa.text('cod_collected_at IS NOT NULL AND cod_verified_at IS NULL')
+    )
+    op.create_index(
+        'ix_orders_awaiting_confirmation',
+        'orders',
+        ['auto_confirm_deadline'],
+        unique=False,
+        postgresql_where=sa.text(
+            'delivery_confirmed_by_agent AND NOT customer_confirmed_delivery AND NOT customer_dispute'
+        )
+    )
+
+
+def downgrade():
+    op.drop_index('ix_orders_awaiting_confirmation', table_name='orders')
+    op.drop_index('ix_orders_cod_unverified', table_name='orders')
+    op.drop_index('ix_orders_cod_collector', table_name='orders')
+
+    op.create_index('ix_orders_assigned_delivery_agent', 'orders', ['assigned_delivery_agent'], unique=False)
+    op.drop_index('ix_orders_agent_status_created', table_name='orders')
@@ -0,0 +1,36 @@
+"""Add payment reconciliation column and index
+
+Revision ID: e6b3f9d1a8c4
+Revises: d4a7e2c9b5f8
+Create Date: 2026-10-18 16:40:52.903215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b3f9d1a8c4'
+down_revision = 'd4a7e2c9b5f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('payment_checked_at', sa.DateTime(), nullable=True))
+
+    op.create_index(
+        'ix_orders_payment_pending',
+        'orders',
+        ['created_at'],
+        unique=False,
+        postgresql_where=sa.text("payment_status = 'PENDING'")
+    )
+
+
+def downgrade():
+    op.drop_index('ix_orders_payment_pending', table_name='orders', postgresql_where=sa.text("payment_status = 'PENDING'"))
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_column('payment_checked_at')
@@ -0,0 +1,49 @@
+"""Add ledger entries table
+
+Revision ID: f1c5a8e3d7b2
+Revises: e6b3f9d1a8c4
+Create Date: 2026-10-18 18:05:17.412986
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c5a8e3d7b2'
+down_revision = 'e6b3f9d1a8c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ledger_entries',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('transaction_id', sa.String(length=36), nullable=False),
+    sa.Column('account_type', sa.String(length=20), nullable=False),
+    sa.Column('account_id', sa.String(length=36), nullable=False),
+    sa.Column('entry_type', sa.Enum('OPENING', 'EARNING', 'DEDUCTION', 'PAYOUT', 'REFUND', name='ledgerentrytype'), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('order_id', sa.String(length=36), nullable=True),
+    sa.Column('reference', sa.String(length=100), nullable=True),
+    sa.Column('memo', sa.String(length=255), nullable=True),
+    sa.Column('created_by', sa.String(length=36), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ledger_entries', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_ledger_entries_transaction_id'), ['transaction_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_ledger_entries_order_id'), ['order_id'], unique=False)
+        batch_op.create_index('ix_ledger_entries_account', ['account_type', 'account_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ledger_entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_ledger_entries_account')
+        batch_op.drop_index(batch_op.f('ix_ledger_entries_order_id'))
+        batch_op.drop_index(batch_op.f('ix_ledger_entries_transaction_id'))
+
+    op.drop_table('ledger_entries')
+    sa.Enum(name='ledgerentrytype').drop(op.get_bind(), checkfirst=True)
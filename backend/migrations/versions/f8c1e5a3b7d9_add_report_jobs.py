@@ -0,0 +1,51 @@
+"""Add report jobs
+
+Revision ID: f8c1e5a3b7d9
+Revises: e2a8c4f7b913
+Create Date: 2026-10-19 01:04:37.215908
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8c1e5a3b7d9'
+down_revision = 'e2a8c4f7b913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('report_jobs',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('report_type', sa.String(length=50), nullable=False),
+    sa.Column('params', sa.JSON(), nullable=False),
+    sa.Column('spec_hash', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'RUNNING', 'COMPLETED', 'FAILED', name='reportjobstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('requested_by', sa.String(length=36), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['requested_by'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_report_jobs_spec_hash', 'report_jobs', ['spec_hash', 'created_at'], unique=False)
+    op.create_index(
+        'ix_report_jobs_pending',
+        'report_jobs',
+        ['created_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'PENDING'")
+    )
+
+
+def downgrade():
+    op.drop_index('ix_report_jobs_pending', table_name='report_jobs', postgresql_where=sa.text("status = 'PENDING'"))
+    op.drop_index('ix_report_jobs_spec_hash', table_name='report_jobs')
+    op.drop_table('report_jobs')
+    sa.Enum(name='reportjobstatus').drop(op.get_bind(), checkfirst=True)
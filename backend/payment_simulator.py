@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Local M-Pesa (Daraja) and Paystack simulator for load testing the payment flow.
+
+Serves the provider endpoints the backend calls, with configurable latency,
+upstream error rate and payment outcomes, and delivers the asynchronous
+callbacks (STK results, B2C results/timeouts, signed Paystack charge.success
+webhooks) back to the backend after a delay, so the whole flow can be
+benchmarked without the live sandboxes.
+
+Run:
+    python payment_simulator.py --port 5055 --latency-ms 80 --decline-rate 0.1
+
+Point the backend at it:
+    MPESA_BASE_URL=http://localhost:5055/daraja
+    PAYSTACK_BASE_URL=http://localhost:5055/paystack
+    MPESA_CALLBACK_URL=http://localhost:5000/api/payments/mpesa/callback
+    MPESA_B2C_RESULT_URL=http://localhost:5000/api/payments/b2c/result
+    MPESA_B2C_TIMEOUT_URL=http://localhost:5000/api/payments/b2c/timeout
+
+Any consumer key/secret and Paystack key pair works; the simulator signs
+webhooks with PAYSTACK_SECRET_KEY, so both processes need the same value.
+
+Control endpoints:
+    GET  /__sim/stats    request counts, callback delivery and ack latency
+    POST /__sim/config   change any setting at runtime (JSON body)
+    POST /__sim/reset    clear transactions and counters
+"""
+
+import argparse
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import Flask, request
+import requests
+
+
+DEFAULTS = {
+    'latency_ms': 50,  # Mean API response latency
+    'jitter_ms': 20,  # +/- spread around the mean
+    'error_rate': 0.0,  # Share of API calls answered with a 503
+    'decline_rate': 0.1,  # Share of payments that end in failure
+    'b2c_timeout_rate': 0.0,  # Share of B2C requests answered on the timeout URL
+    'duplicate_rate': 0.0,  # Share of callbacks delivered twice
+    'callback_delay_ms': 1000,  # Time between a request and its callback
+    'callback_workers': 16,  # Concurrent callback deliveries
+    'paystack_webhook_url': 'http://localhost:5000/api/payments/card/webhook',
+    'paystack_secret': os.getenv('PAYSTACK_SECRET_KEY', 'sk_test_simulator'),
+}
+
+# Daraja result codes used by the simulator
+STK_CANCELLED = (1032, 'Request cancelled by user')
+B2C_DECLINED = (2001, 'The initiator information is invalid.')
+
+
+class CallbackDispatcher:
+    """Delivers callbacks once they are due, from a bounded pool of senders."""
+
+    def __init__(self, stats, workers):
+        self.stats = stats
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._pool = None
+        self._session = requests.Session()
+        self.resize(workers)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def resize(self, workers):
+        old, self._pool = self._pool, ThreadPoolExecutor(max_workers=int(workers))
+        if old:
+            old.shutdown(wait=False)
+
+    def schedule(self, delay_ms, url, body, headers=None):
+        """Send body (bytes) to url after delay_ms."""
+        due = time.monotonic() + delay_ms / 1000
+        with self._condition:
+            heapq.heappush(self._queue, (due, next(self._sequence), url, body, headers or {}))
+            self._condition.notify()
+
+    def pending(self):
+        with self._condition:
+            return len(self._queue)
+
+    def clear(self):
+        with self._condition:
+            self._queue.clear()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+                    self._condition.wait(timeout)
+                _, _, url, body, headers = heapq.heappop(self._queue)
+            self._pool.submit(self._send, url, body, headers)
+
+    def _send(self, url, body, headers):
+        started = time.perf_counter()
+        try:
+            response = self._session.post(url, data=body, timeout=30,
+                                          headers={'Content-Type': 'application/json', **headers})
+            ok = response.status_code < 400
+        except requests.exceptions.RequestException:
+            ok = False
+        self.stats.callback_done((time.perf_counter() - started) * 1000, ok)
+
+
+class SimulatorStats:
+    """Request and callback counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.monotonic()
+            self.requests = Counter()
+            self.errors = Counter()
+            self.callbacks_sent = 0
+            self.callbacks_failed = 0
+            self.ack_latencies = deque(maxlen=10000)
+
+    def request(self, endpoint, error=False):
+        with self._lock:
+            self.requests[endpoint] += 1
+            if error:
+                self.errors[endpoint] += 1
+
+    def callback_done(self, latency_ms, ok):
+        with self._lock:
+            self.callbacks_sent += 1
+            if not ok:
+                self.callbacks_failed += 1
+            self.ack_latencies.append(latency_ms)
+
+    def to_dict(self):
+        with self._lock:
+            ordered = sorted(self.ack_latencies)
+            elapsed = time.monotonic() - self.started
+
+            def percentile(p):
+                return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else None
+
+            return {
+                'elapsed_seconds': round(elapsed, 1),
+                'requests': dict(self.requests),
+                'errors': dict(self.errors),
+                'requests_per_second': round(sum(self.requests.values()) / elapsed, 1) if elapsed else 0,
+                'callbacks_sent': self.callbacks_sent,
+                'callbacks_failed': self.callbacks_failed,
+                'callback_ack_p50_ms': percentile(0.5),
+                'callback_ack_p95_ms': percentile(0.95),
+                'callback_ack_p99_ms': percentile(0.99),
+            }
+
+
+def create_simulator(settings):
+    """Build the simulator app around a mutable settings dict."""
+    app = Flask(__name__)
+    stats = SimulatorStats()
+    dispatcher = CallbackDispatcher(stats, settings['callback_workers'])
+    lock = threading.Lock()
+    stk_transactions = {}  # CheckoutRequestID -> transaction
+    charges = {}  # Paystack reference -> charge
+
+    def outcome(rate):
+        return random.random() >= rate
+
+    def simulate(endpoint):
+        """Apply latency and the upstream error rate. Returns an error response or None."""
+        delay = settings['latency_ms'] + random.uniform(-settings['jitter_ms'], settings['jitter_ms'])
+        time.sleep(max(delay, 0) / 1000)
+        failed = random.random() < settings['error_rate']
+        stats.request(endpoint, error=failed)
+        if failed:
+            return {'requestId': uuid.uuid4().hex, 'errorCode': '503.001.01',
+                    'errorMessage': 'Service temporarily unavailable'}, 503
+        return None
+
+    def deliver(url, body, headers=None):
+        """Schedule a callback, sometimes twice to exercise duplicate handling."""
+        copies = 2 if random.random() < settings['duplicate_rate'] else 1
+        for copy in range(copies):
+            dispatcher.schedule(settings['callback_delay_ms'] * (copy + 1), url, body, headers)
+
+    def bearer_missing():
+        auth = request.headers.get('Authorization', '')
+        if not auth.startswith('Bearer ') or not auth[7:].strip():
+            return {'errorCode': '404.001.04', 'errorMessage': 'Invalid Access Token'}, 401
+        return None
+
+    # -------------------------------------------------------------------------
+    # Daraja
+    # -------------------------------------------------------------------------
+
+    @app.route('/daraja/oauth/v1/generate', methods=['GET'])
+    def daraja_oauth():
+        error = simulate('mpesa_oauth')
+        if error:
+            return error
+        if not request.headers.get('Authorization', '').startswith('Basic '):
+            return {'errorCode': '400.008.01', 'errorMessage': 'Invalid Authentication passed'}, 400
+        return {'access_token': uuid.uuid4().hex, 'expires_in': '3599'}
+
+    @app.route('/daraja/mpesa/stkpush/v1/processrequest', methods=['POST'])
+    def daraja_stk_push():
+        error = simulate('mpesa_stk_push') or bearer_missing()
+        if error:
+            return error
+
+        data = request.get_json(silent=True) or {}
+        checkout_request_id = f'ws_CO_{datetime.utcnow().strftime("%d%m%Y%H%M%S")}{uuid.uuid4().hex[:12]}'
+        merchant_request_id = f'{random.randint(10000, 99999)}-{random.randint(1000000, 9999999)}-1'
+        paid = outcome(settings['decline_rate'])
+        result_code, result_desc = (0, 'The service request is processed successfully.') if paid else STK_CANCELLED
+
+        callback = {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': result_code,
+            'ResultDesc': result_desc,
+        }
+        if paid:
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': data.get('Amount')},
+                {'Name': 'MpesaReceiptNumber', 'Value': f'SIM{uuid.uuid4().hex[:7].upper()}'},
+                {'Name': 'TransactionDate', 'Value': int(datetime.utcnow().strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': int(data.get('PhoneNumber') or 0)},
+            ]}
+
+        with lock:
+            stk_transactions[checkout_request_id] = {
+                'merchant_request_id': merchant_request_id,
+                'result_code': result_code,
+                'result_desc': result_desc,
+                'resolves_at': time.monotonic() + settings['callback_delay_ms'] / 1000,
+            }
+        if data.get('CallBackURL'):
+            deliver(data['CallBackURL'], json.dumps({'Body': {'stkCallback': callback}}).encode())
+
+        return {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        }
+
+    @app.route('/daraja/mpesa/stkpushquery/v1/query', methods=['POST'])
+    def daraja_stk_query():
+        error = simulate('mpesa_stk_query') or bearer_missing()
+        if error:
+            return error
+
+        checkout_request_id = (request.get_json(silent=True) or {}).get('CheckoutRequestID')
+        with lock:
+            transaction = stk_transactions.get(checkout_request_id)
+        if not transaction:
+            return {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid CheckoutRequestID'}, 400
+        if time.monotonic() < transaction['resolves_at']:
+            return {'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'}, 500
+
+        return {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': transaction['merchant_request_id'],
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': str(transaction['result_code']),
+            'ResultDesc': transaction['result_desc'],
+        }
+
+    @app.route('/daraja/mpesa/b2c/v3/paymentrequest', methods=['POST'])
+    def daraja_b2c():
+        error = simulate('mpesa_b2c') or bearer_missing()
+        if error:
+            return error
+
+        data = request.get_json(silent=True) or {}
+        conversation_id = f'AG_{datetime.utcnow().strftime("%Y%m%d")}_{uuid.uuid4().hex[:20]}'
+        originator_id = data.get('OriginatorConversationID') or uuid.uuid4().hex
+
+        if random.random() < settings['b2c_timeout_rate']:
+            url = data.get('QueueTimeOutURL')
+            result = {'ResultType': 1, 'ResultCode': 1037, 'ResultDesc': 'Timeout'}
+        else:
+            url = data.get('ResultURL')
+            paid = outcome(settings['decline_rate'])
+            result_code, result_desc = (0, 'The service request is processed successfully.') if paid else B2C_DECLINED
+            result = {'ResultType': 0, 'ResultCode': result_code, 'ResultDesc': result_desc}
+            if paid:
+                result['ResultParameters'] = {'ResultParameter': [
+                    {'Key': 'TransactionAmount', 'Value': data.get('Amount')},
+                    {'Key': 'TransactionReceipt', 'Value': f'SIM{uuid.uuid4().hex[:7].upper()}'},
+                    {'Key': 'ReceiverPartyPublicName', 'Value': f"{data.get('PartyB')} - Simulated Recipient"},
+                    {'Key': 'TransactionCompletedDateTime', 'Value': datetime.utcnow().strftime('%d.%m.%Y %H:%M:%S')},
+                ]}
+
+        if url:
+            deliver(url, json.dumps({'Result': {
+                **result,
+                'OriginatorConversationID': originator_id,
+                'ConversationID': conversation_id,
+                'TransactionID': f'SIM{uuid.uuid4().hex[:7].upper()}',
+            }}).encode())
+
+        return {
+            'ConversationID': conversation_id,
+            'OriginatorConversationID': originator_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Accept the service request successfully.',
+        }
+
+    # -------------------------------------------------------------------------
+    # Paystack
+    # -------------------------------------------------------------------------
+
+    def paystack_error(message, status):
+        return {'status': False, 'message': message}, status
+
+    @app.route('/paystack/transaction/initialize', methods=['POST'])
+    def paystack_initialize():
+        error = simulate('paystack_initialize')
+        if error:
+            return paystack_error(error[0]['errorMessage'], error[1])
+        if bearer_missing():
+            return paystack_error('Invalid key', 401)
+
+        data = request.get_json(silent=True) or {}
+        reference = data.get('reference') or uuid.uuid4().hex
+        with lock:
+            if reference in charges:
+                return paystack_error('Duplicate Transaction Reference', 400)
+            paid = outcome(settings['decline_rate'])
+            charge = charges[reference] = {
+                'id': random.randint(10 ** 9, 10 ** 10),
+                'reference': reference,
+                'amount': int(data.get('amount') or 0),
+                'currency': data.get('currency', 'KES'),
+                'metadata': data.get('metadata') or {},
+                'email': data.get('email'),
+                'final_status': 'success' if paid else 'failed',
+                'resolves_at': time.monotonic() + settings['callback_delay_ms'] / 1000,
+                'paid_at': datetime.utcnow().isoformat() + 'Z',
+            }
+
+        if paid and settings['paystack_webhook_url']:
+            body = {'event': 'charge.success', 'data': {
+                'id': charge['id'],
+                'status': 'success',
+                'reference': reference,
+                'amount': charge['amount'],
+                'currency': charge['currency'],
+                'paid_at': charge['paid_at'],
+                'channel': 'card',
+                'metadata': charge['metadata'],
+                'customer': {'email': charge['email']},
+            }}
+            raw = json.dumps(body).encode()
+            signature = hmac.new(settings['paystack_secret'].encode(), raw, hashlib.sha512).hexdigest()
+            deliver(settings['paystack_webhook_url'], raw, {'x-paystack-signature': signature})
+
+        access_code = uuid.uuid4().hex[:15]
+        return {'status': True, 'message': 'Authorization URL created', 'data': {
+            'authorization_url': f'{request.host_url}paystack/checkout/{access_code}',
+            'access_code': access_code,
+            'reference': reference,
+        }}
+
+    @app.route('/paystack/transaction/verify/<reference>', methods=['GET'])
+    def paystack_verify(reference):
+        error = simulate('paystack_verify')
+        if error:
+            return paystack_error(error[0]['errorMessage'], error[1])
+        if bearer_missing():
+            return paystack_error('Invalid key', 401)
+
+        with lock:
+            charge = charges.get(reference)
+        if not charge:
+            return paystack_error('Transaction reference not found', 404)
+
+        resolved = time.monotonic() >= charge['resolves_at']
+        status = charge['final_status'] if resolved else 'ongoing'
+        return {'status': True, 'message': 'Verification successful', 'data': {
+            'id': charge['id'],
+            'status': status,
+            'reference': reference,
+            'amount': charge['amount'],
+            'currency': charge['currency'],
+            'paid_at': charge['paid_at'] if status == 'success' else None,
+            'metadata': charge['metadata'],
+        }}
+
+    @app.route('/paystack/refund', methods=['POST'])
+    def paystack_refund():
+        error = simulate('paystack_refund')
+        if error:
+            return paystack_error(error[0]['errorMessage'], error[1])
+        if bearer_missing():
+            return paystack_error('Invalid key', 401)
+
+        data = request.get_json(silent=True) or {}
+        with lock:
+            charge = charges.get(data.get('transaction'))
+        if not charge or charge['final_status'] != 'success':
+            return paystack_error('Transaction not found or not refundable', 400)
+
+        return {'status': True, 'message': 'Refund has been queued for processing', 'data': {
+            'id': random.randint(10 ** 6, 10 ** 7),
+            'transaction': {'id': charge['id'], 'reference': charge['reference']},
+            'amount': int(data.get('amount') or charge['amount']),
+            'currency': charge['currency'],
+            'status': 'pending',
+        }}
+
+    # -------------------------------------------------------------------------
+    # Control
+    # -------------------------------------------------------------------------
+
+    @app.route('/__sim/stats', methods=['GET'])
+    def sim_stats():
+        with lock:
+            transactions = {'stk': len(stk_transactions), 'paystack': len(charges)}
+        return {**stats.to_dict(), 'callbacks_pending': dispatcher.pending(), 'transactions': transactions,
+                'settings': {key: value for key, value in settings.items() if key != 'paystack_secret'}}
+
+    @app.route('/__sim/config', methods=['POST'])
+    def sim_config():
+        data = request.get_json(silent=True) or {}
+        unknown = set(data) - set(DEFAULTS)
+        if unknown:
+            return {'error': f"Unknown settings: {', '.join(sorted(unknown))}"}, 400
+        for key, value in data.items():
+            settings[key] = type(DEFAULTS[key])(value)
+        if 'callback_workers' in data:
+            dispatcher.resize(settings['callback_workers'])
+        return {'settings': {key: value for key, value in settings.items() if key != 'paystack_secret'}}
+
+    @app.route('/__sim/reset', methods=['POST'])
+    def sim_reset():
+        with lock:
+            stk_transactions.clear()
+            charges.clear()
+        dispatcher.clear()
+        stats.reset()
+        return {'status': 'reset'}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local M-Pesa/Paystack simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.getenv('PAYMENT_SIMULATOR_PORT', 5055)))
+    for key, default in DEFAULTS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=type(default), default=default)
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in DEFAULTS}
+    app = create_simulator(settings)
+    print(f'Payment simulator on http://{args.host}:{args.port}')
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()